@@ -4,7 +4,8 @@ import os
 
 PYTHON_COMMAND = "python"
 
-SUMO_SLEEP = 1.0  # Delay between initializing SUMO and connecting with TraCI
+# Maximum time, in seconds, to wait for SUMO to accept a TraCI connection
+SUMO_STARTUP_TIMEOUT = 60.0
 
 PROJECT_PATH = osp.abspath(osp.join(osp.dirname(__file__), '..'))
 
@@ -76,10 +76,12 @@ class BaseController(metaclass=ABCMeta):
             'obey_speed_limit': self.get_obey_speed_limit_action
         }
         self.failsafes = []
+        self.failsafe_names = []
         if failsafe_list:
             for check in failsafe_list:
                 if check in failsafe_map:
                     self.failsafes.append(failsafe_map.get(check))
+                    self.failsafe_names.append(check)
                 else:
                     raise ValueError('Skipping {}, as it is not a valid failsafe.'.format(check))
 
@@ -96,6 +98,32 @@ class BaseController(metaclass=ABCMeta):
         """Return the acceleration of the controller."""
         pass
 
+    def get_accel_batch(self, env, veh_ids):
+        """Return the accelerations of several vehicles using this controller.
+
+        This is the vectorized counterpart of ``get_accel``, used by
+        flow/controllers/batch.py to compute the accelerations of all vehicles
+        of the same type at once. The parameters of this controller are used
+        for every vehicle, and the results must match those of calling
+        ``get_accel`` on the controller of every vehicle. Controllers whose
+        ``get_accel`` method may return None (i.e. let sumo control the
+        vehicle) should not implement this method.
+
+        Parameters
+        ----------
+        env : flow.envs.Env
+            state of the environment at the current time step
+        veh_ids : list of str
+            vehicles controlled by instances of this controller with the same
+            parameters
+
+        Returns
+        -------
+        np.ndarray
+            the acceleration of every vehicle
+        """
+        raise NotImplementedError
+
     def get_action(self, env):
         """Convert the get_accel() acceleration into an action.
 
@@ -379,3 +407,244 @@ class BaseController(metaclass=ABCMeta):
                     "=====================================".format(self.veh_id))
 
         return action
+
+    def apply_failsafes_batch(self, actions, state):
+        """Apply the failsafes of this controller to several vehicles.
+
+        This is the vectorized counterpart of running the methods in
+        ``failsafes`` one after the other, using the parameters of this
+        controller for every vehicle.
+
+        Parameters
+        ----------
+        actions : np.ndarray
+            requested acceleration actions
+        state : dict
+            state of the vehicles, as returned by
+            ``flow.controllers.batch.get_failsafe_state``
+
+        Returns
+        -------
+        np.ndarray
+            the actions after all failsafes are applied
+        """
+        veh_ids = state["veh_ids"]
+        sim_step = state["sim_step"]
+        # if there is only one vehicle in the network, all actions are safe
+        alone = state["num_vehicles"] == 1
+
+        for check in self.failsafe_names:
+            if check == 'instantaneous' and not alone:
+                actions = self.get_safe_action_instantaneous_batch(
+                    veh_ids, actions, state["speed"], state["headway"],
+                    state["has_leader"], sim_step)
+            elif check == 'safe_velocity' and not alone:
+                actions = self.get_safe_velocity_action_batch(
+                    veh_ids, actions, state["speed"], state["headway"],
+                    state["lead_speed"], sim_step)
+            elif check == 'feasible_accel':
+                actions = self.get_feasible_action_batch(veh_ids, actions)
+            elif check == 'obey_speed_limit':
+                actions = self.get_obey_speed_limit_action_batch(
+                    veh_ids, actions, state["speed"], state["speed_limit"],
+                    sim_step)
+
+        return actions
+
+    def get_safe_action_instantaneous_batch(self, veh_ids, actions, speeds,
+                                            headways, has_leader, sim_step):
+        """Perform the "instantaneous" failsafe action on several vehicles.
+
+        See ``get_safe_action_instantaneous``. Unlike the latter, this method
+        does not check the number of vehicles in the network.
+
+        Parameters
+        ----------
+        veh_ids : list of str
+            vehicle identifiers, used to display warnings
+        actions : np.ndarray
+            requested acceleration actions
+        speeds : np.ndarray
+            speeds of the vehicles
+        headways : np.ndarray
+            headways of the vehicles
+        has_leader : np.ndarray
+            whether the vehicles have a leader in their lane
+        sim_step : float
+            simulation step size
+
+        Returns
+        -------
+        np.ndarray
+            the requested actions if they do not lead to a crash; and a
+            stopping action otherwise
+        """
+        next_vel = speeds + actions * sim_step
+        unsafe = has_leader & (next_vel > 0) & (
+            headways < sim_step * next_vel + speeds * 1e-3 +
+            0.5 * speeds * sim_step)
+
+        if self.display_warnings:
+            for i in np.flatnonzero(unsafe):
+                print(
+                    "=====================================\n"
+                    "Vehicle {} is about to crash. Instantaneous acceleration "
+                    "clipping applied.\n"
+                    "=====================================".format(veh_ids[i]))
+
+        return np.where(unsafe, -speeds / sim_step, actions)
+
+    def get_safe_velocity_action_batch(self, veh_ids, actions, speeds,
+                                       headways, lead_speeds, sim_step):
+        """Perform the "safe_velocity" failsafe action on several vehicles.
+
+        See ``get_safe_velocity_action``. Unlike the latter, this method does
+        not check the number of vehicles in the network.
+
+        Parameters
+        ----------
+        veh_ids : list of str
+            vehicle identifiers, used to display warnings
+        actions : np.ndarray
+            requested acceleration actions
+        speeds : np.ndarray
+            speeds of the vehicles
+        headways : np.ndarray
+            headways of the vehicles
+        lead_speeds : np.ndarray
+            speeds of the leaders of the vehicles
+        sim_step : float
+            simulation step size
+
+        Returns
+        -------
+        np.ndarray
+            the requested actions clipped by the safe velocity
+        """
+        safe_velocity = self.safe_velocity_batch(
+            veh_ids, speeds, headways, lead_speeds, sim_step)
+
+        return np.where(
+            speeds + actions * sim_step > safe_velocity,
+            np.where(safe_velocity > 0,
+                     (safe_velocity - speeds) / sim_step,
+                     -speeds / sim_step),
+            actions)
+
+    def safe_velocity_batch(self, veh_ids, speeds, headways, lead_speeds,
+                            sim_step):
+        """Compute a safe velocity for several vehicles.
+
+        See ``safe_velocity``.
+
+        Parameters
+        ----------
+        veh_ids : list of str
+            vehicle identifiers, used to display warnings
+        speeds : np.ndarray
+            speeds of the vehicles
+        headways : np.ndarray
+            headways of the vehicles
+        lead_speeds : np.ndarray
+            speeds of the leaders of the vehicles
+        sim_step : float
+            simulation step size
+
+        Returns
+        -------
+        np.ndarray
+            maximum safe velocity of every vehicle
+        """
+        dv = lead_speeds - speeds
+
+        v_safe = 2 * headways / sim_step + dv - speeds * (2 * self.delay)
+
+        if self.display_warnings:
+            for i in np.flatnonzero(speeds > v_safe):
+                print(
+                    "=====================================\n"
+                    "Speed of vehicle {} is greater than safe speed. Safe velocity "
+                    "clipping applied.\n"
+                    "=====================================".format(veh_ids[i]))
+
+        return v_safe
+
+    def get_obey_speed_limit_action_batch(self, veh_ids, actions, speeds,
+                                          speed_limits, sim_step):
+        """Perform the "obey_speed_limit" failsafe action on several vehicles.
+
+        See ``get_obey_speed_limit_action``.
+
+        Parameters
+        ----------
+        veh_ids : list of str
+            vehicle identifiers, used to display warnings
+        actions : np.ndarray
+            requested acceleration actions
+        speeds : np.ndarray
+            speeds of the vehicles
+        speed_limits : np.ndarray
+            speed limits of the edges the vehicles are on
+        sim_step : float
+            simulation step size
+
+        Returns
+        -------
+        np.ndarray
+            the requested actions clipped by the speed limit
+        """
+        above = speeds + actions * sim_step > speed_limits
+
+        if self.display_warnings:
+            for i in np.flatnonzero(above & (speed_limits > 0)):
+                print(
+                    "=====================================\n"
+                    "Speed of vehicle {} is greater than speed limit. Obey "
+                    "speed limit clipping applied.\n"
+                    "=====================================".format(veh_ids[i]))
+
+        return np.where(
+            above,
+            np.where(speed_limits > 0,
+                     (speed_limits - speeds) / sim_step,
+                     -speeds / sim_step),
+            actions)
+
+    def get_feasible_action_batch(self, veh_ids, actions):
+        """Perform the "feasible_accel" failsafe action on several vehicles.
+
+        See ``get_feasible_action``.
+
+        Parameters
+        ----------
+        veh_ids : list of str
+            vehicle identifiers, used to display warnings
+        actions : np.ndarray
+            requested acceleration actions
+
+        Returns
+        -------
+        np.ndarray
+            the requested actions clipped by the feasible acceleration or
+            deceleration.
+        """
+        above = actions > self.max_accel
+        actions = np.where(above, self.max_accel, actions)
+        below = actions < -self.max_deaccel
+        actions = np.where(below, -self.max_deaccel, actions)
+
+        if self.display_warnings:
+            for i in np.flatnonzero(above):
+                print(
+                    "=====================================\n"
+                    "Acceleration of vehicle {} is greater than the max "
+                    "acceleration. Feasible acceleration clipping applied.\n"
+                    "=====================================".format(veh_ids[i]))
+            for i in np.flatnonzero(below):
+                print(
+                    "=====================================\n"
+                    "Deceleration of vehicle {} is greater than the max "
+                    "deceleration. Feasible acceleration clipping applied.\n"
+                    "=====================================".format(veh_ids[i]))
+
+        return actions
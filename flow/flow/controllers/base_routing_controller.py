@@ -25,8 +25,20 @@ class BaseRouter(metaclass=ABCMeta):
         ID of the vehicle this controller is used for
     router_params : dict
         Dictionary of router params
+
+    Attributes
+    ----------
+    trigger_edges : tuple of str or None
+        edges on which the router may change the route of its vehicle, in
+        addition to the last edge of the current route. If this is not None
+        and ``event_routing`` is set in the environment parameters, the router
+        is only called when its vehicle departs or enters a new edge, and at
+        every step during which the vehicle is on one of these edges (see
+        flow/envs/base.py). If None, the router is called at every step.
     """
 
+    trigger_edges = None
+
     def __init__(self, veh_id, router_params):
         """Instantiate the base class for routing controllers."""
         self.veh_id = veh_id
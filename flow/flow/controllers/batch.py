@@ -0,0 +1,242 @@
+"""Contains the engine computing the actions of many controllers at once.
+
+Vehicles whose acceleration controllers share the same class and parameters
+(i.e. vehicles of the same type) are grouped, and the accelerations of every
+group are computed with a single set of NumPy operations through the
+``get_accel_batch`` method of the controller class. The noise and failsafes of
+``BaseController.get_action`` are then applied to every group at once as well.
+
+The results match those of calling ``get_action`` on every controller one at a
+time, including the random numbers drawn to compute the noise, so that both
+paths produce the same simulations under a fixed seed.
+"""
+import numpy as np
+
+from flow.controllers.base_controller import BaseController
+
+# controller class -> whether its actions can be computed in batches
+_SUPPORTED = {}
+
+
+def elementwise(func, values, *args):
+    """Apply a scalar function to every element of an array.
+
+    This is used for operations whose vectorized NumPy counterpart may differ
+    from the Python scalar operation in the last bit (e.g. ``**``, which NumPy
+    computes with its own routines), so that batched controllers return the
+    same values as their scalar counterparts.
+
+    Parameters
+    ----------
+    func : callable
+        scalar function, e.g. ``pow`` or ``math.cos``
+    values : np.ndarray
+        array of floats
+    args : any
+        additional arguments passed to ``func`` after every element
+
+    Returns
+    -------
+    np.ndarray
+        the result of ``func`` for every element
+    """
+    return np.fromiter((func(x, *args) for x in values.tolist()),
+                       dtype=np.float64, count=len(values))
+
+
+def supports_batch(controller_cls):
+    """Return whether the actions of a controller class can be batched.
+
+    This is the case if the class implements ``get_accel_batch`` alongside
+    ``get_accel``, and does not override ``get_action``. Subclasses of a
+    supported controller that modify its ``get_accel`` method are therefore
+    not batched. Note that controllers whose ``get_accel`` method may return
+    None should not implement ``get_accel_batch``.
+    """
+    supported = _SUPPORTED.get(controller_cls)
+    if supported is None:
+        supported = \
+            _owner(controller_cls, "get_action") is BaseController and \
+            _owner(controller_cls, "get_accel_batch") is not BaseController \
+            and _owner(controller_cls, "get_accel_batch") is \
+            _owner(controller_cls, "get_accel")
+        _SUPPORTED[controller_cls] = supported
+    return supported
+
+
+def get_actions(env, veh_ids):
+    """Compute the actions of the acceleration controllers of many vehicles.
+
+    This is equivalent to calling ``get_action`` on the acceleration
+    controller of every vehicle, in the order of ``veh_ids``. The accelerations
+    of vehicles whose controllers support batching (see ``supports_batch``)
+    are computed in groups, while the remaining vehicles are handled one at a
+    time through ``get_action``.
+
+    Parameters
+    ----------
+    env : flow.envs.Env
+        state of the environment at the current time step
+    veh_ids : list of str
+        vehicle identifiers
+
+    Returns
+    -------
+    list of float or None
+        the action of every vehicle, None if sumo should control the vehicle
+        for the current time step
+    """
+    kv = env.k.vehicle
+    num_vehicles = len(veh_ids)
+    controllers = kv.get_acc_controller(veh_ids)
+    edges = kv.get_edge(veh_ids)
+
+    # accelerations without noise nor failsafes
+    accel = np.zeros(num_vehicles)
+    batched = np.zeros(num_vehicles, dtype=bool)
+    active = np.zeros(num_vehicles, dtype=bool)
+
+    # group vehicles with the same controller class and parameters
+    groups = {}
+    for i, (veh_id, controller) in enumerate(zip(veh_ids, controllers)):
+        if not supports_batch(type(controller)):
+            continue
+        batched[i] = True
+
+        # the acceleration behavior of vehicles that have just entered the
+        # network or are in a junction is described by sumo
+        if len(edges[i]) == 0 or edges[i][0] == ":":
+            continue
+        active[i] = True
+
+        groups.setdefault(kv.get_type(veh_id), []).append(i)
+
+    for indices in groups.values():
+        controller = controllers[indices[0]]
+        accel[indices] = controller.get_accel_batch(
+            env, [veh_ids[i] for i in indices])
+
+    noise = np.array([controller.accel_noise for controller in controllers])
+    noisy_accel = accel.copy()
+
+    # the noise is drawn in the same order as if every controller computed
+    # its action sequentially, including the controllers that are not
+    # batched and may draw noise of their own
+    actions = [None] * num_vehicles
+    pending = []
+    for i in range(num_vehicles):
+        if batched[i]:
+            if active[i] and noise[i] > 0:
+                pending.append(i)
+            continue
+        _add_noise(env, noisy_accel, noise, pending)
+        pending = []
+        actions[i] = controllers[i].get_action(env)
+    _add_noise(env, noisy_accel, noise, pending)
+
+    # clear the stored accels of vehicles controlled by sumo
+    for i in np.flatnonzero(batched & ~active):
+        for with_noise in (False, True):
+            for failsafe in (False, True):
+                kv.update_accel(veh_ids[i], None, noise=with_noise,
+                                failsafe=failsafe)
+
+    for indices in groups.values():
+        controller = controllers[indices[0]]
+        ids = [veh_ids[i] for i in indices]
+
+        no_noise = accel[indices]
+        with_noise = noisy_accel[indices]
+        no_noise_with_failsafe = no_noise
+        with_noise_with_failsafe = with_noise
+        if controller.failsafes:
+            state = get_failsafe_state(
+                env.k, ids, env.sim_step,
+                speed_limit='obey_speed_limit' in controller.failsafe_names)
+            no_noise_with_failsafe = controller.apply_failsafes_batch(
+                no_noise, state)
+            with_noise_with_failsafe = controller.apply_failsafes_batch(
+                with_noise, state)
+
+        for j, veh_id in enumerate(ids):
+            kv.update_accel(veh_id, no_noise[j].item(),
+                            noise=False, failsafe=False)
+            kv.update_accel(veh_id, no_noise_with_failsafe[j].item(),
+                            noise=False, failsafe=True)
+            kv.update_accel(veh_id, with_noise[j].item(),
+                            noise=True, failsafe=False)
+            kv.update_accel(veh_id, with_noise_with_failsafe[j].item(),
+                            noise=True, failsafe=True)
+            actions[indices[j]] = with_noise_with_failsafe[j].item()
+
+    return actions
+
+
+def get_failsafe_state(kernel, veh_ids, sim_step, speed_limit=False):
+    """Collect the state of several vehicles needed by the failsafes.
+
+    Parameters
+    ----------
+    kernel : flow.core.kernel.Kernel
+        the kernel of the environment
+    veh_ids : list of str
+        vehicle identifiers
+    sim_step : float
+        simulation step size
+    speed_limit : bool, optional
+        whether to collect the speed limits of the edges the vehicles are on,
+        which are only needed by the "obey_speed_limit" failsafe
+
+    Returns
+    -------
+    dict
+        the state used by ``BaseController.apply_failsafes_batch``, with the
+        following keys:
+
+        * "veh_ids": the vehicle identifiers
+        * "sim_step": the simulation step size
+        * "num_vehicles": the number of vehicles in the network
+        * "speed", "headway": the speed and headway of every vehicle
+        * "has_leader": whether every vehicle has a leader
+        * "lead_speed": the speed of the leader of every vehicle
+        * "speed_limit": the speed limit of the edge of every vehicle, if
+          requested
+    """
+    kv = kernel.vehicle
+    lead_ids = kv.get_leader(veh_ids)
+
+    state = {
+        "veh_ids": veh_ids,
+        "sim_step": sim_step,
+        "num_vehicles": kv.num_vehicles,
+        "speed": np.asarray(kv.get_speed(veh_ids), dtype=float),
+        "headway": np.asarray(kv.get_headway(veh_ids), dtype=float),
+        "has_leader": np.array(
+            [lead_id is not None for lead_id in lead_ids], dtype=bool),
+        "lead_speed": np.asarray(kv.get_speed(lead_ids), dtype=float),
+    }
+
+    if speed_limit:
+        edges = kv.get_edge(veh_ids)
+        speed_limits = {
+            edge: kernel.network.speed_limit(edge) for edge in set(edges)}
+        state["speed_limit"] = np.array(
+            [speed_limits[edge] for edge in edges], dtype=float)
+
+    return state
+
+
+def _add_noise(env, accel, noise, indices):
+    """Add gaussian noise to the accelerations of the specified vehicles."""
+    if len(indices) == 0:
+        return
+    accel[indices] += np.sqrt(env.sim_step) * \
+        np.random.normal(0, noise[indices])
+
+
+def _owner(cls, name):
+    """Return the class in the MRO of cls that defines an attribute."""
+    for klass in cls.__mro__:
+        if name in vars(klass):
+            return klass
+    return None
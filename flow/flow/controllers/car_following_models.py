@@ -6,11 +6,15 @@ in Flow to match various prominent car-following models that can be calibrated.
 
 Each controller includes the function ``get_accel(self, env) -> acc`` which,
 using the current state of the world and existing parameters, uses the control
-model to return a vehicle acceleration.
+model to return a vehicle acceleration. Most controllers also include its
+vectorized counterpart ``get_accel_batch(self, env, veh_ids) -> acc``, which
+computes the accelerations of several vehicles at once (see
+flow/controllers/batch.py).
 """
 import math
 import numpy as np
 from flow.controllers.base_controller import BaseController
+from flow.controllers.batch import elementwise
 
 class CFMController(BaseController):
     """CFM controller.
@@ -88,6 +92,19 @@ class CFMController(BaseController):
         return self.k_d*(d_l - self.d_des) + self.k_v*(lead_vel - this_vel) + \
             self.k_c*(self.v_des - this_vel)
 
+    def get_accel_batch(self, env, veh_ids):
+        """See parent class."""
+        lead_ids = env.k.vehicle.get_leader(veh_ids)
+        lead_vel = np.asarray(env.k.vehicle.get_speed(lead_ids), dtype=float)
+        this_vel = np.asarray(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        d_l = np.asarray(env.k.vehicle.get_headway(veh_ids), dtype=float)
+
+        accel = self.k_d*(d_l - self.d_des) + self.k_v*(lead_vel - this_vel) + \
+            self.k_c*(self.v_des - this_vel)
+
+        # no car ahead
+        return np.where(_has_leader(lead_ids), accel, self.max_accel)
+
 
 class BCMController(BaseController):
     """Bilateral car-following model controller.
@@ -179,6 +196,27 @@ class BCMController(BaseController):
             self.k_v * ((lead_vel - this_vel) - (this_vel - trail_vel)) + \
             self.k_c * (self.v_des - this_vel)
 
+    def get_accel_batch(self, env, veh_ids):
+        """See parent class."""
+        lead_ids = env.k.vehicle.get_leader(veh_ids)
+        lead_vel = np.asarray(env.k.vehicle.get_speed(lead_ids), dtype=float)
+        this_vel = np.asarray(env.k.vehicle.get_speed(veh_ids), dtype=float)
+
+        trail_ids = env.k.vehicle.get_follower(veh_ids)
+        trail_vel = np.asarray(
+            env.k.vehicle.get_speed(trail_ids), dtype=float)
+
+        headway = np.asarray(env.k.vehicle.get_headway(veh_ids), dtype=float)
+        footway = np.asarray(
+            env.k.vehicle.get_headway(trail_ids), dtype=float)
+
+        accel = self.k_d * (headway - footway) + \
+            self.k_v * ((lead_vel - this_vel) - (this_vel - trail_vel)) + \
+            self.k_c * (self.v_des - this_vel)
+
+        # no car ahead
+        return np.where(_has_leader(lead_ids), accel, self.max_accel)
+
 
 class LACController(BaseController):
     """Linear Adaptive Cruise Control.
@@ -251,6 +289,30 @@ class LACController(BaseController):
 
         return self.a
 
+    def get_accel_batch(self, env, veh_ids):
+        """See parent class.
+
+        The acceleration state ``a`` of the controller of every vehicle is
+        updated as well.
+        """
+        controllers = env.k.vehicle.get_acc_controller(veh_ids)
+        lead_ids = env.k.vehicle.get_leader(veh_ids)
+        lead_vel = np.asarray(env.k.vehicle.get_speed(lead_ids), dtype=float)
+        this_vel = np.asarray(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        headway = np.asarray(env.k.vehicle.get_headway(veh_ids), dtype=float)
+        L = np.asarray(env.k.vehicle.get_length(veh_ids), dtype=float)
+        a = np.array([controller.a for controller in controllers], dtype=float)
+        ex = headway - L - self.h * this_vel
+        ev = lead_vel - this_vel
+        u = self.k_1*ex + self.k_2*ev
+        a_dot = -(a/self.tau) + (u/self.tau)
+        a = a_dot*env.sim_step + a
+
+        for controller, accel in zip(controllers, a.tolist()):
+            controller.a = accel
+
+        return a
+
 
 class OVMController(BaseController):
     """Optimal Vehicle Model controller.
@@ -337,6 +399,27 @@ class OVMController(BaseController):
 
         return self.alpha * (v_h - this_vel) + self.beta * h_dot
 
+    def get_accel_batch(self, env, veh_ids):
+        """See parent class."""
+        lead_ids = env.k.vehicle.get_leader(veh_ids)
+        lead_vel = np.asarray(env.k.vehicle.get_speed(lead_ids), dtype=float)
+        this_vel = np.asarray(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        h = np.asarray(env.k.vehicle.get_headway(veh_ids), dtype=float)
+        h_dot = lead_vel - this_vel
+
+        # V function here - input: h, output : Vh
+        v_h = np.full(len(veh_ids), float(self.v_max))
+        v_h[h <= self.h_st] = 0
+        mid = (self.h_st < h) & (h < self.h_go)
+        v_h[mid] = self.v_max / 2 * (1 - elementwise(
+            math.cos, math.pi * (h[mid] - self.h_st) /
+            (self.h_go - self.h_st)))
+
+        accel = self.alpha * (v_h - this_vel) + self.beta * h_dot
+
+        # no car ahead
+        return np.where(_has_leader(lead_ids), accel, self.max_accel)
+
 
 class LinearOVM(BaseController):
     """Linear OVM controller.
@@ -409,6 +492,20 @@ class LinearOVM(BaseController):
 
         return (v_h - this_vel) / self.adaptation
 
+    def get_accel_batch(self, env, veh_ids):
+        """See parent class."""
+        this_vel = np.asarray(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        h = np.asarray(env.k.vehicle.get_headway(veh_ids), dtype=float)
+
+        # V function here - input: h, output : Vh
+        alpha = 1.689  # the average value from Nakayama paper
+        v_h = np.full(len(veh_ids), float(self.v_max))
+        v_h[h < self.h_st] = 0
+        mid = (self.h_st <= h) & (h <= self.h_st + self.v_max / alpha)
+        v_h[mid] = alpha * (h[mid] - self.h_st)
+
+        return (v_h - this_vel) / self.adaptation
+
 
 class IDMController(BaseController):
     """Intelligent Driver Model (IDM) controller.
@@ -497,6 +594,24 @@ class IDMController(BaseController):
 
         return self.a * (1 - (v / self.v0)**self.delta - (s_star / h)**2)
 
+    def get_accel_batch(self, env, veh_ids):
+        """See parent class."""
+        v = np.asarray(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        lead_ids = env.k.vehicle.get_leader(veh_ids)
+        h = np.asarray(env.k.vehicle.get_headway(veh_ids), dtype=float)
+
+        # in order to deal with ZeroDivisionError
+        h[np.abs(h) < 1e-3] = 1e-3
+
+        lead_vel = np.asarray(env.k.vehicle.get_speed(lead_ids), dtype=float)
+        s_star = v * self.T + v * (v - lead_vel) / \
+            (2 * np.sqrt(self.a * self.b))
+        s_star = self.s0 + np.where(s_star > 0, s_star, 0)
+        s_star[~_has_leader(lead_ids)] = 0  # no car ahead
+
+        return self.a * (1 - elementwise(pow, v / self.v0, self.delta)
+                         - elementwise(pow, s_star / h, 2))
+
 
 class SimCarFollowingController(BaseController):
     """Controller whose actions are purely defined by the simulator.
@@ -599,6 +714,26 @@ class GippsController(BaseController):
 
         return (v_next-v)/env.sim_step
 
+    def get_accel_batch(self, env, veh_ids):
+        """See parent class."""
+        v = np.asarray(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        h = np.asarray(env.k.vehicle.get_headway(veh_ids), dtype=float)
+        v_l = np.asarray(env.k.vehicle.get_speed(
+            env.k.vehicle.get_leader(veh_ids)), dtype=float)
+
+        # get velocity dynamics
+        v_acc = v + (2.5 * self.acc * self.tau * (
+                1 - (v / self.v_desired)) * np.sqrt(0.025 + (v / self.v_desired)))
+        v_safe = (self.tau * self.b) + np.sqrt(((self.tau**2) * (self.b**2)) - (
+                self.b * ((2 * (h-self.s0)) - (self.tau * v) - (
+                    elementwise(pow, v_l, 2) / self.b_l))))
+
+        # same as min(v_acc, v_safe, self.v_desired), including for NaNs
+        v_next = np.where(v_safe < v_acc, v_safe, v_acc)
+        v_next = np.where(self.v_desired < v_next, self.v_desired, v_next)
+
+        return (v_next-v)/env.sim_step
+
 
 class BandoFTLController(BaseController):
     """Bando follow-the-leader controller.
@@ -677,9 +812,30 @@ class BandoFTLController(BaseController):
         s = env.k.vehicle.get_headway(self.veh_id)
         return self.accel_func(v, v_l, s)
 
+    def get_accel_batch(self, env, veh_ids):
+        """See parent class."""
+        lead_ids = env.k.vehicle.get_leader(veh_ids)
+        v_l = np.asarray(env.k.vehicle.get_speed(lead_ids), dtype=float)
+        v = np.asarray(env.k.vehicle.get_speed(veh_ids), dtype=float)
+        s = np.asarray(env.k.vehicle.get_headway(veh_ids), dtype=float)
+
+        v_h = self.v_max * ((np.tanh(s/self.h_st-2)+np.tanh(2))/(1+np.tanh(2)))
+        s_dot = v_l - v
+        accel = self.alpha * (v_h - v) + \
+            self.beta * s_dot/elementwise(pow, s, 2)
+
+        if self.want_max_accel:  # no car ahead
+            accel[~_has_leader(lead_ids)] = self.max_accel
+        return accel
+
     def accel_func(self, v, v_l, s):
         """Compute the acceleration function."""
         v_h = self.v_max * ((np.tanh(s/self.h_st-2)+np.tanh(2))/(1+np.tanh(2)))
         s_dot = v_l - v
         u = self.alpha * (v_h - v) + self.beta * s_dot/(s**2)
         return u
+
+
+def _has_leader(lead_ids):
+    """Return whether every vehicle has a leader, as a boolean array."""
+    return np.array([bool(lead_id) for lead_id in lead_ids], dtype=bool)
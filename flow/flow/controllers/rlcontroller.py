@@ -15,6 +15,13 @@ class RLController(BaseController):
     ----------
     veh_id : str
         Vehicle ID for SUMO identification
+    car_following_params : flow.core.params.SumoCarFollowingParams
+        see parent class
+    fail_safe : list of str or str, optional
+        failsafes applied to the actions of the RL agent when they are passed
+        to the vehicle kernel, see parent class
+    display_warnings : bool, optional
+        see parent class
 
     Examples
     --------
@@ -31,12 +38,18 @@ class RLController(BaseController):
         >>> rl_ids = env.k.vehicle.get_rl_ids()
     """
 
-    def __init__(self, veh_id, car_following_params):
+    def __init__(self,
+                 veh_id,
+                 car_following_params,
+                 fail_safe=None,
+                 display_warnings=True):
         """Instantiate an RL Controller."""
         BaseController.__init__(
             self,
             veh_id,
-            car_following_params)
+            car_following_params,
+            fail_safe=fail_safe,
+            display_warnings=display_warnings)
 
     def get_accel(self, env):
         """Pass, as this is never called; required to override abstractmethod."""
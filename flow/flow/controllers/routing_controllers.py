@@ -15,6 +15,8 @@ class ContinuousRouter(BaseRouter):
     See base class for usage example.
     """
 
+    trigger_edges = ()
+
     def choose_route(self, env):
         """See parent class.
 
@@ -50,6 +52,8 @@ class MinicityRouter(BaseRouter):
     See base class for usage example.
     """
 
+    trigger_edges = ('e_37', 'e_51')
+
     def choose_route(self, env):
         """See parent class."""
         vehicles = env.k.vehicle
@@ -134,24 +138,21 @@ class RingBusHumanRouterGreedy(BaseRouter):
             #Greedy selection
             
             # Define central velocity
-            central_vehs = env.k.vehicle.get_ids_by_edge('central')
-            if len(central_vehs)>0:
-                sorted_central_vehs =sorted(central_vehs, key=env._get_abs_position)
-                central_velocity = env.k.vehicle.get_speed(sorted_central_vehs[0])
+            central_stats = env.k.vehicle.get_edge_stats('central')
+            if central_stats['count'] > 0:
+                central_velocity = env.k.vehicle.get_speed(central_stats['rear_id'])
             else:
                 central_velocity = 30 #maximum speed
             # Define top velocity
-            top_vehs = env.k.vehicle.get_ids_by_edge('top')
-            if len(top_vehs)>0:
-                sorted_top_vehs =sorted(top_vehs, key=env._get_abs_position)
-                top_velocity = env.k.vehicle.get_speed(sorted_top_vehs[0])
+            top_stats = env.k.vehicle.get_edge_stats('top')
+            if top_stats['count'] > 0:
+                top_velocity = env.k.vehicle.get_speed(top_stats['rear_id'])
             else:
                 top_velocity = 30 #maximum speed
 
-            right_vehs = env.k.vehicle.get_ids_by_edge('right')
-            if len(right_vehs)>0:
-                sorted_right_vehs =sorted(right_vehs, key=env._get_abs_position)
-                right_velocity = env.k.vehicle.get_speed(sorted_right_vehs[0])
+            right_stats = env.k.vehicle.get_edge_stats('right')
+            if right_stats['count'] > 0:
+                right_velocity = env.k.vehicle.get_speed(right_stats['rear_id'])
             else:
                 right_velocity = 30 #maximum speed
             # print(f'*******top: {top_velocity}, right: {right_velocity}, central: {central_velocity}')
@@ -215,72 +216,64 @@ class GridBusHumanRouterGreedy(BaseRouter):
                 # Greedy selection
                 
                 # Define left_up velocity
-                left_up_vehs = env.k.vehicle.get_ids_by_edge('left_up')
-                if len(left_up_vehs)>0:
-                    sorted_left_up_vehs =sorted(left_up_vehs, key=env._get_abs_position)
-                    # left_up_velocity = env.k.vehicle.get_speed(sorted_left_up_vehs[0])
-                    left_up_velocity = sum(env.k.vehicle.get_speed(sorted_left_up_vehs)) / len(left_up_vehs)
+                left_up_stats = env.k.vehicle.get_edge_stats('left_up')
+                if left_up_stats['count'] > 0:
+                    # left_up_velocity = env.k.vehicle.get_speed(left_up_stats['rear_id'])
+                    left_up_velocity = left_up_stats['mean_speed']
                 else:
                     left_up_velocity = speed_limit_main #maximum speed
 
                 # Define left_bottom velocity
-                left_bottom_vehs = env.k.vehicle.get_ids_by_edge('left_bottom')
-                if len(left_bottom_vehs)>0:
-                    sorted_left_bottom_vehs =sorted(left_bottom_vehs, key=env._get_abs_position)
-                    # left_bottom_velocity = env.k.vehicle.get_speed(sorted_left_bottom_vehs[0])
-                    left_bottom_velocity = sum(env.k.vehicle.get_speed(sorted_left_bottom_vehs))/ len(left_bottom_vehs)
+                left_bottom_stats = env.k.vehicle.get_edge_stats('left_bottom')
+                if left_bottom_stats['count'] > 0:
+                    # left_bottom_velocity = env.k.vehicle.get_speed(left_bottom_stats['rear_id'])
+                    left_bottom_velocity = left_bottom_stats['mean_speed']
                 else:
                     left_bottom_velocity = speed_limit_main
 
                 # Define left_vertical velocity
-                left_vertical_vehs = env.k.vehicle.get_ids_by_edge('left_vertical')
-                if len(left_vertical_vehs)>0:
-                    sorted_left_vertical_vehs =sorted(left_vertical_vehs, key=env._get_abs_position)
-                    # left_vertical_velocity = env.k.vehicle.get_speed(sorted_left_vertical_vehs[0])
-                    left_vertical_velocity = sum(env.k.vehicle.get_speed(sorted_left_vertical_vehs)) / len(left_vertical_vehs)
+                left_vertical_stats = env.k.vehicle.get_edge_stats('left_vertical')
+                if left_vertical_stats['count'] > 0:
+                    # left_vertical_velocity = env.k.vehicle.get_speed(left_vertical_stats['rear_id'])
+                    left_vertical_velocity = left_vertical_stats['mean_speed']
                 else:
                     left_vertical_velocity = speed_limit_sub
 
                 # Define center_vertical velocity
-                center_vertical_vehs = env.k.vehicle.get_ids_by_edge('center_vertical')
-                if len(center_vertical_vehs)>0:
-                    sorted_center_vertical_vehs =sorted(center_vertical_vehs, key=env._get_abs_position)
-                    # center_vertical_velocity = env.k.vehicle.get_speed(sorted_center_vertical_vehs[0])
-                    center_vertical_velocity = sum(env.k.vehicle.get_speed(sorted_center_vertical_vehs)) / len(center_vertical_vehs)
+                center_vertical_stats = env.k.vehicle.get_edge_stats('center_vertical')
+                if center_vertical_stats['count'] > 0:
+                    # center_vertical_velocity = env.k.vehicle.get_speed(center_vertical_stats['rear_id'])
+                    center_vertical_velocity = center_vertical_stats['mean_speed']
                 else:
                     center_vertical_velocity = speed_limit_extra #maximum speed
 
                 # Define center_bottom velocity
-                center_bottom_vehs = env.k.vehicle.get_ids_by_edge('center_bottom')
-                if len(center_bottom_vehs)>0:
-                    sorted_center_bottom_vehs =sorted(center_bottom_vehs, key=env._get_abs_position)
-                    center_bottom_velocity = env.k.vehicle.get_speed(sorted_center_bottom_vehs[0])
-                    center_bottom_velocity = sum(env.k.vehicle.get_speed(sorted_center_bottom_vehs)) / len(center_bottom_vehs)
+                center_bottom_stats = env.k.vehicle.get_edge_stats('center_bottom')
+                if center_bottom_stats['count'] > 0:
+                    center_bottom_velocity = center_bottom_stats['mean_speed']
                 else:
                     center_bottom_velocity = speed_limit_main #maximum speed
 
                 # Define right_vertical velocity
-                right_vertical_vehs = env.k.vehicle.get_ids_by_edge('right_vertical')
-                if len(right_vertical_vehs)>0:
-                    sorted_right_vertical_vehs =sorted(right_vertical_vehs, key=env._get_abs_position)
-                    # right_vertical_velocity = env.k.vehicle.get_speed(sorted_right_vertical_vehs[0])
-                    right_vertical_velocity = sum(env.k.vehicle.get_speed(sorted_right_vertical_vehs)) / len(right_vertical_vehs)
+                right_vertical_stats = env.k.vehicle.get_edge_stats('right_vertical')
+                if right_vertical_stats['count'] > 0:
+                    # right_vertical_velocity = env.k.vehicle.get_speed(right_vertical_stats['rear_id'])
+                    right_vertical_velocity = right_vertical_stats['mean_speed']
                 else:
                     right_vertical_velocity = speed_limit_sub #maximum speed
 
                 # Define center_up velocity
-                center_up_vehs = env.k.vehicle.get_ids_by_edge('center_up')
-                if len(center_up_vehs)>0:
-                    sorted_center_up_vehs =sorted(center_up_vehs, key=env._get_abs_position)  # The slowest speed
-                    # center_up_velocity = env.k.vehicle.get_speed(sorted_center_up_vehs[0])
-                    center_up_velocity = sum(env.k.vehicle.get_speed(sorted_center_up_vehs)) / len(center_up_vehs)
+                center_up_stats = env.k.vehicle.get_edge_stats('center_up')
+                if center_up_stats['count'] > 0:
+                    # center_up_velocity = env.k.vehicle.get_speed(center_up_stats['rear_id'])
+                    center_up_velocity = center_up_stats['mean_speed']
                 else:
                     center_up_velocity = speed_limit_main # maximum speed
 
                 up_velocity = (left_up_velocity + center_up_velocity + right_vertical_velocity) /3 # average speed
                 down_velocity = (left_vertical_velocity + left_bottom_velocity + center_bottom_velocity) /3 # average speed
-                up_queue = len(left_up_vehs) + len(center_up_vehs) + len(right_vertical_vehs)
-                down_queue = len(left_vertical_vehs) + len(left_bottom_vehs) + len(center_bottom_vehs)
+                up_queue = left_up_stats['count'] + center_up_stats['count'] + right_vertical_stats['count']
+                down_queue = left_vertical_stats['count'] + left_bottom_stats['count'] + center_bottom_stats['count']
                 # (np.percentile(outer_velocity, 80) > np.percentile(central_velocity, 80))
                 # if  len(central_vehs) > 3 * len(top_vehs + right_vehs):
 
@@ -326,72 +319,64 @@ class GridBusHumanRouterGreedy(BaseRouter):
                 # Greedy selection
                 
                 # Define left_up velocity
-                left_up_vehs = env.k.vehicle.get_ids_by_edge('left_up')
-                if len(left_up_vehs)>0:
-                    sorted_left_up_vehs =sorted(left_up_vehs, key=env._get_abs_position)
-                    # left_up_velocity = env.k.vehicle.get_speed(sorted_left_up_vehs[0])
-                    left_up_velocity = sum(env.k.vehicle.get_speed(sorted_left_up_vehs)) / len(left_up_vehs)
+                left_up_stats = env.k.vehicle.get_edge_stats('left_up')
+                if left_up_stats['count'] > 0:
+                    # left_up_velocity = env.k.vehicle.get_speed(left_up_stats['rear_id'])
+                    left_up_velocity = left_up_stats['mean_speed']
                 else:
                     left_up_velocity = speed_limit_main #maximum speed
 
                 # Define left_bottom velocity
-                left_bottom_vehs = env.k.vehicle.get_ids_by_edge('left_bottom')
-                if len(left_bottom_vehs)>0:
-                    sorted_left_bottom_vehs =sorted(left_bottom_vehs, key=env._get_abs_position)
-                    # left_bottom_velocity = env.k.vehicle.get_speed(sorted_left_bottom_vehs[0])
-                    left_bottom_velocity = sum(env.k.vehicle.get_speed(sorted_left_bottom_vehs))/ len(left_bottom_vehs)
+                left_bottom_stats = env.k.vehicle.get_edge_stats('left_bottom')
+                if left_bottom_stats['count'] > 0:
+                    # left_bottom_velocity = env.k.vehicle.get_speed(left_bottom_stats['rear_id'])
+                    left_bottom_velocity = left_bottom_stats['mean_speed']
                 else:
                     left_bottom_velocity = speed_limit_main
 
                 # Define left_vertical velocity
-                left_vertical_vehs = env.k.vehicle.get_ids_by_edge('left_vertical')
-                if len(left_vertical_vehs)>0:
-                    sorted_left_vertical_vehs =sorted(left_vertical_vehs, key=env._get_abs_position)
-                    # left_vertical_velocity = env.k.vehicle.get_speed(sorted_left_vertical_vehs[0])
-                    left_vertical_velocity = sum(env.k.vehicle.get_speed(sorted_left_vertical_vehs)) / len(left_vertical_vehs)
+                left_vertical_stats = env.k.vehicle.get_edge_stats('left_vertical')
+                if left_vertical_stats['count'] > 0:
+                    # left_vertical_velocity = env.k.vehicle.get_speed(left_vertical_stats['rear_id'])
+                    left_vertical_velocity = left_vertical_stats['mean_speed']
                 else:
                     left_vertical_velocity = speed_limit_sub
 
                 # Define center_vertical velocity
-                center_vertical_vehs = env.k.vehicle.get_ids_by_edge('center_vertical')
-                if len(center_vertical_vehs)>0:
-                    sorted_center_vertical_vehs =sorted(center_vertical_vehs, key=env._get_abs_position)
-                    # center_vertical_velocity = env.k.vehicle.get_speed(sorted_center_vertical_vehs[0])
-                    center_vertical_velocity = sum(env.k.vehicle.get_speed(sorted_center_vertical_vehs)) / len(center_vertical_vehs)
+                center_vertical_stats = env.k.vehicle.get_edge_stats('center_vertical')
+                if center_vertical_stats['count'] > 0:
+                    # center_vertical_velocity = env.k.vehicle.get_speed(center_vertical_stats['rear_id'])
+                    center_vertical_velocity = center_vertical_stats['mean_speed']
                 else:
                     center_vertical_velocity = speed_limit_extra #maximum speed
 
                 # Define center_bottom velocity
-                center_bottom_vehs = env.k.vehicle.get_ids_by_edge('center_bottom')
-                if len(center_bottom_vehs)>0:
-                    sorted_center_bottom_vehs =sorted(center_bottom_vehs, key=env._get_abs_position)
-                    center_bottom_velocity = env.k.vehicle.get_speed(sorted_center_bottom_vehs[0])
-                    center_bottom_velocity = sum(env.k.vehicle.get_speed(sorted_center_bottom_vehs)) / len(center_bottom_vehs)
+                center_bottom_stats = env.k.vehicle.get_edge_stats('center_bottom')
+                if center_bottom_stats['count'] > 0:
+                    center_bottom_velocity = center_bottom_stats['mean_speed']
                 else:
                     center_bottom_velocity = speed_limit_main #maximum speed
 
                 # Define right_vertical velocity
-                right_vertical_vehs = env.k.vehicle.get_ids_by_edge('right_vertical')
-                if len(right_vertical_vehs)>0:
-                    sorted_right_vertical_vehs =sorted(right_vertical_vehs, key=env._get_abs_position)
-                    # right_vertical_velocity = env.k.vehicle.get_speed(sorted_right_vertical_vehs[0])
-                    right_vertical_velocity = sum(env.k.vehicle.get_speed(sorted_right_vertical_vehs)) / len(right_vertical_vehs)
+                right_vertical_stats = env.k.vehicle.get_edge_stats('right_vertical')
+                if right_vertical_stats['count'] > 0:
+                    # right_vertical_velocity = env.k.vehicle.get_speed(right_vertical_stats['rear_id'])
+                    right_vertical_velocity = right_vertical_stats['mean_speed']
                 else:
                     right_vertical_velocity = speed_limit_sub # maximum speed
 
                 # Define center_up velocity
-                center_up_vehs = env.k.vehicle.get_ids_by_edge('center_up')
-                if len(center_up_vehs)>0:
-                    sorted_center_up_vehs =sorted(center_up_vehs, key=env._get_abs_position)  # The slowest speed
-                    # center_up_velocity = env.k.vehicle.get_speed(sorted_center_up_vehs[0])
-                    center_up_velocity = sum(env.k.vehicle.get_speed(sorted_center_up_vehs)) / len(center_up_vehs)
+                center_up_stats = env.k.vehicle.get_edge_stats('center_up')
+                if center_up_stats['count'] > 0:
+                    # center_up_velocity = env.k.vehicle.get_speed(center_up_stats['rear_id'])
+                    center_up_velocity = center_up_stats['mean_speed']
                 else:
                     center_up_velocity = speed_limit_main # maximum speed
 
                 up_velocity = (left_up_velocity + center_vertical_velocity + center_bottom_velocity) /3 # average speed
                 down_velocity = (left_vertical_velocity + left_bottom_velocity + center_bottom_velocity) /3 # average speed
-                up_queue = len(left_up_vehs) + len(center_up_vehs) + len(right_vertical_vehs)
-                down_queue = len(left_vertical_vehs) + len(left_bottom_vehs) + len(center_bottom_vehs)
+                up_queue = left_up_stats['count'] + center_up_stats['count'] + right_vertical_stats['count']
+                down_queue = left_vertical_stats['count'] + left_bottom_stats['count'] + center_bottom_stats['count']
                 # (np.percentile(outer_velocity, 80) > np.percentile(central_velocity, 80))
                 # if  len(central_vehs) > 3 * len(top_vehs + right_vehs):
 
@@ -434,45 +419,41 @@ class GridBusHumanRouterGreedy(BaseRouter):
                 # Greedy selection
                 
                 # Define center_vertical velocity
-                center_vertical_vehs = env.k.vehicle.get_ids_by_edge('center_vertical')
-                if len(center_vertical_vehs)>0:
-                    sorted_center_vertical_vehs =sorted(center_vertical_vehs, key=env._get_abs_position)
-                    # center_vertical_velocity = env.k.vehicle.get_speed(sorted_center_vertical_vehs[0])
-                    center_vertical_velocity = sum(env.k.vehicle.get_speed(sorted_center_vertical_vehs)) / len(center_vertical_vehs)
+                center_vertical_stats = env.k.vehicle.get_edge_stats('center_vertical')
+                if center_vertical_stats['count'] > 0:
+                    # center_vertical_velocity = env.k.vehicle.get_speed(center_vertical_stats['rear_id'])
+                    center_vertical_velocity = center_vertical_stats['mean_speed']
                 else:
                     center_vertical_velocity = speed_limit_extra # maximum speed
 
                 # Define center_bottom velocity
-                center_bottom_vehs = env.k.vehicle.get_ids_by_edge('center_bottom')
-                if len(center_bottom_vehs)>0:
-                    sorted_center_bottom_vehs =sorted(center_bottom_vehs, key=env._get_abs_position)
-                    # center_bottom_velocity = env.k.vehicle.get_speed(sorted_center_bottom_vehs[0])
-                    center_bottom_velocity = sum(env.k.vehicle.get_speed(sorted_center_bottom_vehs)) / len(center_bottom_vehs)
+                center_bottom_stats = env.k.vehicle.get_edge_stats('center_bottom')
+                if center_bottom_stats['count'] > 0:
+                    # center_bottom_velocity = env.k.vehicle.get_speed(center_bottom_stats['rear_id'])
+                    center_bottom_velocity = center_bottom_stats['mean_speed']
                 else:
                     center_bottom_velocity = speed_limit_main # maximum speed
 
                 # Define right_vertical velocity
-                right_vertical_vehs = env.k.vehicle.get_ids_by_edge('right_vertical')
-                if len(right_vertical_vehs)>0:
-                    sorted_right_vertical_vehs = sorted(right_vertical_vehs, key=env._get_abs_position)
-                    # right_vertical_velocity = env.k.vehicle.get_speed(sorted_right_vertical_vehs[0])
-                    right_vertical_velocity = sum(env.k.vehicle.get_speed(sorted_right_vertical_vehs))/ len(right_vertical_vehs)
+                right_vertical_stats = env.k.vehicle.get_edge_stats('right_vertical')
+                if right_vertical_stats['count'] > 0:
+                    # right_vertical_velocity = env.k.vehicle.get_speed(right_vertical_stats['rear_id'])
+                    right_vertical_velocity = right_vertical_stats['mean_speed']
                 else:
                     right_vertical_velocity = speed_limit_sub #maximum speed
 
                 # Define center_up velocity
-                center_up_vehs = env.k.vehicle.get_ids_by_edge('center_up')
-                if len(center_up_vehs)>0:
-                    sorted_center_up_vehs =sorted(center_up_vehs, key=env._get_abs_position)  # The clostest vehicle
-                    # center_up_velocity = env.k.vehicle.get_speed(sorted_center_up_vehs[0])
-                    center_up_velocity = sum(env.k.vehicle.get_speed(sorted_center_up_vehs)) / len(center_up_vehs)
+                center_up_stats = env.k.vehicle.get_edge_stats('center_up')
+                if center_up_stats['count'] > 0:
+                    # center_up_velocity = env.k.vehicle.get_speed(center_up_stats['rear_id'])
+                    center_up_velocity = center_up_stats['mean_speed']
                 else:
                     center_up_velocity = speed_limit_main # maximum speed
 
                 up_velocity = (center_up_velocity + right_vertical_velocity) /2 # average speed
                 down_velocity = (center_bottom_velocity + center_vertical_velocity) /2 # average speed
-                up_queue = len(center_up_vehs) + len(right_vertical_vehs)
-                down_queue = len(center_bottom_vehs) + len(center_vertical_vehs)
+                up_queue = center_up_stats['count'] + right_vertical_stats['count']
+                down_queue = center_bottom_stats['count'] + center_vertical_stats['count']
                 # (np.percentile(outer_velocity, 80) > np.percentile(central_velocity, 80))
                 # if  len(central_vehs) > 3 * len(top_vehs + right_vehs):
 
@@ -498,72 +479,64 @@ class GridBusHumanRouterGreedy(BaseRouter):
                 # Greedy selection
                 
                 # Define left_up velocity
-                left_up_vehs = env.k.vehicle.get_ids_by_edge('left_up')
-                if len(left_up_vehs)>0:
-                    sorted_left_up_vehs =sorted(left_up_vehs, key=env._get_abs_position)
-                    # left_up_velocity = env.k.vehicle.get_speed(sorted_left_up_vehs[0])
-                    left_up_velocity = sum(env.k.vehicle.get_speed(sorted_left_up_vehs)) / len(left_up_vehs)
+                left_up_stats = env.k.vehicle.get_edge_stats('left_up')
+                if left_up_stats['count'] > 0:
+                    # left_up_velocity = env.k.vehicle.get_speed(left_up_stats['rear_id'])
+                    left_up_velocity = left_up_stats['mean_speed']
                 else:
                     left_up_velocity = speed_limit_main #maximum speed
 
                 # Define left_bottom velocity
-                left_bottom_vehs = env.k.vehicle.get_ids_by_edge('left_bottom')
-                if len(left_bottom_vehs)>0:
-                    sorted_left_bottom_vehs =sorted(left_bottom_vehs, key=env._get_abs_position)
-                    # left_bottom_velocity = env.k.vehicle.get_speed(sorted_left_bottom_vehs[0])
-                    left_bottom_velocity = sum(env.k.vehicle.get_speed(sorted_left_bottom_vehs))/ len(left_bottom_vehs)
+                left_bottom_stats = env.k.vehicle.get_edge_stats('left_bottom')
+                if left_bottom_stats['count'] > 0:
+                    # left_bottom_velocity = env.k.vehicle.get_speed(left_bottom_stats['rear_id'])
+                    left_bottom_velocity = left_bottom_stats['mean_speed']
                 else:
                     left_bottom_velocity = speed_limit_main
 
                 # Define left_vertical velocity
-                left_vertical_vehs = env.k.vehicle.get_ids_by_edge('left_vertical')
-                if len(left_vertical_vehs)>0:
-                    sorted_left_vertical_vehs =sorted(left_vertical_vehs, key=env._get_abs_position)
-                    # left_vertical_velocity = env.k.vehicle.get_speed(sorted_left_vertical_vehs[0])
-                    left_vertical_velocity = sum(env.k.vehicle.get_speed(sorted_left_vertical_vehs)) / len(left_vertical_vehs)
+                left_vertical_stats = env.k.vehicle.get_edge_stats('left_vertical')
+                if left_vertical_stats['count'] > 0:
+                    # left_vertical_velocity = env.k.vehicle.get_speed(left_vertical_stats['rear_id'])
+                    left_vertical_velocity = left_vertical_stats['mean_speed']
                 else:
                     left_vertical_velocity = speed_limit_sub
 
                 # Define center_vertical velocity
-                center_vertical_vehs = env.k.vehicle.get_ids_by_edge('center_vertical')
-                if len(center_vertical_vehs)>0:
-                    sorted_center_vertical_vehs =sorted(center_vertical_vehs, key=env._get_abs_position)
-                    # center_vertical_velocity = env.k.vehicle.get_speed(sorted_center_vertical_vehs[0])
-                    center_vertical_velocity = sum(env.k.vehicle.get_speed(sorted_center_vertical_vehs)) / len(center_vertical_vehs)
+                center_vertical_stats = env.k.vehicle.get_edge_stats('center_vertical')
+                if center_vertical_stats['count'] > 0:
+                    # center_vertical_velocity = env.k.vehicle.get_speed(center_vertical_stats['rear_id'])
+                    center_vertical_velocity = center_vertical_stats['mean_speed']
                 else:
                     center_vertical_velocity = speed_limit_extra #maximum speed
 
                 # Define center_bottom velocity
-                center_bottom_vehs = env.k.vehicle.get_ids_by_edge('center_bottom')
-                if len(center_bottom_vehs)>0:
-                    sorted_center_bottom_vehs =sorted(center_bottom_vehs, key=env._get_abs_position)
-                    center_bottom_velocity = env.k.vehicle.get_speed(sorted_center_bottom_vehs[0])
-                    center_bottom_velocity = sum(env.k.vehicle.get_speed(sorted_center_bottom_vehs)) / len(center_bottom_vehs)
+                center_bottom_stats = env.k.vehicle.get_edge_stats('center_bottom')
+                if center_bottom_stats['count'] > 0:
+                    center_bottom_velocity = center_bottom_stats['mean_speed']
                 else:
                     center_bottom_velocity = speed_limit_main #maximum speed
 
                 # Define right_vertical velocity
-                right_vertical_vehs = env.k.vehicle.get_ids_by_edge('right_vertical')
-                if len(right_vertical_vehs)>0:
-                    sorted_right_vertical_vehs =sorted(right_vertical_vehs, key=env._get_abs_position)
-                    # right_vertical_velocity = env.k.vehicle.get_speed(sorted_right_vertical_vehs[0])
-                    right_vertical_velocity = sum(env.k.vehicle.get_speed(sorted_right_vertical_vehs)) / len(right_vertical_vehs)
+                right_vertical_stats = env.k.vehicle.get_edge_stats('right_vertical')
+                if right_vertical_stats['count'] > 0:
+                    # right_vertical_velocity = env.k.vehicle.get_speed(right_vertical_stats['rear_id'])
+                    right_vertical_velocity = right_vertical_stats['mean_speed']
                 else:
                     right_vertical_velocity = speed_limit_sub #maximum speed
 
                 # Define center_up velocity
-                center_up_vehs = env.k.vehicle.get_ids_by_edge('center_up')
-                if len(center_up_vehs)>0:
-                    sorted_center_up_vehs =sorted(center_up_vehs, key=env._get_abs_position)  # The slowest speed
-                    # center_up_velocity = env.k.vehicle.get_speed(sorted_center_up_vehs[0])
-                    center_up_velocity = sum(env.k.vehicle.get_speed(sorted_center_up_vehs)) / len(center_up_vehs)
+                center_up_stats = env.k.vehicle.get_edge_stats('center_up')
+                if center_up_stats['count'] > 0:
+                    # center_up_velocity = env.k.vehicle.get_speed(center_up_stats['rear_id'])
+                    center_up_velocity = center_up_stats['mean_speed']
                 else:
                     center_up_velocity = speed_limit_main # maximum speed
 
                 up_velocity = (left_up_velocity + max(center_up_velocity + right_vertical_velocity, center_vertical_velocity+center_bottom_velocity)) /3 # average speed
                 down_velocity = (left_vertical_velocity + left_bottom_velocity + center_bottom_velocity) /3 # average speed
-                up_queue = len(left_up_vehs) + max(len(center_up_vehs) + len(right_vertical_vehs), len(center_vertical_vehs) + len(center_bottom_vehs))
-                down_queue = len(left_vertical_vehs) + len(left_bottom_vehs) + len(center_bottom_vehs)
+                up_queue = left_up_stats['count'] + max(center_up_stats['count'] + right_vertical_stats['count'], center_vertical_stats['count'] + center_bottom_stats['count'])
+                down_queue = left_vertical_stats['count'] + left_bottom_stats['count'] + center_bottom_stats['count']
                 # (np.percentile(outer_velocity, 80) > np.percentile(central_velocity, 80))
                 # if  len(central_vehs) > 3 * len(top_vehs + right_vehs):
 
@@ -606,45 +579,41 @@ class GridBusHumanRouterGreedy(BaseRouter):
                 # Greedy selection
                 
                 # Define center_vertical velocity
-                center_vertical_vehs = env.k.vehicle.get_ids_by_edge('center_vertical')
-                if len(center_vertical_vehs)>0:
-                    sorted_center_vertical_vehs =sorted(center_vertical_vehs, key=env._get_abs_position)
-                    # center_vertical_velocity = env.k.vehicle.get_speed(sorted_center_vertical_vehs[0])
-                    center_vertical_velocity = sum(env.k.vehicle.get_speed(sorted_center_vertical_vehs)) / len(center_vertical_vehs)
+                center_vertical_stats = env.k.vehicle.get_edge_stats('center_vertical')
+                if center_vertical_stats['count'] > 0:
+                    # center_vertical_velocity = env.k.vehicle.get_speed(center_vertical_stats['rear_id'])
+                    center_vertical_velocity = center_vertical_stats['mean_speed']
                 else:
                     center_vertical_velocity = speed_limit_extra # maximum speed
 
                 # Define center_bottom velocity
-                center_bottom_vehs = env.k.vehicle.get_ids_by_edge('center_bottom')
-                if len(center_bottom_vehs)>0:
-                    sorted_center_bottom_vehs =sorted(center_bottom_vehs, key=env._get_abs_position)
-                    # center_bottom_velocity = env.k.vehicle.get_speed(sorted_center_bottom_vehs[0])
-                    center_bottom_velocity = sum(env.k.vehicle.get_speed(sorted_center_bottom_vehs)) / len(center_bottom_vehs)
+                center_bottom_stats = env.k.vehicle.get_edge_stats('center_bottom')
+                if center_bottom_stats['count'] > 0:
+                    # center_bottom_velocity = env.k.vehicle.get_speed(center_bottom_stats['rear_id'])
+                    center_bottom_velocity = center_bottom_stats['mean_speed']
                 else:
                     center_bottom_velocity = speed_limit_main # maximum speed
 
                 # Define right_vertical velocity
-                right_vertical_vehs = env.k.vehicle.get_ids_by_edge('right_vertical')
-                if len(right_vertical_vehs)>0:
-                    sorted_right_vertical_vehs = sorted(right_vertical_vehs, key=env._get_abs_position)
-                    # right_vertical_velocity = env.k.vehicle.get_speed(sorted_right_vertical_vehs[0])
-                    right_vertical_velocity = sum(env.k.vehicle.get_speed(sorted_right_vertical_vehs))/ len(right_vertical_vehs)
+                right_vertical_stats = env.k.vehicle.get_edge_stats('right_vertical')
+                if right_vertical_stats['count'] > 0:
+                    # right_vertical_velocity = env.k.vehicle.get_speed(right_vertical_stats['rear_id'])
+                    right_vertical_velocity = right_vertical_stats['mean_speed']
                 else:
                     right_vertical_velocity = speed_limit_sub #maximum speed
 
                 # Define center_up velocity
-                center_up_vehs = env.k.vehicle.get_ids_by_edge('center_up')
-                if len(center_up_vehs)>0:
-                    sorted_center_up_vehs =sorted(center_up_vehs, key=env._get_abs_position)  # The clostest vehicle
-                    # center_up_velocity = env.k.vehicle.get_speed(sorted_center_up_vehs[0])
-                    center_up_velocity = sum(env.k.vehicle.get_speed(sorted_center_up_vehs)) / len(center_up_vehs)
+                center_up_stats = env.k.vehicle.get_edge_stats('center_up')
+                if center_up_stats['count'] > 0:
+                    # center_up_velocity = env.k.vehicle.get_speed(center_up_stats['rear_id'])
+                    center_up_velocity = center_up_stats['mean_speed']
                 else:
                     center_up_velocity = speed_limit_main # maximum speed
 
                 up_velocity = (center_up_velocity + right_vertical_velocity) /2 # average speed
                 down_velocity = (center_bottom_velocity + center_vertical_velocity) /2 # average speed
-                up_queue = len(center_up_vehs) + len(right_vertical_vehs)
-                down_queue = len(center_bottom_vehs) + len(center_vertical_vehs)
+                up_queue = center_up_stats['count'] + right_vertical_stats['count']
+                down_queue = center_bottom_stats['count'] + center_vertical_stats['count']
                 # (np.percentile(outer_velocity, 80) > np.percentile(central_velocity, 80))
                 # if  len(central_vehs) > 3 * len(top_vehs + right_vehs):
 
@@ -703,26 +672,24 @@ class RingBusHumanRouter20SitAware(BaseRouter):
             #Greedy selection
             
             # Define central velocity
-            central_vehs = env.k.vehicle.get_ids_by_edge('central')
-            top_vehs = env.k.vehicle.get_ids_by_edge('top')
-            right_vehs = env.k.vehicle.get_ids_by_edge('right') + env.k.vehicle.get_ids_by_edge(':right_0')
+            central_stats = env.k.vehicle.get_edge_stats('central')
+            top_stats = env.k.vehicle.get_edge_stats('top')
+            right_stats = env.k.vehicle.get_edge_stats(['right', ':right_0'])
             right_pos = 10001
-            if len(right_vehs)>0:
-                sorted_right_vehs =sorted(right_vehs, key=env._get_abs_position)
-                # right_velocity = env.k.vehicle.get_speed(sorted_right_vehs[0])
-                right_avg_vel = np.mean(env.k.vehicle.get_speed(right_vehs))
-                right_pos = env.k.vehicle.get_position(sorted_right_vehs[0])
+            if right_stats['count'] > 0:
+                # right_velocity = env.k.vehicle.get_speed(right_stats['rear_id'])
+                right_avg_vel = right_stats['mean_speed']
+                right_pos = right_stats['rear_position']
             else:
                 right_velocity = 30 #maximum speed
                 right_avg_vel = 30
 
             central_pos = 10001
-            if len(central_vehs)>0:
-                sorted_central_vehs =sorted(central_vehs, key=env._get_abs_position)
-                # central_velocity = env.k.vehicle.get_speed(sorted_central_vehs[0])
-                central_avg_vel = np.mean(env.k.vehicle.get_speed(central_vehs))
-                central_pos = env.k.vehicle.get_position(sorted_central_vehs[0])
-                # print(f'central: pos {env.k.vehicle.get_position(sorted_central_vehs[0])}, speed {central_velocity}')
+            if central_stats['count'] > 0:
+                # central_velocity = env.k.vehicle.get_speed(central_stats['rear_id'])
+                central_avg_vel = central_stats['mean_speed']
+                central_pos = central_stats['rear_position']
+                # print(f'central: pos {central_stats['rear_position']}, speed {central_velocity}')
             else:
                 central_velocity = 30 #maximum speed
                 central_avg_vel = 30
@@ -731,8 +698,8 @@ class RingBusHumanRouter20SitAware(BaseRouter):
             
             # print(f'right velocity: {right_velocity}, central velocity: {central_velocity}')
             if np.random.uniform(0,1,1)[0] <= prob:
-                # if (len(top_vehs) + len(right_vehs) < tolerance * len(central_vehs)) and not (leader_speed <2 and leader_next_edge == 'right'):
-                if (right_avg_vel > central_avg_vel and right_pos > central_pos) and (len(top_vehs) + len(right_vehs) < len(central_vehs)):
+                # if (top_stats['count'] + right_stats['count'] < tolerance * central_stats['count']) and not (leader_speed <2 and leader_next_edge == 'right'):
+                if (right_avg_vel > central_avg_vel and right_pos > central_pos) and (top_stats['count'] + right_stats['count'] < central_stats['count']):
                     next_route = ['right','top'] # do not go central
                 else:
                     next_route = ['right','central']
@@ -771,36 +738,33 @@ class RingBusHumanRouter100SitAware(BaseRouter):
             #Greedy selection
             
             # Define central velocity
-            central_vehs = env.k.vehicle.get_ids_by_edge('central')
-            top_vehs = env.k.vehicle.get_ids_by_edge('top')
-            right_vehs = env.k.vehicle.get_ids_by_edge('right') + env.k.vehicle.get_ids_by_edge(':right_0')
+            central_stats = env.k.vehicle.get_edge_stats('central')
+            top_stats = env.k.vehicle.get_edge_stats('top')
+            right_stats = env.k.vehicle.get_edge_stats(['right', ':right_0'])
             right_pos = 10001
-            if len(right_vehs)>0:
-                sorted_right_vehs =sorted(right_vehs, key=env._get_abs_position)
-                # right_velocity = env.k.vehicle.get_speed(sorted_right_vehs[0])
-                right_avg_vel = np.mean(env.k.vehicle.get_speed(right_vehs))
-                right_pos = env.k.vehicle.get_position(sorted_right_vehs[0])
+            if right_stats['count'] > 0:
+                # right_velocity = env.k.vehicle.get_speed(right_stats['rear_id'])
+                right_avg_vel = right_stats['mean_speed']
+                right_pos = right_stats['rear_position']
             else:
                 right_velocity = 30 #maximum speed
                 right_avg_vel = 30
 
             central_pos = 10001
-            if len(central_vehs)>0:
-                sorted_central_vehs =sorted(central_vehs, key=env._get_abs_position)
-                # central_velocity = env.k.vehicle.get_speed(sorted_central_vehs[0])
-                central_avg_vel = np.mean(env.k.vehicle.get_speed(central_vehs))
-                central_pos = env.k.vehicle.get_position(sorted_central_vehs[0])
-                # print(f'central: pos {env.k.vehicle.get_position(sorted_central_vehs[0])}, speed {central_velocity}')
+            if central_stats['count'] > 0:
+                # central_velocity = env.k.vehicle.get_speed(central_stats['rear_id'])
+                central_avg_vel = central_stats['mean_speed']
+                central_pos = central_stats['rear_position']
+                # print(f'central: pos {central_stats['rear_position']}, speed {central_velocity}')
             else:
                 central_velocity = 30 #maximum speed
                 central_avg_vel = 30
 
-            if len(top_vehs)>0:
-                sorted_top_vehs =sorted(top_vehs, key=env._get_abs_position)
-                # central_velocity = env.k.vehicle.get_speed(sorted_central_vehs[0])
-                top_avg_vel = np.mean(env.k.vehicle.get_speed(top_vehs))
-                # central_pos = env.k.vehicle.get_position(sorted_central_vehs[0])
-                # print(f'central: pos {env.k.vehicle.get_position(sorted_central_vehs[0])}, speed {central_velocity}')
+            if top_stats['count'] > 0:
+                # central_velocity = env.k.vehicle.get_speed(central_stats['rear_id'])
+                top_avg_vel = top_stats['mean_speed']
+                # central_pos = central_stats['rear_position']
+                # print(f'central: pos {central_stats['rear_position']}, speed {central_velocity}')
             else:
                 # central_velocity = 30 #maximum speed
                 top_avg_vel = 30
@@ -809,9 +773,9 @@ class RingBusHumanRouter100SitAware(BaseRouter):
             # print(f'top: {top_avg_vel}, right: {right_avg_vel}, central: {central_avg_vel}')
             # print(f'right velocity: {right_velocity}, central velocity: {central_velocity}')
             if np.random.uniform(0,1,1)[0] <= prob:
-                # if (len(top_vehs) + len(right_vehs) < tolerance * len(central_vehs)) and not (leader_speed <2 and leader_next_edge == 'right'):
-                # if (right_avg_vel > central_avg_vel and right_pos > central_pos) and (len(top_vehs) + len(right_vehs) < len(central_vehs)):
-                # if (top_avg_vel > central_avg_vel ) & (right_avg_vel > central_avg_vel) & ((len(top_vehs) + len(right_vehs)) < len(central_vehs)):
+                # if (top_stats['count'] + right_stats['count'] < tolerance * central_stats['count']) and not (leader_speed <2 and leader_next_edge == 'right'):
+                # if (right_avg_vel > central_avg_vel and right_pos > central_pos) and (top_stats['count'] + right_stats['count'] < central_stats['count']):
+                # if (top_avg_vel > central_avg_vel ) & (right_avg_vel > central_avg_vel) & ((top_stats['count'] + right_stats['count']) < central_stats['count']):
                 if (top_avg_vel > central_avg_vel ) & (right_avg_vel > central_avg_vel):
                     next_route = ['right','top'] # do not go central
                 else:
@@ -851,26 +815,24 @@ class RingBusHumanRouterCentralQueue(BaseRouter):
             #Greedy selection
             
             # Define central velocity
-            central_vehs = env.k.vehicle.get_ids_by_edge('central')
-            top_vehs = env.k.vehicle.get_ids_by_edge('top')
-            right_vehs = env.k.vehicle.get_ids_by_edge('right') + env.k.vehicle.get_ids_by_edge(':right_0')
+            central_stats = env.k.vehicle.get_edge_stats('central')
+            top_stats = env.k.vehicle.get_edge_stats('top')
+            right_stats = env.k.vehicle.get_edge_stats(['right', ':right_0'])
             right_pos = 10001
-            if len(right_vehs)>0:
-                sorted_right_vehs =sorted(right_vehs, key=env._get_abs_position)
-                # right_velocity = env.k.vehicle.get_speed(sorted_right_vehs[0])
-                right_avg_vel = np.mean(env.k.vehicle.get_speed(right_vehs))
-                right_pos = env.k.vehicle.get_position(sorted_right_vehs[0])
+            if right_stats['count'] > 0:
+                # right_velocity = env.k.vehicle.get_speed(right_stats['rear_id'])
+                right_avg_vel = right_stats['mean_speed']
+                right_pos = right_stats['rear_position']
             else:
                 right_velocity = 30 #maximum speed
                 right_avg_vel = 30
 
             central_pos = 10001
-            if len(central_vehs)>0:
-                sorted_central_vehs =sorted(central_vehs, key=env._get_abs_position)
-                # central_velocity = env.k.vehicle.get_speed(sorted_central_vehs[0])
-                central_avg_vel = np.mean(env.k.vehicle.get_speed(central_vehs))
-                central_pos = env.k.vehicle.get_position(sorted_central_vehs[0])
-                # print(f'central: pos {env.k.vehicle.get_position(sorted_central_vehs[0])}, speed {central_velocity}')
+            if central_stats['count'] > 0:
+                # central_velocity = env.k.vehicle.get_speed(central_stats['rear_id'])
+                central_avg_vel = central_stats['mean_speed']
+                central_pos = central_stats['rear_position']
+                # print(f'central: pos {central_stats['rear_position']}, speed {central_velocity}')
             else:
                 central_velocity = 30 #maximum speed
                 central_avg_vel = 30
@@ -879,8 +841,8 @@ class RingBusHumanRouterCentralQueue(BaseRouter):
             
             # print(f'right velocity: {right_velocity}, central velocity: {central_velocity}')
             if np.random.uniform(0,1,1)[0] <= prob:
-                # if (len(top_vehs) + len(right_vehs) < tolerance * len(central_vehs)) and not (leader_speed <2 and leader_next_edge == 'right'):
-                if (right_avg_vel > central_avg_vel and right_pos > central_pos) and (len(top_vehs) + len(right_vehs) < len(central_vehs)):
+                # if (top_stats['count'] + right_stats['count'] < tolerance * central_stats['count']) and not (leader_speed <2 and leader_next_edge == 'right'):
+                if (right_avg_vel > central_avg_vel and right_pos > central_pos) and (top_stats['count'] + right_stats['count'] < central_stats['count']):
                     next_route = ['bottom','right'] # do not go central
                 else:
                     next_route = ['bottom','central']
@@ -1011,6 +973,8 @@ class GridRouter(BaseRouter):
     See base class for usage example.
     """
 
+    trigger_edges = ()
+
     def choose_route(self, env):
         """See parent class."""
         if len(env.k.vehicle.get_route(self.veh_id)) == 0:
@@ -1034,6 +998,9 @@ class BayBridgeRouter(ContinuousRouter):
     See base class for usage example.
     """
 
+    # vehicles are rerouted when they change lanes on these edges
+    trigger_edges = ("183343422", "124952179")
+
     def choose_route(self, env):
         """See parent class."""
         edge = env.k.vehicle.get_edge(self.veh_id)
@@ -1058,6 +1025,9 @@ class I210Router(ContinuousRouter):
     See base class for usage example.
     """
 
+    # vehicles are rerouted when they change lanes on this edge
+    trigger_edges = ("119257908#1-AddedOffRampEdge",)
+
     def choose_route(self, env):
         """See parent class."""
         edge = env.k.vehicle.get_edge(self.veh_id)
@@ -1,11 +1,13 @@
 """Script containing the Flow kernel object for interacting with simulators."""
 
 import warnings
+from traci.exceptions import FatalTraCIError, TraCIException
 from flow.core.kernel.simulation import TraCISimulation, AimsunKernelSimulation
 from flow.core.kernel.network import TraCIKernelNetwork, AimsunKernelNetwork
 from flow.core.kernel.vehicle import TraCIVehicle, AimsunKernelVehicle
 from flow.core.kernel.traffic_light import TraCITrafficLight, \
     AimsunKernelTrafficLight
+from flow.core.profiler import NULL_PROFILER
 from flow.utils.exceptions import FatalFlowError
 
 
@@ -43,6 +45,22 @@ class Kernel(object):
 
     These subclasses can be modified and recycled to support various different
     traffic simulators, e.g. SUMO, AIMSUN, TruckSim, etc...
+
+    SUMO may be interfaced with through either a TraCI socket connection
+    ("traci") or the libsumo bindings ("libsumo"). The latter runs SUMO within
+    the Python process, and the vehicle, network, and traffic light kernels
+    remain unchanged as libsumo exposes the same API as TraCI. Note that
+    libsumo only supports one simulation per process, and does not support
+    sumo-gui.
+
+    Attributes
+    ----------
+    api_errors : tuple of type
+        exceptions that may be raised by the kernel API when a command to the
+        simulator fails
+    profiler : flow.core.profiler.StepProfiler
+        profiler measuring the duration of the update of every subclass. This
+        is set by the environment, and does not measure anything by default.
     """
 
     def __init__(self, simulator, sim_params):
@@ -51,22 +69,40 @@ class Kernel(object):
         Parameters
         ----------
         simulator : str
-            simulator type, must be one of {"traci"}
+            simulator type, must be one of {"traci", "libsumo", "aimsun"}
         sim_params : flow.core.params.SimParams
             simulation-specific parameters
 
         Raises
         ------
         flow.utils.exceptions.FatalFlowError
-            if the specified input simulator is not a valid type
+            if the specified input simulator is not a valid type, or if
+            "libsumo" is requested but the libsumo bindings are not installed
         """
         self.kernel_api = None
+        self.api_errors = (FatalTraCIError, TraCIException)
+        self.profiler = NULL_PROFILER
 
         if simulator == "traci":
             self.simulation = TraCISimulation(self)
             self.network = TraCIKernelNetwork(self, sim_params)
             self.vehicle = TraCIVehicle(self, sim_params)
-            self.traffic_light = TraCITrafficLight(self)
+            self.traffic_light = TraCITrafficLight(self, sim_params)
+        elif simulator == "libsumo":
+            # libsumo is only imported if requested, as importing it patches
+            # some of the exception classes of the traci package
+            try:
+                import libsumo
+            except ImportError:
+                raise FatalFlowError(
+                    'Simulator type "libsumo" requires the libsumo python '
+                    'bindings. Install them via "pip install libsumo".')
+            self.api_errors += (libsumo.FatalTraCIError,
+                                libsumo.TraCIException)
+            self.simulation = TraCISimulation(self, libsumo=libsumo)
+            self.network = TraCIKernelNetwork(self, sim_params)
+            self.vehicle = TraCIVehicle(self, sim_params)
+            self.traffic_light = TraCITrafficLight(self, sim_params)
         elif simulator == 'aimsun':
             self.simulation = AimsunKernelSimulation(self)
             self.network = AimsunKernelNetwork(self, sim_params)
@@ -98,10 +134,21 @@ class Kernel(object):
             specifies whether the simulator was reset in the last simulation
             step
         """
+        self.profiler.begin("vehicle_update")
         self.vehicle.update(reset)
+        self.profiler.end()
+
+        self.profiler.begin("traffic_light_update")
         self.traffic_light.update(reset)
+        self.profiler.end()
+
+        self.profiler.begin("network_update")
         self.network.update(reset)
+        self.profiler.end()
+
+        self.profiler.begin("simulation_update")
         self.simulation.update(reset)
+        self.profiler.end()
 
     def close(self):
         """Terminate all components within the simulation and network."""
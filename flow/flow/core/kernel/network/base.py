@@ -187,6 +187,48 @@ class BaseKernelNetwork(object):
         """
         raise NotImplementedError
 
+    def get_edge_many(self, xs):
+        """Compute the edges and relative positions of absolute positions.
+
+        Parameters
+        ----------
+        xs : array_like
+            absolute positions in network
+
+        Returns
+        -------
+        list of str
+            name of the edge of every position, None if the position is not
+            on any edge
+        np.ndarray
+            relative position on the edge of every position, NaN if the
+            position is not on any edge
+        """
+        edges, positions = [], []
+        for x in xs:
+            edge = self.get_edge(x)
+            edges.append(None if edge is None else edge[0])
+            positions.append(np.nan if edge is None else edge[1])
+        return edges, np.array(positions, dtype=float)
+
+    def get_x_many(self, edges, positions):
+        """Return the absolute positions of several positions on edges.
+
+        Parameters
+        ----------
+        edges : list of str
+            names of the edges
+        positions : array_like
+            relative positions on the edges
+
+        Returns
+        -------
+        np.ndarray
+            position of every element with respect to some global reference
+        """
+        return np.array([self.get_x(edge, pos)
+                         for edge, pos in zip(edges, positions)], dtype=float)
+
     def next_edge(self, edge, lane):
         """Return the next edge/lane pair from the given edge/lane.
 
@@ -0,0 +1,160 @@
+"""Script containing the geometry index of a network."""
+from bisect import bisect_right
+
+import numpy as np
+
+
+class NetworkIndex(object):
+    """Immutable index of the geometry of a network.
+
+    The index is built once the network is generated, and is used to convert
+    positions on edges to absolute positions in the network (and vice versa)
+    without iterating over the edges of the network. Every edge is assigned an
+    integer, which indexes NumPy arrays of the properties of the edges.
+
+    Attributes
+    ----------
+    edge_ids : list of str
+        names of the edges and junctions of the network. The integer assigned
+        to an edge is its index in this list.
+    edge_index : dict <str, int>
+        integer assigned to every edge
+    lengths : np.ndarray
+        length of every edge
+    num_lanes : np.ndarray
+        number of lanes of every edge
+    speed_limits : np.ndarray
+        speed limit of every edge
+    starts : np.ndarray
+        absolute positions at which the edges of ``total_edgestarts`` start,
+        in increasing order
+    start_edges : list of str
+        names of the edges starting at every element of ``starts``
+    """
+
+    def __init__(self, edges, total_edgestarts, total_edgestarts_dict,
+                 internal_edgestarts_dict):
+        """Instantiate the index.
+
+        Parameters
+        ----------
+        edges : dict <str, dict>
+            length, number of lanes, and speed limit of every edge and junction
+            of the network
+        total_edgestarts : list of (str, float)
+            the edges and junctions of the network along with their starting
+            positions, sorted by position
+        total_edgestarts_dict : dict <str, float>
+            starting position of every edge and junction of the network
+        internal_edgestarts_dict : dict <str, float>
+            starting position of every junction of the network
+        """
+        self.edge_ids = list(edges.keys())
+        self.edge_index = {edge: i for i, edge in enumerate(self.edge_ids)}
+        self.lengths = np.array(
+            [edges[edge]['length'] for edge in self.edge_ids], dtype=float)
+        self.num_lanes = np.array(
+            [edges[edge]['lanes'] for edge in self.edge_ids], dtype=int)
+        self.speed_limits = np.array(
+            [edges[edge]['speed'] for edge in self.edge_ids], dtype=float)
+
+        self.starts = np.array(
+            [start for _, start in total_edgestarts], dtype=float)
+        self.start_edges = [edge for edge, _ in total_edgestarts]
+        self._starts = self.starts.tolist()
+
+        # position at which every edge starts, as used by get_x. Junctions
+        # are looked up in the positions of internal edges only.
+        self._x_starts = {
+            edge: start for edge, start in total_edgestarts_dict.items()
+            if edge[0] != ':'}
+        self._x_starts.update(internal_edgestarts_dict)
+        self._total_edgestarts_dict = total_edgestarts_dict
+
+    def get_edge(self, x):
+        """Compute an edge and relative position from an absolute position.
+
+        See flow.core.kernel.network.base.BaseKernelNetwork.get_edge. None is
+        returned if the position is before the start of the first edge.
+        """
+        i = bisect_right(self._starts, x) - 1
+        if i < 0 or not x >= self._starts[i]:
+            return None
+        return self.start_edges[i], x - self._starts[i]
+
+    def get_x(self, edge, position):
+        """Return the absolute position on the network.
+
+        See flow.core.kernel.network.base.BaseKernelNetwork.get_x.
+        """
+        start = self._x_starts.get(edge)
+        if start is not None:
+            return start + position
+
+        # if there was a collision which caused the vehicle to disappear,
+        # return an x value of -1001
+        if len(edge) == 0:
+            return -1001
+
+        if edge[0] == ':':
+            # in case several internal links are being generalized for by a
+            # single element (for backwards compatibility)
+            edge_name = edge.rsplit('_', 1)[0]
+            return self._total_edgestarts_dict.get(edge_name, -1001)
+
+        raise KeyError(edge)
+
+    def get_edge_many(self, xs):
+        """Compute the edges and relative positions of absolute positions.
+
+        Parameters
+        ----------
+        xs : array_like
+            absolute positions in the network
+
+        Returns
+        -------
+        list of str
+            name of the edge of every position, None if the position is before
+            the start of the first edge
+        np.ndarray
+            relative position on the edge of every position, NaN if the
+            position is before the start of the first edge
+        """
+        xs = np.asarray(xs, dtype=float)
+        indices = np.searchsorted(self.starts, xs, side='right') - 1
+        valid = indices >= 0
+        starts = self.starts[np.maximum(indices, 0)]
+        valid &= xs >= starts
+
+        positions = np.where(valid, xs - starts, np.nan)
+        edges = [self.start_edges[i] if v else None
+                 for i, v in zip(indices.tolist(), valid.tolist())]
+        return edges, positions
+
+    def get_x_many(self, edges, positions):
+        """Return the absolute positions of several positions on edges.
+
+        Parameters
+        ----------
+        edges : list of str
+            names of the edges
+        positions : array_like
+            relative positions on the edges
+
+        Returns
+        -------
+        np.ndarray
+            position of every element with respect to some global reference,
+            as returned by ``get_x``
+        """
+        positions = np.asarray(positions, dtype=float)
+        starts = np.fromiter(
+            (self._x_starts.get(edge, np.nan) for edge in edges),
+            dtype=float, count=len(edges))
+        xs = starts + positions
+
+        # edges that are not indexed are handled one at a time
+        for i in np.flatnonzero(np.isnan(starts)):
+            xs[i] = self.get_x(edges[i], positions[i].item())
+        return xs
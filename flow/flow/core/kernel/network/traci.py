@@ -2,10 +2,16 @@
 import tempfile
 
 from flow.core.kernel.network import BaseKernelNetwork
+from flow.core.kernel.network.index import NetworkIndex
 from flow.core.util import makexml, printxml, ensure_dir
 import time
 import os
 import subprocess
+import fcntl
+import hashlib
+import json
+import pickle
+import shutil
 import xml.etree.ElementTree as ElementTree
 from lxml import etree
 from copy import deepcopy
@@ -16,6 +22,11 @@ E = etree.Element
 RETRIES_ON_ERROR = 10
 # number of seconds to wait before trying to access the .net.xml file again
 WAIT_ON_ERROR = 1
+# directory in which generated networks are cached, see `generate_net`
+CACHE_PATH = os.path.join(tempfile.gettempdir(), 'flow/cache/net/')
+# version of the format of the cached networks. Incrementing it invalidates
+# all existing cache entries.
+CACHE_VERSION = 1
 
 
 def _flow(name, vtype, route, **kwargs):
@@ -31,6 +42,14 @@ def _inputs(net=None, rou=None, add=None, gui=None):
     return inp
 
 
+def _netconvert_version():
+    """Return an identifier of the installed netconvert binary."""
+    path = shutil.which('netconvert')
+    if path is None:
+        return ''
+    return '{}:{}'.format(path, os.stat(path).st_mtime)
+
+
 class TraCIKernelNetwork(BaseKernelNetwork):
     """Base network kernel for sumo-based simulations.
 
@@ -82,6 +101,7 @@ class TraCIKernelNetwork(BaseKernelNetwork):
         self.__non_internal_length = None  # total length of non-internal edges
         self.rts = None
         self.cfg = None
+        self.index = None
 
     def generate_network(self, network):
         """See parent class.
@@ -190,6 +210,12 @@ class TraCIKernelNetwork(BaseKernelNetwork):
 
         self.total_edgestarts_dict = dict(self.total_edgestarts)
 
+        # index used to locate positions in the network
+        self.index = NetworkIndex(self._edges,
+                                  self.total_edgestarts,
+                                  self.total_edgestarts_dict,
+                                  self.internal_edgestarts_dict)
+
         self.__length = sum(
             self._edges[edge_id]['length'] for edge_id in self._edges
         )
@@ -245,27 +271,19 @@ class TraCIKernelNetwork(BaseKernelNetwork):
 
     def get_edge(self, x):
         """See parent class."""
-        for (edge, start_pos) in reversed(self.total_edgestarts):
-            if x >= start_pos:
-                return edge, x - start_pos
+        return self.index.get_edge(x)
 
     def get_x(self, edge, position):
         """See parent class."""
-        # if there was a collision which caused the vehicle to disappear,
-        # return an x value of -1001
-        if len(edge) == 0:
-            return -1001
+        return self.index.get_x(edge, position)
 
-        if edge[0] == ':':
-            try:
-                return self.internal_edgestarts_dict[edge] + position
-            except KeyError:
-                # in case several internal links are being generalized for
-                # by a single element (for backwards compatibility)
-                edge_name = edge.rsplit('_', 1)[0]
-                return self.total_edgestarts_dict.get(edge_name, -1001)
-        else:
-            return self.total_edgestarts_dict[edge] + position
+    def get_edge_many(self, xs):
+        """See parent class."""
+        return self.index.get_edge_many(xs)
+
+    def get_x_many(self, edges, positions):
+        """See parent class."""
+        return self.index.get_x_many(edges, positions)
 
     def edge_length(self, edge_id):
         """See parent class."""
@@ -424,10 +442,13 @@ class TraCIKernelNetwork(BaseKernelNetwork):
 
         # xml file for nodes; contains nodes for the boundary points with
         # respect to the x and y axes
+        # xml files to generate, as (file name, xml element) pairs
+        net_files = []
+
         x = makexml('nodes', 'http://sumo.dlr.de/xsd/nodes_file.xsd')
         for node_attributes in nodes:
             x.append(E('node', **node_attributes))
-        printxml(x, self.net_path + self.nodfn)
+        net_files.append((self.nodfn, x))
 
         # modify the length, shape, numLanes, and speed values
         for edge in edges:
@@ -447,7 +468,7 @@ class TraCIKernelNetwork(BaseKernelNetwork):
         x = makexml('edges', 'http://sumo.dlr.de/xsd/edges_file.xsd')
         for edge_attributes in edges:
             x.append(E('edge', attrib=edge_attributes))
-        printxml(x, self.net_path + self.edgfn)
+        net_files.append((self.edgfn, x))
 
         # xml file for types: contains the the number of lanes and the speed
         # limit for the lanes
@@ -462,7 +483,7 @@ class TraCIKernelNetwork(BaseKernelNetwork):
             x = makexml('types', 'http://sumo.dlr.de/xsd/types_file.xsd')
             for type_attributes in types:
                 x.append(E('type', **type_attributes))
-            printxml(x, self.net_path + self.typfn)
+            net_files.append((self.typfn, x))
 
         # xml for connections: specifies which lanes connect to which in the
         # edges
@@ -480,7 +501,7 @@ class TraCIKernelNetwork(BaseKernelNetwork):
                 if 'signal_group' in connection_attributes:
                     del connection_attributes['signal_group']
                 x.append(E('connection', **connection_attributes))
-            printxml(x, self.net_path + self.confn)
+            net_files.append((self.confn, x))
 
         # xml file for configuration, which specifies:
         # - the location of all files of interest for sumo
@@ -503,28 +524,117 @@ class TraCIKernelNetwork(BaseKernelNetwork):
         t.append(E('no-internal-links', value='false'))
         t.append(E('no-turnarounds', value='true'))
         x.append(t)
-        printxml(x, self.net_path + self.cfgfn)
+        net_files.append((self.cfgfn, x))
+
+        # options passed to netconvert in addition to the configuration file
+        options = ' --no-internal-links="false"'
+
+        def build():
+            for fn, x in net_files:
+                printxml(x, self.net_path + fn)
+
+            subprocess.call(
+                [
+                    'netconvert -c ' + self.net_path + self.cfgfn +
+                    ' --output-file=' + self.cfg_path + self.netfn + options
+                ],
+                stdout=subprocess.DEVNULL,
+                shell=True)
+
+            # collect data from the generated network configuration file
+            error = None
+            for _ in range(RETRIES_ON_ERROR):
+                try:
+                    edges_dict, conn_dict = self._import_edges_from_net(
+                        net_params)
+                    return edges_dict, conn_dict
+                except Exception as e:
+                    print('Error during start: {}'.format(e))
+                    print('Retrying in {} seconds...'.format(WAIT_ON_ERROR))
+                    time.sleep(WAIT_ON_ERROR)
+            raise error
+
+        if not getattr(self.sim_params, "network_cache", False):
+            return build()
+
+        # the network configuration file is not part of the key, as it
+        # contains the name of the network
+        key = hashlib.sha256()
+        key.update(str(CACHE_VERSION).encode())
+        key.update(_netconvert_version().encode())
+        key.update(options.encode())
+        for fn, x in net_files:
+            if fn != self.cfgfn:
+                key.update(fn[len(self.network.name):].encode())
+                key.update(etree.tostring(x))
+        x = dict(net_files)[self.cfgfn]
+        key.update(etree.tostring(x.find('processing')))
+        key.update(json.dumps(traffic_lights.get_properties(),
+                              sort_keys=True, default=str).encode())
+
+        return self._cached_net(key.hexdigest(), build)
+
+    def _cached_net(self, key, build):
+        """Return a generated network, using the cache if possible.
+
+        The .net.xml file and the edge and connection data of every generated
+        network are stored in a directory of ``CACHE_PATH`` named after a hash
+        of all the inputs to netconvert. The network is only generated if no
+        such directory exists. A file lock ensures that a network is generated
+        only once if several processes request it at the same time.
 
-        subprocess.call(
-            [
-                'netconvert -c ' + self.net_path + self.cfgfn +
-                ' --output-file=' + self.cfg_path + self.netfn +
-                ' --no-internal-links="false"'
-            ],
-            stdout=subprocess.DEVNULL,
-            shell=True)
+        Parameters
+        ----------
+        key : str
+            hash of the inputs of the network
+        build : callable
+            function generating the .net.xml file of the network and returning
+            its edge and connection data
 
-        # collect data from the generated network configuration file
-        error = None
-        for _ in range(RETRIES_ON_ERROR):
-            try:
-                edges_dict, conn_dict = self._import_edges_from_net(net_params)
-                return edges_dict, conn_dict
-            except Exception as e:
-                print('Error during start: {}'.format(e))
-                print('Retrying in {} seconds...'.format(WAIT_ON_ERROR))
-                time.sleep(WAIT_ON_ERROR)
-        raise error
+        Returns
+        -------
+        edges : dict <dict>
+            see ``generate_net``
+        connection_data : dict < dict < list < (edge, pos) > > >
+            see ``generate_net``
+        """
+        cache_dir = ensure_dir(os.path.join(CACHE_PATH, key))
+        net_file = os.path.join(cache_dir, 'net.xml')
+        data_file = os.path.join(cache_dir, 'data.pkl')
+
+        # entries are complete once the data file exists, since it is written
+        # last, so they can be read without acquiring the lock
+        data = self._load_cached_net(net_file, data_file)
+        if data is not None:
+            return data
+
+        with open(os.path.join(cache_dir, 'lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            # the network may have been generated while waiting for the lock
+            data = self._load_cached_net(net_file, data_file)
+            if data is not None:
+                return data
+
+            data = build()
+
+            shutil.copyfile(self.cfg_path + self.netfn, net_file + '.tmp')
+            os.replace(net_file + '.tmp', net_file)
+            with open(data_file + '.tmp', 'wb') as f:
+                pickle.dump(data, f)
+            os.replace(data_file + '.tmp', data_file)
+
+        return data
+
+    def _load_cached_net(self, net_file, data_file):
+        """Copy a cached .net.xml file and return its data, if it exists."""
+        try:
+            with open(data_file, 'rb') as f:
+                data = pickle.load(f)
+            shutil.copyfile(net_file, self.cfg_path + self.netfn)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return data
 
     def generate_net_from_osm(self, net_params):
         """Generate .net.xml files from OpenStreetMap files.
@@ -0,0 +1,322 @@
+"""Script containing the streaming recorder of emission data."""
+import csv
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import warnings
+
+from flow.core.trace import TraceWriter
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+# Name and type of every field that can be stored in the emission file, in the
+# order of the columns of the file. The type is used by the Parquet schema.
+FIELDS = [
+    ("time", "float"),
+    ("id", "string"),
+    ("x", "float"),
+    ("y", "float"),
+    ("speed", "float"),
+    ("headway", "float"),
+    ("leader_id", "string"),
+    ("target_accel_with_noise_with_failsafe", "float"),
+    ("target_accel_no_noise_no_failsafe", "float"),
+    ("target_accel_with_noise_no_failsafe", "float"),
+    ("target_accel_no_noise_with_failsafe", "float"),
+    ("realized_accel", "float"),
+    ("road_grade", "float"),
+    ("edge_id", "string"),
+    ("lane_number", "int"),
+    ("distance", "float"),
+    ("relative_position", "float"),
+    ("follower_id", "string"),
+    ("leader_rel_speed", "float"),
+]
+
+# names of the fields that are always stored
+INDEX_FIELDS = ["time", "id"]
+
+# names of the fields that can be selected
+DATA_FIELDS = [name for name, _ in FIELDS if name not in INDEX_FIELDS]
+
+# number of rows at which buffered data is passed to the writer thread
+CHUNK_SIZE = 10000
+
+# maximum number of chunks waiting to be written. Recording blocks once this
+# limit is reached, so that memory usage stays bounded if writing is slow.
+MAX_PENDING_CHUNKS = 4
+
+
+class EmissionRecorder(object):
+    """Streaming, columnar recorder of the emission data of a simulation.
+
+    The data of every simulation step is stored as one list per field. Once
+    enough rows are buffered, they are handed to a background thread that
+    appends them to a temporary file, so that only a bounded number of rows
+    is ever kept in memory. The file is moved to its final location when
+    ``save`` is called.
+
+    Data is written to csv files, to Parquet files if requested and pyarrow
+    is installed, or to binary rollout traces (see flow/core/trace.py), which
+    can be read with memory-mapping.
+
+    Attributes
+    ----------
+    directory : str
+        folder in which the emission files are created
+    fields : list of str
+        names of the columns of the emission file, including time and id
+    file_format : str
+        format of the emission files, "csv", "parquet" or "trace"
+    chunk_size : int
+        number of rows at which buffered data is written
+    """
+
+    def __init__(self,
+                 directory,
+                 fields=None,
+                 file_format="csv",
+                 chunk_size=CHUNK_SIZE):
+        """Instantiate the recorder.
+
+        Parameters
+        ----------
+        directory : str
+            folder in which the emission files are created
+        fields : list of str, optional
+            fields to store in addition to the time and vehicle id, see
+            ``DATA_FIELDS``. All fields are stored by default.
+        file_format : str, optional
+            format of the emission files, "csv", "parquet" or "trace". Falls
+            back to "csv" if "parquet" is requested and pyarrow is not
+            installed.
+        chunk_size : int, optional
+            number of rows at which buffered data is written
+
+        Raises
+        ------
+        ValueError
+            if an unknown field or format is requested
+        """
+        if fields is None:
+            fields = DATA_FIELDS
+        for field in fields:
+            if field not in DATA_FIELDS:
+                raise ValueError("Unknown emission field: {}".format(field))
+        if file_format not in ("csv", "parquet", "trace"):
+            raise ValueError(
+                "Unknown emission format: {}".format(file_format))
+        if file_format == "parquet" and pa is None:
+            warnings.warn("pyarrow is not installed, emission data is saved "
+                          "to csv files instead.")
+            file_format = "csv"
+
+        self.directory = directory
+        self.fields = INDEX_FIELDS + [
+            name for name in DATA_FIELDS if name in fields]
+        self.file_format = file_format
+        self.chunk_size = chunk_size
+
+        self._writer = None
+        self._columns = None
+        self._num_rows = 0
+        self._last_time = None
+        self._last_rows = 0
+
+    @property
+    def extension(self):
+        """Return the file extension of the emission files."""
+        return self.file_format
+
+    def record(self, time, veh_ids, data):
+        """Store the data of every vehicle at a given time.
+
+        If data was already recorded at the same time (e.g. during a reset),
+        it is replaced.
+
+        Parameters
+        ----------
+        time : float
+            time of the sample
+        veh_ids : list of str
+            identifiers of the vehicles
+        data : dict <str, list>
+            the value of every field in ``fields`` (except time and id) for
+            every vehicle
+        """
+        if self._columns is None:
+            self._columns = {name: [] for name in self.fields}
+        elif time == self._last_time:
+            self._truncate(self._num_rows - self._last_rows)
+        elif self._num_rows >= self.chunk_size:
+            self.flush()
+
+        num_vehicles = len(veh_ids)
+        self._columns["time"].extend([time] * num_vehicles)
+        self._columns["id"].extend(veh_ids)
+        for name in self.fields[len(INDEX_FIELDS):]:
+            self._columns[name].extend(data[name])
+
+        self._num_rows += num_vehicles
+        self._last_time = time
+        self._last_rows = num_vehicles
+
+    def flush(self):
+        """Pass all buffered rows to the writer thread."""
+        if self._num_rows == 0:
+            return
+        if self._writer is None:
+            self._writer = _EmissionWriter(
+                self.directory, self.fields, self.file_format)
+        self._writer.write(self._columns)
+        self._columns = {name: [] for name in self.fields}
+        self._num_rows = 0
+        self._last_time = None
+        self._last_rows = 0
+
+    def save(self, path):
+        """Write all recorded data to a file, and start a new file.
+
+        Parameters
+        ----------
+        path : str
+            path to the emission file
+
+        Returns
+        -------
+        bool
+            False if no data was recorded since the last call, in which case
+            no file is created
+        """
+        self.flush()
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return False
+        writer.close(path)
+        return True
+
+    def _truncate(self, num_rows):
+        """Remove the buffered rows past a given number of rows."""
+        for column in self._columns.values():
+            del column[num_rows:]
+        self._num_rows = num_rows
+
+
+class _EmissionWriter(object):
+    """Background thread appending chunks of rows to a temporary file."""
+
+    def __init__(self, directory, fields, file_format):
+        """Create the temporary file and start the writer thread."""
+        if file_format == "trace":
+            self.path = tempfile.mkdtemp(
+                prefix=".emission-", suffix=".part", dir=directory)
+        else:
+            fd, self.path = tempfile.mkstemp(
+                prefix=".emission-", suffix=".part", dir=directory)
+            os.close(fd)
+        self.fields = fields
+        self.file_format = file_format
+        self.error = None
+        self._queue = queue.Queue(maxsize=MAX_PENDING_CHUNKS)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, columns):
+        """Add a chunk of rows to the queue of the writer thread."""
+        self._check()
+        self._queue.put(columns)
+
+    def close(self, path):
+        """Wait for all chunks to be written, and move the file to a path."""
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            self._remove(self.path)
+        else:
+            if self.file_format == "trace" and os.path.isdir(path):
+                # a directory is only replaced by os.replace if it is empty
+                shutil.rmtree(path)
+            os.replace(self.path, path)
+        self._check()
+
+    @staticmethod
+    def _remove(path):
+        """Remove a file or directory."""
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    def _check(self):
+        """Raise any error encountered by the writer thread."""
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _run(self):
+        """Write chunks until the end of the queue is reached."""
+        out, schema = None, None
+        try:
+            if self.file_format == "parquet":
+                types = {"float": pa.float64(), "int": pa.int64(),
+                         "string": pa.string()}
+                field_types = dict(FIELDS)
+                schema = pa.schema([
+                    (name, types[field_types[name]]) for name in self.fields])
+                write = self._write_parquet
+                out = pq.ParquetWriter(self.path, schema)
+            elif self.file_format == "trace":
+                field_types = dict(FIELDS)
+                write = self._write_trace
+                out = TraceWriter(self.path, [
+                    (name, field_types[name]) for name in self.fields])
+            else:
+                write = self._write_csv
+                out = open(self.path, "w", newline="")
+                csv.writer(out).writerow(self.fields)
+        except Exception as e:
+            self.error = e
+
+        # chunks are consumed even after an error, so that the recorder is
+        # never blocked by a full queue
+        try:
+            while True:
+                columns = self._queue.get()
+                if columns is None:
+                    break
+                if self.error is None:
+                    try:
+                        write(out, columns, schema)
+                    except Exception as e:
+                        self.error = e
+        finally:
+            try:
+                if isinstance(out, TraceWriter) and self.error is not None:
+                    out.abort()
+                elif out is not None:
+                    out.close()
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+
+    def _write_csv(self, out, columns, _):
+        """Append a chunk of rows to a csv file."""
+        csv.writer(out).writerows(
+            zip(*[columns[name] for name in self.fields]))
+
+    def _write_trace(self, out, columns, _):
+        """Append a chunk of rows to a rollout trace."""
+        out.write(columns)
+
+    def _write_parquet(self, out, columns, schema):
+        """Append a chunk of rows to a Parquet file."""
+        out.write_table(pa.Table.from_pydict(
+            {name: columns[name] for name in self.fields}, schema=schema))
@@ -1,22 +1,29 @@
 """Script containing the TraCI simulation kernel class."""
 
 from flow.core.kernel.simulation import KernelSimulation
+from flow.core.kernel.simulation.emission import EmissionRecorder
 from flow.core.util import ensure_dir
 import flow.config as config
 import traci.constants as tc
 import traci
+import sumolib
 import traceback
 import os
 import time
 import logging
 import subprocess
 import signal
-import csv
+import numpy as np
 
 
 # Number of retries on restarting SUMO before giving up
 RETRIES_ON_ERROR = 10
 
+# Initial and maximum delay between two attempts to connect to a starting SUMO
+# instance, in seconds. The delay doubles after every failed attempt.
+MIN_POLL_INTERVAL = 0.001
+MAX_POLL_INTERVAL = 0.05
+
 
 class TraCISimulation(KernelSimulation):
     """Sumo simulation kernel.
@@ -26,7 +33,11 @@ class TraCISimulation(KernelSimulation):
     Attributes
     ----------
     sumo_proc : subprocess.Popen
-        contains the subprocess.Popen instance used to start traci
+        contains the subprocess.Popen instance used to start traci. None if
+        sumo is run in-process through libsumo
+    libsumo : module or None
+        the libsumo bindings, if sumo is run in-process instead of through a
+        TraCI socket connection
     sim_step : float
         seconds per simulation step
     emission_path : str or None
@@ -34,12 +45,15 @@ class TraCISimulation(KernelSimulation):
         output is not generated if this value is not specified
     time : float
         used to internally keep track of the simulation time
-    stored_data : dict <str, dict <float, dict <str, Any>>>
-        a dict object used to store additional data if an emission file is
-        provided. The first key corresponds to the name of the vehicle, the
-        second corresponds to the time the sample was issued, and the final
-        keys represent the additional data stored at every given time for every
-        vehicle, and consists of the following keys:
+    startup_time : float or None
+        time, in seconds, it took to start the last simulation instance and
+        have it ready to be advanced. None if no instance was started yet
+    emission_recorder : flow.core.kernel.simulation.emission.EmissionRecorder
+        recorder of the additional data stored in the emission file, if an
+        emission path is provided. Data is collected for every vehicle at
+        every step, and streamed to the emission file as the simulation
+        progresses. The stored fields are specified by the
+        ``emission_fields`` simulation parameter, and include:
 
         * acceleration (no noise): the accelerations issued to the vehicle,
           excluding noise
@@ -50,7 +64,7 @@ class TraCISimulation(KernelSimulation):
           vehicle and dividing it by the sim_step term
     """
 
-    def __init__(self, master_kernel):
+    def __init__(self, master_kernel, libsumo=None):
         """Instantiate the sumo simulator kernel.
 
         Parameters
@@ -58,14 +72,19 @@ class TraCISimulation(KernelSimulation):
         master_kernel : flow.core.kernel.Kernel
             the higher level kernel (used to call methods from other
             sub-kernels)
+        libsumo : module, optional
+            the libsumo bindings. If specified, sumo is run within the Python
+            process rather than as a subprocess controlled over a socket
         """
         KernelSimulation.__init__(self, master_kernel)
 
         self.sumo_proc = None
+        self.libsumo = libsumo
         self.sim_step = None
         self.emission_path = None
         self.time = 0
-        self.stored_data = dict()
+        self.startup_time = None
+        self.emission_recorder = None
 
     def pass_api(self, kernel_api):
         """See parent class.
@@ -88,7 +107,11 @@ class TraCISimulation(KernelSimulation):
         ])
 
     def simulation_step(self):
-        """See parent class."""
+        """See parent class.
+
+        Any actuation commands buffered by the vehicle kernel are sent first.
+        """
+        self.master_kernel.vehicle.flush_commands()
         self.kernel_api.simulationStep()
 
     def update(self, reset):
@@ -99,57 +122,115 @@ class TraCISimulation(KernelSimulation):
             self.time += self.sim_step
 
         # Collect the additional data to store in the emission file.
-        if self.emission_path is not None:
-            kv = self.master_kernel.vehicle
-            for veh_id in self.master_kernel.vehicle.get_ids():
-                t = round(self.time, 2)
-
-                # some miscellaneous pre-processing
-                position = kv.get_2d_position(veh_id)
-
-                # Make sure dictionaries corresponding to the vehicle and
-                # time are available.
-                if veh_id not in self.stored_data.keys():
-                    self.stored_data[veh_id] = dict()
-                if t not in self.stored_data[veh_id].keys():
-                    self.stored_data[veh_id][t] = dict()
-
-                # Add the speed, position, and lane data.
-                self.stored_data[veh_id][t].update({
-                    "speed": kv.get_speed(veh_id),
-                    "lane_number": kv.get_lane(veh_id),
-                    "edge_id": kv.get_edge(veh_id),
-                    "relative_position": kv.get_position(veh_id),
-                    "x": position[0],
-                    "y": position[1],
-                    "headway": kv.get_headway(veh_id),
-                    "leader_id": kv.get_leader(veh_id),
-                    "follower_id": kv.get_follower(veh_id),
-                    "leader_rel_speed":
-                        kv.get_speed(kv.get_leader(veh_id))
-                        - kv.get_speed(veh_id),
-                    "target_accel_with_noise_with_failsafe":
-                        kv.get_accel(veh_id, noise=True, failsafe=True),
-                    "target_accel_no_noise_no_failsafe":
-                        kv.get_accel(veh_id, noise=False, failsafe=False),
-                    "target_accel_with_noise_no_failsafe":
-                        kv.get_accel(veh_id, noise=True, failsafe=False),
-                    "target_accel_no_noise_with_failsafe":
-                        kv.get_accel(veh_id, noise=False, failsafe=True),
-                    "realized_accel":
-                        kv.get_realized_accel(veh_id),
-                    "road_grade": kv.get_road_grade(veh_id),
-                    "distance": kv.get_distance(veh_id),
-                })
+        if self.emission_recorder is not None:
+            veh_ids = self.master_kernel.vehicle.get_ids()
+            self.emission_recorder.record(
+                round(self.time, 2),
+                veh_ids,
+                self._emission_data(veh_ids, self.emission_recorder.fields))
+
+    def _emission_data(self, veh_ids, fields):
+        """Collect the emission data of several vehicles.
+
+        Parameters
+        ----------
+        veh_ids : list of str
+            vehicle identifiers
+        fields : list of str
+            names of the fields to collect
+
+        Returns
+        -------
+        dict <str, list>
+            the value of every requested field for every vehicle
+        """
+        kv = self.master_kernel.vehicle
+
+        def values(x):
+            return x.tolist() if isinstance(x, np.ndarray) else list(x)
+
+        data = {}
+        speed = values(kv.get_speed(veh_ids))
+        if "speed" in fields:
+            data["speed"] = speed
+        if "x" in fields or "y" in fields:
+            position = [kv.get_2d_position(veh_id) for veh_id in veh_ids]
+            data["x"] = [pos[0] for pos in position]
+            data["y"] = [pos[1] for pos in position]
+        if "headway" in fields:
+            data["headway"] = values(kv.get_headway(veh_ids))
+        leader = kv.get_leader(veh_ids)
+        if "leader_id" in fields:
+            data["leader_id"] = leader
+        for noise in (True, False):
+            for failsafe in (True, False):
+                name = "target_accel_{}_noise_{}_failsafe".format(
+                    "with" if noise else "no", "with" if failsafe else "no")
+                if name in fields:
+                    data[name] = [
+                        kv.get_accel(veh_id, noise=noise, failsafe=failsafe)
+                        for veh_id in veh_ids]
+        if "realized_accel" in fields or "distance" in fields:
+            distance = values(kv.get_distance(veh_ids))
+            data["distance"] = distance
+        if "realized_accel" in fields:
+            previous_speed = values(kv.get_previous_speed(veh_ids))
+            data["realized_accel"] = [
+                0 if d == 0 else (v - v_prev) / self.sim_step
+                for d, v, v_prev in zip(distance, speed, previous_speed)]
+        if "road_grade" in fields:
+            data["road_grade"] = [
+                kv.get_road_grade(veh_id) for veh_id in veh_ids]
+        if "edge_id" in fields:
+            data["edge_id"] = kv.get_edge(veh_ids)
+        if "lane_number" in fields:
+            data["lane_number"] = values(kv.get_lane(veh_ids))
+        if "relative_position" in fields:
+            data["relative_position"] = values(kv.get_position(veh_ids))
+        if "follower_id" in fields:
+            data["follower_id"] = kv.get_follower(veh_ids)
+        if "leader_rel_speed" in fields:
+            data["leader_rel_speed"] = [
+                v_lead - v for v_lead, v in zip(
+                    values(kv.get_speed(leader)), speed)]
+
+        return data
 
     def close(self):
         """See parent class."""
         # Save the emission data to a csv.
-        if self.emission_path is not None:
+        if self.emission_recorder is not None:
             self.save_emission()
 
         self.kernel_api.close()
 
+    def save_state(self, path):
+        """Save the current state of the simulation to a file.
+
+        Parameters
+        ----------
+        path : str
+            path to the file the state is written to
+        """
+        self.kernel_api.simulation.saveState(path)
+
+    def load_state(self, path):
+        """Restore the state of the simulation from a file.
+
+        Note that sumo discards all vehicle subscriptions and settings (e.g.
+        speed modes) when loading a state. These are restored by the vehicle
+        kernel's ``rehydrate`` method.
+
+        Parameters
+        ----------
+        path : str
+            path to a file created by ``save_state``
+        """
+        self.kernel_api.simulation.loadState(path)
+
+        # the subscriptions of the simulation are lost as well
+        self.pass_api(self.kernel_api)
+
     def check_collision(self):
         """See parent class."""
         return self.kernel_api.simulation.getStartingTeleportNumber() != 0
@@ -165,7 +246,15 @@ class TraCISimulation(KernelSimulation):
         2. It also uses the configuration files created by the network class to
            initialize a sumo instance.
         3. Finally, It initializes a traci connection to interface with sumo
-           from Python and returns the connection.
+           from Python and returns the connection. If the libsumo bindings are
+           used, sumo is instead loaded within the Python process and the
+           libsumo module is returned in place of the connection.
+
+        Rather than waiting a fixed amount of time for sumo to start, the
+        connection is attempted as soon as the subprocess is created, and is
+        retried with an exponential backoff until sumo accepts it (see
+        ``_connect``). The time it took to start the simulation is stored
+        under ``startup_time``.
         """
         # Save the simulation step size (for later use).
         self.sim_step = sim_params.sim_step
@@ -174,23 +263,36 @@ class TraCISimulation(KernelSimulation):
         self.emission_path = sim_params.emission_path
         if self.emission_path is not None:
             ensure_dir(self.emission_path)
+            if self.emission_recorder is None:
+                self.emission_recorder = EmissionRecorder(
+                    self.emission_path,
+                    fields=getattr(sim_params, "emission_fields", None),
+                    file_format=getattr(
+                        sim_params, "emission_format", "csv"))
 
         error = None
-        for _ in range(RETRIES_ON_ERROR):
+        for attempt in range(RETRIES_ON_ERROR):
             try:
-                # port number the sumo instance will be run on
+                t0 = time.perf_counter()
+
+                # port number the sumo instance will be run on. If a previous
+                # attempt failed, the port may have been taken by another
+                # process in the meantime, so a new one is chosen.
+                if attempt > 0 and self.libsumo is None:
+                    sim_params.port = sumolib.miscutils.getFreeSocketPort()
                 port = sim_params.port
 
                 sumo_binary = "sumo-gui" if sim_params.render is True \
                     else "sumo"
 
-                # command used to start sumo
-                sumo_call = [
-                    sumo_binary, "-c", network.cfg,
-                    "--remote-port", str(sim_params.port),
-                    "--num-clients", str(sim_params.num_clients),
-                    "--step-length", str(sim_params.sim_step)
-                ]
+                # command used to start sumo. No remote port is needed when
+                # sumo is run in-process
+                sumo_call = [sumo_binary, "-c", network.cfg]
+                if self.libsumo is None:
+                    sumo_call.extend([
+                        "--remote-port", str(sim_params.port),
+                        "--num-clients", str(sim_params.num_clients)])
+                sumo_call.extend(["--step-length", str(sim_params.sim_step)])
 
                 # use a ballistic integration step (if request)
                 if sim_params.use_ballistic:
@@ -226,13 +328,32 @@ class TraCISimulation(KernelSimulation):
                 sumo_call.append("--collision.check-junctions")
                 sumo_call.append("true")
 
-                logging.info(" Starting SUMO on port " + str(port))
+                # save states exactly, so that they may be restored on reset
+                if sim_params.snapshot_reset:
+                    sumo_call.append("--save-state.precision")
+                    sumo_call.append("17")
+                    sumo_call.append("--save-state.rng")
+
                 logging.debug(" Cfg file: " + str(network.cfg))
+                logging.debug(" Emission file: " + str(self.emission_path))
+                logging.debug(" Step length: " + str(sim_params.sim_step))
+
+                # load sumo within the Python process
+                if self.libsumo is not None:
+                    logging.info(" Starting SUMO through libsumo")
+                    self.libsumo.start(sumo_call)
+                    self.libsumo.simulationStep()
+
+                    self.startup_time = time.perf_counter() - t0
+                    logging.info(" SUMO started in {:.3f}s".format(
+                        self.startup_time))
+
+                    return self.libsumo
+
+                logging.info(" Starting SUMO on port " + str(port))
                 if sim_params.num_clients > 1:
                     logging.info(" Num clients are" +
                                  str(sim_params.num_clients))
-                logging.debug(" Emission file: " + str(self.emission_path))
-                logging.debug(" Step length: " + str(sim_params.sim_step))
 
                 # Opening the I/O thread to SUMO
                 self.sumo_proc = subprocess.Popen(
@@ -240,17 +361,14 @@ class TraCISimulation(KernelSimulation):
                     stdout=subprocess.DEVNULL
                 )
 
-                # wait a small period of time for the subprocess to activate
-                # before trying to connect with traci
-                if os.environ.get("TEST_FLAG", 0):
-                    time.sleep(0.1)
-                else:
-                    time.sleep(config.SUMO_SLEEP)
-
-                traci_connection = traci.connect(port, numRetries=100)
+                traci_connection = self._connect(port)
                 traci_connection.setOrder(0)
                 traci_connection.simulationStep()
 
+                self.startup_time = time.perf_counter() - t0
+                logging.info(" SUMO started in {:.3f}s".format(
+                    self.startup_time))
+
                 return traci_connection
             except Exception as e:
                 print("Error during start: {}".format(traceback.format_exc()))
@@ -258,18 +376,62 @@ class TraCISimulation(KernelSimulation):
                 self.teardown_sumo()
         raise error
 
+    def _connect(self, port):
+        """Connect to the sumo subprocess as soon as it is ready.
+
+        The connection is attempted repeatedly, starting with a very short
+        delay between attempts that doubles up to ``MAX_POLL_INTERVAL``, until
+        sumo starts listening on the port. This is interrupted if the sumo
+        subprocess terminates, or if sumo does not accept the connection
+        within ``config.SUMO_STARTUP_TIMEOUT`` seconds.
+
+        Parameters
+        ----------
+        port : int
+            port the sumo instance listens to
+
+        Returns
+        -------
+        traci.connection.Connection
+            the TraCI connection to sumo
+
+        Raises
+        ------
+        traci.exceptions.TraCIException
+            if the sumo subprocess terminated before accepting a connection
+        traci.exceptions.FatalTraCIError
+            if the connection could not be established before the timeout
+        """
+        deadline = time.perf_counter() + config.SUMO_STARTUP_TIMEOUT
+        interval = MIN_POLL_INTERVAL
+        while True:
+            try:
+                return traci.connect(port, numRetries=0, proc=self.sumo_proc)
+            except traci.exceptions.FatalTraCIError:
+                if time.perf_counter() > deadline:
+                    raise
+            time.sleep(interval)
+            interval = min(2 * interval, MAX_POLL_INTERVAL)
+
     def teardown_sumo(self):
-        """Kill the sumo subprocess instance."""
+        """Kill the sumo subprocess instance.
+
+        If sumo is run through libsumo, the in-process simulation is closed
+        instead.
+        """
         try:
-            os.killpg(self.sumo_proc.pid, signal.SIGTERM)
+            if self.libsumo is not None:
+                self.libsumo.close()
+            else:
+                os.killpg(self.sumo_proc.pid, signal.SIGTERM)
         except Exception as e:
             print("Error during teardown: {}".format(e))
 
     def save_emission(self, run_id=0):
-        """Save any collected emission data to a csv file.
+        """Save any collected emission data to a file.
 
-        If not data was collected, nothing happens. Moreover, any internally
-        stored data by this class is clear whenever data is stored.
+        If not data was collected, nothing happens. Moreover, a new file is
+        started for any data collected afterwards.
 
         Parameters
         ----------
@@ -277,53 +439,16 @@ class TraCISimulation(KernelSimulation):
             the rollout number, appended to the name of the emission file. Used
             to store emission files from multiple rollouts run sequentially.
         """
-        # If there is no stored data, ignore this operation. This is to ensure
-        # that data isn't deleted if the operation is called twice.
-        if len(self.stored_data) == 0:
+        if self.emission_recorder is None:
             return
 
-        # Get a csv name for the emission file.
-        name = "{}-{}_emission.csv".format(
-            self.master_kernel.network.network.name, run_id)
-
-        # The name of all stored data-points (excluding id and time)
-        stored_ids = [
-            "x",
-            "y",
-            "speed",
-            "headway",
-            "leader_id",
-            "target_accel_with_noise_with_failsafe",
-            "target_accel_no_noise_no_failsafe",
-            "target_accel_with_noise_no_failsafe",
-            "target_accel_no_noise_with_failsafe",
-            "realized_accel",
-            "road_grade",
-            "edge_id",
-            "lane_number",
-            "distance",
-            "relative_position",
-            "follower_id",
-            "leader_rel_speed",
-        ]
-
-        # Update the stored data to push to the csv file.
-        final_data = {"time": [], "id": []}
-        final_data.update({key: [] for key in stored_ids})
-
-        for veh_id in self.stored_data.keys():
-            for t in self.stored_data[veh_id].keys():
-                final_data['time'].append(t)
-                final_data['id'].append(veh_id)
-                for key in stored_ids:
-                    final_data[key].append(self.stored_data[veh_id][t][key])
-
-        with open(os.path.join(self.emission_path, name), "w") as f:
-            print(os.path.join(self.emission_path, name), self.emission_path)
-            writer = csv.writer(f, delimiter=',')
-            writer.writerow(final_data.keys())
-            writer.writerows(zip(*final_data.values()))
-
-        # Clear all memory from the stored data. This is useful if this
-        # function is called in between resets.
-        self.stored_data.clear()
+        # Get a name for the emission file.
+        name = "{}-{}_emission.{}".format(
+            self.master_kernel.network.network.name, run_id,
+            self.emission_recorder.extension)
+        path = os.path.join(self.emission_path, name)
+
+        # If there is no stored data, ignore this operation. This is to ensure
+        # that data isn't deleted if the operation is called twice.
+        if self.emission_recorder.save(path):
+            print(path, self.emission_path)
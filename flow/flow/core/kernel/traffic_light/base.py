@@ -1,4 +1,5 @@
 """Script containing the base traffic light kernel class."""
+import numpy as np
 
 
 class KernelTrafficLight(object):
@@ -24,8 +25,12 @@ class KernelTrafficLight(object):
 
         >>> tl_state = env.k.traffic_light.get_state(node_id)
 
-    All methods in this class are abstract, and must be filled in by the child
-    vehicle kernel of separate simulators.
+      The states of all traffic lights can also be acquired at once by calling:
+
+        >>> tl_states = env.k.traffic_light.get_states()
+
+    Except for ``get_states``, all methods in this class are abstract, and must
+    be filled in by the child vehicle kernel of separate simulators.
     """
 
     def __init__(self, master_kernel):
@@ -98,3 +103,14 @@ class KernelTrafficLight(object):
             Element = state of the traffic light at that node/lane
         """
         raise NotImplementedError
+
+    def get_states(self):
+        """Return the states of the traffic lights of all nodes.
+
+        Returns
+        -------
+        np.ndarray
+            the state of the traffic lights of every node, in the order of
+            ``get_ids``
+        """
+        return np.array([self.get_state(node_id) for node_id in self.get_ids()])
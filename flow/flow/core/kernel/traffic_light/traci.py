@@ -2,6 +2,7 @@
 
 from flow.core.kernel.traffic_light import KernelTrafficLight
 import traci.constants as tc
+import numpy as np
 
 
 class TraCITrafficLight(KernelTrafficLight):
@@ -10,7 +11,7 @@ class TraCITrafficLight(KernelTrafficLight):
     Implements all methods discussed in the base traffic light kernel class.
     """
 
-    def __init__(self, master_kernel):
+    def __init__(self, master_kernel, sim_params=None):
         """Instantiate the sumo traffic light kernel.
 
         Parameters
@@ -18,6 +19,8 @@ class TraCITrafficLight(KernelTrafficLight):
         master_kernel : flow.core.kernel.Kernel
             the higher level kernel (used to call methods from other
             sub-kernels)
+        sim_params : flow.core.params.SumoParams, optional
+            simulation-specific parameters
         """
         KernelTrafficLight.__init__(self, master_kernel)
 
@@ -30,6 +33,19 @@ class TraCITrafficLight(KernelTrafficLight):
         # number of traffic light nodes
         self.num_traffic_lights = 0
 
+        # whether to collect the subscription results of all traffic lights in
+        # a single call, and to skip commands that do not change the state of
+        # a traffic light
+        self._batch = getattr(sim_params, "batch_traffic_lights", False)
+
+        # states of all traffic lights, in the order of self.__ids
+        self._states = None
+
+        # last state sent to every traffic light. Sumo keeps this state until
+        # a new one is sent, so commands sending the same state again may be
+        # skipped.
+        self._sent_states = dict()
+
     def pass_api(self, kernel_api):
         """See parent class.
 
@@ -43,6 +59,9 @@ class TraCITrafficLight(KernelTrafficLight):
         # number of traffic light nodes
         self.num_traffic_lights = len(self.__ids)
 
+        # states sent to a previous sumo instance are no longer valid
+        self._sent_states.clear()
+
         # subscribe the traffic light signal data
         for node_id in self.__ids:
             self.kernel_api.trafficlight.subscribe(
@@ -51,26 +70,73 @@ class TraCITrafficLight(KernelTrafficLight):
     def update(self, reset):
         """See parent class."""
         tls_obs = {}
-        for tl_id in self.__ids:
-            tls_obs[tl_id] = \
-                self.kernel_api.trafficlight.getSubscriptionResults(tl_id)
+        if self._batch:
+            all_obs = self.kernel_api.trafficlight.getAllSubscriptionResults()
+            for tl_id in self.__ids:
+                tls_obs[tl_id] = all_obs.get(tl_id, {})
+        else:
+            for tl_id in self.__ids:
+                tls_obs[tl_id] = \
+                    self.kernel_api.trafficlight.getSubscriptionResults(tl_id)
         self.__tls = tls_obs.copy()
+        self._states = None
 
     def get_ids(self):
         """See parent class."""
         return self.__ids
 
     def set_state(self, node_id, state, link_index="all"):
-        """See parent class."""
+        """See parent class.
+
+        If ``batch_traffic_lights`` is set in the simulation parameters, the
+        command is not sent to sumo if the requested state was already sent
+        to the traffic light and the light is still in this state.
+        """
+        if self._batch:
+            sent_state = self._sent_states.get(node_id)
+            if sent_state is not None and sent_state == self._observed_state(
+                    node_id):
+                if link_index == "all":
+                    if sent_state == state:
+                        return
+                elif sent_state[link_index:link_index + len(state)] == state:
+                    return
+
         if link_index == "all":
             # if lights on all lanes are changed
             self.kernel_api.trafficlight.setRedYellowGreenState(
                 tlsID=node_id, state=state)
+            new_state = state
         else:
             # if lights on a single lane is changed
             self.kernel_api.trafficlight.setLinkState(
                 tlsID=node_id, tlsLinkIndex=link_index, state=state)
+            new_state = self._sent_states.get(node_id)
+            if new_state is not None:
+                new_state = new_state[:link_index] + state + \
+                    new_state[link_index + len(state):]
+
+        if self._batch:
+            if new_state is None:
+                self._sent_states.pop(node_id, None)
+            else:
+                self._sent_states[node_id] = new_state
 
     def get_state(self, node_id):
         """See parent class."""
         return self.__tls[node_id][tc.TL_RED_YELLOW_GREEN_STATE]
+
+    def get_states(self):
+        """See parent class.
+
+        The returned array is shared between calls within a time step, and
+        should not be modified.
+        """
+        if self._states is None:
+            self._states = np.array(
+                [self.get_state(node_id) for node_id in self.__ids])
+        return self._states
+
+    def _observed_state(self, node_id):
+        """Return the state of a traffic light at the last update, if any."""
+        return self.__tls.get(node_id, {}).get(tc.TL_RED_YELLOW_GREEN_STATE)
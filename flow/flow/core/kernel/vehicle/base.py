@@ -2,6 +2,8 @@
 
 from abc import ABCMeta, abstractmethod
 
+from flow.core.kernel.vehicle.edge_stats import EdgeStats
+
 
 class KernelVehicle(object, metaclass=ABCMeta):
     """Flow vehicle kernel.
@@ -132,6 +134,8 @@ class KernelVehicle(object, metaclass=ABCMeta):
         """Apply the acceleration requested by a vehicle in the simulator.
 
         In SUMO, this function applies slowDown method which applies smoothing.
+        The failsafes of the controllers of RL vehicles, if any, are applied to
+        their accelerations beforehand.
 
         Parameters
         ----------
@@ -294,6 +298,41 @@ class KernelVehicle(object, metaclass=ABCMeta):
         """
         pass
 
+    def get_edge_stats(self, edges, lane=None):
+        """Return the traffic statistics of an edge, a lane, or several edges.
+
+        These include the number of vehicles, their mean speed, the length of
+        the queue, the occupancy, and the front and rear vehicles, see
+        flow/core/kernel/vehicle/edge_stats.py. Unless overridden by the
+        simulator kernel, the statistics are computed at every call.
+
+        Parameters
+        ----------
+        edges : str or list of str
+            name of the edge, or names of several edges in the order in which
+            they are traversed
+        lane : int, optional
+            lane of the edges. The statistics of all lanes are returned by
+            default.
+
+        Returns
+        -------
+        dict
+            the statistics
+        """
+        return self._compute_edge_stats().get(edges, lane)
+
+    def _compute_edge_stats(self):
+        """Accumulate the statistics of every edge and lane in the network."""
+        veh_ids = self.get_ids()
+        return EdgeStats(
+            self.master_kernel.network, veh_ids,
+            edges=self.get_edge(veh_ids),
+            lanes=self.get_lane(veh_ids),
+            speeds=self.get_speed(veh_ids),
+            positions=self.get_position(veh_ids),
+            lengths=self.get_length(veh_ids))
+
     @abstractmethod
     def get_inflow_rate(self, time_span):
         """Return the inflow rate (in veh/hr) of vehicles from the network.
@@ -325,6 +364,62 @@ class KernelVehicle(object, metaclass=ABCMeta):
         """Return the ids of vehicles that departed in the last time step."""
         pass
 
+    def get_edge_changed_ids(self):
+        """Return the ids of vehicles that entered a new edge in the last step.
+
+        This includes vehicles that departed in the last time step, and all
+        vehicles after a reset. Unless overridden by the simulator kernel,
+        all vehicles in the network are returned.
+
+        Returns
+        -------
+        set of str
+            vehicle identifiers
+        """
+        return set(self.get_ids())
+
+    def get_routed_ids(self, triggered=None):
+        """Return the ids of vehicles with a routing controller.
+
+        Unless overridden by the simulator kernel, the routing controllers of
+        all vehicles in the network are checked.
+
+        Parameters
+        ----------
+        triggered : bool, optional
+            if True, only vehicles whose routing controller declares trigger
+            edges are returned, and if False, only vehicles whose routing
+            controller does not. All are returned if not specified.
+
+        Returns
+        -------
+        list of str
+            vehicle identifiers
+        """
+        routed_ids = []
+        for veh_id in self.get_ids():
+            router = self.get_routing_controller(veh_id)
+            if router is None:
+                continue
+            has_triggers = getattr(router, "trigger_edges", None) is not None
+            if triggered is None or triggered == has_triggers:
+                routed_ids.append(veh_id)
+        return routed_ids
+
+    def get_trigger_edges(self):
+        """Return the trigger edges of the routing controllers of vehicles.
+
+        Returns
+        -------
+        list of str
+            the edges that are trigger edges of at least one vehicle in the
+            network
+        """
+        edges = set()
+        for veh_id in self.get_routed_ids(triggered=True):
+            edges.update(self.get_routing_controller(veh_id).trigger_edges)
+        return list(edges)
+
     @abstractmethod
     def get_num_not_departed(self):
         """Return the number of vehicles not departed in the last time step.
@@ -0,0 +1,178 @@
+"""Script containing the columnar, array-backed vehicle state store."""
+import numpy as np
+
+
+# Name, dtype, and default (empty/error) value of every column in the store.
+FIELDS = [
+    ("speed", np.float64, -1001),
+    ("previous_speed", np.float64, 0),
+    ("position", np.float64, -1001),
+    ("lane", np.int64, -1001),
+    ("headway", np.float64, -1001),
+    ("x", np.float64, -1001),
+    ("y", np.float64, -1001),
+    ("angle", np.float64, -1001),
+    ("fuel_consumption", np.float64, -1001),
+    ("distance", np.float64, -1001),
+]
+
+# initial number of rows allocated by the store
+DEFAULT_CAPACITY = 64
+
+
+class ColumnarVehicleState(object):
+    """Contiguous, per-field storage of the numeric state of vehicles.
+
+    Every field in ``FIELDS`` is stored in its own NumPy array, and every
+    vehicle is assigned a row in these arrays. Rows freed by vehicles that
+    exit the network are reused by newly departed vehicles, and the arrays
+    grow geometrically if more rows are needed. This allows the vehicle kernel
+    to collect the state of many vehicles with a single fancy-indexing
+    operation rather than one dictionary lookup per vehicle.
+
+    Attributes
+    ----------
+    capacity : int
+        number of rows currently allocated for each field
+    columns : dict <str, np.ndarray>
+        the array corresponding to every field
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """Instantiate the columnar state store.
+
+        Parameters
+        ----------
+        capacity : int, optional
+            number of rows to initially allocate
+        """
+        self.capacity = max(int(capacity), 1)
+        self.columns = {
+            name: np.full(self.capacity, default, dtype=dtype)
+            for name, dtype, default in FIELDS
+        }
+        self._defaults = {name: default for name, _, default in FIELDS}
+
+        # vehicle id -> row index
+        self._index = dict()
+        # rows released by removed vehicles, available for reuse
+        self._free = []
+        # first row that has never been assigned to a vehicle
+        self._next_row = 0
+
+    def __len__(self):
+        """Return the number of vehicles currently stored."""
+        return len(self._index)
+
+    def __contains__(self, veh_id):
+        """Return whether the vehicle has a row in the store."""
+        return veh_id in self._index
+
+    def clear(self):
+        """Remove all vehicles from the store."""
+        self._index.clear()
+        self._free = []
+        self._next_row = 0
+        for name, _, default in FIELDS:
+            self.columns[name].fill(default)
+
+    def add(self, veh_id):
+        """Assign a row to a vehicle, and return the index of that row.
+
+        If the vehicle is already in the store, its current row is returned.
+        """
+        row = self._index.get(veh_id)
+        if row is not None:
+            return row
+
+        if self._free:
+            row = self._free.pop()
+        else:
+            if self._next_row >= self.capacity:
+                self._grow(2 * self.capacity)
+            row = self._next_row
+            self._next_row += 1
+
+        self._index[veh_id] = row
+        return row
+
+    def remove(self, veh_id):
+        """Release the row of a vehicle, if it is in the store."""
+        row = self._index.pop(veh_id, None)
+        if row is None:
+            return
+        for name, _, default in FIELDS:
+            self.columns[name][row] = default
+        self._free.append(row)
+
+    def row(self, veh_id):
+        """Return the row of a vehicle, or None if it is not stored."""
+        return self._index.get(veh_id)
+
+    def rows(self, veh_ids):
+        """Return the rows of several vehicles, with -1 for missing ones.
+
+        Parameters
+        ----------
+        veh_ids : list of str
+            vehicle identifiers
+
+        Returns
+        -------
+        np.ndarray
+            array of row indices
+        """
+        index = self._index
+        return np.fromiter((index.get(veh_id, -1) for veh_id in veh_ids),
+                           dtype=np.int64, count=len(veh_ids))
+
+    def get(self, veh_id, field, error=-1001):
+        """Return the value of a field for a single vehicle."""
+        row = self._index.get(veh_id)
+        if row is None:
+            return error
+        return self.columns[field][row].item()
+
+    def set(self, veh_id, field, value):
+        """Set the value of a field for a single vehicle."""
+        row = self._index.get(veh_id)
+        if row is not None:
+            self.columns[field][row] = value
+
+    def gather(self, field, rows, error=-1001):
+        """Return the values of a field at the specified rows.
+
+        Parameters
+        ----------
+        field : str
+            name of the field
+        rows : np.ndarray
+            row indices, as returned by ``rows``. Negative indices denote
+            vehicles that are not in the store.
+        error : any, optional
+            value to return for vehicles that are not in the store
+
+        Returns
+        -------
+        np.ndarray
+            values of the field, in the order of the requested rows
+        """
+        values = self.columns[field][rows]
+        missing = rows < 0
+        if missing.any():
+            if error is None or isinstance(error, str):
+                values = values.astype(object)
+            values[missing] = error
+        return values
+
+    def scatter(self, field, rows, values):
+        """Set the values of a field at the specified rows."""
+        self.columns[field][rows] = values
+
+    def _grow(self, capacity):
+        """Increase the number of rows allocated for every field."""
+        for name, dtype, default in FIELDS:
+            column = np.full(capacity, default, dtype=dtype)
+            column[:self.capacity] = self.columns[name]
+            self.columns[name] = column
+        self.capacity = capacity
@@ -0,0 +1,182 @@
+"""Script containing the buffer used to batch TraCI actuation commands."""
+import struct
+
+from traci.exceptions import FatalTraCIError, TraCIException
+import traci.constants as tc
+
+# result codes returned by sumo for every command
+RESULTS = {0x00: "OK", 0x01: "Not implemented", 0xFF: "Error"}
+
+
+class TraCICommandBuffer(object):
+    """Buffer of TraCI commands that are sent to sumo in a single message.
+
+    Every call to a setter of the TraCI API (e.g. ``vehicle.slowDown``) is a
+    blocking round trip through the socket connecting Flow to sumo. The TraCI
+    protocol, however, allows several commands to be sent within the same
+    message, with sumo returning a status for each command in the response.
+    This class collects commands during a simulation step, and ``flush``
+    packs all of them into a single message.
+
+    Commands are packed by the TraCI API itself, which relies on private
+    attributes of ``traci.connection.Connection`` (see ``_can_pack``). When
+    the kernel api is not a socket connection (e.g. libsumo), or when these
+    attributes do not match the versions of TraCI this was checked against,
+    the commands are executed one at a time when the buffer is flushed.
+
+    Note that commands are only executed once the buffer is flushed, so any
+    state read from the simulator in between does not reflect them.
+    """
+
+    def __init__(self):
+        """Instantiate the command buffer."""
+        self._commands = []
+
+    def __len__(self):
+        """Return the number of commands that have not been sent yet."""
+        return len(self._commands)
+
+    def append(self, description, command, *args, **kwargs):
+        """Add a command to the buffer.
+
+        Parameters
+        ----------
+        description : str
+            identifier of the command, used to report errors, e.g. the name
+            of the vehicle the command is issued to
+        command : callable
+            the TraCI API method, e.g. ``kernel_api.vehicle.slowDown``
+        args, kwargs : any
+            the arguments of the command
+        """
+        self._commands.append((description, command, args, kwargs))
+
+    def clear(self):
+        """Remove all commands from the buffer without sending them."""
+        self._commands = []
+
+    def flush(self, kernel_api):
+        """Send all buffered commands to sumo.
+
+        All commands are executed, even if some of them fail.
+
+        Parameters
+        ----------
+        kernel_api : any
+            the TraCI connection the commands are sent through
+
+        Returns
+        -------
+        list of (str, traci.exceptions.TraCIException)
+            the description and error of every command that failed
+
+        Raises
+        ------
+        traci.exceptions.FatalTraCIError
+            if the connection to sumo is lost
+        """
+        commands, self._commands = self._commands, []
+        if len(commands) == 0:
+            return []
+
+        conn = kernel_api
+        if not _can_pack(conn):
+            # libsumo raises its own exception class
+            return self._execute(
+                commands, getattr(conn, "TraCIException", TraCIException))
+
+        # pack the commands without sending them, keeping track of the
+        # command every packed TraCI message part belongs to
+        descriptions = []
+        unpacked = None
+        conn._sendExact = _skip_send
+        try:
+            for i, (description, command, args, kwargs) in \
+                    enumerate(commands):
+                string_length = len(conn._string)
+                command(*args, **kwargs)
+                num_parts = len(conn._queue) - len(descriptions)
+                if num_parts != 1 or len(conn._string) <= string_length:
+                    # the command was not packed as expected. If nothing was
+                    # packed, the command was executed by other means.
+                    unpacked = commands[:i] + commands[i + (num_parts == 0):]
+                    break
+                descriptions.append(description)
+        except Exception:
+            conn._string = bytes()
+            conn._queue = []
+            raise
+        finally:
+            del conn._sendExact
+
+        if unpacked is not None:
+            # discard the packed commands, and execute them one at a time
+            conn._string = bytes()
+            conn._queue = []
+            return self._execute(unpacked)
+
+        # send all commands in one message
+        message, queue = conn._string, conn._queue
+        conn._string, conn._queue = bytes(), []
+        if conn._socket is None:
+            raise FatalTraCIError("Connection already closed.")
+        conn._socket.send(struct.pack("!i", len(message) + 4) + message)
+        result = conn._recvExact()
+        if not result:
+            conn._socket.close()
+            conn._socket = None
+            raise FatalTraCIError("Connection closed by SUMO.")
+
+        # collect the status of every command
+        errors = []
+        for description, command_id in zip(descriptions, queue):
+            prefix = result.read("!BBB")
+            err = result.readString()
+            if prefix[2] or err:
+                errors.append((description, TraCIException(
+                    err, prefix[1], RESULTS.get(prefix[2], "Error"))))
+            elif prefix[1] != command_id:
+                raise FatalTraCIError("Received answer %s for command %s." %
+                                      (prefix[1], command_id))
+            elif prefix[1] == tc.CMD_STOP:
+                length = result.read("!B")[0] - 1
+                result.read("!%sx" % length)
+
+        return errors
+
+    @staticmethod
+    def _execute(commands, exception=TraCIException):
+        """Execute commands one at a time, collecting any errors."""
+        errors = []
+        for description, command, args, kwargs in commands:
+            try:
+                command(*args, **kwargs)
+            except exception as e:
+                errors.append((description, e))
+        return errors
+
+
+def _can_pack(conn):
+    """Return whether commands can be packed into a single message.
+
+    Packing replaces ``Connection._sendExact`` while the commands are issued,
+    so that they are appended to ``Connection._string`` and
+    ``Connection._queue`` instead of being sent, and then sends the message
+    through ``Connection._socket`` and reads the reply with
+    ``Connection._recvExact``. All of these must exist with the expected
+    types, and no command may be pending.
+    """
+    try:
+        return "_sendExact" not in vars(conn) \
+            and callable(conn._sendExact) \
+            and callable(conn._recvExact) \
+            and hasattr(conn, "_socket") \
+            and isinstance(conn._string, bytes) and len(conn._string) == 0 \
+            and isinstance(conn._queue, list) and len(conn._queue) == 0
+    except (AttributeError, TypeError):
+        return False
+
+
+def _skip_send():
+    """Replace Connection._sendExact while commands are being packed."""
+    return None
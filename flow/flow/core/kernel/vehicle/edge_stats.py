@@ -0,0 +1,141 @@
+"""Script containing the traffic statistics of every edge and lane."""
+
+# speed (in m/s) below which a vehicle is counted in the queue of its edge.
+# This is the threshold used by sumo for halting vehicles.
+QUEUE_SPEED = 0.1
+
+# indices of the accumulated values of every edge and lane
+_COUNT, _SPEED, _QUEUE, _LENGTH, _FRONT_ID, _FRONT_POS, _REAR_ID, \
+    _REAR_POS = range(8)
+
+
+class EdgeStats(object):
+    """Traffic statistics of every edge and lane at a given time step.
+
+    The statistics of all edges and lanes are accumulated in a single pass
+    over the vehicles in the network, and are shared by all the callers (e.g.
+    routing controllers) during the time step. The vehicle kernel creates a
+    new instance after every update.
+
+    The statistics of an edge, a lane, or a group of edges are returned as a
+    dict with the following keys:
+
+    * count: number of vehicles
+    * mean_speed: mean speed of the vehicles, None if there are none
+    * queue_length: number of vehicles slower than ``QUEUE_SPEED``
+    * occupancy: fraction of the length of the lanes covered by vehicles
+    * front_id, front_position: name and position of the vehicle closest to
+      the end of the edge, None if there are no vehicles
+    * rear_id, rear_position: name and position of the vehicle closest to
+      the start of the edge, None if there are no vehicles
+    """
+
+    def __init__(self, network, veh_ids, edges, lanes, speeds, positions,
+                 lengths):
+        """Accumulate the statistics of every edge and lane.
+
+        Parameters
+        ----------
+        network : flow.core.kernel.network.BaseKernelNetwork
+            the network kernel, used to get the length and number of lanes of
+            the edges
+        veh_ids : list of str
+            names of the vehicles in the network
+        edges : list of str
+            edge of every vehicle
+        lanes : list of int
+            lane of every vehicle
+        speeds : list of float
+            speed of every vehicle
+        positions : list of float
+            position of every vehicle on its edge
+        lengths : list of float
+            length of every vehicle
+        """
+        self.network = network
+        self._edges = {}
+        self._lanes = {}
+        self._stats = {}
+
+        for veh_id, edge, lane, speed, pos, length in zip(
+                veh_ids, edges, lanes, speeds, positions, lengths):
+            # vehicles that are not in the network (e.g. after a collision)
+            if not edge:
+                continue
+            for acc_dict, key in ((self._edges, edge),
+                                  (self._lanes, (edge, lane))):
+                acc = acc_dict.get(key)
+                if acc is None:
+                    acc_dict[key] = [1, speed, int(speed < QUEUE_SPEED),
+                                     length, veh_id, pos, veh_id, pos]
+                    continue
+                acc[_COUNT] += 1
+                acc[_SPEED] += speed
+                acc[_QUEUE] += speed < QUEUE_SPEED
+                acc[_LENGTH] += length
+                if pos > acc[_FRONT_POS]:
+                    acc[_FRONT_ID], acc[_FRONT_POS] = veh_id, pos
+                if pos < acc[_REAR_POS]:
+                    acc[_REAR_ID], acc[_REAR_POS] = veh_id, pos
+
+    def get(self, edges, lane=None):
+        """Return the statistics of an edge, a lane, or a group of edges.
+
+        Parameters
+        ----------
+        edges : str or list of str
+            name of the edge, or names of several edges in the order in which
+            they are traversed. The statistics of several edges are combined,
+            with the front vehicle taken from the last edge with vehicles, and
+            the rear vehicle from the first one.
+        lane : int, optional
+            lane of the edges. The statistics of all lanes are returned by
+            default.
+
+        Returns
+        -------
+        dict
+            the statistics (see class documentation). This dict is shared
+            between calls within a time step, and should not be modified.
+        """
+        key = (tuple(edges) if isinstance(edges, (list, tuple)) else edges,
+               lane)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = self._combine(
+                [edges] if isinstance(edges, str) else edges, lane)
+        return stats
+
+    def _combine(self, edges, lane):
+        """Compute the statistics of a group of edges."""
+        count, speed, queue, length, capacity = 0, 0, 0, 0, 0
+        front, rear = (None, None), None
+        for edge in edges:
+            if lane is None:
+                acc = self._edges.get(edge)
+                capacity += max(self.network.edge_length(edge), 0) * \
+                    max(self.network.num_lanes(edge), 0)
+            else:
+                acc = self._lanes.get((edge, lane))
+                capacity += max(self.network.edge_length(edge), 0)
+            if acc is None:
+                continue
+            count += acc[_COUNT]
+            speed += acc[_SPEED]
+            queue += acc[_QUEUE]
+            length += acc[_LENGTH]
+            front = acc[_FRONT_ID], acc[_FRONT_POS]
+            if rear is None:
+                rear = acc[_REAR_ID], acc[_REAR_POS]
+
+        rear = rear or (None, None)
+        return {
+            "count": count,
+            "mean_speed": speed / count if count > 0 else None,
+            "queue_length": queue,
+            "occupancy": length / capacity if capacity > 0 else 0,
+            "front_id": front[0],
+            "front_position": front[1],
+            "rear_id": rear[0],
+            "rear_position": rear[1],
+        }
@@ -2,16 +2,18 @@
 import traceback
 
 from flow.core.kernel.vehicle import KernelVehicle
+from flow.core.kernel.vehicle.columnar import ColumnarVehicleState
+from flow.core.kernel.vehicle.command_buffer import TraCICommandBuffer
 import traci.constants as tc
-from traci.exceptions import FatalTraCIError, TraCIException
+from traci.exceptions import TraCIException
 import numpy as np
 import collections
 import warnings
+from flow.controllers.batch import get_failsafe_state
 from flow.controllers.car_following_models import SimCarFollowingController
 from flow.controllers.rlcontroller import RLController
 from flow.controllers.lane_change_controllers import SimLaneChangeController
 from bisect import bisect_left
-import itertools
 from copy import deepcopy
 
 # colors for vehicles
@@ -25,6 +27,21 @@ rdelta = 255 / STEPS
 color_bins = [[int(255 - rdelta * i), int(rdelta * i), 0] for i in
               range(STEPS + 1)]
 
+# variables subscribed to for every vehicle in the network
+SUBSCRIPTION_VARS = [
+    tc.VAR_LANE_INDEX, tc.VAR_LANEPOSITION,
+    tc.VAR_ROAD_ID,
+    tc.VAR_SPEED,
+    tc.VAR_EDGES,
+    tc.VAR_POSITION,
+    tc.VAR_ANGLE,
+    tc.VAR_SPEED_WITHOUT_TRACI,
+    tc.VAR_FUELCONSUMPTION,
+    tc.VAR_DISTANCE
+]
+# maximum distance (in meters) at which leaders are collected by sumo
+LEADER_LOOKAHEAD = 2000
+
 
 class TraCIVehicle(KernelVehicle):
     """Flow kernel for the TraCI API.
@@ -44,6 +61,13 @@ class TraCIVehicle(KernelVehicle):
         self.__controlled_lc_ids = []  # ids of flow lc-controlled vehicles
         self.__rl_ids = []  # ids of rl-controlled vehicles
         self.__observed_ids = []  # ids of the observed vehicles
+        # ids of vehicles whose routing controller is called at every step,
+        # and of vehicles whose routing controller declares trigger edges
+        self.__step_routed_ids = []
+        self.__event_routed_ids = []
+        # trigger edges of the routing controllers, with their number of
+        # vehicles
+        self._trigger_edges = collections.Counter()
 
         # vehicles: Key = Vehicle ID, Value = Dictionary describing the vehicle
         # Ordered dictionary used to keep neural net inputs in order
@@ -53,6 +77,13 @@ class TraCIVehicle(KernelVehicle):
         # on the state of the vehicles for a given time step
         self.__sumo_obs = {}
 
+        # ids of the vehicles that entered a new edge in the last time step
+        self._edge_changed_ids = set()
+
+        # traffic statistics of every edge and lane at the current time step,
+        # computed the first time they are requested (see get_edge_stats)
+        self._edge_stats = None
+
         # total number of vehicles in the network
         self.num_vehicles = 0
         # number of rl vehicles in the network
@@ -69,6 +100,21 @@ class TraCIVehicle(KernelVehicle):
         # list of vehicle ids located in each edge in the network
         self._ids_by_edge = dict()
 
+        # vehicle ids and positions in every (edge, lane) pair, sorted by
+        # position, and the (edge, lane) pair every vehicle is located in
+        self._lane_ids = dict()
+        self._lane_pos = dict()
+        self._lane_of = dict()
+
+        # memoized (edge, lane) pairs connected to every (edge, lane) pair
+        self._next_lanes = dict()
+        self._prev_lanes = dict()
+
+        # leaders/followers in the edges ahead of/behind every (edge, lane)
+        # pair, for the current time step
+        self._leaders_ahead = dict()
+        self._followers_behind = dict()
+
         # number of vehicles that entered the network for every time-step
         self._num_departed = []
         self._departed_ids = 0
@@ -88,6 +134,32 @@ class TraCIVehicle(KernelVehicle):
         # old speeds used to compute accelerations
         self.previous_speeds = {}
 
+        # whether to additionally store the numeric state of vehicles in
+        # contiguous arrays, used to vectorize the list getters
+        try:
+            columnar_state = sim_params.columnar_state
+        except AttributeError:
+            columnar_state = False
+        self._state = ColumnarVehicleState() if columnar_state else None
+        # rows of the vehicles in self.__ids within self._state
+        self._rows = None
+
+        # whether to subscribe to all variables of a vehicle (including its
+        # leader) in a single command, and to collect the subscription results
+        # of all vehicles in a single call
+        try:
+            self._batch_subscriptions = sim_params.batch_subscriptions
+        except AttributeError:
+            self._batch_subscriptions = False
+
+        # whether to buffer acceleration, lane change, and routing commands
+        # and send them to sumo in a single message before the next step
+        try:
+            self._batch_commands = sim_params.batch_commands
+        except AttributeError:
+            self._batch_commands = False
+        self._command_buffer = TraCICommandBuffer()
+
     def initialize(self, vehicles):
         """Initialize vehicle state information.
 
@@ -107,6 +179,14 @@ class TraCIVehicle(KernelVehicle):
         self.num_not_departed = 0
 
         self.__vehicles.clear()
+        self._lane_ids.clear()
+        self._lane_pos.clear()
+        self._lane_of.clear()
+        self._next_lanes.clear()
+        self._prev_lanes.clear()
+        if self._state is not None:
+            self._state.clear()
+            self._rows = None
         for typ in vehicles.initial:
             for i in range(typ['num_vehicles']):
                 veh_id = '{}_{}'.format(typ['veh_id'], i)
@@ -137,10 +217,16 @@ class TraCIVehicle(KernelVehicle):
         # copy over the previous speeds
 
         vehicle_obs = {}
-        for veh_id in self.__ids:
-            self.previous_speeds[veh_id] = self.get_speed(veh_id)
-            vehicle_obs[veh_id] = \
-                self.kernel_api.vehicle.getSubscriptionResults(veh_id)
+        if self._batch_subscriptions:
+            all_obs = self.kernel_api.vehicle.getAllSubscriptionResults()
+            for veh_id in self.__ids:
+                self.previous_speeds[veh_id] = self.get_speed(veh_id)
+                vehicle_obs[veh_id] = all_obs.get(veh_id)
+        else:
+            for veh_id in self.__ids:
+                self.previous_speeds[veh_id] = self.get_speed(veh_id)
+                vehicle_obs[veh_id] = \
+                    self.kernel_api.vehicle.getSubscriptionResults(veh_id)
         sim_obs = self.kernel_api.simulation.getSubscriptionResults()
 
         arrived_rl_ids = []
@@ -220,8 +306,23 @@ class TraCIVehicle(KernelVehicle):
             self.num_not_departed += sim_obs[tc.VAR_LOADED_VEHICLES_NUMBER] - \
                 sim_obs[tc.VAR_DEPARTED_VEHICLES_NUMBER]
 
-        # update the "headway", "leader", and "follower" variables
+        # all vehicles are new after a reset. Otherwise, vehicles that were
+        # removed and placed again in the network keep their id, and are found
+        # in the departed vehicles.
+        if reset:
+            self._edge_changed_ids = set(self.__ids)
+        else:
+            self._edge_changed_ids = set(
+                self._departed_ids).intersection(self.__ids)
+
+        # update the "headway", "leader", and "follower" variables, and find
+        # the vehicles that entered a new edge
         for veh_id in self.__ids:
+            if not reset:
+                prev_obs = self.__sumo_obs.get(veh_id)
+                if not prev_obs or prev_obs.get(tc.VAR_ROAD_ID) != \
+                        (vehicle_obs.get(veh_id) or {}).get(tc.VAR_ROAD_ID):
+                    self._edge_changed_ids.add(veh_id)
             try:
                 _position = vehicle_obs.get(veh_id, {}).get(
                     tc.VAR_POSITION, -1001)
@@ -235,8 +336,10 @@ class TraCIVehicle(KernelVehicle):
             except TypeError:
                 print(traceback.format_exc())
             headway = vehicle_obs.get(veh_id, {}).get(tc.VAR_LEADER, None)
-            # check for a collided vehicle or a vehicle with no leader
-            if headway is None:
+            # check for a collided vehicle or a vehicle with no leader. A
+            # vehicle with no leader is returned as None by TraCI, and as
+            # ('', -1) by libsumo
+            if headway is None or not headway[0] or headway[1] < 0:
                 self.__vehicles[veh_id]["leader"] = None
                 self.__vehicles[veh_id]["follower"] = None
                 self.__vehicles[veh_id]["headway"] = 1e+3
@@ -256,6 +359,11 @@ class TraCIVehicle(KernelVehicle):
 
         # update the sumo observations variable
         self.__sumo_obs = vehicle_obs.copy()
+        self._edge_stats = None
+
+        # update the columnar copy of the state of the vehicles
+        if self._state is not None:
+            self._update_columnar_state()
 
         # update the lane leaders data for each vehicle
         self._multi_lane_headways()
@@ -263,6 +371,53 @@ class TraCIVehicle(KernelVehicle):
         # make sure the rl vehicle list is still sorted
         self.__rl_ids.sort()
 
+    def _update_columnar_state(self):
+        """Copy the current state of all vehicles into the columnar store.
+
+        Rows are assigned to newly departed vehicles, and the rows of all
+        vehicles in the network are cached so that the list getters called
+        with ``get_ids()`` do not need to look them up again.
+        """
+        ids = self.__ids
+        state = self._state
+        rows = np.fromiter((state.add(veh_id) for veh_id in ids),
+                           dtype=np.int64, count=len(ids))
+
+        obs = [self.__sumo_obs.get(veh_id) or {} for veh_id in ids]
+        position = [o.get(tc.VAR_POSITION, (-1001, -1001)) for o in obs]
+
+        state.scatter("previous_speed", rows, [
+            self.previous_speeds.get(veh_id, 0) for veh_id in ids])
+        state.scatter("speed", rows, [
+            o.get(tc.VAR_SPEED, -1001) for o in obs])
+        state.scatter("position", rows, [
+            o.get(tc.VAR_LANEPOSITION, -1001) for o in obs])
+        state.scatter("lane", rows, [
+            o.get(tc.VAR_LANE_INDEX, -1001) for o in obs])
+        state.scatter("x", rows, [pos[0] for pos in position])
+        state.scatter("y", rows, [pos[1] for pos in position])
+        state.scatter("angle", rows, [
+            o.get(tc.VAR_ANGLE, -1001) for o in obs])
+        state.scatter("fuel_consumption", rows, [
+            o.get(tc.VAR_FUELCONSUMPTION, -1001) for o in obs])
+        state.scatter("distance", rows, [
+            o.get(tc.VAR_DISTANCE, -1001) for o in obs])
+        state.scatter("headway", rows, [
+            self.__vehicles[veh_id].get("headway", -1001) for veh_id in ids])
+
+        self._rows = rows
+
+    def _gather(self, field, veh_ids, error):
+        """Return the values of a field for several vehicles as an array.
+
+        This is only used when the columnar state store is enabled.
+        """
+        if veh_ids is self.__ids and self._rows is not None:
+            rows = self._rows
+        else:
+            rows = self._state.rows(veh_ids)
+        return self._state.gather(field, rows, error)
+
     def _add_departed(self, veh_id, veh_type):
         """Add a vehicle that entered the network from an inflow or reset.
 
@@ -283,6 +438,7 @@ class TraCIVehicle(KernelVehicle):
 
         if veh_id not in self.__ids:
             self.__ids.append(veh_id)
+            self._rows = None
         if veh_id not in self.__vehicles:
             self.num_vehicles += 1
             self.__vehicles[veh_id] = dict()
@@ -310,10 +466,10 @@ class TraCIVehicle(KernelVehicle):
         # specify the routing controller class
         rt_controller = self.type_parameters[veh_type]["routing_controller"]
         if rt_controller is not None:
-            self.__vehicles[veh_id]["router"] = \
-                rt_controller[0](veh_id=veh_id, router_params=rt_controller[1])
+            self._set_router(veh_id, rt_controller[0](
+                veh_id=veh_id, router_params=rt_controller[1]))
         else:
-            self.__vehicles[veh_id]["router"] = None
+            self._set_router(veh_id, None)
 
         # add the vehicle's id to the list of vehicle ids
         if accel_controller[0] == RLController:
@@ -328,18 +484,7 @@ class TraCIVehicle(KernelVehicle):
                     self.__controlled_lc_ids.append(veh_id)
 
         # subscribe the new vehicle
-        self.kernel_api.vehicle.subscribe(veh_id, [
-            tc.VAR_LANE_INDEX, tc.VAR_LANEPOSITION,
-            tc.VAR_ROAD_ID,
-            tc.VAR_SPEED,
-            tc.VAR_EDGES,
-            tc.VAR_POSITION,
-            tc.VAR_ANGLE,
-            tc.VAR_SPEED_WITHOUT_TRACI,
-            tc.VAR_FUELCONSUMPTION,
-            tc.VAR_DISTANCE
-        ])
-        self.kernel_api.vehicle.subscribeLeader(veh_id, 2000)
+        self._subscribe(veh_id)
 
         # some constant vehicle parameters to the vehicles class
         self.__vehicles[veh_id]["length"] = self.kernel_api.vehicle.getLength(
@@ -362,19 +507,6 @@ class TraCIVehicle(KernelVehicle):
             "lane_change_params"].lane_change_mode
         self.kernel_api.vehicle.setLaneChangeMode(veh_id, lc_mode)
 
-        # get initial state info
-        self.__sumo_obs[veh_id] = dict()
-        self.__sumo_obs[veh_id][tc.VAR_ROAD_ID] = \
-            self.kernel_api.vehicle.getRoadID(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_LANEPOSITION] = \
-            self.kernel_api.vehicle.getLanePosition(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_LANE_INDEX] = \
-            self.kernel_api.vehicle.getLaneIndex(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_SPEED] = \
-            self.kernel_api.vehicle.getSpeed(veh_id)
-        self.__sumo_obs[veh_id][tc.VAR_FUELCONSUMPTION] = \
-            self.kernel_api.vehicle.getFuelConsumption(veh_id)
-
         # make sure that the order of rl_ids is kept sorted
         self.__rl_ids.sort()
         self.num_rl_vehicles = len(self.__rl_ids)
@@ -382,14 +514,95 @@ class TraCIVehicle(KernelVehicle):
         # get the subscription results from the new vehicle
         new_obs = self.kernel_api.vehicle.getSubscriptionResults(veh_id)
 
+        # get initial state info. The subscription results already contain
+        # this information, so the individual queries are only needed when
+        # subscriptions are not batched.
+        if self._batch_subscriptions and new_obs is not None:
+            self.__sumo_obs[veh_id] = dict(new_obs)
+        else:
+            self.__sumo_obs[veh_id] = dict()
+            self.__sumo_obs[veh_id][tc.VAR_ROAD_ID] = \
+                self.kernel_api.vehicle.getRoadID(veh_id)
+            self.__sumo_obs[veh_id][tc.VAR_LANEPOSITION] = \
+                self.kernel_api.vehicle.getLanePosition(veh_id)
+            self.__sumo_obs[veh_id][tc.VAR_LANE_INDEX] = \
+                self.kernel_api.vehicle.getLaneIndex(veh_id)
+            self.__sumo_obs[veh_id][tc.VAR_SPEED] = \
+                self.kernel_api.vehicle.getSpeed(veh_id)
+            self.__sumo_obs[veh_id][tc.VAR_FUELCONSUMPTION] = \
+                self.kernel_api.vehicle.getFuelConsumption(veh_id)
+
         return new_obs
 
     def reset(self):
         """See parent class."""
         self.previous_speeds = {}
+        self._command_buffer.clear()
+
+    def rehydrate(self):
+        """Restore the simulator-side settings of all vehicles.
+
+        Sumo discards the subscriptions, speed modes, and lane change modes of
+        all vehicles when it loads a saved state. This method is meant to be
+        called on a copy of the vehicle kernel taken at the time the state was
+        saved, once the state has been loaded, so that the information stored
+        by this class matches the simulation again.
+        """
+        self._command_buffer.clear()
+        for veh_id in self.__ids:
+            self._subscribe(veh_id)
+
+            veh_type = self.get_type(veh_id)
+            self.kernel_api.vehicle.setSpeedMode(
+                veh_id, self.type_parameters[veh_type][
+                    "car_following_params"].speed_mode)
+            self.kernel_api.vehicle.setLaneChangeMode(
+                veh_id, self.type_parameters[veh_type][
+                    "lane_change_params"].lane_change_mode)
+
+    def _subscribe(self, veh_id):
+        """Subscribe to the variables of a vehicle that are needed by Flow."""
+        if self._batch_subscriptions:
+            self.kernel_api.vehicle.subscribe(
+                veh_id, SUBSCRIPTION_VARS + [tc.VAR_LEADER],
+                parameters={tc.VAR_LEADER: ("d", LEADER_LOOKAHEAD)})
+        else:
+            self.kernel_api.vehicle.subscribe(veh_id, SUBSCRIPTION_VARS)
+            self.kernel_api.vehicle.subscribeLeader(veh_id, LEADER_LOOKAHEAD)
+
+    def flush_commands(self):
+        """Send all buffered actuation commands to sumo.
+
+        This is called by the simulation kernel before every simulation step,
+        and does nothing if commands are not being buffered. Every command is
+        executed, even if some of them fail.
+
+        Raises
+        ------
+        traci.exceptions.TraCIException
+            if any of the commands failed. The message contains the vehicle
+            and error of every failed command.
+        """
+        if len(self._command_buffer) == 0:
+            return
+
+        errors = self._command_buffer.flush(self.kernel_api)
+        if len(errors) > 0:
+            raise TraCIException('\n'.join(
+                'Command to vehicle {} failed: {}'.format(veh_id, e)
+                for veh_id, e in errors))
+
+    def _send_command(self, veh_id, command, *args, **kwargs):
+        """Issue an actuation command, or buffer it if requested."""
+        if self._batch_commands:
+            self._command_buffer.append(veh_id, command, *args, **kwargs)
+        else:
+            command(*args, **kwargs)
 
     def remove(self, veh_id):
         """See parent class."""
+        self._edge_stats = None
+
         # remove from sumo
         if veh_id in self.kernel_api.vehicle.getIDList():
             self.kernel_api.vehicle.unsubscribe(veh_id)
@@ -397,14 +610,26 @@ class TraCIVehicle(KernelVehicle):
 
         if veh_id in self.__ids:
             self.__ids.remove(veh_id)
+            self._rows = None
+
+        # remove from the columnar state store
+        if self._state is not None:
+            self._state.remove(veh_id)
+
+        # remove from the (edge, lane) index
+        self._remove_from_lane_index(veh_id)
 
         # remove from the vehicles kernel
         if veh_id in self.__vehicles:
+            self._set_router(veh_id, None)
             del self.__vehicles[veh_id]
 
         if veh_id in self.__sumo_obs:
             del self.__sumo_obs[veh_id]
 
+        self.previous_speeds.pop(veh_id, None)
+        self._edge_changed_ids.discard(veh_id)
+
         # remove it from all other id lists (if it is there)
         if veh_id in self.__human_ids:
             self.__human_ids.remove(veh_id)
@@ -424,10 +649,14 @@ class TraCIVehicle(KernelVehicle):
     def test_set_speed(self, veh_id, speed):
         """Set the speed of the specified vehicle."""
         self.__sumo_obs[veh_id][tc.VAR_SPEED] = speed
+        self._edge_stats = None
+        if self._state is not None:
+            self._state.set(veh_id, "speed", speed)
 
     def test_set_edge(self, veh_id, edge):
         """Set the speed of the specified vehicle."""
         self.__sumo_obs[veh_id][tc.VAR_ROAD_ID] = edge
+        self._edge_stats = None
 
     def set_follower(self, veh_id, follower):
         """Set the follower of the specified vehicle."""
@@ -436,6 +665,8 @@ class TraCIVehicle(KernelVehicle):
     def set_headway(self, veh_id, headway):
         """Set the headway of the specified vehicle."""
         self.__vehicles[veh_id]["headway"] = headway
+        if self._state is not None:
+            self._state.set(veh_id, "headway", headway)
 
     def get_orientation(self, veh_id):
         """See parent class."""
@@ -497,6 +728,17 @@ class TraCIVehicle(KernelVehicle):
             return sum([self.get_ids_by_edge(edge) for edge in edges], [])
         return self._ids_by_edge.get(edges, []) or []
 
+    def get_edge_stats(self, edges, lane=None):
+        """See parent class.
+
+        The statistics of all edges and lanes are computed in a single pass
+        over the vehicles the first time they are requested in a time step,
+        and are shared by all subsequent calls until the next update.
+        """
+        if self._edge_stats is None:
+            self._edge_stats = self._compute_edge_stats()
+        return self._edge_stats.get(edges, lane)
+
     def get_inflow_rate(self, time_span):
         """See parent class."""
         if len(self._num_departed) == 0:
@@ -536,6 +778,10 @@ class TraCIVehicle(KernelVehicle):
         """See parent class."""
         return self._departed_ids
 
+    def get_edge_changed_ids(self):
+        """See parent class."""
+        return self._edge_changed_ids
+
     def get_num_not_departed(self):
         """See parent class."""
         return self.num_not_departed
@@ -544,18 +790,27 @@ class TraCIVehicle(KernelVehicle):
         """Return fuel consumption in gallons/s."""
         ml_to_gallons = 0.000264172
         if isinstance(veh_id, (list, np.ndarray)):
+            if self._state is not None:
+                return self._gather("fuel_consumption", veh_id, error) * \
+                    ml_to_gallons
             return [self.get_fuel_consumption(vehID, error) for vehID in veh_id]
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_FUELCONSUMPTION, error) * ml_to_gallons
 
     def get_previous_speed(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
+            if self._state is not None:
+                # vehicles that are not in the network have a previous speed
+                # of 0, as in the per-vehicle getter
+                return self._gather("previous_speed", veh_id, 0)
             return [self.get_previous_speed(vehID, error) for vehID in veh_id]
         return self.previous_speeds.get(veh_id, 0)
 
     def get_speed(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
+            if self._state is not None:
+                return self._gather("speed", veh_id, error)
             return [self.get_speed(vehID, error) for vehID in veh_id]
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_SPEED, error)
 
@@ -569,6 +824,8 @@ class TraCIVehicle(KernelVehicle):
     def get_position(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
+            if self._state is not None:
+                return self._gather("position", veh_id, error)
             return [self.get_position(vehID, error) for vehID in veh_id]
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_LANEPOSITION, error)
 
@@ -581,6 +838,8 @@ class TraCIVehicle(KernelVehicle):
     def get_lane(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
+            if self._state is not None:
+                return self._gather("lane", veh_id, error)
             return [self.get_lane(vehID, error) for vehID in veh_id]
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_LANE_INDEX, error)
 
@@ -613,6 +872,8 @@ class TraCIVehicle(KernelVehicle):
     def get_headway(self, veh_id, error=-1001):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
+            if self._state is not None:
+                return self._gather("headway", veh_id, error)
             return [self.get_headway(vehID, error) for vehID in veh_id]
         return self.__vehicles.get(veh_id, {}).get("headway", error)
 
@@ -643,6 +904,50 @@ class TraCIVehicle(KernelVehicle):
             ]
         return self.__vehicles.get(veh_id, {}).get("lane_changer", error)
 
+    def _set_router(self, veh_id, router):
+        """Set the routing controller of a vehicle, and index its triggers.
+
+        Parameters
+        ----------
+        veh_id : str
+            vehicle ID, which must be in the vehicles kernel
+        router : flow.controllers.BaseRouter or None
+            the new routing controller
+        """
+        old_router = self.__vehicles[veh_id].get("router")
+        if old_router is not None:
+            trigger_edges = getattr(old_router, "trigger_edges", None)
+            if trigger_edges is None:
+                self.__step_routed_ids.remove(veh_id)
+            else:
+                self.__event_routed_ids.remove(veh_id)
+                for edge in set(trigger_edges):
+                    self._trigger_edges[edge] -= 1
+                    if self._trigger_edges[edge] == 0:
+                        del self._trigger_edges[edge]
+
+        self.__vehicles[veh_id]["router"] = router
+        if router is not None:
+            trigger_edges = getattr(router, "trigger_edges", None)
+            if trigger_edges is None:
+                self.__step_routed_ids.append(veh_id)
+            else:
+                self.__event_routed_ids.append(veh_id)
+                self._trigger_edges.update(set(trigger_edges))
+
+    def get_routed_ids(self, triggered=None):
+        """See parent class."""
+        if triggered is None:
+            return self.__step_routed_ids + self.__event_routed_ids
+        elif triggered:
+            return self.__event_routed_ids
+        else:
+            return self.__step_routed_ids
+
+    def get_trigger_edges(self):
+        """See parent class."""
+        return list(self._trigger_edges)
+
     def get_routing_controller(self, veh_id, error=None):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
@@ -717,39 +1022,51 @@ class TraCIVehicle(KernelVehicle):
         This includes the lane leaders/followers/headways/tailways/
         leader velocity/follower velocity for all
         vehicles in the network.
+
+        The vehicles in every (edge, lane) pair are kept in a persistent index
+        that is sorted by position. Every step, only vehicles that changed
+        edges or lanes are moved within this index, after which each lane is
+        re-sorted. Since vehicles rarely overtake each other within a lane in
+        a single step, the lanes are nearly sorted and this is linear in the
+        number of vehicles.
         """
-        edge_list = self.master_kernel.network.get_edge_list()
-        junction_list = self.master_kernel.network.get_junction_list()
-        tot_list = edge_list + junction_list
-        num_edges = (len(self.master_kernel.network.get_edge_list()) + len(
-            self.master_kernel.network.get_junction_list()))
-
-        # maximum number of lanes in the network
-        max_lanes = max([self.master_kernel.network.num_lanes(edge_id)
-                         for edge_id in tot_list])
-
-        # Key = edge id
-        # Element = list, with the ith element containing tuples with the name
-        #           and position of all vehicles in lane i
-        edge_dict = dict.fromkeys(tot_list)
-
-        # add the vehicles to the edge_dict element
-        for veh_id in self.get_ids():
-            edge = self.get_edge(veh_id)
-            lane = self.get_lane(veh_id)
-            pos = self.get_position(veh_id)
-            if edge:
-                if edge_dict[edge] is None:
-                    edge_dict[edge] = [[] for _ in range(max_lanes)]
-                edge_dict[edge][lane].append((veh_id, pos))
-
-        # sort all lanes in each edge by position
-        for edge in tot_list:
-            if edge_dict[edge] is None:
-                del edge_dict[edge]
-            else:
-                for lane in range(max_lanes):
-                    edge_dict[edge][lane].sort(key=lambda x: x[1])
+        network = self.master_kernel.network
+        edge_list = network.get_edge_list()
+        num_edges = len(edge_list) + len(network.get_junction_list())
+
+        lane_ids = self._lane_ids
+        lane_of = self._lane_of
+
+        # move the vehicles that changed edges or lanes within the index, and
+        # collect the current position of all vehicles
+        positions = {}
+        for veh_id in self.__ids:
+            obs = self.__sumo_obs.get(veh_id) or {}
+            edge = obs.get(tc.VAR_ROAD_ID, "")
+            key = (edge, obs.get(tc.VAR_LANE_INDEX, -1001)) if edge else None
+            old_key = lane_of.get(veh_id)
+            if key != old_key:
+                self._remove_from_lane_index(veh_id)
+                if key is not None:
+                    lane_of[veh_id] = key
+                    lane_ids.setdefault(key, []).append(veh_id)
+            if key is not None:
+                positions[veh_id] = obs.get(tc.VAR_LANEPOSITION, -1001)
+
+        # sort all lanes by position, and remove empty lanes from the index
+        self._lane_pos = dict()
+        for key in list(lane_ids.keys()):
+            ids = lane_ids[key]
+            if len(ids) == 0:
+                del lane_ids[key]
+                continue
+            ids.sort(key=positions.__getitem__)
+            self._lane_pos[key] = [positions[veh_id] for veh_id in ids]
+
+        # leaders/followers in the edges ahead of/behind every lane, computed
+        # on demand below
+        self._leaders_ahead = dict()
+        self._followers_behind = dict()
 
         for veh_id in self.get_rl_ids():
             # collect the lane leaders, followers, headways, and tailways for
@@ -757,8 +1074,7 @@ class TraCIVehicle(KernelVehicle):
             edge = self.get_edge(veh_id)
             if edge:
                 headways, tailways, leaders, followers = \
-                    self._multi_lane_headways_util(veh_id, edge_dict,
-                                                   num_edges)
+                    self._multi_lane_headways_util(veh_id, num_edges)
 
                 # add the above values to the vehicles class
                 self.set_lane_headways(veh_id, headways)
@@ -768,26 +1084,55 @@ class TraCIVehicle(KernelVehicle):
 
         self._ids_by_edge = dict().fromkeys(edge_list)
 
-        for edge_id in edge_dict:
-            edges = list(itertools.chain.from_iterable(edge_dict[edge_id]))
-            # check for edges with no vehicles
-            if len(edges) > 0:
-                edges, _ = zip(*edges)
-                self._ids_by_edge[edge_id] = list(edges)
-            else:
-                self._ids_by_edge[edge_id] = []
+        for edge, lane in sorted(lane_ids.keys()):
+            if self._ids_by_edge.get(edge) is None:
+                self._ids_by_edge[edge] = []
+            self._ids_by_edge[edge].extend(lane_ids[(edge, lane)])
+
+    def _remove_from_lane_index(self, veh_id):
+        """Remove a vehicle from the (edge, lane) index, if it is there."""
+        key = self._lane_of.pop(veh_id, None)
+        if key is not None:
+            self._lane_ids[key].remove(veh_id)
+
+    def _next_lane(self, edge, lane):
+        """Return the (edge, lane) pair after the specified one, or None.
 
-    def _multi_lane_headways_util(self, veh_id, edge_dict, num_edges):
+        The connections in the network are static, so these values are
+        memoized.
+        """
+        try:
+            return self._next_lanes[(edge, lane)]
+        except KeyError:
+            next_edge = self.master_kernel.network.next_edge(edge, lane)
+            val = tuple(next_edge[0]) if len(next_edge) > 0 else None
+            self._next_lanes[(edge, lane)] = val
+            return val
+
+    def _prev_lane(self, edge, lane):
+        """Return the (edge, lane) pair before the specified one, or None.
+
+        The connections in the network are static, so these values are
+        memoized.
+        """
+        try:
+            return self._prev_lanes[(edge, lane)]
+        except KeyError:
+            prev_edge = self.master_kernel.network.prev_edge(edge, lane)
+            val = tuple(prev_edge[0]) if len(prev_edge) > 0 else None
+            self._prev_lanes[(edge, lane)] = val
+            return val
+
+    def _multi_lane_headways_util(self, veh_id, num_edges):
         """Compute multi-lane data for the specified vehicle.
 
         Parameters
         ----------
         veh_id : str
             name of the vehicle
-        edge_dict : dict < list<tuple> >
-            Key = Edge name
-                Index = lane index
-                Element = list sorted by position of (vehicle id, position)
+        num_edges : int
+            maximum number of edges/junctions searched ahead of and behind the
+            vehicle for leaders and followers
 
         Returns
         -------
@@ -797,12 +1142,6 @@ class TraCIVehicle(KernelVehicle):
         tailway : list<float>
             Index = lane index
             Element = tailway at this lane
-        lead_speed : list<str>
-            Index = lane index
-            Element = speed of leader at this lane
-        follow_speed : list<str>
-            Index = lane index
-            Element = speed of follower at this lane
         leader : list<str>
             Index = lane index
             Element = leader at this lane
@@ -823,10 +1162,9 @@ class TraCIVehicle(KernelVehicle):
 
         for lane in range(num_lanes):
             # check the vehicle's current  edge for lane leaders and followers
-            if len(edge_dict[this_edge][lane]) > 0:
-                ids, positions = zip(*edge_dict[this_edge][lane])
-                ids = list(ids)
-                positions = list(positions)
+            positions = self._lane_pos.get((this_edge, lane))
+            if positions:
+                ids = self._lane_ids[(this_edge, lane)]
                 index = bisect_left(positions, this_pos)
 
                 # if you are at the end or the front of the edge, the lane
@@ -854,21 +1192,22 @@ class TraCIVehicle(KernelVehicle):
             # if lane leader not found, check next edges
             if leader[lane] == "":
                 headway[lane], leader[lane] = self._next_edge_leaders(
-                    veh_id, edge_dict, lane, num_edges)
+                    veh_id, lane, num_edges)
 
             # if lane follower not found, check previous edges
             if follower[lane] == "":
                 tailway[lane], follower[lane] = self._prev_edge_followers(
-                    veh_id, edge_dict, lane, num_edges)
+                    veh_id, lane, num_edges)
 
         return headway, tailway, leader, follower
 
-    def _next_edge_leaders(self, veh_id, edge_dict, lane, num_edges):
+    def _next_edge_leaders(self, veh_id, lane, num_edges):
         """Search for leaders in the next edge.
 
         Looks to the edges/junctions in front of the vehicle's current edge
-        for potential leaders. This is currently done by only looking one
-        edge/junction forwards.
+        for potential leaders, up to `num_edges` edges/junctions forward. The
+        result of the search only depends on the current edge and lane, and
+        is accordingly shared by all vehicles in that lane within a step.
 
         Returns
         -------
@@ -880,40 +1219,43 @@ class TraCIVehicle(KernelVehicle):
         pos = self.get_position(veh_id)
         edge = self.get_edge(veh_id)
 
-        headway = 1000  # env.network.length
-        leader = ""
-        add_length = 0  # length increment in headway
-
-        for _ in range(num_edges):
-            # break if there are no edge/lane pairs behind the current one
-            if len(self.master_kernel.network.next_edge(edge, lane)) == 0:
-                break
-
-            add_length += self.master_kernel.network.edge_length(edge)
-            edge, lane = self.master_kernel.network.next_edge(edge, lane)[0]
-
-            try:
-                if len(edge_dict[edge][lane]) > 0:
-                    leader = edge_dict[edge][lane][0][0]
-                    headway = edge_dict[edge][lane][0][1] - pos + add_length \
-                        - self.get_length(leader)
-            except KeyError:
-                # current edge has no vehicles, so move on
-                # print(traceback.format_exc())
-                continue
-
-            # stop if a lane follower is found
-            if leader != "":
-                break
-
-        return headway, leader
-
-    def _prev_edge_followers(self, veh_id, edge_dict, lane, num_edges):
+        key = (edge, lane)
+        if key not in self._leaders_ahead:
+            # distance from the start of the current edge to the leader, and
+            # the name of the leader
+            leader_ahead = (None, "")
+            add_length = 0  # length increment in headway
+            for _ in range(num_edges):
+                next_lane = self._next_lane(edge, lane)
+                # break if there are no edge/lane pairs in front of this one
+                if next_lane is None:
+                    break
+
+                add_length += self.master_kernel.network.edge_length(edge)
+                edge, lane = next_lane
+
+                # stop if a lane leader is found
+                positions = self._lane_pos.get(next_lane)
+                if positions:
+                    leader_ahead = (positions[0] + add_length,
+                                    self._lane_ids[next_lane][0])
+                    break
+
+            self._leaders_ahead[key] = leader_ahead
+
+        offset, leader = self._leaders_ahead[key]
+        if leader == "":
+            return 1000, ""  # env.network.length
+
+        return offset - pos - self.get_length(leader), leader
+
+    def _prev_edge_followers(self, veh_id, lane, num_edges):
         """Search for followers in the previous edge.
 
         Looks to the edges/junctions behind the vehicle's current edge for
-        potential followers. This is currently done by only looking one
-        edge/junction backwards.
+        potential followers, up to `num_edges` edges/junctions backward. The
+        result of the search only depends on the current edge and lane, and
+        is accordingly shared by all vehicles in that lane within a step.
 
         Returns
         -------
@@ -925,33 +1267,35 @@ class TraCIVehicle(KernelVehicle):
         pos = self.get_position(veh_id)
         edge = self.get_edge(veh_id)
 
-        tailway = 1000  # env.network.length
-        follower = ""
-        add_length = 0  # length increment in headway
+        key = (edge, lane)
+        if key not in self._followers_behind:
+            # distance from the follower to the start of the current edge, and
+            # the name of the follower
+            follower_behind = (None, "")
+            add_length = 0  # length increment in tailway
+            for _ in range(num_edges):
+                prev_lane = self._prev_lane(edge, lane)
+                # break if there are no edge/lane pairs behind the current one
+                if prev_lane is None:
+                    break
 
-        for _ in range(num_edges):
-            # break if there are no edge/lane pairs behind the current one
-            if len(self.master_kernel.network.prev_edge(edge, lane)) == 0:
-                break
+                edge, lane = prev_lane
+                add_length += self.master_kernel.network.edge_length(edge)
 
-            edge, lane = self.master_kernel.network.prev_edge(edge, lane)[0]
-            add_length += self.master_kernel.network.edge_length(edge)
+                # stop if a lane follower is found
+                positions = self._lane_pos.get(prev_lane)
+                if positions:
+                    follower_behind = (add_length - positions[-1],
+                                       self._lane_ids[prev_lane][-1])
+                    break
 
-            try:
-                if len(edge_dict[edge][lane]) > 0:
-                    tailway = pos - edge_dict[edge][lane][-1][1] + add_length \
-                              - self.get_length(veh_id)
-                    follower = edge_dict[edge][lane][-1][0]
-            except KeyError:
-                # current edge has no vehicles, so move on
-                # print(traceback.format_exc())
-                continue
+            self._followers_behind[key] = follower_behind
 
-            # stop if a lane follower is found
-            if follower != "":
-                break
+        offset, follower = self._followers_behind[key]
+        if follower == "":
+            return 1000, ""  # env.network.length
 
-        return tailway, follower
+        return pos + offset - self.get_length(veh_id), follower
 
     def apply_acceleration(self, veh_ids, acc, smooth=True):
         """See parent class."""
@@ -960,15 +1304,53 @@ class TraCIVehicle(KernelVehicle):
             veh_ids = [veh_ids]
             acc = [acc]
 
+        acc = self._apply_rl_failsafes(veh_ids, acc)
+
         for i, vid in enumerate(veh_ids):
             if acc[i] is not None and vid in self.get_ids():
                 self.__vehicles[vid]["accel"] = acc[i]
                 this_vel = self.get_speed(vid)
                 next_vel = max([this_vel + acc[i] * self.sim_step, 0])
                 if smooth:
-                    self.kernel_api.vehicle.slowDown(vid, next_vel, 1e-3)
+                    self._send_command(vid, self.kernel_api.vehicle.slowDown,
+                                       vid, next_vel, 1e-3)
                 else:
-                    self.kernel_api.vehicle.setSpeed(vid, next_vel)
+                    self._send_command(vid, self.kernel_api.vehicle.setSpeed,
+                                       vid, next_vel)
+
+    def _apply_rl_failsafes(self, veh_ids, acc):
+        """Apply the failsafes of RL controllers to the requested actions.
+
+        The actions of RL vehicles sharing the same type are processed at
+        once through ``BaseController.apply_failsafes_batch``. The actions of
+        other vehicles are returned unchanged, as the failsafes of their
+        controllers are applied by ``BaseController.get_action``.
+        """
+        rl_ids = set(self.__rl_ids)
+        groups = {}
+        for i, veh_id in enumerate(veh_ids):
+            if acc[i] is None or veh_id not in rl_ids:
+                continue
+            controller = self.get_acc_controller(veh_id)
+            if controller is not None and controller.failsafes:
+                groups.setdefault(self.get_type(veh_id), []).append(i)
+
+        if len(groups) == 0:
+            return acc
+
+        acc = list(acc)
+        for indices in groups.values():
+            ids = [veh_ids[i] for i in indices]
+            controller = self.get_acc_controller(ids[0])
+            state = get_failsafe_state(
+                self.master_kernel, ids, self.sim_step,
+                speed_limit='obey_speed_limit' in controller.failsafe_names)
+            safe_acc = controller.apply_failsafes_batch(
+                np.array([acc[i] for i in indices], dtype=float), state)
+            for i, accel in zip(indices, safe_acc.tolist()):
+                acc[i] = accel
+
+        return acc
 
     def apply_lane_change(self, veh_ids, direction):
         """See parent class."""
@@ -997,7 +1379,8 @@ class TraCIVehicle(KernelVehicle):
 
             # perform the requested lane action action in TraCI
             if target_lane != this_lane:
-                self.kernel_api.vehicle.changeLane(
+                self._send_command(
+                    veh_id, self.kernel_api.vehicle.changeLane,
                     veh_id, int(target_lane), self.sim_step)
 
                 if veh_id in self.get_rl_ids():
@@ -1013,13 +1396,19 @@ class TraCIVehicle(KernelVehicle):
 
         for i, veh_id in enumerate(veh_ids):
             if route_choices[i] is not None:
-                self.kernel_api.vehicle.setRoute(
-                    vehID=veh_id, edgeList=route_choices[i])
+                self._send_command(
+                    veh_id, self.kernel_api.vehicle.setRoute,
+                    veh_id, route_choices[i])
 
     def get_x_by_id(self, veh_id):
         """See parent class."""
         if isinstance(veh_id, (list, np.ndarray)):
-            return [self.get_x_by_id(vehID) for vehID in veh_id]
+            edges = self.get_edge(veh_id)
+            x = self.master_kernel.network.get_x_many(
+                edges, self.get_position(veh_id))
+            # occurs when a vehicle crashes is teleported for some other reason
+            return [0. if edge == '' else pos
+                    for edge, pos in zip(edges, x.tolist())]
         if self.get_edge(veh_id) == '':
             # occurs when a vehicle crashes is teleported for some other reason
             return 0.
@@ -1041,7 +1430,7 @@ class TraCIVehicle(KernelVehicle):
                         self.type_parameters[self.get_type(veh_id)]:
                     # color rl vehicles red
                     self.set_color(veh_id=veh_id, color=RED)
-            except (FatalTraCIError, TraCIException) as e:
+            except self.master_kernel.api_errors as e:
                 print('Error when updating rl vehicle colors:', e)
 
         # color vehicles white if not observed and cyan if observed
@@ -1052,7 +1441,7 @@ class TraCIVehicle(KernelVehicle):
                 if self._force_color_update or 'color' not in \
                         self.type_parameters[self.get_type(veh_id)]:
                     self.set_color(veh_id=veh_id, color=color)
-            except (FatalTraCIError, TraCIException) as e:
+            except self.master_kernel.api_errors as e:
                 print('Error when updating human vehicle colors:', e)
 
         for veh_id in self.get_ids():
@@ -1063,7 +1452,7 @@ class TraCIVehicle(KernelVehicle):
                     if self._force_color_update or 'color' not in \
                             self.type_parameters[self.get_type(veh_id)]:
                         self.set_color(veh_id=veh_id, color=color)
-            except (FatalTraCIError, TraCIException) as e:
+            except self.master_kernel.api_errors as e:
                 print('Error when updating human vehicle colors:', e)
 
         # color vehicles by speed if desired
@@ -1096,8 +1485,7 @@ class TraCIVehicle(KernelVehicle):
         The last term for sumo (transparency) is set to 255.
         """
         r, g, b = color
-        self.kernel_api.vehicle.setColor(
-            vehID=veh_id, color=(r, g, b, 255))
+        self.kernel_api.vehicle.setColor(veh_id, (r, g, b, 255))
 
     def add(self, veh_id, type_id, edge, pos, lane, speed):
         """See parent class."""
@@ -1171,6 +1559,10 @@ class TraCIVehicle(KernelVehicle):
 
     def get_distance(self, veh_id, error=-1001):
         """See parent class."""
+        if isinstance(veh_id, (list, np.ndarray)):
+            if self._state is not None:
+                return self._gather("distance", veh_id, error)
+            return [self.get_distance(vehID, error) for vehID in veh_id]
         return self.__sumo_obs.get(veh_id, {}).get(tc.VAR_DISTANCE, error)
 
     def get_road_grade(self, veh_id):
@@ -539,6 +539,15 @@ class SumoParams(SimParams):
     emission_path : str, optional
         Path to the folder in which to create the emissions output.
         Emissions output is not generated if this value is not specified
+    emission_fields : list of str, optional
+        the fields stored in the emissions output in addition to the time and
+        vehicle ID (see flow/core/kernel/simulation/emission.py for a list of
+        valid fields). All fields are stored by default.
+    emission_format : str, optional
+        format of the emissions output, "csv", "parquet", or "trace".
+        Parquet files require pyarrow to be installed. Traces are directories
+        of .npy files that can be read without loading them in memory (see
+        flow/core/trace.py). Defaults to "csv".
     lateral_resolution : float, optional
         width of the divided sublanes within a lane, defaults to None (i.e.
         no sublanes). If this value is specified, the vehicle in the
@@ -588,6 +597,55 @@ class SumoParams(SimParams):
         current time step
     use_ballistic: bool, optional
         If true, use a ballistic integration step instead of an euler step
+    columnar_state : bool, optional
+        whether the vehicle kernel should additionally store the numeric state
+        of vehicles (speed, position, lane, headway, ...) in contiguous NumPy
+        arrays. If set to True, getters called with a list of vehicle IDs
+        return NumPy arrays instead of lists. Defaults to False.
+    batch_subscriptions : bool, optional
+        whether the vehicle kernel should subscribe to all variables of a
+        vehicle (including its leader) in a single command, and collect the
+        subscription results of all vehicles with a single call every step.
+        Defaults to False.
+    batch_commands : bool, optional
+        whether the vehicle kernel should buffer the acceleration, lane change,
+        and routing commands issued during a step and send them to sumo in a
+        single message right before the simulation step, instead of one
+        blocking round trip per command. Note that, if set to True, the effect
+        of these commands is not visible to the simulator until the step is
+        performed. Defaults to False.
+    snapshot_reset : bool, optional
+        whether to save the state of the simulation once, at the end of the
+        first reset (i.e. after the warmup steps), and to restore this state
+        during subsequent resets instead of re-introducing every vehicle and
+        re-running the warmup steps. The snapshot is discarded whenever the
+        sumo instance is restarted, and is not used if the initial positions
+        of vehicles are shuffled or if restart_instance is set to True.
+        Defaults to False.
+    network_cache : bool, optional
+        whether to cache the networks generated by netconvert, along with
+        their edge and connection data, in the temporary directory of the
+        system. Networks whose nodes, edges, types, connections, and traffic
+        lights match those of a cached network are then not generated again.
+        The cache is shared by all processes. Defaults to False.
+    batch_traffic_lights : bool, optional
+        whether the traffic light kernel should collect the states of all
+        traffic lights with a single call every step, and only send the
+        states of traffic lights that are not already in the requested state.
+        Defaults to False.
+    render_backend : str, optional
+        the renderer used by the "gray", "dgray", "rgb" and "drgb" rendering
+        modes. "pyglet" (default) draws frames with OpenGL in a pyglet
+        window, and requires a display. "raster" rasterizes frames with NumPy
+        and OpenCV instead, and runs without any display (see
+        flow.renderer.raster_renderer.RasterRenderer).
+    render_format : str, optional
+        the format of the frames saved by the "gray", "dgray", "rgb" and
+        "drgb" rendering modes when save_render is set to True. "png"
+        (default) saves one image per frame, "mp4" encodes the frames into a
+        video, and "npz" saves compressed chunks of frames. The frames are
+        encoded in a background thread (see
+        flow.renderer.render_writer.RenderWriter).
     """
 
     def __init__(self,
@@ -609,7 +667,17 @@ class SumoParams(SimParams):
                  teleport_time=-1,
                  num_clients=1,
                  color_by_speed=False,
-                 use_ballistic=False):
+                 use_ballistic=False,
+                 columnar_state=False,
+                 batch_subscriptions=False,
+                 batch_commands=False,
+                 snapshot_reset=False,
+                 emission_fields=None,
+                 emission_format="csv",
+                 network_cache=False,
+                 batch_traffic_lights=False,
+                 render_backend="pyglet",
+                 render_format="png"):
         """Instantiate SumoParams."""
         super(SumoParams, self).__init__(
             sim_step, render, restart_instance, emission_path, save_render,
@@ -624,6 +692,16 @@ class SumoParams(SimParams):
         self.num_clients = num_clients
         self.color_by_speed = color_by_speed
         self.use_ballistic = use_ballistic
+        self.columnar_state = columnar_state
+        self.batch_subscriptions = batch_subscriptions
+        self.batch_commands = batch_commands
+        self.snapshot_reset = snapshot_reset
+        self.emission_fields = emission_fields
+        self.emission_format = emission_format
+        self.network_cache = network_cache
+        self.batch_traffic_lights = batch_traffic_lights
+        self.render_backend = render_backend
+        self.render_format = render_format
 
 
 class EnvParams:
@@ -657,6 +735,30 @@ class EnvParams:
         specifies whether to clip actions from the policy by their range when
         they are inputted to the reward function. Note that the actions are
         still clipped before they are provided to `apply_rl_actions`.
+    batch_controllers : bool, optional
+        specifies whether the accelerations of vehicles sharing the same
+        acceleration controller type should be computed together using
+        vectorized operations (see flow/controllers/batch.py), rather than by
+        calling the controller of every vehicle one at a time. This produces
+        the same actions, and is only faster for controllers that implement
+        ``get_accel_batch``.
+    event_routing : bool, optional
+        specifies whether routing controllers that declare trigger edges (see
+        flow/controllers/base_routing_controller.py) should only be called
+        when their vehicle departs, enters a new edge, or is on one of these
+        edges, rather than at every step. Routers without trigger edges are
+        still called at every step.
+    profile_path : str, optional
+        path to the file in which to save the duration of the phases of every
+        step and reset (controllers, routing, simulation step, kernel updates,
+        observations, rewards, ...) when the environment is terminated. Phases
+        are only measured if this value is specified. See
+        flow/core/profiler.py
+    profile_format : str, optional
+        format of the profiling file: "json" to save the number of
+        occurrences, total and mean duration, percentiles, and maximum
+        duration of every phase, or "chrome" to save every measured phase as a
+        Chrome trace (viewable in chrome://tracing). Defaults to "json".
     """
 
     def __init__(self,
@@ -665,7 +767,11 @@ class EnvParams:
                  warmup_steps=0,
                  sims_per_step=1,
                  evaluate=False,
-                 clip_actions=True):
+                 clip_actions=True,
+                 batch_controllers=False,
+                 event_routing=False,
+                 profile_path=None,
+                 profile_format="json"):
         """Instantiate EnvParams."""
         self.additional_params = \
             additional_params if additional_params is not None else {}
@@ -674,6 +780,10 @@ class EnvParams:
         self.sims_per_step = sims_per_step
         self.evaluate = evaluate
         self.clip_actions = clip_actions
+        self.batch_controllers = batch_controllers
+        self.event_routing = event_routing
+        self.profile_path = profile_path
+        self.profile_format = profile_format
 
     def get_additional_param(self, key):
         """Return a variable from additional_params."""
@@ -0,0 +1,185 @@
+"""Contains the profiler measuring the duration of every phase of a step."""
+import json
+import os
+from array import array
+from time import perf_counter_ns
+
+import numpy as np
+
+from flow.core.util import ensure_dir
+
+# percentiles of the durations of every phase included in the summary
+PERCENTILES = [50, 90, 99]
+
+# maximum number of spans stored for Chrome traces. Spans past this limit are
+# still included in the summary.
+MAX_TRACE_EVENTS = 1000000
+
+
+class StepProfiler(object):
+    """Profiler of the phases of environment steps and resets.
+
+    Phases are delimited by calls to ``begin`` and ``end``, and may be nested.
+    The duration of every phase is measured with ``time.perf_counter_ns`` and
+    stored as a compact array of integers, from which percentiles are computed
+    once profiling is over.
+
+    Usage
+    -----
+    >>> profiler = StepProfiler()
+    >>> profiler.begin("step")
+    >>> ...
+    >>> profiler.end()
+    >>> profiler.summary()
+    {'step': {'count': 1, 'total_ms': ..., 'mean_ms': ..., ...}}
+
+    Attributes
+    ----------
+    enabled : bool
+        whether phases are measured. False for the ``NullProfiler``.
+    trace : bool
+        whether to store the start time of every span, as required to
+        generate Chrome traces
+    """
+
+    enabled = True
+
+    def __init__(self, trace=False):
+        """Instantiate the profiler.
+
+        Parameters
+        ----------
+        trace : bool, optional
+            whether to store the start time of every span, as required to
+            generate Chrome traces
+        """
+        self.trace = trace
+        self._stack = []
+        self._durations = {}
+        self._events = []
+
+    def begin(self, name):
+        """Start a phase.
+
+        Parameters
+        ----------
+        name : str
+            name of the phase
+        """
+        self._stack.append((name, perf_counter_ns()))
+
+    def end(self):
+        """End the last phase started."""
+        end = perf_counter_ns()
+        name, start = self._stack.pop()
+
+        durations = self._durations.get(name)
+        if durations is None:
+            durations = self._durations[name] = array('q')
+        durations.append(end - start)
+
+        if self.trace and len(self._events) < MAX_TRACE_EVENTS:
+            self._events.append((name, start, end - start))
+
+    def reset(self):
+        """Discard all measurements."""
+        self._stack.clear()
+        self._durations.clear()
+        self._events.clear()
+
+    def summary(self):
+        """Return statistics on the duration of every phase.
+
+        Returns
+        -------
+        dict <str, dict>
+            number of occurrences, total duration, mean duration, percentiles
+            (see ``PERCENTILES``) and maximum duration of every phase, in
+            milliseconds
+        """
+        summary = {}
+        for name, durations in self._durations.items():
+            values = np.frombuffer(durations, dtype=np.int64) / 1e6
+            stats = {
+                "count": len(values),
+                "total_ms": float(values.sum()),
+                "mean_ms": float(values.mean()),
+            }
+            for q, value in zip(PERCENTILES,
+                                np.percentile(values, PERCENTILES)):
+                stats["p{}_ms".format(q)] = float(value)
+            stats["max_ms"] = float(values.max())
+            summary[name] = stats
+        return summary
+
+    def chrome_trace(self):
+        """Return the spans in the Chrome trace event format.
+
+        The trace can be opened in chrome://tracing or https://ui.perfetto.dev.
+        Spans are only stored if ``trace`` is set to True.
+
+        Returns
+        -------
+        dict
+            the trace events
+        """
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {"name": name, "ph": "X", "pid": pid, "tid": 0,
+                 "ts": start / 1e3, "dur": duration / 1e3}
+                for name, start, duration in self._events],
+            "displayTimeUnit": "ms",
+        }
+
+    def save(self, path, file_format="json"):
+        """Save the measurements to a file.
+
+        Parameters
+        ----------
+        path : str
+            path to the file
+        file_format : str, optional
+            "json" to save the summary of every phase (see ``summary``), or
+            "chrome" to save all spans as a Chrome trace (see
+            ``chrome_trace``)
+
+        Raises
+        ------
+        ValueError
+            if an unknown format is requested
+        """
+        if file_format == "json":
+            data = self.summary()
+        elif file_format == "chrome":
+            data = self.chrome_trace()
+        else:
+            raise ValueError("Unknown profile format: {}".format(file_format))
+
+        directory = os.path.dirname(path)
+        if directory:
+            ensure_dir(directory)
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2 if file_format == "json" else None)
+
+
+class NullProfiler(StepProfiler):
+    """Profiler that does not measure anything.
+
+    This is used when profiling is disabled, so that phases can be delimited
+    unconditionally at a negligible cost.
+    """
+
+    enabled = False
+
+    def begin(self, name):
+        """See parent class."""
+        pass
+
+    def end(self):
+        """See parent class."""
+        pass
+
+
+# shared instance of the profiler used when profiling is disabled
+NULL_PROFILER = NullProfiler()
@@ -1,7 +1,98 @@
-"""A series of reward functions."""
+"""A series of reward functions.
+
+Most rewards are available in two forms: functions of the environment (e.g.
+``desired_velocity``), and functions of arrays of vehicle states (e.g.
+``desired_velocity_from_arrays``), which compute the reward with vectorized
+NumPy operations. The arrays of the vehicles of an environment are collected
+by ``get_vehicle_arrays``, and ``multi_reward`` computes several rewards from
+a single collection, e.g. for logging.
+"""
 
 import numpy as np
 
+# parameters of an average sized vehicle, used to compute energy consumption
+M = 1200  # mass of average sized vehicle (kg)
+g = 9.81  # gravitational acceleration (m/s^2)
+Cr = 0.005  # rolling resistance coefficient
+Ca = 0.3  # aerodynamic drag coefficient
+rho = 1.225  # air density (kg/m^3)
+A = 2.6  # vehicle cross sectional area (m^2)
+
+# speeds below this value (e.g. -1001) denote vehicles that are missing from
+# the network, after which rewards are set to zero
+_MISSING_SPEED = -100
+
+
+# keys of the arrays collected by get_vehicle_arrays
+VEHICLE_ARRAYS = ("speed", "previous_speed", "accel", "grade", "fuel",
+                  "max_speed", "sim_step", "num_vehicles")
+
+
+def get_vehicle_arrays(env, veh_ids=None, keys=None):
+    """Collect the state of vehicles as arrays, as used by vectorized rewards.
+
+    Parameters
+    ----------
+    env : flow.envs.Env
+        the environment variable, which contains information on the current
+        state of the system.
+    veh_ids : list of str, optional
+        the vehicles to collect. Defaults to all vehicles in the network.
+    keys : list of str, optional
+        the arrays to collect (see below), so that rewards only collect the
+        arrays they use. All arrays are collected by default.
+
+    Returns
+    -------
+    dict
+        with the following keys:
+
+        * speed: speed of every vehicle
+        * previous_speed: speed of every vehicle at the previous step
+        * accel: absolute acceleration of every vehicle, computed from the
+          two previous values
+        * grade: road grade of every vehicle, in radians
+        * fuel: fuel consumption of every vehicle, in gallons/s
+        * max_speed: maximum speed limit of the (non-internal) edges of the
+          network
+        * sim_step: duration of a simulation step
+        * num_vehicles: number of vehicles in the network
+    """
+    if veh_ids is None:
+        veh_ids = env.k.vehicle.get_ids()
+    if keys is None:
+        keys = VEHICLE_ARRAYS
+    vehicles = env.k.vehicle
+
+    arrays = {"sim_step": env.sim_step}
+    if "speed" in keys or "accel" in keys:
+        arrays["speed"] = np.asarray(vehicles.get_speed(veh_ids), dtype=float)
+    if "previous_speed" in keys or "accel" in keys:
+        arrays["previous_speed"] = np.asarray(
+            vehicles.get_previous_speed(veh_ids), dtype=float)
+    if "accel" in keys:
+        arrays["accel"] = np.abs(
+            arrays["speed"] - arrays["previous_speed"]) / env.sim_step
+    if "grade" in keys:
+        arrays["grade"] = np.array(
+            [vehicles.get_road_grade(veh_id) for veh_id in veh_ids],
+            dtype=float)
+    if "fuel" in keys:
+        arrays["fuel"] = np.asarray(
+            vehicles.get_fuel_consumption(veh_ids), dtype=float)
+    if "max_speed" in keys:
+        arrays["max_speed"] = _max_speed_limit(env)
+    if "num_vehicles" in keys:
+        arrays["num_vehicles"] = vehicles.num_vehicles
+    return arrays
+
+
+def _max_speed_limit(env):
+    """Return the maximum speed limit of the edges of the network."""
+    return max(
+        env.k.network.speed_limit(edge)
+        for edge in env.k.network.get_edge_list())
+
 
 def desired_velocity(env, fail=False, edge_list=None):
     r"""Encourage proximity to a desired velocity.
@@ -40,18 +131,36 @@ def desired_velocity(env, fail=False, edge_list=None):
     else:
         veh_ids = env.k.vehicle.get_ids_by_edge(edge_list)
 
-    vel = np.array(env.k.vehicle.get_speed(veh_ids))
-    num_vehicles = len(veh_ids)
+    vel = np.asarray(env.k.vehicle.get_speed(veh_ids), dtype=float)
+    target_vel = env.env_params.additional_params['target_velocity']
+    return desired_velocity_from_arrays(vel, target_vel, fail=fail)
 
-    if any(vel < -100) or fail or num_vehicles == 0:
-        return 0.
 
-    target_vel = env.env_params.additional_params['target_velocity']
-    max_cost = np.array([target_vel] * num_vehicles)
-    max_cost = np.linalg.norm(max_cost)
+def desired_velocity_from_arrays(speed, target_velocity, fail=False):
+    """Compute the desired velocity reward from the speeds of vehicles.
+
+    See ``desired_velocity``.
+
+    Parameters
+    ----------
+    speed : np.ndarray
+        speed of every vehicle
+    target_velocity : float
+        the desired velocity
+    fail : bool, optional
+        specifies if any crash or other failure occurred in the system
+
+    Returns
+    -------
+    float
+        reward value
+    """
+    num_vehicles = len(speed)
+    if fail or num_vehicles == 0 or np.any(speed < _MISSING_SPEED):
+        return 0.
 
-    cost = vel - target_vel
-    cost = np.linalg.norm(cost)
+    max_cost = np.linalg.norm(np.full(num_vehicles, float(target_velocity)))
+    cost = np.linalg.norm(speed - target_velocity)
 
     # epsilon term (to deal with ZeroDivisionError exceptions)
     eps = np.finfo(np.float32).eps
@@ -78,14 +187,32 @@ def average_velocity(env, fail=False):
     float
         reward value
     """
-    vel = np.array(env.k.vehicle.get_speed(env.k.vehicle.get_ids()))
+    vel = np.asarray(
+        env.k.vehicle.get_speed(env.k.vehicle.get_ids()), dtype=float)
+    return average_velocity_from_arrays(vel, fail=fail)
 
-    if any(vel < -100) or fail:
-        return 0.
-    if len(vel) == 0:
+
+def average_velocity_from_arrays(speed, fail=False):
+    """Compute the average velocity reward from the speeds of vehicles.
+
+    See ``average_velocity``.
+
+    Parameters
+    ----------
+    speed : np.ndarray
+        speed of every vehicle
+    fail : bool, optional
+        specifies if any crash or other failure occurred in the system
+
+    Returns
+    -------
+    float
+        reward value
+    """
+    if fail or len(speed) == 0 or np.any(speed < _MISSING_SPEED):
         return 0.
 
-    return np.mean(vel)
+    return np.mean(speed)
 
 
 def rl_forward_progress(env, gain=0.1):
@@ -131,20 +258,37 @@ def min_delay(env):
     float
         reward value
     """
-    vel = np.array(env.k.vehicle.get_speed(env.k.vehicle.get_ids()))
+    vel = np.asarray(
+        env.k.vehicle.get_speed(env.k.vehicle.get_ids()), dtype=float)
+    return min_delay_from_arrays(vel, _max_speed_limit(env), env.sim_step)
 
-    vel = vel[vel >= -1e-6]
-    v_top = max(
-        env.k.network.speed_limit(edge)
-        for edge in env.k.network.get_edge_list())
-    time_step = env.sim_step
 
-    max_cost = time_step * sum(vel.shape)
+def min_delay_from_arrays(speed, max_speed, sim_step):
+    """Compute the minimum delay reward from the speeds of vehicles.
+
+    See ``min_delay``.
+
+    Parameters
+    ----------
+    speed : np.ndarray
+        speed of every vehicle
+    max_speed : float
+        maximum speed limit of the network
+    sim_step : float
+        duration of a simulation step
+
+    Returns
+    -------
+    float
+        reward value
+    """
+    vel = speed[speed >= -1e-6]
+    max_cost = sim_step * len(vel)
 
     # epsilon term (to deal with ZeroDivisionError exceptions)
     eps = np.finfo(np.float32).eps
 
-    cost = time_step * sum((v_top - vel) / v_top)
+    cost = sim_step * np.sum((max_speed - vel) / max_speed)
     return max((max_cost - cost) / (max_cost + eps), 0)
 
 
@@ -163,18 +307,21 @@ def avg_delay_specified_vehicles(env, veh_ids):
     float
         average delay
     """
-    sum = 0
-    for edge in env.k.network.get_edge_list():
-        for veh_id in env.k.vehicle.get_ids_by_edge(edge):
-            v_top = env.k.network.speed_limit(edge)
-            sum += (v_top - env.k.vehicle.get_speed(veh_id)) / v_top
-    time_step = env.sim_step
-    try:
-        cost = time_step * sum
-        return cost / len(veh_ids)
-    except ZeroDivisionError:
+    if len(veh_ids) == 0:
         return 0
 
+    # speed limit of the edge of every vehicle on a (non-internal) edge
+    ids, v_top = [], []
+    for edge in env.k.network.get_edge_list():
+        edge_ids = env.k.vehicle.get_ids_by_edge(edge)
+        ids.extend(edge_ids)
+        v_top.extend([env.k.network.speed_limit(edge)] * len(edge_ids))
+    v_top = np.asarray(v_top, dtype=float)
+    vel = np.asarray(env.k.vehicle.get_speed(ids), dtype=float)
+
+    cost = env.sim_step * np.sum((v_top - vel) / v_top)
+    return cost / len(veh_ids)
+
 
 def min_delay_unscaled(env):
     """Return the average delay for all vehicles in the system.
@@ -190,19 +337,41 @@ def min_delay_unscaled(env):
     float
         reward value
     """
-    vel = np.array(env.k.vehicle.get_speed(env.k.vehicle.get_ids()))
+    vel = np.asarray(
+        env.k.vehicle.get_speed(env.k.vehicle.get_ids()), dtype=float)
+    return min_delay_unscaled_from_arrays(
+        vel, _max_speed_limit(env), env.sim_step,
+        env.k.vehicle.num_vehicles)
 
-    vel = vel[vel >= -1e-6]
-    v_top = max(
-        env.k.network.speed_limit(edge)
-        for edge in env.k.network.get_edge_list())
-    time_step = env.sim_step
+
+def min_delay_unscaled_from_arrays(speed, max_speed, sim_step, num_vehicles):
+    """Compute the average delay of vehicles from their speeds.
+
+    See ``min_delay_unscaled``.
+
+    Parameters
+    ----------
+    speed : np.ndarray
+        speed of every vehicle
+    max_speed : float
+        maximum speed limit of the network
+    sim_step : float
+        duration of a simulation step
+    num_vehicles : int
+        number of vehicles in the network
+
+    Returns
+    -------
+    float
+        reward value
+    """
+    vel = speed[speed >= -1e-6]
 
     # epsilon term (to deal with ZeroDivisionError exceptions)
     eps = np.finfo(np.float32).eps
 
-    cost = time_step * sum((v_top - vel) / v_top)
-    return cost / (env.k.vehicle.num_vehicles + eps)
+    cost = sim_step * np.sum((max_speed - vel) / max_speed)
+    return cost / (num_vehicles + eps)
 
 
 def penalize_standstill(env, gain=1):
@@ -226,10 +395,28 @@ def penalize_standstill(env, gain=1):
         reward value
     """
     veh_ids = env.k.vehicle.get_ids()
-    vel = np.array(env.k.vehicle.get_speed(veh_ids))
-    num_standstill = len(vel[vel == 0])
-    penalty = gain * num_standstill
-    return -penalty
+    vel = np.asarray(env.k.vehicle.get_speed(veh_ids), dtype=float)
+    return penalize_standstill_from_arrays(vel, gain=gain)
+
+
+def penalize_standstill_from_arrays(speed, gain=1):
+    """Penalize vehicle standstill from the speeds of vehicles.
+
+    See ``penalize_standstill``.
+
+    Parameters
+    ----------
+    speed : np.ndarray
+        speed of every vehicle
+    gain : float
+        multiplicative factor on the action penalty
+
+    Returns
+    -------
+    float
+        reward value
+    """
+    return -gain * np.count_nonzero(speed == 0)
 
 
 def penalize_near_standstill(env, thresh=0.3, gain=1):
@@ -250,10 +437,30 @@ def penalize_near_standstill(env, thresh=0.3, gain=1):
         multiplicative factor on the action penalty
     """
     veh_ids = env.k.vehicle.get_ids()
-    vel = np.array(env.k.vehicle.get_speed(veh_ids))
-    penalize = len(vel[vel < thresh])
-    penalty = gain * penalize
-    return -penalty
+    vel = np.asarray(env.k.vehicle.get_speed(veh_ids), dtype=float)
+    return penalize_near_standstill_from_arrays(vel, thresh=thresh, gain=gain)
+
+
+def penalize_near_standstill_from_arrays(speed, thresh=0.3, gain=1):
+    """Penalize vehicles at a low velocity from the speeds of vehicles.
+
+    See ``penalize_near_standstill``.
+
+    Parameters
+    ----------
+    speed : np.ndarray
+        speed of every vehicle
+    thresh : float
+        the velocity threshold below which penalties are applied
+    gain : float
+        multiplicative factor on the action penalty
+
+    Returns
+    -------
+    float
+        reward value
+    """
+    return -gain * np.count_nonzero(speed < thresh)
 
 
 def penalize_headway_variance(vehicles,
@@ -313,23 +520,9 @@ def energy_consumption(env, gain=.001):
     The power calculated here is the lower bound of the actual power consumed
     by a vehicle.
     """
-    power = 0
-
-    M = 1200  # mass of average sized vehicle (kg)
-    g = 9.81  # gravitational acceleration (m/s^2)
-    Cr = 0.005  # rolling resistance coefficient
-    Ca = 0.3  # aerodynamic drag coefficient
-    rho = 1.225  # air density (kg/m^3)
-    A = 2.6  # vehicle cross sectional area (m^2)
-    for veh_id in env.k.vehicle.get_ids():
-        speed = env.k.vehicle.get_speed(veh_id)
-        prev_speed = env.k.vehicle.get_previous_speed(veh_id)
-
-        accel = abs(speed - prev_speed) / env.sim_step
-
-        power += M * speed * accel + M * g * Cr * speed + 0.5 * rho * A * Ca * speed ** 3
-
-    return -gain * power
+    arrays = get_vehicle_arrays(env, keys=("speed", "accel", "grade"))
+    return energy_consumption_from_arrays(
+        arrays["speed"], arrays["accel"], arrays["grade"], gain=gain)
 
 
 def veh_energy_consumption(env, veh_id, gain=.001):
@@ -339,22 +532,61 @@ def veh_energy_consumption(env, veh_id, gain=.001):
     The power calculated here is the lower bound of the actual power consumed
     by a vehicle.
     """
-    power = 0
-
-    M = 1200  # mass of average sized vehicle (kg)
-    g = 9.81  # gravitational acceleration (m/s^2)
-    Cr = 0.005  # rolling resistance coefficient
-    Ca = 0.3  # aerodynamic drag coefficient
-    rho = 1.225  # air density (kg/m^3)
-    A = 2.6  # vehicle cross sectional area (m^2)
     speed = env.k.vehicle.get_speed(veh_id)
     prev_speed = env.k.vehicle.get_previous_speed(veh_id)
 
     accel = abs(speed - prev_speed) / env.sim_step
+    grade = env.k.vehicle.get_road_grade(veh_id)
+
+    return -gain * float(power_from_arrays(speed, accel, grade))
+
+
+def power_from_arrays(speed, accel, grade=0):
+    """Compute the power consumed by vehicles.
+
+    Assumes vehicles are average sized vehicles. The power calculated here is
+    the lower bound of the actual power consumed by a vehicle.
+
+    Parameters
+    ----------
+    speed : np.ndarray or float
+        speed of every vehicle
+    accel : np.ndarray or float
+        absolute acceleration of every vehicle
+    grade : np.ndarray or float, optional
+        road grade of every vehicle, in radians
+
+    Returns
+    -------
+    np.ndarray or float
+        power consumed by every vehicle
+    """
+    return M * speed * accel + M * g * Cr * speed \
+        + 0.5 * rho * A * Ca * speed ** 3 + M * g * np.sin(grade) * speed
+
 
-    power += M * speed * accel + M * g * Cr * speed + 0.5 * rho * A * Ca * speed ** 3
+def energy_consumption_from_arrays(speed, accel, grade=0, gain=.001):
+    """Compute the energy consumption reward from the states of vehicles.
 
-    return -gain * power
+    See ``energy_consumption``.
+
+    Parameters
+    ----------
+    speed : np.ndarray
+        speed of every vehicle
+    accel : np.ndarray
+        absolute acceleration of every vehicle
+    grade : np.ndarray or float, optional
+        road grade of every vehicle, in radians
+    gain : float
+        scaling factor for the reward
+
+    Returns
+    -------
+    float
+        reward value
+    """
+    return -gain * float(np.sum(power_from_arrays(speed, accel, grade)))
 
 
 def miles_per_megajoule(env, veh_ids=None, gain=.001):
@@ -374,29 +606,43 @@ def miles_per_megajoule(env, veh_ids=None, gain=.001):
     gain : float
         scaling factor for the reward
     """
-    mpj = 0
-    counter = 0
-    if veh_ids is None:
-        veh_ids = env.k.vehicle.get_ids()
-    elif not isinstance(veh_ids, list):
+    if veh_ids is not None and not isinstance(veh_ids, list):
         veh_ids = [veh_ids]
-    for veh_id in veh_ids:
-        speed = env.k.vehicle.get_speed(veh_id)
-        # convert to be positive since the function called is a penalty
-        power = -veh_energy_consumption(env, veh_id, gain=1.0)
-        if power > 0 and speed >= 0.0:
-            counter += 1
-            # meters / joule is (v * \delta t) / (power * \delta t)
-            mpj += speed / power
-    if counter > 0:
-        mpj /= counter
+    arrays = get_vehicle_arrays(
+        env, veh_ids, keys=("speed", "accel", "grade"))
+    return miles_per_megajoule_from_arrays(
+        arrays["speed"], arrays["accel"], arrays["grade"], gain=gain)
+
+
+def miles_per_megajoule_from_arrays(speed, accel, grade=0, gain=.001):
+    """Compute the average miles per mega-joule of vehicles.
+
+    See ``miles_per_megajoule``.
+
+    Parameters
+    ----------
+    speed : np.ndarray
+        speed of every vehicle
+    accel : np.ndarray
+        absolute acceleration of every vehicle
+    grade : np.ndarray or float, optional
+        road grade of every vehicle, in radians
+    gain : float
+        scaling factor for the reward
 
-    # convert from meters per joule to miles per joule
-    mpj /= 1609.0
-    # convert from miles per joule to miles per megajoule
-    mpj *= 10**6
+    Returns
+    -------
+    float
+        reward value
+    """
+    power = power_from_arrays(speed, accel, grade)
+    valid = (power > 0) & (speed >= 0.0)
+
+    # meters / joule is (v * \delta t) / (power * \delta t)
+    mpj = np.mean(speed[valid] / power[valid]) if np.any(valid) else 0
 
-    return mpj * gain
+    # convert from meters per joule to miles per megajoule
+    return mpj / 1609.0 * 10**6 * gain
 
 
 def miles_per_gallon(env, veh_ids=None, gain=.001):
@@ -416,23 +662,116 @@ def miles_per_gallon(env, veh_ids=None, gain=.001):
     gain : float
         scaling factor for the reward
     """
-    mpg = 0
-    counter = 0
     if veh_ids is None:
         veh_ids = env.k.vehicle.get_ids()
     elif not isinstance(veh_ids, list):
         veh_ids = [veh_ids]
-    for veh_id in veh_ids:
-        speed = env.k.vehicle.get_speed(veh_id)
-        gallons_per_s = env.k.vehicle.get_fuel_consumption(veh_id)
-        if gallons_per_s > 0 and speed >= 0.0:
-            counter += 1
-            # meters / gallon is (v * \delta t) / (gallons_per_s * \delta t)
-            mpg += speed / gallons_per_s
-    if counter > 0:
-        mpg /= counter
+    speed = np.asarray(env.k.vehicle.get_speed(veh_ids), dtype=float)
+    fuel = np.asarray(
+        env.k.vehicle.get_fuel_consumption(veh_ids), dtype=float)
+    return miles_per_gallon_from_arrays(speed, fuel, gain=gain)
+
+
+def miles_per_gallon_from_arrays(speed, fuel, gain=.001):
+    """Compute the average mpg of vehicles.
+
+    See ``miles_per_gallon``.
+
+    Parameters
+    ----------
+    speed : np.ndarray
+        speed of every vehicle
+    fuel : np.ndarray
+        fuel consumption of every vehicle, in gallons/s
+    gain : float
+        scaling factor for the reward
+
+    Returns
+    -------
+    float
+        reward value
+    """
+    valid = (fuel > 0) & (speed >= 0.0)
+
+    # meters / gallon is (v * \delta t) / (gallons_per_s * \delta t)
+    mpg = np.mean(speed[valid] / fuel[valid]) if np.any(valid) else 0
 
     # convert from meters per gallon to miles per gallon
-    mpg /= 1609.0
+    return mpg / 1609.0 * gain
+
+
+# rewards computed by multi_reward, as functions of the arrays returned by
+# get_vehicle_arrays and of the keyword arguments of every reward
+MULTI_REWARDS = {
+    "desired_velocity": lambda a, target_velocity, fail=False:
+        desired_velocity_from_arrays(a["speed"], target_velocity, fail),
+    "average_velocity": lambda a, fail=False:
+        average_velocity_from_arrays(a["speed"], fail),
+    "min_delay": lambda a:
+        min_delay_from_arrays(a["speed"], a["max_speed"], a["sim_step"]),
+    "min_delay_unscaled": lambda a: min_delay_unscaled_from_arrays(
+        a["speed"], a["max_speed"], a["sim_step"], a["num_vehicles"]),
+    "penalize_standstill": lambda a, gain=1:
+        penalize_standstill_from_arrays(a["speed"], gain),
+    "penalize_near_standstill": lambda a, thresh=0.3, gain=1:
+        penalize_near_standstill_from_arrays(a["speed"], thresh, gain),
+    "energy_consumption": lambda a, gain=.001: energy_consumption_from_arrays(
+        a["speed"], a["accel"], a["grade"], gain),
+    "miles_per_megajoule": lambda a, gain=.001:
+        miles_per_megajoule_from_arrays(
+            a["speed"], a["accel"], a["grade"], gain),
+    "miles_per_gallon": lambda a, gain=.001:
+        miles_per_gallon_from_arrays(a["speed"], a["fuel"], gain),
+}
+
+
+def multi_reward(env, rewards, veh_ids=None, arrays=None):
+    """Compute several rewards from a single collection of vehicle states.
+
+    This is meant for logging several rewards at every step, without
+    collecting the state of every vehicle once per reward.
 
-    return mpg * gain
+    Parameters
+    ----------
+    env : flow.envs.Env
+        the environment variable, which contains information on the current
+        state of the system.
+    rewards : list of str or dict <str, dict>
+        names of the rewards to compute (see ``MULTI_REWARDS``), or the
+        keyword arguments of every reward (e.g. ``{"penalize_standstill":
+        {"gain": 0.2}}``). The target velocity of "desired_velocity" defaults
+        to the "target_velocity" additional parameter of the environment.
+    veh_ids : list of str, optional
+        the vehicles the rewards are computed over. Defaults to all vehicles
+        in the network.
+    arrays : dict, optional
+        the state of the vehicles, as returned by ``get_vehicle_arrays``.
+        Collected from the environment by default.
+
+    Returns
+    -------
+    dict <str, float>
+        the value of every reward
+
+    Raises
+    ------
+    ValueError
+        if an unknown reward is requested
+    """
+    if not isinstance(rewards, dict):
+        rewards = {name: {} for name in rewards}
+    for name in rewards:
+        if name not in MULTI_REWARDS:
+            raise ValueError("Unknown reward: {}".format(name))
+
+    if arrays is None:
+        arrays = get_vehicle_arrays(env, veh_ids)
+
+    values = {}
+    for name, kwargs in rewards.items():
+        if name == "desired_velocity" and "target_velocity" not in kwargs:
+            kwargs = dict(
+                kwargs, target_velocity=env.env_params.additional_params[
+                    'target_velocity'])
+        values[name] = MULTI_REWARDS[name](arrays, **kwargs)
+    return values
@@ -0,0 +1,403 @@
+"""Contains the binary rollout trace format and its readers.
+
+A rollout trace is a directory containing one ``.npy`` file per field of the
+emission data (see flow/core/kernel/simulation/emission.py), in which the
+i-th element of every file belongs to the i-th sample. Numeric fields are
+stored with a fixed dtype, and string fields (e.g. vehicle ids) as int32
+codes into a table of strings shared by all string fields. Missing values
+are stored as NaN in float fields, as -1001 in integer fields, and as empty
+strings in string fields. A time index
+stores the first row of every time step, so that the samples of a time
+range can be located without reading the data.
+
+Traces are read by memory-mapping the ``.npy`` files, so that only the data
+that is accessed is loaded, regardless of the size of the trace.
+
+Layout
+------
+* index.json: version, number of rows, and dtype of every field
+* <field>.npy: the values of every field
+* strings.json: the strings referenced by the codes of string fields
+* times.npy: the distinct times, in the order in which they were recorded
+* offsets.npy: the first row of every time in ``times.npy``, followed by the
+  number of rows
+"""
+import csv
+import json
+import os
+
+import numpy as np
+
+# version of the trace format, stored in the index
+TRACE_VERSION = 1
+
+# dtypes of the fields of every type of emission data
+DTYPES = {"float": np.float64, "int": np.int64, "string": np.int32}
+
+# size of the headers of the .npy files. The shape of the arrays is only
+# known once a trace is closed, so a header of a fixed size is reserved when
+# a file is created, and rewritten on close.
+_HEADER_SIZE = 128
+
+# number of rows written at a time by trace_to_csv
+CSV_CHUNK_SIZE = 100000
+
+
+def _npy_header(dtype, length):
+    """Return the header of a one-dimensional .npy file (format 1.0)."""
+    header = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                   "fortran_order": False,
+                   "shape": (length,)})
+    preamble = np.lib.format.magic(1, 0)
+    size = _HEADER_SIZE - len(preamble) - 2
+    header = header.ljust(size - 1) + "\n"
+    return preamble + size.to_bytes(2, "little") + header.encode("latin1")
+
+
+class TraceWriter(object):
+    """Writer appending chunks of rows to a rollout trace.
+
+    Attributes
+    ----------
+    path : str
+        directory of the trace
+    fields : list of (str, str)
+        name and type ("float", "int" or "string") of every field
+    num_rows : int
+        number of rows written so far
+    """
+
+    def __init__(self, path, fields):
+        """Create the files of a rollout trace.
+
+        Parameters
+        ----------
+        path : str
+            directory of the trace, which is created if needed
+        fields : list of (str, str)
+            name and type ("float", "int" or "string") of every field
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.fields = fields
+        self.num_rows = 0
+        self._strings = {}
+        self._times = []
+        self._offsets = []
+        self._files = {}
+        for name, _ in fields:
+            f = open(os.path.join(path, name + ".npy"), "wb")
+            f.write(b"\0" * _HEADER_SIZE)
+            self._files[name] = f
+
+    def write(self, columns):
+        """Append a chunk of rows to the trace.
+
+        Parameters
+        ----------
+        columns : dict <str, list>
+            the values of every field for every row. Must contain a "time"
+            field, which is used to build the time index.
+        """
+        num_rows = len(columns["time"])
+        if num_rows == 0:
+            return
+
+        for name, field_type in self.fields:
+            if field_type == "string":
+                values = np.fromiter(
+                    (self._code(value) for value in columns[name]),
+                    dtype=DTYPES[field_type], count=num_rows)
+            elif field_type == "int":
+                values = np.fromiter(
+                    (-1001 if value is None else value
+                     for value in columns[name]),
+                    dtype=DTYPES[field_type], count=num_rows)
+            else:
+                values = np.asarray(columns[name], dtype=DTYPES[field_type])
+            self._files[name].write(values.tobytes())
+
+        # rows at which the time changes
+        times = np.asarray(columns["time"], dtype=float)
+        starts = np.flatnonzero(times[1:] != times[:-1]) + 1
+        if not self._times or self._times[-1] != times[0]:
+            starts = np.concatenate([[0], starts])
+        self._times.extend(times[starts].tolist())
+        self._offsets.extend((starts + self.num_rows).tolist())
+
+        self.num_rows += num_rows
+
+    def close(self):
+        """Write the headers and the index of the trace."""
+        for name, field_type in self.fields:
+            f = self._files[name]
+            f.seek(0)
+            f.write(_npy_header(DTYPES[field_type], self.num_rows))
+            f.close()
+
+        np.save(os.path.join(self.path, "times.npy"),
+                np.array(self._times, dtype=float))
+        np.save(os.path.join(self.path, "offsets.npy"),
+                np.array(self._offsets + [self.num_rows], dtype=np.int64))
+
+        strings = sorted(self._strings, key=self._strings.get)
+        with open(os.path.join(self.path, "strings.json"), "w") as f:
+            json.dump(strings, f)
+        with open(os.path.join(self.path, "index.json"), "w") as f:
+            json.dump({"version": TRACE_VERSION,
+                       "num_rows": self.num_rows,
+                       "fields": self.fields}, f, indent=2)
+
+    def abort(self):
+        """Close the files of the trace without completing them."""
+        for f in self._files.values():
+            f.close()
+
+    def _code(self, value):
+        """Return the code of a string, adding it to the table if needed."""
+        if value is None:
+            value = ""
+        code = self._strings.get(value)
+        if code is None:
+            code = self._strings[value] = len(self._strings)
+        return code
+
+
+class RolloutTrace(object):
+    """Memory-mapped reader of a rollout trace.
+
+    Usage
+    -----
+    >>> trace = RolloutTrace("ring-0_emission.trace")
+    >>> rows = trace.time_range(100, 200)
+    >>> speeds = trace.column("speed")[rows]
+    >>> ids = trace.decode("id", rows)
+
+    Attributes
+    ----------
+    path : str
+        directory of the trace
+    fields : list of str
+        names of the fields of the trace
+    field_types : dict <str, str>
+        type ("float", "int" or "string") of every field
+    num_rows : int
+        number of rows of the trace
+    strings : np.ndarray
+        the strings referenced by the codes of string fields
+    times : np.ndarray
+        the distinct times of the trace, in the order in which they were
+        recorded
+    offsets : np.ndarray
+        the first row of every time in ``times``, followed by the number of
+        rows
+    """
+
+    def __init__(self, path):
+        """Open a rollout trace.
+
+        Parameters
+        ----------
+        path : str
+            directory of the trace
+
+        Raises
+        ------
+        ValueError
+            if the trace was written with an unsupported version
+        """
+        with open(os.path.join(path, "index.json")) as f:
+            index = json.load(f)
+        if index["version"] != TRACE_VERSION:
+            raise ValueError(
+                "Unsupported trace version: {}".format(index["version"]))
+
+        self.path = path
+        self.fields = [name for name, _ in index["fields"]]
+        self.field_types = dict((name, t) for name, t in index["fields"])
+        self.num_rows = index["num_rows"]
+        with open(os.path.join(path, "strings.json")) as f:
+            self.strings = np.array(json.load(f), dtype=object)
+        self.times = np.load(os.path.join(path, "times.npy"))
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self._columns = {}
+
+    def __len__(self):
+        """Return the number of rows of the trace."""
+        return self.num_rows
+
+    def column(self, name):
+        """Return the memory-mapped values of a field.
+
+        Strings fields are returned as codes into ``strings``, see
+        ``decode``.
+
+        Parameters
+        ----------
+        name : str
+            name of the field
+
+        Returns
+        -------
+        np.ndarray
+            read-only array of the values of the field for every row
+        """
+        column = self._columns.get(name)
+        if column is None:
+            if name not in self.field_types:
+                raise KeyError(name)
+            if self.num_rows == 0:
+                column = np.zeros(
+                    0, dtype=DTYPES[self.field_types[name]])
+            else:
+                column = np.load(os.path.join(self.path, name + ".npy"),
+                                 mmap_mode="r")
+            self._columns[name] = column
+        return column
+
+    def decode(self, name, rows=slice(None)):
+        """Return the values of a string field.
+
+        Parameters
+        ----------
+        name : str
+            name of the field
+        rows : slice or array_like, optional
+            the rows to decode. All rows are decoded by default.
+
+        Returns
+        -------
+        np.ndarray
+            the strings of every row, as an array of objects
+        """
+        return self.strings[self.column(name)[rows]]
+
+    def time_range(self, start=None, end=None):
+        """Return the rows of the samples within a time range.
+
+        The times of the trace are assumed to be increasing.
+
+        Parameters
+        ----------
+        start : float, optional
+            first time of the range. Starts at the first sample by default.
+        end : float, optional
+            end of the range (excluded). Ends at the last sample by default.
+
+        Returns
+        -------
+        slice
+            the rows of the samples within the range
+        """
+        first, last = self._time_indices(start, end)
+        return slice(int(self.offsets[first]), int(self.offsets[last]))
+
+    def time_rows(self, start=None, end=None, steps=1):
+        """Return the rows of every n-th time within a time range.
+
+        Parameters
+        ----------
+        start : float, optional
+            first time of the range. Starts at the first sample by default.
+        end : float, optional
+            end of the range (excluded). Ends at the last sample by default.
+        steps : int, optional
+            rate at which times are kept, starting from the first time of the
+            range. All times are kept by default.
+
+        Returns
+        -------
+        slice or np.ndarray
+            the rows of the samples of the kept times, as a slice if all
+            times are kept
+        """
+        if steps <= 1:
+            return self.time_range(start, end)
+        kept = np.arange(*self._time_indices(start, end), steps)
+        starts = self.offsets[kept]
+        lengths = self.offsets[kept + 1] - starts
+        # the rows of every kept time, shifted from the first row of the time
+        # to the first row of the time in the concatenated rows
+        return np.arange(lengths.sum()) + np.repeat(
+            starts - np.cumsum(lengths) + lengths, lengths)
+
+    def to_dataframe(self, fields=None, rows=slice(None)):
+        """Return the samples of the trace as a pandas dataframe.
+
+        Parameters
+        ----------
+        fields : list of str, optional
+            the fields to load. All fields are loaded by default.
+        rows : slice or array_like, optional
+            the rows to load, e.g. as returned by ``time_range``. All rows
+            are loaded by default.
+
+        Returns
+        -------
+        pd.DataFrame
+            the values of the fields, with strings decoded
+        """
+        import pandas as pd
+
+        if fields is None:
+            fields = self.fields
+        data = {}
+        for name in fields:
+            if self.field_types[name] == "string":
+                data[name] = self.decode(name, rows)
+            else:
+                data[name] = np.array(self.column(name)[rows])
+        return pd.DataFrame(data, columns=fields)
+
+    def _time_indices(self, start, end):
+        """Return the indices of the first and last (excluded) times."""
+        first = 0 if start is None else \
+            int(np.searchsorted(self.times, start, side="left"))
+        last = len(self.times) if end is None else \
+            int(np.searchsorted(self.times, end, side="left"))
+        return first, max(first, last)
+
+
+def trace_to_csv(trace_path, output_path=None, chunk_size=CSV_CHUNK_SIZE):
+    """Convert a rollout trace into a csv file.
+
+    The trace is converted in chunks of rows, so that memory usage does not
+    depend on the size of the trace. Missing float values (NaN) are written
+    as empty cells.
+
+    Parameters
+    ----------
+    trace_path : str
+        directory of the trace
+    output_path : str, optional
+        path to the csv file. Defaults to the path of the trace with a .csv
+        extension.
+    chunk_size : int, optional
+        number of rows converted at a time
+    """
+    trace = RolloutTrace(trace_path)
+    if output_path is None:
+        output_path = os.path.splitext(trace_path.rstrip(os.sep))[0] + ".csv"
+
+    with open(output_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(trace.fields)
+        for start in range(0, trace.num_rows, chunk_size):
+            rows = slice(start, start + chunk_size)
+            columns = []
+            for name in trace.fields:
+                field_type = trace.field_types[name]
+                if field_type == "string":
+                    columns.append(trace.decode(name, rows).tolist())
+                elif field_type == "float":
+                    columns.append([
+                        "" if value != value else value
+                        for value in trace.column(name)[rows].tolist()])
+                else:
+                    columns.append(trace.column(name)[rows].tolist())
+            writer.writerows(zip(*columns))
+
+
+def is_trace(path):
+    """Return whether a path is a rollout trace."""
+    return os.path.isfile(os.path.join(path, "index.json"))
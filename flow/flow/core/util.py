@@ -2,9 +2,60 @@
 
 import csv
 import errno
+import heapq
+import mmap
 import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from operator import itemgetter
 from lxml import etree
-from xml.etree import ElementTree
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+# name and type of the columns of the files generated by emission_to_csv
+EMISSION_COLUMNS = [
+    ("time", "float"),
+    ("CO", "float"),
+    ("y", "float"),
+    ("CO2", "float"),
+    ("electricity", "float"),
+    ("type", "string"),
+    ("id", "string"),
+    ("eclass", "string"),
+    ("waiting", "float"),
+    ("NOx", "float"),
+    ("fuel", "float"),
+    ("HC", "float"),
+    ("x", "float"),
+    ("route", "string"),
+    ("relative_position", "float"),
+    ("noise", "float"),
+    ("angle", "float"),
+    ("PMx", "float"),
+    ("speed", "float"),
+    ("edge_id", "string"),
+    ("lane_number", "string"),
+]
+
+# index of the vehicle id in the rows of the generated files
+_ID_INDEX = [name for name, _ in EMISSION_COLUMNS].index("id")
+
+# number of rows converted, sorted, and written at a time by emission_to_csv
+EMISSION_CHUNK_SIZE = 100000
+
+# maximum number of sorted files merged at once by emission_to_csv
+_MAX_MERGED_FILES = 64
+
+# number of bytes read from the emission file at a time
+_READ_SIZE = 1 << 20
 
 
 def makexml(name, nsl):
@@ -32,13 +83,24 @@ def ensure_dir(path):
     return path
 
 
-def emission_to_csv(emission_path, output_path=None):
+def emission_to_csv(emission_path,
+                    output_path=None,
+                    sort_by_id=True,
+                    output_format="csv",
+                    num_workers=1,
+                    chunk_size=EMISSION_CHUNK_SIZE):
     """Convert an emission file generated by sumo into a csv file.
 
     Note that the emission file contains information generated by sumo, not
     flow. This means that some data, such as absolute position, is not
     immediately available from the emission file, but can be recreated.
 
+    The emission file is parsed incrementally and converted in chunks of
+    ``chunk_size`` rows, so that the memory used does not depend on the size
+    of the file. If the rows are sorted by vehicle id, sorted chunks are
+    stored in temporary files next to the output file and merged once the
+    whole file is parsed.
+
     Parameters
     ----------
     emission_path : str
@@ -46,54 +108,267 @@ def emission_to_csv(emission_path, output_path=None):
     output_path : str
         path to the csv file that will be generated, default is the same
         directory as the emission file, with the same name
+    sort_by_id : bool, optional
+        whether to sort the rows by vehicle id. The rows of a vehicle remain
+        sorted by time. Otherwise, rows are sorted by time only, as in the
+        emission file.
+    output_format : str, optional
+        format of the generated file, "csv" or "parquet". Parquet files
+        require pyarrow to be installed.
+    num_workers : int, optional
+        number of processes converting the emission file. If greater than
+        one, the file is split into as many ranges of time steps, which are
+        converted in parallel.
+    chunk_size : int, optional
+        number of rows converted and written at a time
+
+    Raises
+    ------
+    ValueError
+        if an unknown output format is requested
+    ImportError
+        if a Parquet file is requested and pyarrow is not installed
     """
-    parser = etree.XMLParser(recover=True)
-    tree = ElementTree.parse(emission_path, parser=parser)
-    root = tree.getroot()
-
-    # parse the xml data into a dict
-    out_data = []
-    for time in root.findall('timestep'):
-        t = float(time.attrib['time'])
-
-        for car in time:
-            out_data.append(dict())
-            try:
-                out_data[-1]['time'] = t
-                out_data[-1]['CO'] = float(car.attrib['CO'])
-                out_data[-1]['y'] = float(car.attrib['y'])
-                out_data[-1]['CO2'] = float(car.attrib['CO2'])
-                out_data[-1]['electricity'] = float(car.attrib['electricity'])
-                out_data[-1]['type'] = car.attrib['type']
-                out_data[-1]['id'] = car.attrib['id']
-                out_data[-1]['eclass'] = car.attrib['eclass']
-                out_data[-1]['waiting'] = float(car.attrib['waiting'])
-                out_data[-1]['NOx'] = float(car.attrib['NOx'])
-                out_data[-1]['fuel'] = float(car.attrib['fuel'])
-                out_data[-1]['HC'] = float(car.attrib['HC'])
-                out_data[-1]['x'] = float(car.attrib['x'])
-                out_data[-1]['route'] = car.attrib['route']
-                out_data[-1]['relative_position'] = float(car.attrib['pos'])
-                out_data[-1]['noise'] = float(car.attrib['noise'])
-                out_data[-1]['angle'] = float(car.attrib['angle'])
-                out_data[-1]['PMx'] = float(car.attrib['PMx'])
-                out_data[-1]['speed'] = float(car.attrib['speed'])
-                out_data[-1]['edge_id'] = car.attrib['lane'].rpartition('_')[0]
-                out_data[-1]['lane_number'] = car.attrib['lane'].\
-                    rpartition('_')[-1]
-            except KeyError:
-                del out_data[-1]
-
-    # sort the elements of the dictionary by the vehicle id
-    out_data = sorted(out_data, key=lambda k: k['id'])
+    if output_format not in ("csv", "parquet"):
+        raise ValueError("Unknown output format: {}".format(output_format))
+    if output_format == "parquet" and pa is None:
+        raise ImportError("pyarrow is required to generate Parquet files.")
 
     # default output path
     if output_path is None:
-        output_path = emission_path[:-3] + 'csv'
-
-    # output the dict data into a csv file
-    keys = out_data[0].keys()
-    with open(output_path, 'w') as output_file:
-        dict_writer = csv.DictWriter(output_file, keys)
-        dict_writer.writeheader()
-        dict_writer.writerows(out_data)
+        output_path = emission_path[:-3] + output_format
+
+    ranges = _split_emission(emission_path, max(num_workers, 1))
+    tmp_dir = tempfile.mkdtemp(
+        prefix=".emission-", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        if len(ranges) == 1 and not sort_by_id:
+            # rows are written as they are parsed
+            rows = _parse_emission(emission_path, *ranges[0])
+        else:
+            args = [(emission_path, start, end, tmp_dir, sort_by_id,
+                     chunk_size) for start, end in ranges]
+            if len(ranges) > 1:
+                with ProcessPoolExecutor(len(ranges)) as executor:
+                    parts = list(
+                        executor.map(_convert_emission, *zip(*args)))
+            else:
+                parts = [_convert_emission(*a) for a in args]
+            # the files of every range, in the order of the emission file
+            paths = [path for part in parts for path in part]
+
+            if sort_by_id:
+                while len(paths) > _MAX_MERGED_FILES:
+                    paths = [
+                        _merge_emission(paths[i:i + _MAX_MERGED_FILES],
+                                        tmp_dir)
+                        for i in range(0, len(paths), _MAX_MERGED_FILES)]
+                rows = _merge_rows(paths)
+            else:
+                rows = (row for path in paths for row in _read_rows(path))
+
+        with _EmissionFileWriter(output_path, output_format) as writer:
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if len(chunk) == 0:
+                    break
+                writer.write(chunk)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def _split_emission(emission_path, num_ranges):
+    """Split an emission file into ranges of time steps of similar size.
+
+    Returns
+    -------
+    list of (int, int)
+        the start and end offsets of every range, in bytes. Every range
+        starts at a timestep element.
+    """
+    with open(emission_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            starts = []
+            for i in range(num_ranges):
+                start = mm.find(b"<timestep", i * size // num_ranges)
+                if start < 0:
+                    break
+                if len(starts) == 0 or start > starts[-1]:
+                    starts.append(start)
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def _convert_emission(emission_path, start, end, tmp_dir, sort_by_id,
+                      chunk_size):
+    """Convert a range of an emission file into temporary csv files.
+
+    If the rows are sorted by vehicle id, a file is created for every chunk
+    of rows, and the rows of every file are sorted.
+
+    Returns
+    -------
+    list of str
+        the paths to the generated files
+    """
+    paths = []
+    rows = _parse_emission(emission_path, start, end)
+    if sort_by_id:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if len(chunk) == 0:
+                break
+            chunk.sort(key=itemgetter(_ID_INDEX))
+            paths.append(_write_rows(chunk, tmp_dir))
+    else:
+        paths.append(_write_rows(rows, tmp_dir))
+    return paths
+
+
+def _parse_emission(emission_path, start, end):
+    """Yield the rows of a range of an emission file.
+
+    The range is parsed incrementally, and every element is discarded as
+    soon as it is converted.
+    """
+    parser = etree.XMLPullParser(
+        events=("start", "end"), tag=("timestep", "vehicle"), recover=True,
+        huge_tree=True)
+    # the range is wrapped in a root element, as it may contain several time
+    # steps. Any closing tag of the original root element is ignored.
+    parser.feed(b"<emission-export>")
+
+    t = None
+    with open(emission_path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = f.read(min(_READ_SIZE, remaining))
+            if len(data) == 0:
+                break
+            remaining -= len(data)
+            parser.feed(data)
+
+            for event, element in parser.read_events():
+                if element.tag == "timestep":
+                    if event == "start":
+                        t = float(element.attrib['time'])
+                    else:
+                        _discard(element)
+                elif event == "end":
+                    row = _emission_row(t, element.attrib)
+                    _discard(element)
+                    if row is not None:
+                        yield row
+    parser.close()
+
+
+def _emission_row(t, attrib):
+    """Return the row of a vehicle element, or None if data is missing."""
+    try:
+        edge_id, _, lane_number = attrib['lane'].rpartition('_')
+        return [
+            t,
+            float(attrib['CO']),
+            float(attrib['y']),
+            float(attrib['CO2']),
+            float(attrib['electricity']),
+            attrib['type'],
+            attrib['id'],
+            attrib['eclass'],
+            float(attrib['waiting']),
+            float(attrib['NOx']),
+            float(attrib['fuel']),
+            float(attrib['HC']),
+            float(attrib['x']),
+            attrib['route'],
+            float(attrib['pos']),
+            float(attrib['noise']),
+            float(attrib['angle']),
+            float(attrib['PMx']),
+            float(attrib['speed']),
+            edge_id,
+            lane_number,
+        ]
+    except KeyError:
+        return None
+
+
+def _discard(element):
+    """Free the memory used by an element and its preceding siblings."""
+    element.clear()
+    while element.getprevious() is not None:
+        del element.getparent()[0]
+
+
+def _write_rows(rows, tmp_dir):
+    """Write rows to a new temporary csv file, and return its path."""
+    fd, path = tempfile.mkstemp(suffix=".csv", dir=tmp_dir)
+    with os.fdopen(fd, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+    return path
+
+
+def _read_rows(path):
+    """Yield the rows of a temporary csv file, and delete it once read."""
+    with open(path, newline="") as f:
+        yield from csv.reader(f)
+    os.remove(path)
+
+
+def _merge_rows(paths):
+    """Yield the rows of several sorted files, sorted by vehicle id.
+
+    Rows with the same id are yielded in the order of the files.
+    """
+    return heapq.merge(*[_read_rows(path) for path in paths],
+                       key=itemgetter(_ID_INDEX))
+
+
+def _merge_emission(paths, tmp_dir):
+    """Merge several sorted files into a new one, and return its path."""
+    return _write_rows(_merge_rows(paths), tmp_dir)
+
+
+class _EmissionFileWriter(object):
+    """Writer of the files generated by emission_to_csv."""
+
+    def __init__(self, path, file_format):
+        self.path = path
+        self.file_format = file_format
+        self._out = None
+
+    def __enter__(self):
+        names = [name for name, _ in EMISSION_COLUMNS]
+        if self.file_format == "parquet":
+            types = {"float": pa.float64(), "string": pa.string()}
+            self._schema = pa.schema(
+                [(name, types[kind]) for name, kind in EMISSION_COLUMNS])
+            self._out = pq.ParquetWriter(self.path, self._schema)
+        else:
+            self._out = open(self.path, "w", newline="")
+            self._csv = csv.writer(self._out)
+            self._csv.writerow(names)
+        return self
+
+    def __exit__(self, *args):
+        self._out.close()
+
+    def write(self, rows):
+        """Append rows to the file.
+
+        Rows read from temporary files contain strings only, and are
+        converted to the type of every column for Parquet files.
+        """
+        if self.file_format == "parquet":
+            columns = {}
+            for (name, kind), values in zip(EMISSION_COLUMNS, zip(*rows)):
+                if kind == "float":
+                    values = [float(value) for value in values]
+                columns[name] = list(values)
+            self._out.write_table(
+                pa.Table.from_pydict(columns, schema=self._schema))
+        else:
+            self._csv.writerows(rows)
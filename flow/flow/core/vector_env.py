@@ -0,0 +1,483 @@
+"""Contains a vectorized environment running several Flow envs in parallel."""
+from copy import deepcopy
+import multiprocessing
+import os
+import socket
+import tempfile
+import traceback
+
+from gym.spaces import Box
+import numpy as np
+
+from flow.core.params import InitialConfig
+from flow.core.params import TrafficLightParams
+from flow.utils.exceptions import FatalFlowError
+
+
+class VectorEnv(object):
+    """Run several instances of a Flow environment in parallel.
+
+    Every environment is created and stepped in its own process, and with its
+    own simulator instance. Observations and actions are exchanged with the
+    processes through shared memory buffers whenever the observation and
+    action spaces are Box spaces, and pickled otherwise.
+
+    Only single-agent environments are supported.
+
+    Usage
+    -----
+    >>> from flow.core.vector_env import VectorEnv
+    >>> flow_params = dict(...)  # see the examples in exp_config
+    >>> vec_env = VectorEnv(flow_params, num_envs=4)
+    >>> obs = vec_env.reset()  # one observation per environment
+    >>> obs, rewards, dones, infos = vec_env.step(actions)
+    >>> vec_env.close()
+
+    Environments that are done are automatically reset (if ``auto_reset`` is
+    set), in which case the observation returned for them is the first
+    observation of the new rollout, and the last observation of the previous
+    rollout is available under the "terminal_observation" key of their info
+    dict.
+
+    Sumo uses a socket port per environment. To avoid races between the
+    processes, the ports are reserved by this class before the environments
+    are created, rather than by every environment upon initialization.
+
+    Attributes
+    ----------
+    num_envs : int
+        number of environments
+    observation_space : gym.spaces.*
+        observation space of a single environment
+    action_space : gym.spaces.*
+        action space of a single environment
+    auto_reset : bool
+        whether environments are reset automatically once they are done
+    """
+
+    def __init__(self,
+                 flow_params,
+                 num_envs,
+                 auto_reset=True,
+                 start_method=None):
+        """Instantiate the vectorized environment.
+
+        Parameters
+        ----------
+        flow_params : dict
+            flow-specific parameters, see flow.utils.registry.make_create_env.
+            The environment and network classes must be classes rather than
+            strings.
+        num_envs : int
+            number of environments to run in parallel
+        auto_reset : bool, optional
+            whether environments are reset automatically once they are done
+        start_method : str, optional
+            method used to start the processes (e.g. "fork", "spawn" or
+            "forkserver"), defaults to the default method of the platform
+
+        Raises
+        ------
+        flow.utils.exceptions.FatalFlowError
+            if an environment could not be created
+        """
+        self.num_envs = num_envs
+        self.auto_reset = auto_reset
+        self.closed = False
+        self._waiting = False
+        self._buffers = []
+
+        ctx = multiprocessing.get_context(start_method)
+        ports = reserve_ports(num_envs) \
+            if flow_params.get("simulator", "traci") == "traci" \
+            else [None] * num_envs
+
+        self._remotes, self._processes = [], []
+        for i in range(num_envs):
+            remote, worker_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(worker_remote, remote, flow_params, ports[i],
+                      auto_reset),
+                daemon=True)
+            process.start()
+            worker_remote.close()
+            self._remotes.append(remote)
+            self._processes.append(process)
+
+        try:
+            spaces = self._receive_all()
+        except FatalFlowError:
+            self._terminate()
+            raise
+        self.observation_space, self.action_space = spaces[0]
+
+        # create the shared buffers and pass them to the processes
+        self._obs, obs_path = self._create_buffer(self.observation_space)
+        self._actions, action_path = self._create_buffer(self.action_space)
+        for i, remote in enumerate(self._remotes):
+            remote.send(("buffers", (i, obs_path, action_path)))
+        self._receive_all()
+
+    def reset(self):
+        """Reset all environments.
+
+        Returns
+        -------
+        np.ndarray or list
+            the initial observation of every environment
+        """
+        for remote in self._remotes:
+            remote.send(("reset", None))
+        return self._observations(self._receive_all())
+
+    def step_async(self, actions):
+        """Send actions to all environments, without waiting for the results.
+
+        Parameters
+        ----------
+        actions : array_like or None
+            the action of every environment, or None if no RL actions should
+            be applied
+        """
+        if actions is not None and self._actions is not None:
+            self._actions[:] = np.asarray(actions).reshape(
+                self._actions.shape)
+        for i, remote in enumerate(self._remotes):
+            if actions is None:
+                action = None
+            elif self._actions is not None:
+                action = True  # read from the shared buffer
+            else:
+                action = actions[i]
+            remote.send(("step", action))
+        self._waiting = True
+
+    def step_wait(self):
+        """Wait for the results of the actions sent in ``step_async``.
+
+        Returns
+        -------
+        np.ndarray or list
+            the observation of every environment
+        np.ndarray
+            the reward of every environment
+        np.ndarray
+            whether every environment is done
+        list of dict
+            the info dict of every environment
+        """
+        results = self._receive_all()
+        self._waiting = False
+        _, rewards, dones, infos = zip(*results)
+        obs = self._observations([result[0] for result in results])
+        return obs, np.array(rewards), np.array(dones, dtype=bool), \
+            list(infos)
+
+    def step(self, actions):
+        """Advance all environments by one step.
+
+        See ``step_async`` and ``step_wait``.
+        """
+        self.step_async(actions)
+        return self.step_wait()
+
+    def run(self, num_runs, rl_actions=None, custom_callables=None):
+        """Run a set number of rollouts, distributed over all environments.
+
+        This is the vectorized counterpart of ``Experiment.run``. Every
+        environment runs complete rollouts on its own, and rollouts are
+        assigned to the environments in a round-robin fashion.
+
+        Parameters
+        ----------
+        num_runs : int
+            number of rollouts to perform
+        rl_actions : method, optional
+            maps states to actions to be performed by the RL agents (if
+            there are any). This method must be picklable, e.g. a function
+            defined at the top level of a module.
+        custom_callables : dict < str, method >, optional
+            strings and methods corresponding to some information we want to
+            extract from the environment at every step, see ``Experiment``.
+            These methods must be picklable as well.
+
+        Returns
+        -------
+        info_dict : dict < str, Any >
+            contains returns, average speed per step, and outflows of every
+            rollout, in the same format as ``Experiment.run``
+        """
+        custom_callables = custom_callables or {}
+        runs = [list(range(i, num_runs, self.num_envs))
+                for i in range(self.num_envs)]
+        for remote, env_runs in zip(self._remotes, runs):
+            remote.send(("run", (env_runs, rl_actions, custom_callables)))
+        results = self._receive_all()
+
+        # sort the rollouts by run number
+        rollouts = sorted(
+            rollout for env_rollouts in results for rollout in env_rollouts)
+
+        info_dict = {"returns": [], "velocities": [], "outflows": []}
+        info_dict.update({key: [] for key in custom_callables.keys()})
+        for _, rollout in rollouts:
+            for key, value in rollout.items():
+                info_dict[key].append(value)
+
+        return info_dict
+
+    def close(self):
+        """Terminate all environments and release the shared buffers."""
+        if self.closed:
+            return
+        if self._waiting:
+            self._receive_all()
+        for remote in self._remotes:
+            remote.send(("close", None))
+        for process in self._processes:
+            process.join()
+        for remote in self._remotes:
+            remote.close()
+        self._release_buffers()
+        self.closed = True
+
+    def _receive_all(self):
+        """Collect a reply from every process, raising their errors."""
+        results, error = [], None
+        for remote in self._remotes:
+            try:
+                success, result = remote.recv()
+            except EOFError:
+                success, result = False, "The process exited unexpectedly."
+            if not success and error is None:
+                error = result
+            results.append(result)
+        if error is not None:
+            raise FatalFlowError(
+                "An environment raised an error:\n{}".format(error))
+        return results
+
+    def _observations(self, observations):
+        """Return the observations, read from the shared buffer if any."""
+        if self._obs is not None:
+            return np.array(self._obs)
+        return list(observations)
+
+    def _create_buffer(self, space):
+        """Create a buffer holding one element of a space per environment.
+
+        Returns None if the elements of the space cannot be stored in a
+        buffer, in which case they are pickled instead.
+        """
+        if not _use_buffer(space):
+            return None, None
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        fd, path = tempfile.mkstemp(prefix="flow_vec_env_", dir=directory)
+        os.close(fd)
+        self._buffers.append(path)
+        buffer = np.memmap(path, dtype=space.dtype, mode="w+",
+                           shape=(self.num_envs,) + space.shape)
+        return buffer, path
+
+    def _release_buffers(self):
+        """Delete the files backing the shared buffers."""
+        self._obs = None
+        self._actions = None
+        for path in self._buffers:
+            if os.path.exists(path):
+                os.remove(path)
+        self._buffers = []
+
+    def _terminate(self):
+        """Kill all processes, e.g. if one of them failed."""
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        self._release_buffers()
+        self.closed = True
+
+    def __del__(self):
+        """Release the shared buffers when the object is garbage-collected."""
+        if not getattr(self, "closed", True):
+            self._terminate()
+
+
+def reserve_ports(num_ports):
+    """Find several distinct ports that are currently free.
+
+    Unlike repeated calls to ``sumolib.miscutils.getFreeSocketPort``, the
+    sockets used to find the ports are kept open until all ports are found,
+    so that the same port cannot be returned twice.
+
+    Parameters
+    ----------
+    num_ports : int
+        number of ports to find
+
+    Returns
+    -------
+    list of int
+        the port numbers
+    """
+    sockets = []
+    try:
+        for _ in range(num_ports):
+            sock = socket.socket()
+            sockets.append(sock)
+            sock.bind(('', 0))
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def _use_buffer(space):
+    """Return whether elements of a space can be stored in a shared buffer."""
+    return isinstance(space, Box) and int(np.prod(space.shape)) > 0
+
+
+def make_env(flow_params, port=None):
+    """Create an environment from flow parameters.
+
+    Unlike ``flow.utils.registry.make_create_env``, the environment is not
+    registered with gym, so that it can be created in any process.
+
+    Parameters
+    ----------
+    flow_params : dict
+        flow-specific parameters, see flow.utils.registry.make_create_env
+    port : int, optional
+        port used by sumo. A free port is found by the environment if none is
+        specified.
+
+    Returns
+    -------
+    flow.envs.Env
+        the environment
+    """
+    sim_params = deepcopy(flow_params["sim"])
+    if port is not None:
+        sim_params.port = port
+
+    network = flow_params["network"](
+        name=flow_params["exp_tag"],
+        vehicles=deepcopy(flow_params["veh"]),
+        net_params=flow_params["net"],
+        initial_config=flow_params.get("initial", InitialConfig()),
+        traffic_lights=flow_params.get("tls", TrafficLightParams()),
+    )
+
+    return flow_params["env_name"](
+        env_params=flow_params["env"],
+        sim_params=sim_params,
+        network=network,
+        simulator=flow_params["simulator"],
+    )
+
+
+def _worker(remote, parent_remote, flow_params, port, auto_reset):
+    """Create an environment and run the commands sent by the VectorEnv."""
+    parent_remote.close()
+    env = None
+    obs_buffer, action_buffer, index = None, None, None
+
+    def observation(obs):
+        if obs_buffer is None:
+            return obs
+        obs_buffer[index] = obs
+        return None
+
+    try:
+        env = make_env(flow_params, port)
+        remote.send((True, (env.observation_space, env.action_space)))
+
+        while True:
+            command, data = remote.recv()
+            try:
+                if command == "buffers":
+                    index, obs_path, action_path = data
+                    if obs_path is not None:
+                        obs_buffer = np.memmap(
+                            obs_path, dtype=env.observation_space.dtype,
+                            mode="r+")
+                        obs_buffer = obs_buffer.reshape(
+                            (-1,) + env.observation_space.shape)
+                    if action_path is not None:
+                        action_buffer = np.memmap(
+                            action_path, dtype=env.action_space.dtype,
+                            mode="r")
+                        action_buffer = action_buffer.reshape(
+                            (-1,) + env.action_space.shape)
+                    remote.send((True, None))
+                elif command == "reset":
+                    remote.send((True, observation(env.reset())))
+                elif command == "step":
+                    action = np.array(action_buffer[index]) \
+                        if data is True else data
+                    obs, reward, done, info = env.step(action)
+                    if done and auto_reset:
+                        info = dict(info, terminal_observation=obs)
+                        obs = env.reset()
+                    remote.send((True, (observation(obs), reward, done, info)))
+                elif command == "run":
+                    remote.send((True, _run(env, *data)))
+                elif command == "close":
+                    break
+                else:
+                    raise ValueError("Unknown command: {}".format(command))
+            except Exception:
+                remote.send((False, traceback.format_exc()))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    except Exception:
+        remote.send((False, traceback.format_exc()))
+    finally:
+        if env is not None:
+            env.terminate()
+        remote.close()
+
+
+def _run(env, runs, rl_actions, custom_callables):
+    """Perform rollouts in an environment, see ``VectorEnv.run``."""
+    if rl_actions is None:
+        def rl_actions(*_):
+            return None
+
+    num_steps = env.env_params.horizon
+    rollouts = []
+    for i in runs:
+        ret = 0
+        vel = []
+        custom_vals = {key: [] for key in custom_callables.keys()}
+        state = env.reset()
+        for _ in range(num_steps):
+            state, reward, done, _ = env.step(rl_actions(state))
+
+            # Compute the velocity speeds and cumulative returns.
+            veh_ids = env.k.vehicle.get_ids()
+            vel.append(np.mean(env.k.vehicle.get_speed(veh_ids)))
+            ret += reward
+
+            # Compute the results for the custom callables.
+            for (key, lambda_func) in custom_callables.items():
+                custom_vals[key].append(lambda_func(env))
+
+            if done:
+                break
+
+        rollout = {
+            "returns": ret,
+            "velocities": np.mean(vel),
+            "outflows": env.k.vehicle.get_outflow_rate(int(500)),
+        }
+        for key in custom_vals.keys():
+            rollout[key] = np.mean(custom_vals[key])
+        rollouts.append((i, rollout))
+
+        # Save emission data at the end of every rollout. This is skipped
+        # by the internal method if no emission path was specified.
+        if env.simulator in ["traci", "libsumo"]:
+            env.k.simulation.save_emission(run_id=i)
+
+    return rollouts
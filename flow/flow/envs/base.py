@@ -1,29 +1,33 @@
 """Base environment class. This is the parent of all other environments."""
 
 from abc import ABCMeta, abstractmethod
+from collections import deque
 from copy import deepcopy
 import os
 import atexit
-import time
 import traceback
 import numpy as np
 import random
 import shutil
 import subprocess
+import tempfile
+import warnings
 from flow.renderer.pyglet_renderer import PygletRenderer as Renderer
+from flow.renderer.raster_renderer import RasterRenderer
+from flow.renderer.frame_buffer import FrameBuffer
 from flow.utils.flow_warnings import deprecated_attribute
 
 import gym
 from gym.spaces import Box
 from gym.spaces import Tuple
-from traci.exceptions import FatalTraCIError
-from traci.exceptions import TraCIException
 
 import sumolib
 
 
+from flow.controllers import batch
 from flow.core.util import ensure_dir
 from flow.core.kernel import Kernel
+from flow.core.profiler import StepProfiler, NULL_PROFILER
 from flow.utils.exceptions import FatalFlowError
 
 
@@ -61,7 +65,7 @@ class Env(gym.Env, metaclass=ABCMeta):
     network : flow.networks.Network
         see flow/networks/base.py
     simulator : str
-        the simulator used, one of {'traci', 'aimsun'}
+        the simulator used, one of {'traci', 'libsumo', 'aimsun'}
     k : flow.core.kernel.Kernel
         Flow kernel object, using for state acquisition and issuing commands to
         the certain components of the simulator. For more information, see:
@@ -94,12 +98,22 @@ class Env(gym.Env, metaclass=ABCMeta):
         the available_routes variable contains a dictionary of routes vehicles
         can traverse; to be used when routes need to be chosen dynamically.
         Equivalent to `network.rts`.
-    renderer : flow.renderer.pyglet_renderer.PygletRenderer or None
+    renderer : flow.renderer.PygletRenderer or RasterRenderer or None
         renderer class, used to collect image-based representations of the
         traffic network. This attribute is set to None if `sim_params.render`
         is set to True or False.
+    profiler : flow.core.profiler.StepProfiler
+        profiler measuring the duration of the phases of every step and reset,
+        if `env_params.profile_path` is set. Otherwise, this is a profiler that
+        does not measure anything.
+    snapshot_attributes : tuple of str
+        names of additional attributes of the environment that are updated
+        during a rollout, and that should be saved and restored alongside the
+        state of the simulation if `sim_params.snapshot_reset` is set to True
     """
 
+    snapshot_attributes = ()
+
     def __init__(self,
                  env_params,
                  sim_params,
@@ -117,7 +131,8 @@ class Env(gym.Env, metaclass=ABCMeta):
         network : flow.networks.Network
             see flow/networks/base.py
         simulator : str
-            the simulator used, one of {'traci', 'aimsun'}. Defaults to 'traci'
+            the simulator used, one of {'traci', 'libsumo', 'aimsun'}.
+            Defaults to 'traci'
 
         Raises
         ------
@@ -134,20 +149,30 @@ class Env(gym.Env, metaclass=ABCMeta):
         # check whether we should be rendering
         self.should_render = self.sim_params.render
         self.sim_params.render = False
-        time_stamp = ''.join(str(time.time()).split('.'))
-        if os.environ.get("TEST_FLAG", 0):
-            # 1.0 works with stress_test_start 10k times
-            time.sleep(1.0 * int(time_stamp[-6:]) / 1e6)
-        # FIXME: this is sumo-specific
-        self.sim_params.port = sumolib.miscutils.getFreeSocketPort()
+        # FIXME: this is sumo-specific. Collisions with ports taken by other
+        # processes are handled when the simulation is started. Ports that
+        # were explicitly specified (e.g. reserved by flow.core.vector_env)
+        # are kept as is.
+        if getattr(self.sim_params, "port", None) is None:
+            self.sim_params.port = sumolib.miscutils.getFreeSocketPort()
         # time_counter: number of steps taken since the start of a rollout
         self.time_counter = 0
         # step_counter: number of total steps taken
         self.step_counter = 0
+        # vehicles whose routing controller should be called at the next step
+        # regardless of events, if event_routing is set (see
+        # _apply_routing_actions)
+        self._pending_routing_ids = set()
+        # terms shared by the agents of multi-agent environments, memoized
+        # until the next update of the kernels (see MultiEnv.shared_term)
+        self._shared_terms = {}
         # initial_state:
         self.initial_state = {}
         self.state = None
         self.obs_var_labels = []
+        # state of the environment saved after the first reset, see
+        # `sim_params.snapshot_reset`
+        self._snapshot = None
 
         # simulation step size
         self.sim_step = sim_params.sim_step
@@ -159,6 +184,14 @@ class Env(gym.Env, metaclass=ABCMeta):
         self.k = Kernel(simulator=self.simulator,
                         sim_params=self.sim_params)
 
+        # profiler of the phases of every step, shared with the kernel
+        if getattr(env_params, "profile_path", None) is not None:
+            self.profiler = StepProfiler(
+                trace=getattr(env_params, "profile_format", "json") == "chrome")
+        else:
+            self.profiler = NULL_PROFILER
+        self.k.profiler = self.profiler
+
         # use the network class's network parameters to generate the necessary
         # network components within the network kernel
         self.k.network.generate_network(self.network)
@@ -208,14 +241,24 @@ class Env(gym.Env, metaclass=ABCMeta):
                 lane_poly = [i for pt in _lane_poly for i in pt]
                 network.append(lane_poly)
 
-            # instantiate a pyglet renderer
-            self.renderer = Renderer(
+            # instantiate a pyglet renderer, or a raster renderer if the
+            # frames are rendered without a display
+            if getattr(self.sim_params, "render_backend", "pyglet") == \
+                    "raster":
+                renderer_class = RasterRenderer
+            else:
+                renderer_class = Renderer
+            self.renderer = renderer_class(
                 network,
                 self.sim_params.render,
                 save_render,
                 sight_radius=sight_radius,
                 pxpm=pxpm,
-                show_radius=show_radius)
+                show_radius=show_radius,
+                save_format=getattr(
+                    self.sim_params, "render_format", "png"),
+                # same speedup as the videos of sumo-gui (see terminate)
+                fps=10 / self.sim_step)
 
             # render a frame
             self.render(reset=True)
@@ -246,6 +289,7 @@ class Env(gym.Env, metaclass=ABCMeta):
             specifies whether to use the gui
         """
         self.k.close()
+        self._discard_snapshot()
 
         # killed the sumo process if using sumo/TraCI
         if self.simulator == 'traci':
@@ -322,21 +366,29 @@ class Env(gym.Env, metaclass=ABCMeta):
         info : dict
             contains other diagnostic information from the previous action
         """
+        self.profiler.begin("step")
         for _ in range(self.env_params.sims_per_step):
             self.time_counter += 1
             self.step_counter += 1
 
             # perform acceleration actions for controlled human-driven vehicles
+            self.profiler.begin("controllers")
             if len(self.k.vehicle.get_controlled_ids()) > 0:
-                accel = []
-                for veh_id in self.k.vehicle.get_controlled_ids():
-                    action = self.k.vehicle.get_acc_controller(
-                        veh_id).get_action(self)
-                    accel.append(action)
+                if self.env_params.batch_controllers:
+                    accel = batch.get_actions(
+                        self, self.k.vehicle.get_controlled_ids())
+                else:
+                    accel = []
+                    for veh_id in self.k.vehicle.get_controlled_ids():
+                        action = self.k.vehicle.get_acc_controller(
+                            veh_id).get_action(self)
+                        accel.append(action)
                 self.k.vehicle.apply_acceleration(
                     self.k.vehicle.get_controlled_ids(), accel)
+            self.profiler.end()
 
             # perform lane change actions for controlled human-driven vehicles
+            self.profiler.begin("lane_change")
             if len(self.k.vehicle.get_controlled_lc_ids()) > 0:
                 direction = []
                 for veh_id in self.k.vehicle.get_controlled_lc_ids():
@@ -346,34 +398,35 @@ class Env(gym.Env, metaclass=ABCMeta):
                 self.k.vehicle.apply_lane_change(
                     self.k.vehicle.get_controlled_lc_ids(),
                     direction=direction)
+            self.profiler.end()
 
             # perform (optionally) routing actions for all vehicles in the
             # network, including RL and SUMO-controlled vehicles
-            routing_ids = []
-            routing_actions = []
-            for veh_id in self.k.vehicle.get_ids():
-                if self.k.vehicle.get_routing_controller(veh_id) \
-                        is not None:
-                    routing_ids.append(veh_id)
-                    route_contr = self.k.vehicle.get_routing_controller(
-                        veh_id)
-                    routing_actions.append(route_contr.choose_route(self))
-
-            self.k.vehicle.choose_routes(routing_ids, routing_actions)
+            self.profiler.begin("routing")
+            self._apply_routing_actions()
+            self.profiler.end()
 
+            self.profiler.begin("rl_actions")
             self.apply_rl_actions(rl_actions)
+            self.profiler.end()
 
+            self.profiler.begin("additional_command")
             self.additional_command()
+            self.profiler.end()
 
             # advance the simulation in the simulator by one step
+            self.profiler.begin("simulation_step")
             self.k.simulation.simulation_step()
+            self.profiler.end()
 
             # store new observations in the vehicles and traffic lights class
+            self.profiler.begin("update")
             self.k.update(reset=False)
 
             # update the colors of vehicles
             if self.sim_params.render:
                 self.k.vehicle.update_vehicle_colors()
+            self.profiler.end()
 
             # crash encodes whether the simulator experienced a collision
             crash = self.k.simulation.check_collision()
@@ -383,8 +436,11 @@ class Env(gym.Env, metaclass=ABCMeta):
                 break
 
             # render a frame
+            self.profiler.begin("render")
             self.render()
+            self.profiler.end()
 
+        self.profiler.begin("get_state")
         states = self.get_state()
 
         # collect information of the state of the network based on the
@@ -393,6 +449,7 @@ class Env(gym.Env, metaclass=ABCMeta):
 
         # collect observation new state associated with action
         next_observation = np.copy(states)
+        self.profiler.end()
 
         # test if the environment should terminate due to a collision or the
         # time horizon being met
@@ -404,12 +461,15 @@ class Env(gym.Env, metaclass=ABCMeta):
         infos = {}
 
         # compute the reward
+        self.profiler.begin("reward")
         if self.env_params.clip_actions:
             rl_clipped = self.clip_actions(rl_actions)
             reward = self.compute_reward(rl_clipped, fail=crash)
         else:
             reward = self.compute_reward(rl_actions, fail=crash)
+        self.profiler.end()
 
+        self.profiler.end()
         return next_observation, reward, done, infos
 
     def reset(self):
@@ -428,8 +488,11 @@ class Env(gym.Env, metaclass=ABCMeta):
             the initial observation of the space. The initial reward is assumed
             to be zero.
         """
+        self.profiler.begin("reset")
+
         # reset the time counter
         self.time_counter = 0
+        self._pending_routing_ids.clear()
 
         # Now that we've passed the possibly fake init steps some rl libraries
         # do, we can feel free to actually render things
@@ -468,12 +531,18 @@ class Env(gym.Env, metaclass=ABCMeta):
         elif self.initial_config.shuffle:
             self.setup_initial_state()
 
+        # restore the state saved at the end of the first reset (if available)
+        if self._snapshot is not None:
+            observation = self._load_snapshot()
+            self.profiler.end()
+            return observation
+
         # clear all vehicles from the network and the vehicles class
-        if self.simulator == 'traci':
+        if self.simulator in ['traci', 'libsumo']:
             for veh_id in self.k.kernel_api.vehicle.getIDList():  # FIXME: hack
                 try:
                     self.k.vehicle.remove(veh_id)
-                except (FatalTraCIError, TraCIException):
+                except self.k.api_errors:
                     print(traceback.format_exc())
 
         # clear all vehicles from the network and the vehicles class
@@ -485,7 +554,7 @@ class Env(gym.Env, metaclass=ABCMeta):
                 continue
             try:
                 self.k.vehicle.remove(veh_id)
-            except (FatalTraCIError, TraCIException):
+            except self.k.api_errors:
                 print("Error during start: {}".format(traceback.format_exc()))
 
         # do any additional resetting of the vehicle class needed
@@ -504,11 +573,11 @@ class Env(gym.Env, metaclass=ABCMeta):
                     lane=lane_index,
                     pos=pos,
                     speed=speed)
-            except (FatalTraCIError, TraCIException):
+            except self.k.api_errors:
                 # if a vehicle was not removed in the first attempt, remove it
                 # now and then reintroduce it
                 self.k.vehicle.remove(veh_id)
-                if self.simulator == 'traci':
+                if self.simulator in ['traci', 'libsumo']:
                     self.k.kernel_api.vehicle.remove(veh_id)  # FIXME: hack
                 self.k.vehicle.add(
                     veh_id=veh_id,
@@ -528,7 +597,7 @@ class Env(gym.Env, metaclass=ABCMeta):
         if self.sim_params.render:
             self.k.vehicle.update_vehicle_colors()
 
-        if self.simulator == 'traci':
+        if self.simulator in ['traci', 'libsumo']:
             initial_ids = self.k.kernel_api.vehicle.getIDList()
         else:
             initial_ids = self.initial_ids
@@ -555,11 +624,148 @@ class Env(gym.Env, metaclass=ABCMeta):
         for _ in range(self.env_params.warmup_steps):
             observation, _, _, _ = self.step(rl_actions=None)
 
+        # save the state of the environment to be restored on later resets
+        self._save_snapshot(observation)
+
         # render a frame
         self.render(reset=True)
 
+        self.profiler.end()
         return observation
 
+    def _save_snapshot(self, observation):
+        """Save the state of the environment at the end of a reset.
+
+        This is only performed if requested via `sim_params.snapshot_reset`,
+        and only for sumo simulations in which the initial positions of
+        vehicles are not shuffled, and that are not restarted on every reset
+        (see `sim_params.restart_instance`). The state of the simulation is saved to a
+        temporary file by sumo, and is complemented by copies of the vehicle
+        kernel and of the attributes of the environment that are modified
+        during a rollout.
+
+        Parameters
+        ----------
+        observation : array_like
+            the observation returned by the reset
+        """
+        if not getattr(self.sim_params, "snapshot_reset", False) \
+                or self.simulator not in ['traci', 'libsumo'] \
+                or self.initial_config.shuffle:
+            return
+
+        # restarting the simulation discards the snapshot on every reset, so
+        # that it would never be loaded
+        if self.sim_params.restart_instance:
+            warnings.warn(
+                "SumoParams(snapshot_reset=True) has no effect when "
+                "restart_instance is set to True, since the simulation is "
+                "restarted on every reset.")
+            return
+
+        fd, path = tempfile.mkstemp(prefix="flow_snapshot_", suffix=".xml")
+        os.close(fd)
+        self.k.simulation.save_state(path)
+
+        self.k.vehicle.kernel_api = None
+        self.k.vehicle.master_kernel = None
+        vehicle = deepcopy(self.k.vehicle)
+        self.k.vehicle.kernel_api = self.k.kernel_api
+        self.k.vehicle.master_kernel = self.k
+
+        self._snapshot = {
+            "path": path,
+            "vehicle": vehicle,
+            "time": self.k.simulation.time,
+            "time_counter": self.time_counter,
+            "state": deepcopy(self.state),
+            "observation": deepcopy(observation),
+            "attributes": {name: deepcopy(getattr(self, name))
+                           for name in self.snapshot_attributes},
+        }
+
+    def _load_snapshot(self):
+        """Restore the state of the environment saved by `_save_snapshot`.
+
+        Returns
+        -------
+        array_like
+            the observation returned by the reset the snapshot was taken at
+        """
+        snapshot = self._snapshot
+
+        self.k.simulation.load_state(snapshot["path"])
+        self.k.simulation.time = snapshot["time"]
+
+        # replace the vehicle kernel with the one matching the loaded state
+        self.k.vehicle = deepcopy(snapshot["vehicle"])
+        self.k.vehicle.master_kernel = self.k
+        self.k.vehicle.pass_api(self.k.kernel_api)
+        self.k.vehicle.rehydrate()
+
+        # traffic light subscriptions are lost when loading a state as well
+        self.k.traffic_light.pass_api(self.k.kernel_api)
+        self.k.traffic_light.update(reset=True)
+
+        self.time_counter = snapshot["time_counter"]
+        self.state = deepcopy(snapshot["state"])
+        for name, value in snapshot["attributes"].items():
+            setattr(self, name, deepcopy(value))
+
+        # render a frame
+        self.render(reset=True)
+
+        return deepcopy(snapshot["observation"])
+
+    def _discard_snapshot(self):
+        """Delete the saved state of the environment, if any."""
+        if self._snapshot is not None:
+            try:
+                os.remove(self._snapshot["path"])
+            except OSError:
+                pass
+            self._snapshot = None
+
+    def _apply_routing_actions(self):
+        """Update the routes of the vehicles with a routing controller.
+
+        By default, the routing controller of every vehicle is called at every
+        step. If ``event_routing`` is set in the environment parameters,
+        routers that declare trigger edges are only called when their vehicle
+        departs or enters a new edge, at every step during which the vehicle
+        is on one of its trigger edges, and until the route of a vehicle that
+        just departed is known.
+        """
+        if getattr(self.env_params, "event_routing", False):
+            # routers with trigger edges are only called for the vehicles with
+            # an event, and for the vehicles on their trigger edges
+            events = self.k.vehicle.get_edge_changed_ids().union(
+                self._pending_routing_ids)
+            self._pending_routing_ids.clear()
+            candidates = events.union(self.k.vehicle.get_ids_by_edge(
+                self.k.vehicle.get_trigger_edges()))
+            veh_ids = list(self.k.vehicle.get_routed_ids(triggered=False))
+            for veh_id in sorted(candidates):
+                route_contr = self.k.vehicle.get_routing_controller(veh_id)
+                trigger_edges = getattr(route_contr, "trigger_edges", None)
+                if trigger_edges is None:
+                    # no router, or a router that is already called
+                    continue
+                if veh_id in events or \
+                        self.k.vehicle.get_edge(veh_id) in trigger_edges:
+                    veh_ids.append(veh_id)
+                    if len(self.k.vehicle.get_route(veh_id)) == 0:
+                        # the route of inflowing vehicles is not known in the
+                        # first step that they departed
+                        self._pending_routing_ids.add(veh_id)
+        else:
+            veh_ids = self.k.vehicle.get_routed_ids()
+
+        routing_actions = [
+            self.k.vehicle.get_routing_controller(veh_id).choose_route(self)
+            for veh_id in veh_ids]
+        self.k.vehicle.choose_routes(veh_ids, routing_actions)
+
     def additional_command(self):
         """Additional commands that may be performed by the step method."""
         pass
@@ -691,6 +897,11 @@ class Env(gym.Env, metaclass=ABCMeta):
         try:
             # close everything within the kernel
             self.k.close()
+            self._discard_snapshot()
+            # save the durations of the phases of every step
+            if self.profiler.enabled:
+                self.profiler.save(self.env_params.profile_path,
+                                   self.env_params.profile_format)
             # close pyglet renderer
             if self.sim_params.render in ['gray', 'dgray', 'rgb', 'drgb']:
                 self.renderer.close()
@@ -710,6 +921,10 @@ class Env(gym.Env, metaclass=ABCMeta):
     def render(self, reset=False, buffer_length=5):
         """Render a frame.
 
+        The frames are cached in ``frame_buffer``, a ring buffer allocated
+        once (see flow.renderer.frame_buffer.FrameBuffer), and the local
+        observations of RL vehicles in ``sights_buffer``.
+
         Parameters
         ----------
         reset : bool
@@ -723,15 +938,18 @@ class Env(gym.Env, metaclass=ABCMeta):
 
             # cache rendering
             if reset:
-                self.frame_buffer = [self.frame.copy() for _ in range(5)]
-                self.sights_buffer = [self.sights.copy() for _ in range(5)]
-            else:
-                if self.step_counter % int(1/self.sim_step) == 0:
-                    self.frame_buffer.append(self.frame.copy())
-                    self.sights_buffer.append(self.sights.copy())
-                if len(self.frame_buffer) > buffer_length:
-                    self.frame_buffer.pop(0)
-                    self.sights_buffer.pop(0)
+                frame_buffer = getattr(self, "frame_buffer", None)
+                if frame_buffer is None \
+                        or frame_buffer.capacity != buffer_length \
+                        or frame_buffer.shape != self.frame.shape:
+                    self.frame_buffer = FrameBuffer(
+                        buffer_length, self.frame.shape, self.frame.dtype)
+                self.frame_buffer.fill(self.frame)
+                self.sights_buffer = deque(
+                    [self.sights] * buffer_length, maxlen=buffer_length)
+            elif self.step_counter % int(1/self.sim_step) == 0:
+                self.frame_buffer.append(self.frame)
+                self.sights_buffer.append(self.sights)
         elif (self.sim_params.render is True) and self.sim_params.save_render:
             # sumo-gui render
             self.k.kernel_api.gui.screenshot("View #0", self.path+"/frame_%06d.png" % self.time_counter)
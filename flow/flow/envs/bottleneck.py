@@ -285,7 +285,7 @@ class BottleneckEnv(Env):
             if self.k.vehicle.get_edge(veh_id) == EDGE_AFTER_RAMP_METER:
                 color = self.cars_before_ramp[veh_id]['color']
                 self.k.vehicle.set_color(veh_id, color)
-                if self.simulator == 'traci':
+                if self.simulator in ['traci', 'libsumo']:
                     lane_change_mode = self.cars_before_ramp[veh_id][
                         'lane_change_mode']
                     self.k.kernel_api.vehicle.setLaneChangeMode(
@@ -301,7 +301,7 @@ class BottleneckEnv(Env):
             for veh_id, pos in cars_in_lane:
                 if pos > RAMP_METER_AREA:
                     if veh_id not in self.cars_waiting_for_toll:
-                        if self.simulator == 'traci':
+                        if self.simulator in ['traci', 'libsumo']:
                             # Disable lane changes inside Toll Area
                             lane_change_mode = \
                                 self.k.kernel_api.vehicle.getLaneChangeMode(
@@ -377,7 +377,7 @@ class BottleneckEnv(Env):
                 lane = self.k.vehicle.get_lane(veh_id)
                 color = self.cars_waiting_for_toll[veh_id]["color"]
                 self.k.vehicle.set_color(veh_id, color)
-                if self.simulator == 'traci':
+                if self.simulator in ['traci', 'libsumo']:
                     lane_change_mode = \
                         self.cars_waiting_for_toll[veh_id]["lane_change_mode"]
                     self.k.kernel_api.vehicle.setLaneChangeMode(
@@ -409,7 +409,7 @@ class BottleneckEnv(Env):
                 if pos > TOLL_BOOTH_AREA:
                     if veh_id not in self.cars_waiting_for_toll:
                         # Disable lane changes inside Toll Area
-                        if self.simulator == 'traci':
+                        if self.simulator in ['traci', 'libsumo']:
                             lane_change_mode = self.k.kernel_api.vehicle.\
                                 getLaneChangeMode(veh_id)
                             self.k.kernel_api.vehicle.setLaneChangeMode(
@@ -70,6 +70,8 @@ class MergePOEnv(Env):
         vehicles collide into one another.
     """
 
+    snapshot_attributes = ("rl_queue", "rl_veh", "leader", "follower")
+
     def __init__(self, env_params, sim_params, network, simulator='traci'):
         for p in ADDITIONAL_ENV_PARAMS.keys():
             if p not in env_params.additional_params:
@@ -6,11 +6,9 @@ import random
 import traceback
 from gym.spaces import Box
 
-from traci.exceptions import FatalTraCIError
-from traci.exceptions import TraCIException
-
 from ray.rllib.env import MultiAgentEnv
 
+from flow.controllers import batch
 from flow.envs.base import Env
 from flow.utils.exceptions import FatalFlowError
 
@@ -48,21 +46,29 @@ class MultiEnv(MultiAgentEnv, Env):
         info : dict
             contains other diagnostic information from the previous action
         """
+        self.profiler.begin("step")
         for _ in range(self.env_params.sims_per_step):
             self.time_counter += 1
             self.step_counter += 1
 
             # perform acceleration actions for controlled human-driven vehicles
+            self.profiler.begin("controllers")
             if len(self.k.vehicle.get_controlled_ids()) > 0:
-                accel = []
-                for veh_id in self.k.vehicle.get_controlled_ids():
-                    accel_contr = self.k.vehicle.get_acc_controller(veh_id)
-                    action = accel_contr.get_action(self)
-                    accel.append(action)
+                if self.env_params.batch_controllers:
+                    accel = batch.get_actions(
+                        self, self.k.vehicle.get_controlled_ids())
+                else:
+                    accel = []
+                    for veh_id in self.k.vehicle.get_controlled_ids():
+                        accel_contr = self.k.vehicle.get_acc_controller(veh_id)
+                        action = accel_contr.get_action(self)
+                        accel.append(action)
                 self.k.vehicle.apply_acceleration(
                     self.k.vehicle.get_controlled_ids(), accel)
+            self.profiler.end()
 
             # perform lane change actions for controlled human-driven vehicles
+            self.profiler.begin("lane_change")
             if len(self.k.vehicle.get_controlled_lc_ids()) > 0:
                 direction = []
                 for veh_id in self.k.vehicle.get_controlled_lc_ids():
@@ -72,31 +78,36 @@ class MultiEnv(MultiAgentEnv, Env):
                 self.k.vehicle.apply_lane_change(
                     self.k.vehicle.get_controlled_lc_ids(),
                     direction=direction)
+            self.profiler.end()
 
             # perform (optionally) routing actions for all vehicle in the
             # network, including rl and sumo-controlled vehicles
-            routing_ids = []
-            routing_actions = []
-            for veh_id in self.k.vehicle.get_ids():
-                if self.k.vehicle.get_routing_controller(veh_id) is not None:
-                    routing_ids.append(veh_id)
-                    route_contr = self.k.vehicle.get_routing_controller(veh_id)
-                    routing_actions.append(route_contr.choose_route(self))
-            self.k.vehicle.choose_routes(routing_ids, routing_actions)
+            self.profiler.begin("routing")
+            self._apply_routing_actions()
+            self.profiler.end()
 
+            self.profiler.begin("rl_actions")
             self.apply_rl_actions(rl_actions)
+            self.profiler.end()
 
+            self.profiler.begin("additional_command")
             self.additional_command()
+            self.profiler.end()
 
             # advance the simulation in the simulator by one step
+            self.profiler.begin("simulation_step")
             self.k.simulation.simulation_step()
+            self.profiler.end()
 
             # store new observations in the vehicles and traffic lights class
+            self.profiler.begin("update")
             self.k.update(reset=False)
+            self.clear_shared_terms()
 
             # update the colors of vehicles
             if self.sim_params.render:
                 self.k.vehicle.update_vehicle_colors()
+            self.profiler.end()
 
             # crash encodes whether the simulator experienced a collision
             crash = self.k.simulation.check_collision()
@@ -105,7 +116,10 @@ class MultiEnv(MultiAgentEnv, Env):
             if crash:
                 break
 
+        self.profiler.begin("get_state")
         states = self.get_state()
+        self.profiler.end()
+
         done = {key: key in self.k.vehicle.get_arrived_ids()
                 for key in states.keys()}
         if crash or (self.time_counter >= self.env_params.sims_per_step *
@@ -116,17 +130,20 @@ class MultiEnv(MultiAgentEnv, Env):
         infos = {key: {} for key in states.keys()}
 
         # compute the reward
+        self.profiler.begin("reward")
         if self.env_params.clip_actions:
             clipped_actions = self.clip_actions(rl_actions)
             reward = self.compute_reward(clipped_actions, fail=crash)
         else:
             reward = self.compute_reward(rl_actions, fail=crash)
+        self.profiler.end()
 
         for rl_id in self.k.vehicle.get_arrived_rl_ids(self.env_params.sims_per_step):
             done[rl_id] = True
             reward[rl_id] = 0
             states[rl_id] = np.zeros(self.observation_space.shape[0])
 
+        self.profiler.end()
         return states, reward, done, infos
 
     def reset(self, new_inflow_rate=None):
@@ -145,8 +162,12 @@ class MultiEnv(MultiAgentEnv, Env):
             the initial observation of the space. The initial reward is assumed
             to be zero.
         """
+        self.profiler.begin("reset")
+
         # reset the time counter
         self.time_counter = 0
+        self._pending_routing_ids.clear()
+        self.clear_shared_terms()
 
         # Now that we've passed the possibly fake init steps some rl libraries
         # do, we can feel free to actually render things
@@ -185,12 +206,18 @@ class MultiEnv(MultiAgentEnv, Env):
         elif self.initial_config.shuffle:
             self.setup_initial_state()
 
+        # restore the state saved at the end of the first reset (if available)
+        if self._snapshot is not None:
+            observation = self._load_snapshot()
+            self.profiler.end()
+            return observation
+
         # clear all vehicles from the network and the vehicles class
-        if self.simulator == 'traci':
+        if self.simulator in ['traci', 'libsumo']:
             for veh_id in self.k.kernel_api.vehicle.getIDList():  # FIXME: hack
                 try:
                     self.k.vehicle.remove(veh_id)
-                except (FatalTraCIError, TraCIException):
+                except self.k.api_errors:
                     print(traceback.format_exc())
 
         # clear all vehicles from the network and the vehicles class
@@ -202,7 +229,7 @@ class MultiEnv(MultiAgentEnv, Env):
                 continue
             try:
                 self.k.vehicle.remove(veh_id)
-            except (FatalTraCIError, TraCIException):
+            except self.k.api_errors:
                 print("Error during start: {}".format(traceback.format_exc()))
 
         # do any additional resetting of the vehicle class needed
@@ -221,11 +248,11 @@ class MultiEnv(MultiAgentEnv, Env):
                     lane=lane_index,
                     pos=pos,
                     speed=speed)
-            except (FatalTraCIError, TraCIException):
+            except self.k.api_errors:
                 # if a vehicle was not removed in the first attempt, remove it
                 # now and then reintroduce it
                 self.k.vehicle.remove(veh_id)
-                if self.simulator == 'traci':
+                if self.simulator in ['traci', 'libsumo']:
                     self.k.kernel_api.vehicle.remove(veh_id)  # FIXME: hack
                 self.k.vehicle.add(
                     veh_id=veh_id,
@@ -240,6 +267,7 @@ class MultiEnv(MultiAgentEnv, Env):
 
         # update the information in each kernel to match the current state
         self.k.update(reset=True)
+        self.clear_shared_terms()
 
         # update the colors of vehicles
         if self.sim_params.render:
@@ -259,10 +287,145 @@ class MultiEnv(MultiAgentEnv, Env):
         for _ in range(self.env_params.warmup_steps):
             observation, _, _, _ = self.step(rl_actions=None)
 
+        observation = self.get_state()
+
+        # save the state of the environment to be restored on later resets
+        self._save_snapshot(observation)
+
         # render a frame
         self.render(reset=True)
 
-        return self.get_state()
+        self.profiler.end()
+        return observation
+
+    def get_batch_state(self, agent_ids):
+        """Return the observations of several agents as a single array.
+
+        Environments whose agents share an observation space may implement
+        this method to compute the observations of all agents in a single
+        pass over the state of the vehicle kernel, rather than by calling
+        the getters of the kernel once per agent. The dict of observations
+        expected by RLlib is then obtained with ``batch_state_dict``.
+
+        Parameters
+        ----------
+        agent_ids : list of str
+            the agents to observe
+
+        Returns
+        -------
+        np.ndarray
+            array of shape (len(agent_ids), obs_dim), whose i-th row is the
+            observation of the i-th agent
+
+        Raises
+        ------
+        NotImplementedError
+            if the environment does not support batched observations
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def batch_state_dict(agent_ids, states):
+        """Return the observations of a batch of agents as a dict.
+
+        The observations are views of the rows of ``states``, so no data is
+        copied.
+
+        Parameters
+        ----------
+        agent_ids : list of str
+            the agents of the batch
+        states : np.ndarray
+            the observations of the agents, as returned by
+            ``get_batch_state``
+
+        Returns
+        -------
+        dict <str, np.ndarray>
+            the observation of every agent
+        """
+        return {agent_id: states[i] for i, agent_id in enumerate(agent_ids)}
+
+    @staticmethod
+    def _get_neighbor_values(getter, veh_ids, default):
+        """Return the values of a getter for vehicles that may be missing.
+
+        This is used by ``get_batch_state`` to collect the state of the
+        leaders or followers of several agents with a single call to a
+        getter of the vehicle kernel.
+
+        Parameters
+        ----------
+        getter : callable
+            getter of the vehicle kernel accepting a list of vehicles, e.g.
+            ``self.k.vehicle.get_speed``
+        veh_ids : list of str
+            names of the vehicles, with "" or None for missing vehicles
+        default : float
+            value of missing vehicles
+
+        Returns
+        -------
+        np.ndarray
+            the value of every vehicle
+        """
+        values = np.full(len(veh_ids), default, dtype=float)
+        present = [i for i, veh_id in enumerate(veh_ids)
+                   if veh_id not in ["", None]]
+        if present:
+            values[present] = getter([veh_ids[i] for i in present])
+        return values
+
+    def shared_term(self, key, fn, *args, **kwargs):
+        """Return a term shared by all agents, computed once per step.
+
+        Multi-agent environments often compute the same system-level terms
+        (e.g. the average velocity of all vehicles) for every agent. This
+        method computes such a term the first time it is requested, and
+        returns the memoized value until the next update of the kernels
+        (i.e. the next simulation step or reset). If the state of the
+        simulation is modified otherwise (e.g. with ``test_set_speed``),
+        ``clear_shared_terms`` should be called.
+
+        Usage
+        -----
+        >>> cost = self.shared_term("average_velocity", average_velocity, self)
+
+        Parameters
+        ----------
+        key : hashable
+            name of the term. Terms computed with different arguments should
+            use different keys.
+        fn : callable
+            function computing the term
+        args, kwargs
+            arguments of ``fn``
+
+        Returns
+        -------
+        Any
+            the value returned by ``fn``
+        """
+        try:
+            return self._shared_terms[key]
+        except KeyError:
+            value = self._shared_terms[key] = fn(*args, **kwargs)
+            return value
+
+    def get_rl_id_set(self):
+        """Return the names of the RL vehicles as a set, shared by all agents.
+
+        This allows agents to check whether other vehicles (e.g. their
+        leaders) are RL vehicles in constant time. The returned set should
+        not be modified.
+        """
+        return self.shared_term(
+            "rl_id_set", lambda: set(self.k.vehicle.get_rl_ids()))
+
+    def clear_shared_terms(self):
+        """Clear the terms memoized by ``shared_term``."""
+        self._shared_terms.clear()
 
     def clip_actions(self, rl_actions=None):
         """Clip the actions passed from the RL agent.
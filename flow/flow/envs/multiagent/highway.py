@@ -96,44 +96,38 @@ class MultiAgentHighwayPOEnv(MultiEnv):
 
     def get_state(self):
         """See class definition."""
-        obs = {}
+        rl_ids = self.k.vehicle.get_rl_ids()
+        return self.batch_state_dict(rl_ids, self.get_batch_state(rl_ids))
+
+    def get_batch_state(self, agent_ids):
+        """See parent class."""
+        veh = self.k.vehicle
 
         # normalizing constants
         max_speed = self.k.network.max_speed()
         max_length = self.k.network.length()
 
-        for rl_id in self.k.vehicle.get_rl_ids():
-            this_speed = self.k.vehicle.get_speed(rl_id)
-            lead_id = self.k.vehicle.get_leader(rl_id)
-            follower = self.k.vehicle.get_follower(rl_id)
-
-            if lead_id in ["", None]:
-                # in case leader is not visible
-                lead_speed = max_speed
-                lead_head = max_length
-            else:
-                lead_speed = self.k.vehicle.get_speed(lead_id)
-                lead_head = self.k.vehicle.get_headway(lead_id)
-
-            if follower in ["", None]:
-                # in case follower is not visible
-                follow_speed = 0
-                follow_head = max_length
-            else:
-                follow_speed = self.k.vehicle.get_speed(follower)
-                follow_head = self.k.vehicle.get_headway(follower)
-
-            observation = np.array([
-                this_speed / max_speed,
-                (lead_speed - this_speed) / max_speed,
-                lead_head / max_length,
-                (this_speed - follow_speed) / max_speed,
-                follow_head / max_length
-            ])
-
-            obs.update({rl_id: observation})
-
-        return obs
+        this_speed = np.asarray(veh.get_speed(agent_ids), dtype=float)
+        lead_ids = veh.get_leader(agent_ids)
+        followers = veh.get_follower(agent_ids)
+
+        # missing leaders and followers are replaced with default values
+        lead_speed = self._get_neighbor_values(
+            veh.get_speed, lead_ids, max_speed)
+        lead_head = self._get_neighbor_values(
+            veh.get_headway, lead_ids, max_length)
+        follow_speed = self._get_neighbor_values(
+            veh.get_speed, followers, 0)
+        follow_head = self._get_neighbor_values(
+            veh.get_headway, followers, max_length)
+
+        return np.column_stack([
+            this_speed / max_speed,
+            (lead_speed - this_speed) / max_speed,
+            lead_head / max_length,
+            (this_speed - follow_speed) / max_speed,
+            follow_head / max_length
+        ])
 
     def compute_reward(self, rl_actions, **kwargs):
         """See class definition."""
@@ -151,7 +145,8 @@ class MultiAgentHighwayPOEnv(MultiEnv):
                 reward = 0
             else:
                 # reward high system-level velocities
-                cost1 = desired_velocity(self, fail=kwargs['fail'])
+                cost1 = self.shared_term(
+                    "desired_velocity", desired_velocity, self)
 
                 # penalize small time headways
                 cost2 = 0
@@ -113,20 +113,23 @@ class I210MultiEnv(MultiEnv):
 
     def get_state(self):
         """See class definition."""
+        rl_ids = self.k.vehicle.get_rl_ids()
+        return self.batch_state_dict(rl_ids, self.get_batch_state(rl_ids))
+
+    def get_batch_state(self, agent_ids):
+        """See parent class."""
+        veh = self.k.vehicle
         if self.lead_obs:
-            veh_info = {}
-            for rl_id in self.k.vehicle.get_rl_ids():
-                speed = self.k.vehicle.get_speed(rl_id)
-                headway = self.k.vehicle.get_headway(rl_id)
-                lead_speed = self.k.vehicle.get_speed(self.k.vehicle.get_leader(rl_id))
-                if lead_speed == -1001:
-                    lead_speed = 0
-                veh_info.update({rl_id: np.array([speed / 50.0, headway / 1000.0, lead_speed / 50.0])})
+            speed = np.asarray(veh.get_speed(agent_ids), dtype=float)
+            headway = np.asarray(veh.get_headway(agent_ids), dtype=float)
+            lead_speed = np.asarray(
+                veh.get_speed(veh.get_leader(agent_ids)), dtype=float)
+            lead_speed[lead_speed == -1001] = 0
+            return np.column_stack(
+                [speed / 50.0, headway / 1000.0, lead_speed / 50.0])
         else:
-            veh_info = {rl_id: np.concatenate((self.state_util(rl_id),
-                                               self.veh_statistics(rl_id)))
-                        for rl_id in self.k.vehicle.get_rl_ids()}
-        return veh_info
+            return np.hstack((self.batch_state_util(agent_ids),
+                              self.batch_veh_statistics(agent_ids)))
 
     def compute_reward(self, rl_actions, **kwargs):
         # TODO(@evinitsky) we need something way better than this. Something that adds
@@ -146,7 +149,8 @@ class I210MultiEnv(MultiEnv):
                 reward = 0
             else:
                 # reward high system-level velocities
-                cost1 = average_velocity(self, fail=kwargs['fail'])
+                cost1 = self.shared_term(
+                    "average_velocity", average_velocity, self)
 
                 # penalize small time headways
                 cost2 = 0
@@ -198,7 +202,7 @@ class I210MultiEnv(MultiEnv):
         lane_follower_speed = veh.get_lane_followers_speed(rl_id).copy()
         leader_ids = veh.get_lane_leaders(rl_id).copy()
         follower_ids = veh.get_lane_followers(rl_id).copy()
-        rl_ids = self.k.vehicle.get_rl_ids()
+        rl_ids = self.get_rl_id_set()
         is_leader_rl = [1 if l_id in rl_ids else 0 for l_id in leader_ids]
         is_follow_rl = [1 if f_id in rl_ids else 0 for f_id in follower_ids]
         diff = MAX_LANES - len(is_leader_rl)
@@ -218,8 +222,58 @@ class I210MultiEnv(MultiEnv):
                                lane_follower_speed, is_leader_rl,
                                is_follow_rl))
 
+    def batch_state_util(self, rl_ids):
+        """Return the output of ``state_util`` for several vehicles.
+
+        The lane observations of all vehicles are written into a single
+        array, and the speeds of all lane leaders and followers are collected
+        with a single call to the vehicle kernel.
+
+        Returns
+        -------
+        np.ndarray
+            array of shape (len(rl_ids), 6 * MAX_LANES), whose i-th row is
+            ``state_util(rl_ids[i])``
+        """
+        veh = self.k.vehicle
+        rl_id_set = self.get_rl_id_set()
+
+        # headways, tailways, leader speeds, follower speeds, whether the
+        # leaders are rl, and whether the followers are rl, in every lane.
+        # Missing lanes are filled with -1 to disambiguate from zeros.
+        state = np.full((len(rl_ids), 6, MAX_LANES), -1, dtype=float)
+        neighbors = {2: ([], [], []), 3: ([], [], [])}
+        for i, rl_id in enumerate(rl_ids):
+            headways = veh.get_lane_headways(rl_id)
+            tailways = veh.get_lane_tailways(rl_id)
+            state[i, 0, :len(headways)] = headways
+            state[i, 1, :len(tailways)] = tailways
+            for j, ids in ((2, veh.get_lane_leaders(rl_id)),
+                           (3, veh.get_lane_followers(rl_id))):
+                rows, lanes, names = neighbors[j]
+                rows.extend([i] * len(ids))
+                lanes.extend(range(len(ids)))
+                names.extend(ids)
+                state[i, j + 2, :len(ids)] = [
+                    1 if veh_id in rl_id_set else 0 for veh_id in ids]
+
+        # speeds of the lane leaders and followers, 0 if there are none
+        for j, (rows, lanes, names) in neighbors.items():
+            state[rows, j, lanes] = self._get_neighbor_values(
+                veh.get_speed, names, 0)
+
+        state[:, 0:2] /= 1000
+        state[:, 2:4] /= 100
+        return state.reshape(len(rl_ids), 6 * MAX_LANES)
+
     def veh_statistics(self, rl_id):
         """Return speed, edge information, and x, y about the vehicle itself."""
         speed = self.k.vehicle.get_speed(rl_id) / 100.0
         lane = (self.k.vehicle.get_lane(rl_id) + 1) / 10.0
         return np.array([speed, lane])
+
+    def batch_veh_statistics(self, rl_ids):
+        """Return the output of ``veh_statistics`` for several vehicles."""
+        speed = np.asarray(self.k.vehicle.get_speed(rl_ids), dtype=float)
+        lane = np.asarray(self.k.vehicle.get_lane(rl_ids), dtype=float)
+        return np.column_stack([speed / 100.0, (lane + 1) / 10.0])
@@ -162,51 +162,54 @@ class MultiAgentAccelPOEnv(MultiEnv):
 
     def get_state(self, **kwargs):  # FIXME
         """See class definition."""
-        self.leader = []
-        self.follower = []
-        obs = {}
+        rl_ids = self.k.vehicle.get_rl_ids()
+        return self.batch_state_dict(rl_ids, self.get_batch_state(rl_ids))
+
+    def get_batch_state(self, agent_ids):
+        """See parent class.
+
+        The leaders and followers of the agents are stored in the "leader"
+        and "follower" attributes, for visualization purposes.
+        """
+        veh = self.k.vehicle
 
         # normalizing constants
         max_speed = self.k.network.max_speed()
         max_length = self.k.network.length()
 
-        for rl_id in self.k.vehicle.get_rl_ids():
-            this_pos = self.k.vehicle.get_x_by_id(rl_id)
-            this_speed = self.k.vehicle.get_speed(rl_id)
-            lead_id = self.k.vehicle.get_leader(rl_id)
-            follower = self.k.vehicle.get_follower(rl_id)
-
-            if lead_id in ["", None]:
-                # in case leader is not visible
-                lead_speed = max_speed
-                lead_head = max_length
-            else:
-                self.leader.append(lead_id)
-                lead_speed = self.k.vehicle.get_speed(lead_id)
-                lead_head = self.k.vehicle.get_x_by_id(lead_id) \
-                    - self.k.vehicle.get_x_by_id(rl_id) \
-                    - self.k.vehicle.get_length(rl_id)
-
-            if follower in ["", None]:
-                # in case follower is not visible
-                follow_speed = 0
-                follow_head = max_length
-            else:
-                self.follower.append(follower)
-                follow_speed = self.k.vehicle.get_speed(follower)
-                follow_head = self.k.vehicle.get_headway(follower)
-
-            # Add the next observation.
-            obs[rl_id] = np.array([
-                this_pos / max_length,
-                this_speed / max_speed,
-                (lead_speed - this_speed) / max_speed,
-                lead_head / max_length,
-                (this_speed - follow_speed) / max_speed,
-                follow_head / max_length
-            ])
-
-        return obs
+        this_pos = np.asarray(veh.get_x_by_id(agent_ids), dtype=float)
+        this_speed = np.asarray(veh.get_speed(agent_ids), dtype=float)
+        lead_ids = veh.get_leader(agent_ids)
+        followers = veh.get_follower(agent_ids)
+        has_lead = np.array([lead_id not in ["", None]
+                             for lead_id in lead_ids], dtype=bool)
+        self.leader = [lead_id for lead_id in lead_ids
+                       if lead_id not in ["", None]]
+        self.follower = [follower for follower in followers
+                         if follower not in ["", None]]
+
+        # missing leaders and followers are replaced with default values
+        lead_speed = self._get_neighbor_values(
+            veh.get_speed, lead_ids, max_speed)
+        lead_x = self._get_neighbor_values(veh.get_x_by_id, lead_ids, 0)
+        lead_head = np.where(
+            has_lead,
+            lead_x - this_pos
+            - np.asarray(veh.get_length(agent_ids), dtype=float),
+            max_length)
+        follow_speed = self._get_neighbor_values(
+            veh.get_speed, followers, 0)
+        follow_head = self._get_neighbor_values(
+            veh.get_headway, followers, max_length)
+
+        return np.column_stack([
+            this_pos / max_length,
+            this_speed / max_speed,
+            (lead_speed - this_speed) / max_speed,
+            lead_head / max_length,
+            (this_speed - follow_speed) / max_speed,
+            follow_head / max_length
+        ])
 
     def additional_command(self):
         """See parent class.
@@ -72,24 +72,28 @@ class MultiWaveAttenuationPOEnv(MultiEnv):
 
     def get_state(self):
         """See class definition."""
-        obs = {}
-        for rl_id in self.k.vehicle.get_rl_ids():
-            lead_id = self.k.vehicle.get_leader(rl_id) or rl_id
-
-            # normalizers
-            max_speed = 15.
-            max_length = self.env_params.additional_params['ring_length'][1]
-
-            observation = np.array([
-                self.k.vehicle.get_speed(rl_id) / max_speed,
-                (self.k.vehicle.get_speed(lead_id) -
-                 self.k.vehicle.get_speed(rl_id))
-                / max_speed,
-                self.k.vehicle.get_headway(rl_id) / max_length
-            ])
-            obs.update({rl_id: observation})
-
-        return obs
+        rl_ids = self.k.vehicle.get_rl_ids()
+        return self.batch_state_dict(rl_ids, self.get_batch_state(rl_ids))
+
+    def get_batch_state(self, agent_ids):
+        """See parent class."""
+        veh = self.k.vehicle
+        lead_ids = [lead_id or rl_id for rl_id, lead_id in
+                    zip(agent_ids, veh.get_leader(agent_ids))]
+
+        # normalizers
+        max_speed = 15.
+        max_length = self.env_params.additional_params['ring_length'][1]
+
+        speed = np.asarray(veh.get_speed(agent_ids), dtype=float)
+        lead_speed = np.asarray(veh.get_speed(lead_ids), dtype=float)
+        headway = np.asarray(veh.get_headway(agent_ids), dtype=float)
+
+        return np.column_stack([
+            speed / max_speed,
+            (lead_speed - speed) / max_speed,
+            headway / max_length
+        ])
 
     def _apply_rl_actions(self, rl_actions):
         """Split the accelerations by ring."""
@@ -195,24 +199,28 @@ class MultiAgentWaveAttenuationPOEnv(MultiEnv):
 
     def get_state(self):
         """See class definition."""
-        obs = {}
-        for rl_id in self.k.vehicle.get_rl_ids():
-            lead_id = self.k.vehicle.get_leader(rl_id) or rl_id
-
-            # normalizers
-            max_speed = 15.
-            max_length = self.env_params.additional_params['ring_length'][1]
-
-            observation = np.array([
-                self.k.vehicle.get_speed(rl_id) / max_speed,
-                (self.k.vehicle.get_speed(lead_id) -
-                 self.k.vehicle.get_speed(rl_id))
-                / max_speed,
-                self.k.vehicle.get_headway(rl_id) / max_length
-            ])
-            obs.update({rl_id: observation})
-
-        return obs
+        rl_ids = self.k.vehicle.get_rl_ids()
+        return self.batch_state_dict(rl_ids, self.get_batch_state(rl_ids))
+
+    def get_batch_state(self, agent_ids):
+        """See parent class."""
+        veh = self.k.vehicle
+        lead_ids = [lead_id or rl_id for rl_id, lead_id in
+                    zip(agent_ids, veh.get_leader(agent_ids))]
+
+        # normalizers
+        max_speed = 15.
+        max_length = self.env_params.additional_params['ring_length'][1]
+
+        speed = np.asarray(veh.get_speed(agent_ids), dtype=float)
+        lead_speed = np.asarray(veh.get_speed(lead_ids), dtype=float)
+        headway = np.asarray(veh.get_headway(agent_ids), dtype=float)
+
+        return np.column_stack([
+            speed / max_speed,
+            (lead_speed - speed) / max_speed,
+            headway / max_length
+        ])
 
     def _apply_rl_actions(self, rl_actions):
         """Split the accelerations by ring."""
@@ -122,8 +122,8 @@ class LaneChangeAccelEnv(AccelEnv):
 
         speed = [self.k.vehicle.get_speed(veh_id) / max_speed
                  for veh_id in self.sorted_ids]
-        pos = [self.k.vehicle.get_x_by_id(veh_id) / length
-               for veh_id in self.sorted_ids]
+        pos = [x / length
+               for x in self.k.vehicle.get_x_by_id(self.sorted_ids)]
         lane = [self.k.vehicle.get_lane(veh_id) / max_lanes
                 for veh_id in self.sorted_ids]
 
@@ -1,5 +1,9 @@
 """Empty init file to ensure documentation for the renderer is created."""
 
+from flow.renderer.frame_buffer import FrameBuffer
 from flow.renderer.pyglet_renderer import PygletRenderer
+from flow.renderer.raster_renderer import RasterRenderer
+from flow.renderer.render_writer import RenderWriter
 
-__all__ = ['PygletRenderer']
+__all__ = ['FrameBuffer', 'PygletRenderer', 'RasterRenderer',
+           'RenderWriter']
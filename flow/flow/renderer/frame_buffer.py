@@ -0,0 +1,159 @@
+"""Contains the ring buffer storing the history of rendered frames."""
+
+import numpy as np
+
+
+class FrameBuffer(object):
+    """Preallocated ring buffer of the last rendered frames.
+
+    The frames are stored in a single array of shape (capacity,) + shape,
+    allocated once. Adding a frame writes it into the slot of the oldest
+    frame, so that the memory used by the buffer is constant and no array is
+    allocated or copied per frame beyond this single write.
+
+    Usage
+    -----
+    >>> buffer = FrameBuffer(5, (height, width, 3))
+    >>> buffer.append(frame)
+    >>> stacked = buffer.latest(3)  # shape (3, height, width, 3)
+
+    Attributes
+    ----------
+    capacity : int
+        maximum number of frames stored
+    frames : np.ndarray
+        the underlying array of shape (capacity,) + shape. The frames are not
+        stored in chronological order.
+    """
+
+    def __init__(self, capacity, shape, dtype=np.uint8):
+        """Allocate the buffer.
+
+        Parameters
+        ----------
+        capacity : int
+            maximum number of frames stored
+        shape : tuple of int
+            shape of every frame
+        dtype : np.dtype, optional
+            data type of the frames
+        """
+        self.capacity = max(int(capacity), 1)
+        self.frames = np.zeros((self.capacity,) + tuple(shape), dtype=dtype)
+        # number of frames stored
+        self._size = 0
+        # slot of the next frame
+        self._next = 0
+
+    def __len__(self):
+        """Return the number of frames stored."""
+        return self._size
+
+    def __getitem__(self, index):
+        """Return a frame, indexed from the oldest to the newest.
+
+        Negative indices start from the newest frame. The returned array is a
+        view of the buffer, which is overwritten once ``capacity`` new frames
+        are added.
+        """
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("frame index out of range")
+        return self.frames[self._slot(index)]
+
+    def __iter__(self):
+        """Iterate over the frames, from the oldest to the newest."""
+        for index in range(self._size):
+            yield self[index]
+
+    @property
+    def shape(self):
+        """Return the shape of every frame."""
+        return self.frames.shape[1:]
+
+    def advance(self):
+        """Add a frame, and return its slot for it to be written in place.
+
+        This allows renderers to draw a frame directly into the buffer.
+
+        Returns
+        -------
+        np.ndarray
+            the slot of the new frame, which contains the oldest frame until
+            it is overwritten
+        """
+        slot = self.frames[self._next]
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+        return slot
+
+    def append(self, frame):
+        """Add a copy of a frame, overwriting the oldest frame if full.
+
+        Parameters
+        ----------
+        frame : array_like
+            the frame, whose shape must match the shape of the buffer
+
+        Returns
+        -------
+        np.ndarray
+            the copy of the frame stored in the buffer
+        """
+        slot = self.advance()
+        np.copyto(slot, frame)
+        return slot
+
+    def fill(self, frame):
+        """Replace all frames with copies of a single frame.
+
+        Parameters
+        ----------
+        frame : array_like
+            the frame, whose shape must match the shape of the buffer
+        """
+        self.frames[:] = frame
+        self._size = self.capacity
+        self._next = 0
+
+    def clear(self):
+        """Remove all frames from the buffer, without releasing memory."""
+        self._size = 0
+        self._next = 0
+
+    def latest(self, k=None):
+        """Return the last frames, stacked from the oldest to the newest.
+
+        The stacked frames are a view of the buffer if they are stored
+        contiguously, and a copy if they wrap around the end of the buffer.
+
+        Parameters
+        ----------
+        k : int, optional
+            number of frames. All stored frames are returned by default.
+
+        Returns
+        -------
+        np.ndarray
+            array of shape (k,) + shape
+
+        Raises
+        ------
+        ValueError
+            if fewer than k frames are stored
+        """
+        if k is None:
+            k = self._size
+        if k > self._size:
+            raise ValueError("Only {} frames are stored, {} requested."
+                             .format(self._size, k))
+        start = (self._next - k) % self.capacity
+        if k == 0 or start + k <= self.capacity:
+            return self.frames[start:start + k]
+        return np.concatenate(
+            (self.frames[start:], self.frames[:start + k - self.capacity]))
+
+    def _slot(self, index):
+        """Return the slot of the index-th oldest frame."""
+        return (self._next - self._size + index) % self.capacity
@@ -11,6 +11,8 @@ from os.path import expanduser
 import time
 import copy
 import warnings
+from flow.renderer.frame_buffer import FrameBuffer
+from flow.renderer.render_writer import RenderWriter
 HOME = expanduser("~")
 
 
@@ -23,9 +25,9 @@ class PygletRenderer(object):
 
     Attributes
     ----------
-    data : list
-        A list of rendering data to be saved when save_render is set to
-        True.
+    writer : flow.renderer.render_writer.RenderWriter
+        The writer saving the frames and the rendering data in the
+        background, when save_render is set to True.
     mode : str or bool
 
         * False: no rendering
@@ -39,6 +41,8 @@ class PygletRenderer(object):
         Specify whether to save rendering data to disk
     path : str
         Specify where to store the rendering data
+    save_format : str
+        Specify the format of the saved frames ("png", "mp4" or "npz")
     sight_radius : int
         Set the radius of observation for RL vehicles (meter)
     show_radius : bool
@@ -66,6 +70,9 @@ class PygletRenderer(object):
     frame : numpy.array
         An array of size width x height x channel, where channel = 3 when
         rendering in rgb mode and channel = 1 when rendering in gray mode
+    frames : flow.renderer.frame_buffer.FrameBuffer
+        The last rendered frames. The frame attribute is a view of the newest
+        one.
     pxpm : int
         Specify rendering resolution (pixel / meter)
     """
@@ -76,7 +83,10 @@ class PygletRenderer(object):
                  sight_radius=50,
                  show_radius=False,
                  pxpm=2,
-                 alpha=1.0):
+                 alpha=1.0,
+                 frame_history=2,
+                 save_format="png",
+                 fps=10):
         """Initialize Pyglet Renderer.
 
         Parameters
@@ -106,17 +116,26 @@ class PygletRenderer(object):
         alpha : int
             Specify opacity of the alpha channel.
             1.0 is fully opaque; 0.0 is fully transparent.
+        frame_history : int
+            Number of rendered frames kept in memory
+        save_format : str
+            Specify the format of the saved frames ("png", "mp4" or "npz",
+            see flow.renderer.render_writer.RenderWriter)
+        fps : float
+            Specify the frame rate of the saved videos
         """
         self.mode = mode
         if self.mode not in [True, False, "rgb", "drgb", "gray", "dgray"]:
             raise ValueError("Mode %s is not supported!" % self.mode)
         self.save_render = save_render
+        self.save_format = save_format
         self.path = path + '/' + time.strftime("%Y-%m-%d-%H%M%S")
         if self.save_render:
             if not os.path.exists(path):
                 os.mkdir(path)
             os.mkdir(self.path)
-            self.data = [network]
+            self.writer = RenderWriter(self.path, save_format, fps)
+            self.writer.write_data(network)
         self.sight_radius = sight_radius
         self.pxpm = pxpm  # Pixel per meter
         self.show_radius = show_radius
@@ -165,11 +184,9 @@ class PygletRenderer(object):
             self.lane_batch = pyglet.graphics.Batch()
             self._add_lane_polys()
             self.lane_batch.draw()
-            buffer = pyglet.image.get_buffer_manager().get_color_buffer()
-            image_data = buffer.get_image_data()
-            frame = np.fromstring(image_data.data, dtype=np.uint8, sep='')
-            frame = frame.reshape(buffer.height, buffer.width, 4)
-            self.frame = frame[::-1, :, 0:3][..., ::-1]
+            frame = self._read_color_buffer()
+            self.frames = FrameBuffer(frame_history, frame.shape)
+            self.frame = self.frames.append(frame)
             self.network = self.frame.copy()
             print('Rendering with frame {} x {}...'
                   .format(self.width, self.height))
@@ -212,14 +229,6 @@ class PygletRenderer(object):
             A list contains the timestep (ms), timedelta (ms), and id of
             all RL vehicles
         """
-        if self.save_render:
-            _human_orientations = copy.deepcopy(human_orientations)
-            _machine_orientations = copy.deepcopy(machine_orientations)
-            _human_dynamics = copy.deepcopy(human_dynamics)
-            _machine_dynamics = copy.deepcopy(machine_dynamics)
-            _human_logs = copy.deepcopy(human_logs)
-            _machine_logs = copy.deepcopy(machine_logs)
-
         self.time += 1
 
         pyglet.gl.glClearColor(0.125, 0.125, 0.125, self.alpha)
@@ -285,19 +294,17 @@ class PygletRenderer(object):
             )
         self.vehicle_batch.draw()
 
-        buffer = pyglet.image.get_buffer_manager().get_color_buffer()
-        image_data = buffer.get_image_data()
-        frame = np.fromstring(image_data.data, dtype=np.uint8, sep='')
-        frame = frame.reshape(buffer.height, buffer.width, 4)
-        self.frame = frame[::-1, :, 0:3][..., ::-1]
+        # the frame is written once, into the slot of the oldest frame
+        self.frame = self.frames.append(self._read_color_buffer())
         self.window.flip()
 
         if self.save_render:
-            cv2.imwrite("%s/frame_%06d.png" %
-                        (self.path, self.time), self.frame)
-            self.data.append([_human_orientations, _machine_orientations,
-                              _human_dynamics, _machine_dynamics,
-                              _human_logs, _machine_logs])
+            # the frame and the data are serialized before returning, and
+            # encoded in the background
+            self.writer.write_frame(self.frame)
+            self.writer.write_data([human_orientations, machine_orientations,
+                                    human_dynamics, machine_dynamics,
+                                    human_logs, machine_logs])
         if "gray" in self.mode:
             return self.frame[:, :, 0]
         else:
@@ -308,8 +315,8 @@ class PygletRenderer(object):
         print('Closing renderer...')
         save_path = ''
         if self.save_render:
-            save_path = '%s/data_%06d.npy' % (self.path, self.time)
-            np.save(save_path, self.data)
+            save_path = self.writer.close(
+                '%s/data_%06d.npy' % (self.path, self.time))
         self.window.close()
         print('Goodbye!')
         return save_path
@@ -343,14 +350,26 @@ class PygletRenderer(object):
         rotated_sight = imutils.rotate(rotated_sight, ang)
 
         if self.save_render:
-            cv2.imwrite("%s/sight_%s_%06d.png" %
-                        (self.path, veh_id, self.time),
-                        rotated_sight)
+            self.writer.write_image(
+                "sight_%s_%06d" % (veh_id, self.time), rotated_sight)
         if "gray" in self.mode:
             return rotated_sight[:, :, 0]
         else:
             return rotated_sight
 
+    @staticmethod
+    def _read_color_buffer():
+        """Return a view of the color buffer of the window as a BGR image.
+
+        The returned array is not copied from the color buffer, and should be
+        copied before the next frame is drawn.
+        """
+        buffer = pyglet.image.get_buffer_manager().get_color_buffer()
+        image_data = buffer.get_image_data()
+        frame = np.frombuffer(image_data.data, dtype=np.uint8)
+        frame = frame.reshape(buffer.height, buffer.width, 4)
+        return frame[::-1, :, 0:3][..., ::-1]
+
     def _add_lane_polys(self):
         """Render road network polygons."""
         for lane_poly, lane_color in zip(self.lane_polys, self.lane_colors):
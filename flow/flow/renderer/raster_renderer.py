@@ -0,0 +1,441 @@
+"""Contains the headless raster renderer class."""
+
+import numpy as np
+import cv2
+import os
+from os.path import expanduser
+import time
+import copy
+from flow.renderer.frame_buffer import FrameBuffer
+from flow.renderer.render_writer import RenderWriter
+HOME = expanduser("~")
+
+# color of the background and of the lanes, as [r, g, b]
+BACKGROUND_COLOR = [32, 32, 32]
+LANE_COLOR = [224, 224, 224]
+
+# size of the triangles representing vehicles (meter)
+VEHICLE_SIZE = 5
+
+# number of fractional bits of the coordinates passed to OpenCV
+_SHIFT = 4
+
+
+class RasterRenderer(object):
+    """Raster Renderer class.
+
+    Provide the same rendering modes, frames, and local observations as the
+    pyglet renderer (see flow.renderer.pyglet_renderer.PygletRenderer), but
+    rasterize them with NumPy and OpenCV only. This renderer does not need a
+    display or an OpenGL context, and can therefore be used on headless
+    machines without xvfb-run.
+
+    The road network is rasterized once into a cached background, which is
+    copied into a preallocated buffer of frames at every frame. The vehicles of a frame are then drawn as
+    triangles computed for all vehicles at once, with one call to OpenCV per
+    color, and the colors of the dynamic modes are read from lookup tables
+    computed once from the colormaps.
+
+    Attributes
+    ----------
+    writer : flow.renderer.render_writer.RenderWriter
+        The writer saving the frames and the rendering data in the
+        background, when save_render is set to True.
+    mode : str
+        * "gray": static grayscale rendering, which is good for training
+        * "dgray": dynamic grayscale rendering
+        * "rgb": static RGB rendering
+        * "drgb": dynamic RGB rendering, which is good for visualization
+
+    save_render : bool
+        Specify whether to save rendering data to disk
+    path : str
+        Specify where to store the rendering data
+    save_format : str
+        Specify the format of the saved frames ("png", "mp4" or "npz")
+    sight_radius : int
+        Set the radius of observation for RL vehicles (meter)
+    show_radius : bool
+        Specify whether to render the radius of RL observation
+    time : int
+        Rendering time that increments by one with every render() call
+    lane_polys : list
+        A list of road network polygons, in pixels
+    width : int
+        Width of the frame
+    height : int
+        Height of the frame
+    x_shift : float
+        The shift substracted to the input x coordinate
+    x_scale : float
+        The scale multiplied to the input x coordinate
+    y_shift : float
+        The shift substracted to the input y coordinate
+    y_scale : float
+        The scale multiplied to the input y coordinate
+    background : numpy.array
+        The rasterized road network, of size height x width x 3 (BGR)
+    frame : numpy.array
+        An array of size height x width x 3 (BGR), containing the last
+        rendered frame
+    frames : flow.renderer.frame_buffer.FrameBuffer
+        The last rendered frames. The frame attribute is a view of the newest
+        one.
+    pxpm : int
+        Specify rendering resolution (pixel / meter)
+    """
+
+    def __init__(self, network, mode,
+                 save_render=False,
+                 path=HOME+"/flow_rendering",
+                 sight_radius=50,
+                 show_radius=False,
+                 pxpm=2,
+                 alpha=1.0,
+                 frame_history=2,
+                 save_format="png",
+                 fps=10):
+        """Initialize Raster Renderer.
+
+        Parameters
+        ----------
+        network : list of list
+            A list of road network polygons. Each polygon is expressed as
+            a list of x and y coordinates, e.g., [x1, y1, x2, y2, ...]
+        mode : str
+            * "gray": static grayscale rendering, which is good for training
+            * "dgray": dynamic grayscale rendering
+            * "rgb": static RGB rendering
+            * "drgb": dynamic RGB rendering, which is good for visualization
+
+        save_render : bool
+            Specify whether to save rendering data to disk
+        path : str
+            Specify where to store the rendering data
+        sight_radius : int
+            Set the radius of observation for RL vehicles (meter)
+        show_radius : bool
+            Specify whether to render the radius of RL observation
+        pxpm : int
+            Specify rendering resolution (pixel / meter)
+        alpha : int
+            Specify opacity of the alpha channel.
+            1.0 is fully opaque; 0.0 is fully transparent.
+        frame_history : int
+            Number of rendered frames kept in memory
+        save_format : str
+            Specify the format of the saved frames ("png", "mp4" or "npz",
+            see flow.renderer.render_writer.RenderWriter)
+        fps : float
+            Specify the frame rate of the saved videos
+        """
+        self.mode = mode
+        if self.mode not in ["rgb", "drgb", "gray", "dgray"]:
+            raise ValueError("Mode %s is not supported!" % self.mode)
+        self.save_render = save_render
+        self.save_format = save_format
+        self.path = path + '/' + time.strftime("%Y-%m-%d-%H%M%S")
+        if self.save_render:
+            if not os.path.exists(path):
+                os.mkdir(path)
+            os.mkdir(self.path)
+            self.writer = RenderWriter(self.path, save_format, fps)
+            self.writer.write_data(network)
+        self.sight_radius = sight_radius
+        self.pxpm = pxpm  # Pixel per meter
+        self.show_radius = show_radius
+        self.alpha = alpha
+        self.time = 0
+
+        self.lane_polys = copy.deepcopy(network)
+        lane_polys_flat = [pt for poly in network for pt in poly]
+
+        polys_x = np.asarray(lane_polys_flat[::2])
+        width = int(polys_x.max() - polys_x.min())
+        shift = polys_x.min() - 2
+        scale = (width - 4) / width
+        self.width = (width + 2*self.sight_radius) * self.pxpm
+        self.x_shift = shift - self.sight_radius
+        self.x_scale = scale
+
+        polys_y = np.asarray(lane_polys_flat[1::2])
+        height = int(polys_y.max() - polys_y.min())
+        shift = polys_y.min() - 2
+        scale = (height - 4) / height
+        self.height = (height + 2*self.sight_radius) * self.pxpm
+        self.y_shift = shift - self.sight_radius
+        self.y_scale = scale
+
+        for lane_poly in self.lane_polys:
+            lane_poly[::2] = [(x-self.x_shift)*self.x_scale*self.pxpm
+                              for x in lane_poly[::2]]
+            lane_poly[1::2] = [(y-self.y_shift)*self.y_scale*self.pxpm
+                               for y in lane_poly[1::2]]
+
+        # opacity of the lanes and vehicles, as applied by the pyglet
+        # renderer to their 8-bit alpha channel
+        self._opacity = int(255*self.alpha) / 255
+
+        # rasterize the road network once
+        self.background = np.empty((self.height, self.width, 3), np.uint8)
+        self.background[:] = BACKGROUND_COLOR[::-1]
+        lanes = self.background.copy()
+        cv2.polylines(
+            lanes,
+            [self._to_pixels(np.reshape(lane_poly, (-1, 2)))
+             for lane_poly in self.lane_polys],
+            False, LANE_COLOR[::-1], 1, cv2.LINE_8, _SHIFT)
+        self.background = self._blend(lanes, self.background)
+        self.frames = FrameBuffer(frame_history, self.background.shape)
+        self.frame = self.frames.append(self.background)
+
+        # colors of human and RL vehicles, as [b, g, r] lookup tables indexed
+        # by the speed of vehicles normalized by the max speed
+        if self.mode == "drgb":
+            self._human_lut = self._colormap_lut("Greens", 0.2, 0.8)
+            self._machine_lut = self._colormap_lut("Blues", 0.2, 0.8)
+        elif self.mode == "dgray":
+            self._human_lut = self._colormap_lut("binary", 0.55, 0.95)
+            self._machine_lut = self._colormap_lut("binary", 0.05, 0.45)
+        elif self.mode == "rgb":
+            self._human_lut = np.array([[0, 225, 0]], np.uint8)
+            self._machine_lut = np.array([[200, 150, 0]], np.uint8)
+        else:
+            self._human_lut = np.array([[100, 100, 100]], np.uint8)
+            self._machine_lut = np.array([[150, 150, 150]], np.uint8)
+
+        # mask of the local observations of vehicles
+        sight_radius = int(self.sight_radius * self.pxpm)
+        self._sight_mask = np.zeros(
+            (2 * sight_radius, 2 * sight_radius), np.uint8)
+        cv2.circle(self._sight_mask, (sight_radius, sight_radius),
+                   sight_radius, 255, thickness=-1)
+
+        print('Rendering with frame {} x {}...'
+              .format(self.width, self.height))
+
+    def render(self,
+               human_orientations,
+               machine_orientations,
+               human_dynamics,
+               machine_dynamics,
+               human_logs,
+               machine_logs):
+        """Update the rendering frame.
+
+        Parameters
+        ----------
+        human_orientations : list
+            A list contains orientations of all human vehicles
+            An orientation is a list contains [x, y, angle].
+        machine_orientations : list
+            A list contains orientations of all RL vehicles
+            An orientation is a list contains [x, y, angle].
+        human_dynamics : list
+            A list contains the speed of all human vehicles normalized by
+            max speed, i.e., speed/max_speed
+            This is used to dynamically color human vehicles based on its
+            velocity.
+        machine_dynamics : list
+            A list contains the speed of all RL vehicles normalized by
+            max speed, i.e., speed/max_speed
+            This is used to dynamically color RL vehicles based on its
+            velocity.
+        human_logs : list
+            A list contains the timestep (ms), timedelta (ms), and id of
+            all human vehicles
+        machine_logs : list
+            A list contains the timestep (ms), timedelta (ms), and id of
+            all RL vehicles
+
+        Returns
+        -------
+        numpy.array
+            the frame, of size height x width x 3 (BGR) in rgb modes, and
+            height x width in gray modes
+        """
+        self.time += 1
+
+        # the frame is drawn in place, in the slot of the oldest frame
+        frame = self.frames.advance()
+        np.copyto(frame, self.background)
+        self._add_vehicle_polys(
+            frame, human_orientations,
+            self._colors(self._human_lut, human_dynamics), 0)
+        self._add_vehicle_polys(
+            frame, machine_orientations,
+            self._colors(self._machine_lut, machine_dynamics),
+            self.sight_radius if self.show_radius else 0)
+        self.frame = self._blend(frame, self.background)
+
+        if self.save_render:
+            # the frame and the data are serialized before returning, and
+            # encoded in the background
+            self.writer.write_frame(self.frame)
+            self.writer.write_data([human_orientations, machine_orientations,
+                                    human_dynamics, machine_dynamics,
+                                    human_logs, machine_logs])
+        if "gray" in self.mode:
+            return self.frame[:, :, 0]
+        else:
+            return self.frame
+
+    def close(self):
+        """Terminate the renderer."""
+        print('Closing renderer...')
+        save_path = ''
+        if self.save_render:
+            save_path = self.writer.close(
+                '%s/data_%06d.npy' % (self.path, self.time))
+        print('Goodbye!')
+        return save_path
+
+    def get_sight(self, orientation, veh_id):
+        """Return the local observation of a vehicle.
+
+        The observation is cropped from the frame and rotated by the angle of
+        the vehicle with a single affine warp.
+
+        Parameters
+        ----------
+        orientation : list
+            An orientation is a list contains [x, y, angle]
+        veh_id : str
+            The vehicle to observe for
+        """
+        x, y, ang = orientation
+        x = (x-self.x_shift)*self.x_scale*self.pxpm
+        y = (y-self.y_shift)*self.y_scale*self.pxpm
+        sight_radius = self.sight_radius * self.pxpm
+        size = self._sight_mask.shape[0]
+        x_min = int(x - sight_radius)
+        y_min = int(self.height - y - sight_radius)
+
+        # rotation around the center of the sight, applied to the frame
+        # translated to the corner of the sight
+        matrix = cv2.getRotationMatrix2D((size // 2, size // 2), ang, 1.0)
+        matrix[:, 2] -= matrix[:, :2].dot([x_min, y_min])
+        rotated_sight = cv2.warpAffine(self.frame, matrix, (size, size))
+        rotated_sight = cv2.bitwise_and(
+            rotated_sight, rotated_sight, mask=self._sight_mask)
+
+        if self.save_render:
+            self.writer.write_image(
+                "sight_%s_%06d" % (veh_id, self.time), rotated_sight)
+        if "gray" in self.mode:
+            return rotated_sight[:, :, 0]
+        else:
+            return rotated_sight
+
+    def _add_vehicle_polys(self, image, orientations, colors, sight_radius):
+        """Draw vehicle polygons.
+
+        Parameters
+        ----------
+        image : numpy.array
+            The image to draw on
+        orientations : list
+            A list of orientations
+            An orientation is a list contains [x, y, angle].
+        colors : numpy.array
+            The [b, g, r] color of every vehicle
+        sight_radius : int
+            Set the radius of observation for RL vehicles (meter)
+        """
+        if len(orientations) == 0:
+            return
+        orientations = np.asarray(orientations, dtype=float)
+        x = (orientations[:, 0]-self.x_shift)*self.x_scale*self.pxpm
+        y = (orientations[:, 1]-self.y_shift)*self.y_scale*self.pxpm
+        ang = np.radians(orientations[:, 2])
+
+        # vertices of the triangles of all vehicles (see
+        # PygletRenderer._add_triangle)
+        s = VEHICLE_SIZE*self.pxpm
+        base_x = x - s*self.x_scale*np.sin(ang)
+        base_y = y - s*self.y_scale*np.cos(ang)
+        half_x = 0.25*s*self.x_scale*np.sin(np.pi/2-ang)
+        half_y = 0.25*s*self.y_scale*np.cos(np.pi/2-ang)
+        triangles = np.stack([
+            np.stack([x, y], axis=1),
+            np.stack([base_x + half_x, base_y - half_y], axis=1),
+            np.stack([base_x - half_x, base_y + half_y], axis=1),
+        ], axis=1)
+        triangles = self._to_pixels(triangles)
+
+        # draw the vehicles of every color at once
+        unique_colors, color_index = np.unique(
+            colors, axis=0, return_inverse=True)
+        color_index = color_index.reshape(-1)
+        for i, color in enumerate(unique_colors.tolist()):
+            cv2.fillPoly(image, triangles[color_index == i], color,
+                         cv2.LINE_8, _SHIFT)
+
+        if sight_radius != 0:
+            centers = self._to_pixels(np.stack([x, y], axis=1))
+            axes = (int(round(sight_radius*self.pxpm*self.x_scale)),
+                    int(round(sight_radius*self.pxpm*self.y_scale)))
+            for center, color in zip(centers.tolist(), colors.tolist()):
+                cv2.ellipse(image, tuple(center), tuple(a << _SHIFT
+                                                        for a in axes),
+                            0, 0, 360, color, 1, cv2.LINE_8, _SHIFT)
+
+    def _colors(self, lut, dynamics):
+        """Return the [b, g, r] colors of vehicles from a lookup table."""
+        if len(lut) == 1:
+            return np.repeat(lut, len(dynamics), axis=0)
+        index = (np.asarray(dynamics, dtype=float) * len(lut)).astype(int)
+        return lut[np.clip(index, 0, len(lut) - 1)]
+
+    def _to_pixels(self, points):
+        """Convert coordinates in the frame to fixed-point pixel indices.
+
+        The y axis of the frame points up, while the rows of images are
+        indexed from the top.
+        """
+        pixels = np.array(points, dtype=float)
+        pixels[..., 1] = self.height - pixels[..., 1]
+        return np.round(pixels * (1 << _SHIFT)).astype(np.int32)
+
+    def _blend(self, image, background):
+        """Blend an image drawn over a background with the opacity.
+
+        The image is blended in place, and returned.
+        """
+        if self._opacity < 1:
+            cv2.addWeighted(image, self._opacity, background,
+                            1 - self._opacity, 0, dst=image)
+        return image
+
+    @staticmethod
+    def _colormap_lut(name, minval, maxval, n=256):
+        """Return a colormap truncated to [minval, maxval] as a lookup table.
+
+        This matches the colors of the colormaps truncated by
+        PygletRenderer._truncate_colormap.
+
+        Parameters
+        ----------
+        name : str
+            name of the matplotlib colormap
+        minval : float
+            Minimum value of the truncated colormap
+        maxval : float
+            Maximum value of the truncated colormap
+        n : int
+            Number of entries of the lookup table
+
+        Returns
+        -------
+        numpy.array
+            the [b, g, r] colors of the n levels of the colormap
+        """
+        import matplotlib.cm as cm
+        import matplotlib.colors as colors
+
+        cmap = getattr(cm, name)
+        truncated = colors.LinearSegmentedColormap.from_list(
+            'trunc({n},{a:.2f},{b:.2f})'.format(n=name, a=minval, b=maxval),
+            cmap(np.linspace(minval, maxval, 100)), N=n)
+        rgb = (255*truncated(np.arange(n))[:, :3]).astype(np.uint8)
+        return np.ascontiguousarray(rgb[:, ::-1])
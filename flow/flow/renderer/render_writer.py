@@ -0,0 +1,280 @@
+"""Contains the asynchronous writer of rendering data."""
+
+import os
+import pickle
+import queue
+import threading
+
+import numpy as np
+import cv2
+
+# formats in which the frames can be saved
+FORMATS = ["png", "mp4", "npz"]
+
+# name of the file in which the rendering data of every frame is streamed
+DATA_LOG = "data.pkl"
+
+
+class RenderWriter(object):
+    """Writer saving rendered frames and rendering data in the background.
+
+    The frames and the rendering data of every frame are handed to a
+    background thread through a bounded queue, and are encoded and written
+    by that thread as they arrive, so that rendering does not wait for the
+    encoding of images. If the queue is full, the renderer waits for the
+    thread to catch up, so that the memory used by pending frames is bounded.
+
+    The frames are saved in one of the following formats:
+
+    * "png": one image per frame, named frame_%06d.png
+    * "mp4": a single video, named frames.mp4, encoded as the frames arrive
+    * "npz": compressed chunks of ``chunk_size`` frames, named
+      frames_%06d.npz after their first frame, each containing an array of
+      shape (num_frames, height, width, 3)
+
+    Other images (e.g. the local observations of RL vehicles) are always
+    saved as png images. The rendering data is appended to a log file (see
+    ``DATA_LOG``) as pickled records, one per frame, and is converted into a
+    single .npy file on close.
+
+    If the background thread fails, the items that follow are discarded, and
+    the error is raised by every later call to the writer.
+
+    Usage
+    -----
+    >>> writer = RenderWriter(path, save_format="mp4", fps=10)
+    >>> writer.write_frame(frame)
+    >>> writer.write_data([orientations, dynamics, logs])
+    >>> writer.close("data.npy")
+
+    Attributes
+    ----------
+    path : str
+        directory in which the rendering data is saved
+    save_format : str
+        format of the frames, one of ``FORMATS``
+    fps : float
+        frame rate of the videos
+    chunk_size : int
+        number of frames per chunk in the "npz" format
+    num_frames : int
+        number of frames written so far
+    """
+
+    def __init__(self, path, save_format="png", fps=10, max_queue=32,
+                 chunk_size=100):
+        """Start the background thread.
+
+        Parameters
+        ----------
+        path : str
+            directory in which the rendering data is saved, which must exist
+        save_format : str, optional
+            format of the frames, one of ``FORMATS``
+        fps : float, optional
+            frame rate of the videos
+        max_queue : int, optional
+            maximum number of pending items, after which the writing methods
+            block until the background thread catches up
+        chunk_size : int, optional
+            number of frames per chunk in the "npz" format
+
+        Raises
+        ------
+        ValueError
+            if the format is not supported
+        """
+        if save_format not in FORMATS:
+            raise ValueError("Format %s is not supported!" % save_format)
+        self.path = path
+        self.save_format = save_format
+        self.fps = fps
+        self.chunk_size = chunk_size
+        self.num_frames = 0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None
+        self._video = None
+        self._chunk = []
+        self._chunk_start = 1
+        self._log = open(os.path.join(path, DATA_LOG), "wb")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write_frame(self, frame):
+        """Save a frame.
+
+        Parameters
+        ----------
+        frame : numpy.array
+            the frame, as a BGR image. The frame is copied, and can be
+            modified once this method returns.
+        """
+        self.num_frames += 1
+        self._put((self._write_frame, self.num_frames, np.array(frame)))
+
+    def write_image(self, name, image):
+        """Save an image as a png file.
+
+        Parameters
+        ----------
+        name : str
+            name of the file, without extension
+        image : numpy.array
+            the image. The image is copied, and can be modified once this
+            method returns.
+        """
+        self._put((self._write_image, name, np.array(image)))
+
+    def write_data(self, data):
+        """Append the rendering data of a frame to the log.
+
+        Parameters
+        ----------
+        data : object
+            the rendering data. The data is serialized before this method
+            returns, and can be modified afterwards.
+        """
+        self._put((self._log.write,
+                   pickle.dumps(data, pickle.HIGHEST_PROTOCOL)))
+
+    def flush(self):
+        """Wait until all pending items are written.
+
+        Raises
+        ------
+        Exception
+            the error of the background thread, if it failed
+        """
+        self._queue.join()
+        self._raise_error()
+
+    def close(self, data_path=None):
+        """Write the pending items and stop the background thread.
+
+        Parameters
+        ----------
+        data_path : str, optional
+            path to a .npy file in which to save the rendering data of all
+            frames, as an array of objects. The log is kept if not specified.
+
+        Returns
+        -------
+        str
+            the path to the saved rendering data
+
+        Raises
+        ------
+        Exception
+            the error of the background thread, if it failed
+        """
+        if not self._thread.is_alive():
+            self._raise_error()
+            return data_path or self._log.name
+        self._queue.put(None)
+        self._thread.join()
+        self._log.close()
+        self._raise_error()
+
+        if data_path is None:
+            return self._log.name
+        data = read_render_log(self._log.name)
+        np.save(data_path, data)
+        os.remove(self._log.name)
+        return data_path
+
+    def _put(self, item):
+        """Add an item to the queue, waiting if the queue is full."""
+        self._raise_error()
+        self._queue.put(item)
+
+    def _raise_error(self):
+        """Raise the error of the background thread, if any."""
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        """Write the items of the queue, until None is received."""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    self._finish()
+                elif self._error is None:
+                    item[0](*item[1:])
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+            if item is None:
+                return
+
+    def _write_frame(self, index, frame):
+        """Encode a frame in the format of the writer."""
+        if self.save_format == "png":
+            self._write_image("frame_%06d" % index, frame)
+        elif self.save_format == "mp4":
+            if self._video is None:
+                height, width = frame.shape[:2]
+                self._video = cv2.VideoWriter(
+                    os.path.join(self.path, "frames.mp4"),
+                    cv2.VideoWriter_fourcc(*"mp4v"), self.fps,
+                    (width, height))
+                if not self._video.isOpened():
+                    self._video = None
+                    raise IOError("OpenCV cannot encode mp4 videos. Use "
+                                  "another format.")
+            self._video.write(frame)
+        else:
+            if not self._chunk:
+                self._chunk_start = index
+            self._chunk.append(frame)
+            if len(self._chunk) == self.chunk_size:
+                self._write_chunk()
+
+    def _write_image(self, name, image):
+        """Write an image as a png file."""
+        cv2.imwrite(os.path.join(self.path, name + ".png"), image)
+
+    def _write_chunk(self):
+        """Write the pending frames of the "npz" format."""
+        chunk, self._chunk = self._chunk, []
+        np.savez_compressed(
+            os.path.join(self.path, "frames_%06d.npz" % self._chunk_start),
+            frames=np.stack(chunk))
+
+    def _finish(self):
+        """Complete the files of the frames."""
+        if self._chunk:
+            self._write_chunk()
+        if self._video is not None:
+            self._video.release()
+            self._video = None
+
+
+def read_render_log(path):
+    """Return the rendering data streamed to a log by a RenderWriter.
+
+    Parameters
+    ----------
+    path : str
+        path to the log
+
+    Returns
+    -------
+    numpy.array
+        the rendering data of every frame, as an array of objects
+    """
+    records = []
+    with open(path, "rb") as f:
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except EOFError:
+                break
+    # the data of every frame is stored as an object, since frames have
+    # different numbers of vehicles
+    data = np.empty(len(records), dtype=object)
+    for i, record in enumerate(records):
+        data[i] = record
+    return data
@@ -1,12 +1,14 @@
 """Generate a time space diagram for some networks.
 
 This method accepts as input a csv file containing the sumo-formatted emission
-file, and then uses this data to generate a time-space diagram, with the x-axis
-being the time (in seconds), the y-axis being the position of a vehicle, and
-color representing the speed of te vehicles.
+file (or a rollout trace, see flow/core/trace.py), and then uses this data to
+generate a time-space diagram, with the x-axis being the time (in seconds), the
+y-axis being the position of a vehicle, and color representing the speed of te
+vehicles.
 
 If the number of simulation steps is too dense, you can plot every nth step in
-the plot by setting the input `--steps=n`.
+the plot by setting the input `--steps=n`. Only the samples of these steps are
+read from rollout traces.
 
 Note: This script assumes that the provided network has only one lane on the
 each edge, or one lane on the main highway in the case of MergeNetwork.
@@ -16,6 +18,7 @@ Usage
 ::
     python time_space_diagram.py </path/to/emission>.csv </path/to/params>.json
 """
+from flow.core.trace import RolloutTrace, is_trace
 from flow.utils.rllib import get_flow_params
 from flow.networks import RingNetwork, FigureEightNetwork, MergeNetwork, I210SubNetwork, HighwayNetwork
 
@@ -43,14 +46,24 @@ ACCEPTABLE_NETWORKS = [
     HighwayNetwork
 ]
 
+# fields of rollout traces used to generate time-space diagrams. Only these
+# fields are read from traces, and the fields used to compute the absolute
+# positions of vehicles (TRACE_POSITION_FIELDS) are only read if the traces do
+# not contain these positions ("distance").
+TRACE_FIELDS = ['time', 'id', 'speed', 'edge_id', 'lane_number']
+TRACE_POSITION_FIELDS = ['x', 'relative_position']
 
-def import_data_from_trajectory(fp, params=dict()):
+
+def import_data_from_trajectory(fp, params=dict(), start=None, end=None,
+                                steps=1):
     r"""Import and preprocess data from the Flow trajectory (.csv) file.
 
     Parameters
     ----------
     fp : str
-        file path (for the .csv formatted file)
+        file path (for the .csv formatted file), or directory of a rollout
+        trace. Only the fields used by the diagrams (see TRACE_FIELDS) and the
+        samples within the time range and steps are read from traces.
     params : dict
         flow-specific parameters, including:
 
@@ -60,13 +73,35 @@ def import_data_from_trajectory(fp, params=dict()):
         * "net_params" (flow.core.params.NetParams): network-specific
           parameters. This is used to collect the lengths of various network
           links.
+    start : float, optional
+        first time of the samples kept. Starts at the first sample by default.
+    end : float, optional
+        end of the times of the samples kept (excluded). Ends at the last
+        sample by default.
+    steps : int, optional
+        rate at which time steps are kept. All time steps are kept by default.
 
     Returns
     -------
     pd.DataFrame
     """
     # Read trajectory csv into pandas dataframe
-    df = pd.read_csv(fp)
+    if is_trace(fp):
+        trace = RolloutTrace(fp)
+        fields = TRACE_FIELDS + (['distance'] if 'distance' in trace.fields
+                                 else TRACE_POSITION_FIELDS)
+        df = trace.to_dataframe(
+            fields=[name for name in fields if name in trace.fields],
+            rows=trace.time_rows(start, end, steps))
+    else:
+        df = pd.read_csv(fp)
+        if start is not None or end is not None or steps > 1:
+            times = np.unique(df['time'])
+            if start is not None:
+                times = times[times >= start]
+            if end is not None:
+                times = times[times < end]
+            df = df[df['time'].isin(times[::steps])]
 
     # Convert column names for backwards compatibility using emissions csv
     column_conversions = {
@@ -504,7 +539,8 @@ if __name__ == '__main__':
     my_cmap = colors.LinearSegmentedColormap('my_colormap', cdict, 1024)
 
     # Read trajectory csv into pandas dataframe
-    traj_df = import_data_from_trajectory(args.trajectory_path, flow_params)
+    traj_df = import_data_from_trajectory(
+        args.trajectory_path, flow_params, steps=args.steps)
 
     # Convert df data into segments for plotting
     segs, traj_df = get_time_space_data(traj_df, flow_params)
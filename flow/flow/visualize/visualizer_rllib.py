@@ -121,6 +121,7 @@ def visualizer_rllib(args):
             sim_params.render = 'drgb'
             sim_params.pxpm = 4
         sim_params.save_render = True
+        sim_params.render_format = args.render_format
 
     # Create and register a gym+rllib env
     create_env, env_name = make_create_env(params=flow_params, version=0)
@@ -372,6 +373,13 @@ def create_parser():
         action='store_true',
         help='Saves a rendered video to a file. NOTE: Overrides render_mode '
              'with pyglet rendering.')
+    parser.add_argument(
+        '--render_format',
+        type=str,
+        default='png',
+        help='Format of the frames saved with --save_render. Options '
+             'include png (one image per frame), mp4 and npz (compressed '
+             'chunks of frames).')
     parser.add_argument(
         '--horizon',
         type=int,
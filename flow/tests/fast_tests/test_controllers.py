@@ -10,6 +10,8 @@ from flow.controllers.car_following_models import IDMController, \
     OVMController, BCMController, LinearOVM, CFMController, LACController, \
     GippsController, BandoFTLController
 from flow.controllers import FollowerStopper, PISaturation, NonLocalFollowerStopper
+from flow.controllers import RLController
+from flow.controllers.batch import get_failsafe_state
 from tests.setup_scripts import ring_road_exp_setup
 import os
 import numpy as np
@@ -988,5 +990,141 @@ class TestBandoFTLController(unittest.TestCase):
         np.testing.assert_array_almost_equal(requested_accel, expected_accel)
 
 
+class TestBatchControllers(unittest.TestCase):
+    """Tests the vectorized computation of the actions of controllers."""
+
+    def run_env(self, batch_controllers):
+        params = {"fail_safe": ['feasible_accel', 'safe_velocity'],
+                  "display_warnings": False}
+        controllers = [
+            (IDMController, dict(params, noise=0.2, fail_safe=[
+                'instantaneous', 'feasible_accel'])),
+            (OVMController, dict(params, noise=0.1, fail_safe=[
+                'obey_speed_limit', 'safe_velocity'])),
+            (NonLocalFollowerStopper, {"v_des": 7.5}),
+            (GippsController, params),
+            (BandoFTLController, dict(params, want_max_accel=True)),
+            (LACController, dict(params, noise=0.1)),
+            (LinearOVM, params),
+            (CFMController, params),
+            (BCMController, params),
+        ]
+
+        vehicles = VehicleParams()
+        for i, controller in enumerate(controllers):
+            vehicles.add(
+                veh_id="test_{}".format(i),
+                acceleration_controller=controller,
+                routing_controller=(ContinuousRouter, {}),
+                car_following_params=SumoCarFollowingParams(
+                    accel=3, decel=5),
+                num_vehicles=2)
+
+        env_params = EnvParams(
+            additional_params={"target_velocity": 8, "max_accel": 1,
+                               "max_decel": 1, "sort_vehicles": False},
+            batch_controllers=batch_controllers)
+        net_params = NetParams(additional_params={
+            "length": 400, "lanes": 1, "speed_limit": 30, "resolution": 40})
+        env, _, _ = ring_road_exp_setup(
+            vehicles=vehicles, env_params=env_params, net_params=net_params)
+
+        np.random.seed(0)
+        env.reset()
+        ids = env.k.vehicle.get_ids()
+        speeds, accels = [], []
+        for _ in range(100):
+            env.step(None)
+            speeds.append(env.k.vehicle.get_speed(ids))
+            accels.append([env.k.vehicle.get_accel(veh_id, noise=True,
+                                                   failsafe=False)
+                           for veh_id in ids])
+        env.terminate()
+
+        return speeds, accels
+
+    def test_matches_get_action(self):
+        """Checks that both methods produce the same simulations."""
+        speeds, accels = self.run_env(batch_controllers=False)
+        batch_speeds, batch_accels = self.run_env(batch_controllers=True)
+        self.assertEqual(speeds, batch_speeds)
+        self.assertEqual(accels, batch_accels)
+
+
+class TestBatchFailsafes(unittest.TestCase):
+    """Tests the vectorized failsafes of BaseController."""
+
+    def setUp(self):
+        vehicles = VehicleParams()
+        vehicles.add(
+            veh_id="human",
+            acceleration_controller=(IDMController, {
+                "fail_safe": ['instantaneous', 'safe_velocity',
+                              'obey_speed_limit', 'feasible_accel'],
+                "display_warnings": False}),
+            routing_controller=(ContinuousRouter, {}),
+            car_following_params=SumoCarFollowingParams(accel=3, decel=5),
+            num_vehicles=5)
+        vehicles.add(
+            veh_id="rl",
+            acceleration_controller=(RLController, {
+                "fail_safe": 'feasible_accel', "display_warnings": False}),
+            routing_controller=(ContinuousRouter, {}),
+            car_following_params=SumoCarFollowingParams(
+                accel=0.5, decel=5, speed_mode="aggressive"),
+            num_vehicles=1)
+
+        # create the environment and network classes for a ring road
+        self.env, _, _ = ring_road_exp_setup(vehicles=vehicles)
+
+    def tearDown(self):
+        # terminate the traci instance
+        self.env.terminate()
+
+        # free data used by the class
+        self.env = None
+
+    def test_matches_failsafes(self):
+        """Checks that the failsafes return the same actions."""
+        self.env.reset()
+        ids = [veh_id for veh_id in self.env.k.vehicle.get_ids()
+               if veh_id.startswith("human")]
+
+        test_headways = [0.1, 1, 5, 20, 100]
+        test_speeds = [0, 5, 10, 20, 40]
+        for i, veh_id in enumerate(ids):
+            self.env.k.vehicle.set_headway(veh_id, test_headways[i])
+            self.env.k.vehicle.test_set_speed(veh_id, test_speeds[i])
+
+        controller = self.env.k.vehicle.get_acc_controller(ids[0])
+        state = get_failsafe_state(
+            self.env.k, ids, self.env.sim_step, speed_limit=True)
+
+        for action in [-20, -1, 0, 1, 20]:
+            actions = np.full(len(ids), float(action))
+            expected = []
+            for veh_id in ids:
+                accel = float(action)
+                for failsafe in self.env.k.vehicle.get_acc_controller(
+                        veh_id).failsafes:
+                    accel = failsafe(self.env, accel)
+                expected.append(accel)
+
+            self.assertEqual(
+                controller.apply_failsafes_batch(actions, state).tolist(),
+                expected)
+
+    def test_rl_failsafes(self):
+        """Checks that the failsafes of RL vehicles are applied."""
+        self.env.reset()
+        rl_id = self.env.k.vehicle.get_rl_ids()[0]
+        speed = self.env.k.vehicle.get_speed(rl_id)
+
+        # the requested acceleration is clipped by the feasible_accel failsafe
+        self.env.step([1])
+        self.assertAlmostEqual(self.env.k.vehicle.get_speed(rl_id),
+                               speed + 0.5 * self.env.sim_step)
+
+
 if __name__ == '__main__':
     unittest.main()
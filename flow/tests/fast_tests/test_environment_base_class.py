@@ -4,7 +4,8 @@ from flow.core.params import SumoParams, EnvParams, InitialConfig, \
     NetParams, SumoCarFollowingParams, SumoLaneChangeParams
 from flow.core.params import VehicleParams
 
-from flow.controllers.routing_controllers import ContinuousRouter
+from flow.controllers.routing_controllers import ContinuousRouter, \
+    BayBridgeRouter, I210Router
 from flow.controllers.car_following_models import IDMController
 from flow.controllers import RLController
 from flow.envs.ring.accel import ADDITIONAL_ENV_PARAMS
@@ -12,7 +13,18 @@ from flow.utils.exceptions import FatalFlowError
 from flow.envs import Env, TestEnv
 
 from tests.setup_scripts import ring_road_exp_setup, highway_exp_setup
+import flow.config as config
+from flow.core.kernel.simulation import emission
+from flow.core.kernel.vehicle import KernelVehicle
+from flow.core.kernel.simulation.emission import EmissionRecorder
+from flow.core.trace import RolloutTrace, trace_to_csv
+import csv
+import json
 import os
+import shutil
+import tempfile
+import socket
+from types import SimpleNamespace
 import gym.spaces as spaces
 from gym.spaces.box import Box
 import numpy as np
@@ -136,6 +148,376 @@ class TestEmissionPath(unittest.TestCase):
         self.assertIsNone(self.env.sim_params.emission_path)
 
 
+class TestEmissionRecorder(unittest.TestCase):
+    """Tests the streaming recorder of emission data."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_record(self):
+        # fields are stored in the order of the columns of the file
+        recorder = EmissionRecorder(
+            self.dir, fields=["edge_id", "speed"], chunk_size=2)
+        self.assertListEqual(recorder.fields,
+                             ["time", "id", "speed", "edge_id"])
+
+        # data recorded twice at the same time is replaced
+        recorder.record(0.0, ["a", "b"], {"speed": [0, 0], "edge_id": [""] * 2})
+        recorder.record(0.0, ["a", "b"], {"speed": [1, 2], "edge_id": ["e"] * 2})
+        recorder.record(0.1, ["a"], {"speed": [3], "edge_id": ["f"]})
+        recorder.record(0.2, ["b"], {"speed": [4], "edge_id": ["g"]})
+
+        path = os.path.join(self.dir, "emission.csv")
+        self.assertTrue(recorder.save(path))
+        # nothing is saved if no data was recorded since the last save
+        self.assertFalse(recorder.save(path))
+
+        with open(path) as f:
+            rows = list(csv.reader(f))
+        self.assertListEqual(rows, [
+            ["time", "id", "speed", "edge_id"],
+            ["0.0", "a", "1", "e"],
+            ["0.0", "b", "2", "e"],
+            ["0.1", "a", "3", "f"],
+            ["0.2", "b", "4", "g"],
+        ])
+        # no temporary file is left behind
+        self.assertListEqual(os.listdir(self.dir), ["emission.csv"])
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, EmissionRecorder, self.dir,
+                          fields=["unknown"])
+        self.assertRaises(ValueError, EmissionRecorder, self.dir,
+                          file_format="xml")
+
+    def test_parquet_fallback(self):
+        # without pyarrow, a warning is raised and csv files are saved
+        pa = emission.pa
+        emission.pa = None
+        try:
+            with self.assertWarns(UserWarning):
+                recorder = EmissionRecorder(self.dir, file_format="parquet")
+        finally:
+            emission.pa = pa
+        self.assertEqual(recorder.file_format, "csv")
+
+    def test_simulation(self):
+        env, _, _ = ring_road_exp_setup(
+            sim_params=SumoParams(emission_path=self.dir, render=False))
+        for _ in range(5):
+            env.step(rl_actions=[])
+        env.k.simulation.save_emission()
+        env.terminate()
+
+        name = "{}-0_emission.csv".format(env.network.name)
+        with open(os.path.join(self.dir, name)) as f:
+            rows = list(csv.reader(f))
+        self.assertListEqual(
+            rows[0], [name for name, _ in emission.FIELDS])
+        # the data of every vehicle is stored at every step
+        num_vehicles = env.k.vehicle.num_vehicles
+        self.assertEqual(len(rows) - 1, 6 * num_vehicles)
+
+    def test_trace(self):
+        recorder = EmissionRecorder(
+            self.dir, fields=["speed", "leader_id", "lane_number"],
+            file_format="trace", chunk_size=2)
+        self.assertEqual(recorder.extension, "trace")
+        recorder.record(0.0, ["a", "b"], {"speed": [1., 2.],
+                                          "leader_id": ["b", None],
+                                          "lane_number": [0, 1]})
+        recorder.record(0.1, ["a"], {"speed": [3.], "leader_id": [""],
+                                     "lane_number": [2]})
+        recorder.record(0.1, ["a", "b"], {"speed": [4., 5.],
+                                          "leader_id": ["b", "a"],
+                                          "lane_number": [0, 0]})
+        recorder.record(0.2, ["b"], {"speed": [6.], "leader_id": ["a"],
+                                     "lane_number": [1]})
+        path = os.path.join(self.dir, "emission.trace")
+        self.assertTrue(recorder.save(path))
+        self.assertListEqual(os.listdir(self.dir), ["emission.trace"])
+
+        trace = RolloutTrace(path)
+        self.assertEqual(len(trace), 5)
+        self.assertListEqual(trace.fields,
+                             ["time", "id", "speed", "leader_id",
+                              "lane_number"])
+
+        # numeric fields are memory-mapped arrays with a fixed dtype
+        speed = trace.column("speed")
+        self.assertIsInstance(speed, np.memmap)
+        np.testing.assert_array_equal(speed, [1, 2, 4, 5, 6])
+        self.assertEqual(trace.column("lane_number").dtype, np.int64)
+        self.assertListEqual(trace.decode("leader_id").tolist(),
+                             ["b", "", "b", "a", "a"])
+
+        # time index, including times split across chunks
+        np.testing.assert_array_equal(trace.times, [0, 0.1, 0.2])
+        rows = trace.time_range(0.1, 0.2)
+        self.assertEqual(rows, slice(2, 4))
+        self.assertListEqual(trace.decode("id", rows).tolist(), ["a", "b"])
+        self.assertEqual(trace.time_range(0.15), slice(4, 5))
+        # rows of every n-th time
+        self.assertEqual(trace.time_rows(0.1), slice(2, 5))
+        self.assertListEqual(trace.time_rows(steps=2).tolist(), [0, 1, 4])
+        self.assertListEqual(trace.time_rows(0.1, steps=2).tolist(), [2, 3])
+
+        df = trace.to_dataframe(fields=["id", "speed"],
+                                rows=trace.time_range(end=0.1))
+        self.assertListEqual(df["id"].tolist(), ["a", "b"])
+        self.assertListEqual(df["speed"].tolist(), [1., 2.])
+
+        # a new trace replaces a previous one
+        recorder.record(0.0, ["c"], {"speed": [0.], "leader_id": [""],
+                                     "lane_number": [0]})
+        self.assertTrue(recorder.save(path))
+        self.assertListEqual(
+            RolloutTrace(path).decode("id").tolist(), ["c"])
+
+    def test_simulation_trace(self):
+        # the same simulation, saved as a csv file and as a trace
+        paths = []
+        for file_format in ["csv", "trace"]:
+            env, _, _ = ring_road_exp_setup(sim_params=SumoParams(
+                emission_path=self.dir, render=False,
+                emission_format=file_format))
+            for _ in range(20):
+                env.step(rl_actions=[])
+            env.k.simulation.save_emission(run_id=file_format)
+            env.terminate()
+            paths.append(os.path.join(self.dir, "{}-{}_emission.{}".format(
+                env.network.name, file_format, file_format)))
+
+        # the csv conversion of the trace matches the csv file, with numbers
+        # stored as floats
+        output_path = os.path.join(self.dir, "converted.csv")
+        trace_to_csv(paths[1], output_path, chunk_size=7)
+        with open(paths[0]) as f1, open(output_path) as f2:
+            rows, converted_rows = list(csv.reader(f1)), list(csv.reader(f2))
+        self.assertEqual(len(rows), len(converted_rows))
+        self.assertListEqual(rows[0], converted_rows[0])
+        for row, converted_row in zip(rows[1:], converted_rows[1:]):
+            for value, converted in zip(row, converted_row):
+                try:
+                    self.assertEqual(float(value), float(converted))
+                except ValueError:
+                    self.assertEqual(value, converted)
+
+
+class TestProfiler(unittest.TestCase):
+    """Tests the profiler of the phases of steps and resets."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_env(self, profile_format):
+        path = os.path.join(self.dir, "profile.json")
+        env_params = EnvParams(
+            additional_params=ADDITIONAL_ENV_PARAMS,
+            profile_path=path,
+            profile_format=profile_format)
+        env, _, _ = ring_road_exp_setup(env_params=env_params)
+        env.reset()
+        for _ in range(5):
+            env.step(rl_actions=[])
+        env.terminate()
+
+        with open(path) as f:
+            return json.load(f)
+
+    def test_summary(self):
+        summary = self.run_env("json")
+
+        for phase in ["step", "controllers", "lane_change", "routing",
+                      "rl_actions", "additional_command", "simulation_step",
+                      "update", "render", "get_state", "reward"]:
+            self.assertEqual(summary[phase]["count"], 5)
+        self.assertIn("reset", summary)
+
+        # the kernel is also updated outside of steps
+        for phase in ["vehicle_update", "traffic_light_update",
+                      "network_update", "simulation_update"]:
+            self.assertGreater(summary[phase]["count"], 5)
+
+        # nested phases are included in the phases containing them
+        self.assertGreaterEqual(summary["step"]["total_ms"],
+                                summary["simulation_step"]["total_ms"])
+        self.assertLessEqual(summary["step"]["p50_ms"],
+                             summary["step"]["max_ms"])
+
+    def test_chrome_trace(self):
+        trace = self.run_env("chrome")
+        events = trace["traceEvents"]
+        self.assertEqual(len([e for e in events if e["name"] == "step"]), 5)
+        self.assertTrue(all(e["ph"] == "X" for e in events))
+
+    def test_disabled(self):
+        env, _, _ = ring_road_exp_setup()
+        self.assertFalse(env.profiler.enabled)
+        env.step(rl_actions=[])
+        self.assertDictEqual(env.profiler.summary(), {})
+        env.terminate()
+
+
+class CountingRouter(ContinuousRouter):
+    """Continuous router counting the number of times it is called."""
+
+    num_calls = 0
+
+    def choose_route(self, env):
+        CountingRouter.num_calls += 1
+        return super().choose_route(env)
+
+
+class StepRouter(ContinuousRouter):
+    """Continuous router called at every step."""
+
+    trigger_edges = None
+
+
+class TriggerRouter(ContinuousRouter):
+    """Continuous router with trigger edges, one of which is repeated."""
+
+    trigger_edges = ("top", "left", "top")
+
+
+class TestEventRouting(unittest.TestCase):
+    """Tests the event-driven invocation of routing controllers."""
+
+    def run_env(self, event_routing):
+        vehicles = VehicleParams()
+        vehicles.add(
+            veh_id="idm",
+            acceleration_controller=(IDMController, {}),
+            routing_controller=(CountingRouter, {}),
+            num_vehicles=5)
+        env_params = EnvParams(
+            additional_params=ADDITIONAL_ENV_PARAMS,
+            event_routing=event_routing)
+        env, _, _ = ring_road_exp_setup(
+            vehicles=vehicles, env_params=env_params)
+        env.reset()
+
+        CountingRouter.num_calls = 0
+        routes = []
+        for _ in range(300):
+            env.step(rl_actions=[])
+            ids = env.k.vehicle.get_ids()
+            routes.append((env.k.vehicle.get_edge(ids),
+                           env.k.vehicle.get_route(ids),
+                           env.k.vehicle.get_position(ids)))
+        env.terminate()
+        return routes, CountingRouter.num_calls
+
+    def test_event_routing(self):
+        routes, num_calls = self.run_env(event_routing=False)
+        event_routes, event_num_calls = self.run_env(event_routing=True)
+
+        # vehicles follow the same routes, with far fewer router calls
+        self.assertEqual(routes, event_routes)
+        self.assertEqual(num_calls, 300 * 5)
+        self.assertLess(event_num_calls, num_calls / 5)
+
+        # the vehicles went around the ring, and were rerouted
+        self.assertGreater(len(set(edge for step in routes
+                                   for edge in step[0])), 4)
+
+    def test_trigger_edges(self):
+        # vehicles changing lanes within a trigger edge, without entering a
+        # new edge, are still rerouted
+        for router, edge, lane in (
+                (I210Router, "119257908#1-AddedOffRampEdge", 4),
+                (BayBridgeRouter, "183343422", 2),
+                (BayBridgeRouter, "124952179", 1)):
+            self.assertIn(edge, router.trigger_edges)
+            choices = []
+            vehicle = SimpleNamespace(
+                get_edge_changed_ids=lambda: set(),
+                get_routed_ids=lambda triggered=None:
+                    [] if triggered is False else ["veh"],
+                get_trigger_edges=lambda: list(router.trigger_edges),
+                get_ids_by_edge=lambda edges:
+                    ["veh"] if edge in edges else [],
+                get_routing_controller=lambda _: router("veh", {}),
+                get_edge=lambda _: edge,
+                get_lane=lambda _: lane,
+                get_route=lambda _: [edge, "next"],
+                choose_routes=lambda ids, routes: choices.append(
+                    (ids, routes)))
+            env = SimpleNamespace(
+                env_params=EnvParams(event_routing=True),
+                k=SimpleNamespace(vehicle=vehicle),
+                available_routes={edge: [(["off_ramp"], 1)],
+                                  edge + "_1": [(["off_ramp"], 1)]},
+                _pending_routing_ids=set())
+            Env._apply_routing_actions(env)
+            self.assertEqual(choices, [(["veh"], [["off_ramp"]])])
+
+    def test_routed_ids(self):
+        vehicles = VehicleParams()
+        vehicles.add(
+            veh_id="trigger",
+            acceleration_controller=(IDMController, {}),
+            routing_controller=(TriggerRouter, {}),
+            num_vehicles=2)
+        vehicles.add(
+            veh_id="step",
+            acceleration_controller=(IDMController, {}),
+            routing_controller=(StepRouter, {}),
+            num_vehicles=2)
+        vehicles.add(
+            veh_id="idm",
+            acceleration_controller=(IDMController, {}),
+            num_vehicles=1)
+        env, _, _ = ring_road_exp_setup(vehicles=vehicles)
+        env.reset()
+        kernel = env.k.vehicle
+
+        def check(num_step_routed, num_event_routed, trigger_edges):
+            # the kernel matches the routing controllers of all vehicles
+            for triggered in (None, True, False):
+                self.assertListEqual(
+                    sorted(kernel.get_routed_ids(triggered)),
+                    sorted(KernelVehicle.get_routed_ids(kernel, triggered)))
+            self.assertEqual(len(kernel.get_routed_ids(False)),
+                             num_step_routed)
+            self.assertEqual(len(kernel.get_routed_ids(True)),
+                             num_event_routed)
+            self.assertListEqual(sorted(kernel.get_trigger_edges()),
+                                 trigger_edges)
+
+        check(2, 2, ["left", "top"])
+        kernel.remove(kernel.get_routed_ids(False)[0])
+        kernel.remove(kernel.get_routed_ids(True)[0])
+        check(1, 1, ["left", "top"])
+        kernel.remove(kernel.get_routed_ids(True)[0])
+        check(1, 0, [])
+        env.terminate()
+
+    def test_edge_changed_ids(self):
+        env, _, _ = ring_road_exp_setup()
+        env.reset()
+        veh_id = env.k.vehicle.get_ids()[0]
+
+        # all vehicles are new after a reset
+        self.assertSetEqual(env.k.vehicle.get_edge_changed_ids(), {veh_id})
+
+        prev_edge = env.k.vehicle.get_edge(veh_id)
+        for _ in range(100):
+            env.step(rl_actions=[])
+            edge = env.k.vehicle.get_edge(veh_id)
+            self.assertEqual(veh_id in env.k.vehicle.get_edge_changed_ids(),
+                             edge != prev_edge)
+            prev_edge = edge
+        env.terminate()
+
+
 class TestApplyingActionsWithSumo(unittest.TestCase):
     """
     Tests the apply_acceleration, apply_lane_change, and choose_routes
@@ -339,6 +721,164 @@ class TestSimsPerStep(unittest.TestCase):
         self.assertEqual(t2 - t1, sims_per_step)
 
 
+class TestStartup(unittest.TestCase):
+    """Ensures that sumo instances are connected to as soon as they are ready,
+    and that startup failures are recovered from."""
+
+    def setUp(self):
+        self.env, _, _ = ring_road_exp_setup()
+
+    def tearDown(self):
+        self.env.terminate()
+        self.env = None
+
+    def test_startup_time(self):
+        startup_time = self.env.k.simulation.startup_time
+        self.assertIsNotNone(startup_time)
+        self.assertLess(startup_time, config.SUMO_STARTUP_TIMEOUT)
+
+    def test_port_in_use(self):
+        # occupy a port so that sumo fails to start on it
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("localhost", 0))
+        port = sock.getsockname()[1]
+
+        # restart the simulation on the occupied port
+        self.env.sim_params.port = port
+        self.env.sim_params.restart_instance = True
+        self.env.reset()
+        sock.close()
+
+        # a new port should have been chosen, and the simulation should run
+        self.assertNotEqual(self.env.sim_params.port, port)
+        self.env.step(rl_actions=[])
+        self.assertEqual(len(self.env.k.vehicle.get_ids()), 1)
+
+
+class TestLibsumo(unittest.TestCase):
+    """Ensures that simulations run in-process through libsumo match those run
+    through a TraCI connection."""
+
+    @staticmethod
+    def _run(setup, num_steps, simulator, **kwargs):
+        """Return the speeds, leaders and headways of every step."""
+        env, _, flow_params = setup(**kwargs)
+        if simulator == 'libsumo':
+            env.terminate()
+            network = flow_params['network'](
+                name=flow_params['exp_tag'],
+                vehicles=flow_params['veh'],
+                net_params=flow_params['net'],
+                initial_config=flow_params['initial'])
+            env = flow_params['env_name'](
+                env_params=flow_params['env'],
+                sim_params=flow_params['sim'],
+                network=network,
+                simulator='libsumo')
+            env.reset()
+            assert env.k.simulation.sumo_proc is None
+        speeds, leaders, headways = [], [], []
+        for _ in range(num_steps):
+            env.step(rl_actions=[])
+            ids = env.k.vehicle.get_ids()
+            speeds.append(env.k.vehicle.get_speed(ids))
+            leaders.append(env.k.vehicle.get_leader(ids))
+            headways.append(env.k.vehicle.get_headway(ids))
+        env.terminate()
+        return speeds, leaders, headways
+
+    def test_matches_traci(self):
+        traci_speeds, _, _ = self._run(ring_road_exp_setup, 50, 'traci')
+        libsumo_speeds, _, _ = self._run(ring_road_exp_setup, 50, 'libsumo')
+        np.testing.assert_array_almost_equal(traci_speeds, libsumo_speeds)
+
+    def test_leaderless_vehicles(self):
+        # the vehicle at the front of a highway has no leader
+        vehicles = VehicleParams()
+        vehicles.add(
+            veh_id="idm",
+            acceleration_controller=(IDMController, {}),
+            routing_controller=(ContinuousRouter, {}),
+            num_vehicles=3)
+
+        traci = self._run(highway_exp_setup, 20, 'traci', vehicles=vehicles)
+        libsumo = self._run(
+            highway_exp_setup, 20, 'libsumo', vehicles=vehicles)
+
+        np.testing.assert_array_almost_equal(traci[0], libsumo[0])
+        self.assertEqual(traci[1], libsumo[1])
+        np.testing.assert_array_almost_equal(traci[2], libsumo[2])
+        self.assertIn(None, libsumo[1][-1])
+        self.assertIn(1e3, libsumo[2][-1])
+
+
+class TestSnapshotReset(unittest.TestCase):
+    """Ensures that resets restoring a saved simulation state reproduce the
+    state reached at the end of the first reset."""
+
+    def setUp(self):
+        vehicles = VehicleParams()
+        vehicles.add(
+            veh_id="test",
+            acceleration_controller=(IDMController, {}),
+            routing_controller=(ContinuousRouter, {}),
+            num_vehicles=10)
+
+        sim_params = SumoParams(sim_step=0.1, snapshot_reset=True)
+        env_params = EnvParams(
+            warmup_steps=50, additional_params=ADDITIONAL_ENV_PARAMS)
+
+        self.env, _, _ = ring_road_exp_setup(
+            sim_params=sim_params, env_params=env_params, vehicles=vehicles)
+
+    def tearDown(self):
+        self.env.terminate()
+        self.env = None
+
+    def test_reset(self):
+        env = self.env
+        ids = env.k.vehicle.get_ids()
+        positions = env.k.vehicle.get_position(ids)
+        speeds = env.k.vehicle.get_speed(ids)
+
+        # advance the simulation and then reset it
+        for _ in range(20):
+            env.step(rl_actions=[])
+        env.reset()
+
+        # the state of the vehicles and the time should be restored
+        self.assertEqual(env.time_counter, 50)
+        self.assertAlmostEqual(env.k.simulation.time, 5.0)
+        self.assertListEqual(sorted(env.k.vehicle.get_ids()), sorted(ids))
+        np.testing.assert_array_almost_equal(
+            env.k.vehicle.get_position(ids), positions)
+        np.testing.assert_array_almost_equal(
+            env.k.vehicle.get_speed(ids), speeds)
+        self.assertAlmostEqual(
+            env.k.kernel_api.vehicle.getSpeed(ids[0]), speeds[0])
+
+        # the vehicles should be subscribed to again
+        env.step(rl_actions=[])
+        self.assertAlmostEqual(env.k.simulation.time, 5.1)
+        for veh_id in ids:
+            self.assertAlmostEqual(
+                env.k.vehicle.get_speed(veh_id),
+                env.k.kernel_api.vehicle.getSpeed(veh_id))
+
+    def test_restart_discards_snapshot(self):
+        path = self.env._snapshot["path"]
+        self.env.restart_simulation(self.env.sim_params)
+        self.assertIsNone(self.env._snapshot)
+        self.assertFalse(os.path.exists(path))
+
+    def test_restart_instance(self):
+        # no snapshot is saved if the simulation is restarted on every reset
+        self.env.sim_params.restart_instance = True
+        with self.assertWarns(UserWarning):
+            self.env.reset()
+        self.assertIsNone(self.env._snapshot)
+
+
 class TestAbstractMethods(unittest.TestCase):
     """
     These series of tests are meant to ensure that the environment abstractions
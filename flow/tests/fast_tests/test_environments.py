@@ -1325,6 +1325,60 @@ class TestMultiAgentHighwayPOEnv(unittest.TestCase):
             )
         )
 
+    def test_batch_state(self):
+        """Ensures that batched observations match the observation dict."""
+        env = MultiAgentHighwayPOEnv(
+            sim_params=self.sim_params,
+            network=self.network,
+            env_params=self.env_params
+        )
+        env.reset()
+
+        rl_ids = env.k.vehicle.get_rl_ids()
+        states = env.get_batch_state(rl_ids)
+        self.assertEqual(states.shape, (1, 5))
+
+        obs = env.get_state()
+        self.assertListEqual(list(obs.keys()), rl_ids)
+        np.testing.assert_array_equal(obs["rl_0"], states[0])
+
+        # the observations of the dict are views of the batch
+        obs = env.batch_state_dict(rl_ids, states)
+        self.assertTrue(np.shares_memory(obs["rl_0"], states))
+
+        # no agents
+        self.assertEqual(env.get_batch_state([]).shape, (0, 5))
+
+        env.terminate()
+
+    def test_shared_terms(self):
+        """Ensures that shared terms are computed once per step."""
+        env = MultiAgentHighwayPOEnv(
+            sim_params=self.sim_params,
+            network=self.network,
+            env_params=self.env_params
+        )
+        env.reset()
+
+        calls = []
+
+        def term():
+            calls.append(None)
+            return len(calls)
+
+        # the term is memoized within a step
+        self.assertEqual(env.shared_term("term", term), 1)
+        self.assertEqual(env.shared_term("term", term), 1)
+        self.assertSetEqual(env.get_rl_id_set(), {"rl_0"})
+
+        # the term is computed again after a step, or when cleared
+        env.step(None)
+        self.assertEqual(env.shared_term("term", term), 2)
+        env.clear_shared_terms()
+        self.assertEqual(env.shared_term("term", term), 3)
+
+        env.terminate()
+
 
 ###############################################################################
 #                              Utility methods                                #
@@ -4,6 +4,7 @@ import time
 import csv
 
 from flow.core.experiment import Experiment
+from flow.core.vector_env import VectorEnv, reserve_ports
 from flow.core.params import VehicleParams
 from flow.controllers import IDMController, RLController, ContinuousRouter
 from flow.core.params import SumoCarFollowingParams
@@ -210,5 +211,75 @@ class TestConvertToCSV(unittest.TestCase):
             exp.env.network.name)))
 
 
+def accelerate(*_):
+    """Return an acceleration of 1 for one RL vehicle."""
+    return [1]
+
+
+class TestVectorEnv(unittest.TestCase):
+    """Tests the VectorEnv class."""
+
+    def setUp(self):
+        vehicles = VehicleParams()
+        vehicles.add(
+            veh_id="rl",
+            acceleration_controller=(RLController, {}),
+            routing_controller=(ContinuousRouter, {}),
+            car_following_params=SumoCarFollowingParams(
+                speed_mode="aggressive",
+            ),
+            num_vehicles=1)
+        vehicles.add(
+            veh_id="idm",
+            acceleration_controller=(IDMController, {}),
+            routing_controller=(ContinuousRouter, {}),
+            num_vehicles=4)
+
+        env, _, flow_params = ring_road_exp_setup(vehicles=vehicles)
+        env.terminate()
+        flow_params['sim'].render = False
+        flow_params['env'].horizon = 5
+        self.vec_env = VectorEnv(flow_params, num_envs=2)
+
+    def tearDown(self):
+        self.vec_env.close()
+        self.vec_env = None
+
+    def test_step(self):
+        obs = self.vec_env.reset()
+        self.assertEqual(obs.shape, (2,) + self.vec_env.observation_space.shape)
+        np.testing.assert_array_almost_equal(obs[0], obs[1])
+
+        for _ in range(4):
+            obs, rewards, dones, infos = self.vec_env.step([[1], [1]])
+            self.assertFalse(any(dones))
+        np.testing.assert_array_almost_equal(obs[0], obs[1])
+        self.assertEqual(rewards.shape, (2,))
+
+        # the environments are reset once the horizon is met
+        last_obs = obs
+        obs, rewards, dones, infos = self.vec_env.step([[1], [1]])
+        self.assertTrue(all(dones))
+        for i in range(2):
+            self.assertFalse(np.allclose(
+                infos[i]["terminal_observation"], last_obs[i]))
+            self.assertEqual(infos[i]["terminal_observation"].shape,
+                             obs[i].shape)
+
+    def test_run(self):
+        info_dict = self.vec_env.run(3, rl_actions=accelerate)
+        self.assertEqual(len(info_dict["returns"]), 3)
+        self.assertEqual(len(info_dict["velocities"]), 3)
+        self.assertEqual(len(info_dict["outflows"]), 3)
+
+        # all rollouts are the same
+        self.assertAlmostEqual(info_dict["returns"][0],
+                               info_dict["returns"][2])
+
+    def test_reserve_ports(self):
+        ports = reserve_ports(10)
+        self.assertEqual(len(set(ports)), 10)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+
+from flow.renderer.frame_buffer import FrameBuffer
+
+
+class TestFrameBuffer(unittest.TestCase):
+    """Tests the ring buffer of rendered frames."""
+
+    def setUp(self):
+        self.buffer = FrameBuffer(3, (2, 2))
+
+    @staticmethod
+    def _frame(value):
+        return np.full((2, 2), value, dtype=np.uint8)
+
+    def test_append(self):
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.buffer.shape, (2, 2))
+
+        stored = self.buffer.append(self._frame(1))
+        self.assertEqual(len(self.buffer), 1)
+        np.testing.assert_array_equal(stored, self._frame(1))
+        # the stored frame is a view of the buffer
+        self.assertTrue(np.shares_memory(stored, self.buffer.frames))
+
+        # the oldest frames are overwritten once the buffer is full
+        for value in range(2, 6):
+            self.buffer.append(self._frame(value))
+        self.assertEqual(len(self.buffer), 3)
+        self.assertListEqual([int(frame[0, 0]) for frame in self.buffer],
+                             [3, 4, 5])
+        self.assertEqual(self.buffer[0][0, 0], 3)
+        self.assertEqual(self.buffer[-1][0, 0], 5)
+        self.assertRaises(IndexError, self.buffer.__getitem__, 3)
+
+    def test_latest(self):
+        self.buffer.append(self._frame(1))
+        self.buffer.append(self._frame(2))
+
+        latest = self.buffer.latest()
+        self.assertEqual(latest.shape, (2, 2, 2))
+        self.assertListEqual(latest[:, 0, 0].tolist(), [1, 2])
+        # contiguous frames are returned as a view
+        self.assertTrue(np.shares_memory(latest, self.buffer.frames))
+
+        # frames wrapping around the end of the buffer
+        self.buffer.append(self._frame(3))
+        self.buffer.append(self._frame(4))
+        self.assertListEqual(self.buffer.latest()[:, 0, 0].tolist(),
+                             [2, 3, 4])
+        self.assertListEqual(self.buffer.latest(1)[:, 0, 0].tolist(), [4])
+        self.assertEqual(self.buffer.latest(0).shape, (0, 2, 2))
+        self.assertRaises(ValueError, self.buffer.latest, 4)
+
+    def test_advance(self):
+        slot = self.buffer.advance()
+        slot[:] = 7
+        self.assertEqual(self.buffer[-1][0, 0], 7)
+
+    def test_fill_and_clear(self):
+        self.buffer.append(self._frame(1))
+        self.buffer.fill(self._frame(9))
+        self.assertEqual(len(self.buffer), 3)
+        self.assertListEqual(self.buffer.latest()[:, 0, 0].tolist(),
+                             [9, 9, 9])
+
+        self.buffer.clear()
+        self.assertEqual(len(self.buffer), 0)
+        self.buffer.append(self._frame(2))
+        self.assertListEqual(self.buffer.latest()[:, 0, 0].tolist(), [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
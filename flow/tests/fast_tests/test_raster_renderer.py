@@ -0,0 +1,150 @@
+from flow.renderer.raster_renderer import RasterRenderer as Renderer
+import numpy as np
+import shutil
+import tempfile
+import unittest
+
+
+class TestRasterRenderer(unittest.TestCase):
+    """Tests raster_renderer"""
+
+    def setUp(self):
+        # a ring road of radius 50 m with two lanes
+        angles = np.linspace(0, 2 * np.pi, 60)
+        self.network = [
+            [v for a in angles for v in (100 + r * np.cos(a),
+                                         100 + r * np.sin(a))]
+            for r in (50, 53)
+        ]
+        # vehicles on the ring, as [x, y, angle]
+        self.human_orientations = [
+            [100 + 51 * np.cos(a), 100 + 51 * np.sin(a), np.degrees(a)]
+            for a in np.linspace(0, 2 * np.pi, 20, endpoint=False)]
+        self.machine_orientations = [[100, 151.5, 90]]
+        self.human_dynamics = list(np.linspace(0, 1, 20))
+        self.machine_dynamics = [0.5]
+        self.human_logs = [[0, 100, "human_{}".format(i)] for i in range(20)]
+        self.machine_logs = [[0, 100, "rl_0"]]
+
+        # Default renderer parameters
+        self.mode = "drgb"
+        self.save_render = False
+        self.sight_radius = 25
+        self.pxpm = 3
+        self.show_radius = True
+        self.alpha = 0.9
+
+    def tearDown(self):
+        self.renderer.close()
+
+    def _render(self):
+        return self.renderer.render(
+            self.human_orientations, self.machine_orientations,
+            self.human_dynamics, self.machine_dynamics,
+            self.human_logs, self.machine_logs)
+
+    def _create_renderer(self, **kwargs):
+        self.renderer = Renderer(
+            self.network,
+            mode=self.mode,
+            save_render=self.save_render,
+            sight_radius=self.sight_radius,
+            pxpm=self.pxpm,
+            show_radius=self.show_radius,
+            alpha=self.alpha,
+            **kwargs
+        )
+
+    def test_init(self):
+        self._create_renderer()
+
+        # Ensure that the attributes match their correct values
+        self.assertEqual(self.renderer.mode, self.mode)
+        self.assertEqual(self.renderer.save_render, self.save_render)
+        self.assertEqual(self.renderer.sight_radius, self.sight_radius)
+        self.assertEqual(self.renderer.pxpm, self.pxpm)
+        self.assertEqual(self.renderer.show_radius, self.show_radius)
+        self.assertEqual(self.renderer.alpha, self.alpha)
+
+        # the road network is drawn in the background
+        self.assertEqual(self.renderer.background.shape, (465, 465, 3))
+        self.assertGreater(self.renderer.background.max(), 32)
+
+        # unsupported modes
+        self.assertRaises(ValueError, Renderer, self.network, mode=True)
+
+    def test_render(self):
+        for mode, shape in (("drgb", (465, 465, 3)), ("rgb", (465, 465, 3)),
+                            ("dgray", (465, 465)), ("gray", (465, 465))):
+            self.mode = mode
+            self._create_renderer()
+            frame = self._render()
+            self.assertEqual(self.renderer.mode, mode)
+            self.assertEqual(frame.shape, shape)
+            self.assertEqual(frame.dtype, np.uint8)
+
+            # vehicles are drawn over the background
+            self.assertTrue(np.any(self.renderer.frame !=
+                                   self.renderer.background))
+            self.renderer.close()
+
+    def test_frame_history(self):
+        self._create_renderer(frame_history=3)
+        first = self._render().copy()
+        self.machine_orientations = [[100, 151.5, 80]]
+        second = self._render()
+
+        # the frames are drawn into the buffer of the renderer
+        self.assertTrue(np.shares_memory(self.renderer.frame,
+                                         self.renderer.frames.frames))
+        latest = self.renderer.frames.latest(2)
+        np.testing.assert_array_equal(latest[0], first)
+        np.testing.assert_array_equal(latest[1], second)
+
+    def test_render_colors(self):
+        self.mode = "rgb"
+        self.alpha = 1.0
+        self.show_radius = False
+        self._create_renderer()
+        self._render()
+
+        # the static colors of human and RL vehicles, in BGR
+        colors = set(map(tuple, self.renderer.frame.reshape(-1, 3)))
+        self.assertIn((0, 225, 0), colors)
+        self.assertIn((200, 150, 0), colors)
+
+    def test_get_sight(self):
+        self._create_renderer()
+        self._render()
+        sight = self.renderer.get_sight(self.machine_orientations[0], "rl_0")
+        self.assertEqual(sight.shape, (150, 150, 3))
+
+        # the corners of the sight are outside of the radius of observation
+        self.assertEqual(sight[0, 0].tolist(), [0, 0, 0])
+        # the observed vehicle is at the center of its sight
+        self.assertTrue(np.any(sight[70:80, 70:80] !=
+                               self.renderer.background[0, 0]))
+
+        self.mode = "gray"
+        self._create_renderer()
+        self._render()
+        sight = self.renderer.get_sight(self.machine_orientations[0], "rl_0")
+        self.assertEqual(sight.shape, (150, 150))
+
+    def test_save_renderer(self):
+        self.save_render = True
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self._create_renderer(path=path)
+        self._render()
+
+        save_path = self.renderer.close()
+        saved_data = np.load(save_path, allow_pickle=True)
+
+        self.assertEqual(len(saved_data), 2)
+        self.assertEqual(saved_data[1][1], self.machine_orientations)
+        self.assertEqual(saved_data[1][5], self.machine_logs)
+
+
+if __name__ == '__main__':
+    unittest.main()
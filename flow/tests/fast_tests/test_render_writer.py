@@ -0,0 +1,120 @@
+from flow.renderer.render_writer import RenderWriter, read_render_log
+import cv2
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+
+class TestRenderWriter(unittest.TestCase):
+    """Tests render_writer"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.frames = [np.full((48, 64, 3), 10 * i, dtype=np.uint8)
+                       for i in range(5)]
+
+    def test_png(self):
+        writer = RenderWriter(self.path, max_queue=2)
+        frame = self.frames[0].copy()
+        writer.write_frame(frame)
+        # frames are copied before being written in the background
+        frame[:] = 255
+        for frame in self.frames[1:]:
+            writer.write_frame(frame)
+        writer.write_image("sight_rl_0_000001", self.frames[2])
+        writer.flush()
+
+        self.assertEqual(writer.num_frames, 5)
+        np.testing.assert_array_equal(
+            cv2.imread(os.path.join(self.path, "frame_000001.png")),
+            self.frames[0])
+        np.testing.assert_array_equal(
+            cv2.imread(os.path.join(self.path, "frame_000005.png")),
+            self.frames[4])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.path, "sight_rl_0_000001.png")))
+        writer.close()
+
+    def test_npz(self):
+        writer = RenderWriter(self.path, save_format="npz", chunk_size=2)
+        for frame in self.frames:
+            writer.write_frame(frame)
+        writer.close()
+
+        files = sorted(f for f in os.listdir(self.path) if f.endswith(".npz"))
+        self.assertEqual(files, ["frames_000001.npz", "frames_000003.npz",
+                                 "frames_000005.npz"])
+        frames = np.concatenate([
+            np.load(os.path.join(self.path, f))["frames"] for f in files])
+        np.testing.assert_array_equal(frames, np.stack(self.frames))
+
+    def test_mp4(self):
+        writer = RenderWriter(self.path, save_format="mp4", fps=10)
+        for frame in self.frames:
+            writer.write_frame(frame)
+        writer.close()
+
+        video = cv2.VideoCapture(os.path.join(self.path, "frames.mp4"))
+        if not video.isOpened():
+            self.skipTest("OpenCV cannot decode mp4 videos")
+        num_frames = 0
+        while video.read()[0]:
+            num_frames += 1
+        video.release()
+        self.assertEqual(num_frames, 5)
+
+    def test_data(self):
+        writer = RenderWriter(self.path)
+        data = [[[0, 1, 90]], [0.5], [[0, 100, "rl_0"]]]
+        writer.write_data("network")
+        writer.write_data(data)
+        # the data is serialized when it is written
+        data[0][0][0] = 5
+        save_path = writer.close(os.path.join(self.path, "data.npy"))
+
+        saved_data = np.load(save_path, allow_pickle=True)
+        self.assertEqual(len(saved_data), 2)
+        self.assertEqual(saved_data[0], "network")
+        self.assertEqual(saved_data[1][0], [[0, 1, 90]])
+        # the log is removed once converted
+        self.assertFalse(os.path.exists(os.path.join(self.path, "data.pkl")))
+
+        # without a path, the log is kept
+        writer = RenderWriter(self.path)
+        writer.write_data(data)
+        log_path = writer.close()
+        self.assertEqual(len(read_render_log(log_path)), 1)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, RenderWriter, self.path,
+                          save_format="gif")
+
+        # errors of the background thread are raised by every later call to
+        # the writer
+        writer = RenderWriter(self.path, save_format="npz", chunk_size=2)
+        writer.write_frame(self.frames[0])
+        writer.write_frame(np.zeros((2, 2, 3), dtype=np.uint8))
+        self.assertRaises(ValueError, writer.flush)
+        self.assertRaises(ValueError, writer.flush)
+        self.assertRaises(ValueError, writer.write_frame, self.frames[0])
+        self.assertRaises(ValueError, writer.close)
+        self.assertRaises(ValueError, writer.close)
+
+    def test_mp4_unavailable(self):
+        # an error is raised if no mp4 encoder is available
+        video = mock.Mock()
+        video.isOpened.return_value = False
+        with mock.patch.object(cv2, "VideoWriter", return_value=video):
+            writer = RenderWriter(self.path, save_format="mp4")
+            writer.write_frame(self.frames[0])
+            self.assertRaises(IOError, writer.flush)
+            self.assertRaises(IOError, writer.close)
+        video.write.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
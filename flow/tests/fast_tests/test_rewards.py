@@ -8,6 +8,12 @@ from flow.core.rewards import average_velocity, min_delay
 from flow.core.rewards import desired_velocity, boolean_action_penalty
 from flow.core.rewards import penalize_near_standstill, penalize_standstill
 from flow.core.rewards import energy_consumption
+from flow.core.rewards import miles_per_megajoule, miles_per_gallon
+from flow.core.rewards import min_delay_unscaled, multi_reward
+from flow.core.rewards import get_vehicle_arrays, VEHICLE_ARRAYS
+from flow.core.rewards import energy_consumption_from_arrays
+from flow.core.rewards import miles_per_megajoule_from_arrays
+from flow.core.rewards import miles_per_gallon_from_arrays
 
 os.environ["TEST_FLAG"] = "True"
 
@@ -192,5 +198,101 @@ class TestRewards(unittest.TestCase):
         self.assertEqual(boolean_action_penalty(actions, gain=2), 4)
 
 
+class TestVectorizedRewards(unittest.TestCase):
+    """Tests the rewards computed from arrays of vehicle states."""
+
+    def test_from_arrays(self):
+        rng = np.random.RandomState(0)
+        speed = rng.uniform(0, 20, 100)
+        speed[:10] = 0
+        accel = rng.uniform(0, 3, 100)
+        fuel = rng.uniform(0, 0.01, 100)
+        fuel[10:20] = 0
+
+        # per-vehicle computations, as previously performed by the rewards
+        power = [1200 * v * a + 1200 * 9.81 * 0.005 * v
+                 + 0.5 * 1.225 * 2.6 * 0.3 * v ** 3
+                 for v, a in zip(speed, accel)]
+        mpj = [v / p for v, p in zip(speed, power) if p > 0]
+        mpg = [v / f for v, f in zip(speed, fuel) if f > 0]
+
+        self.assertAlmostEqual(energy_consumption_from_arrays(speed, accel),
+                               -0.001 * sum(power))
+        self.assertAlmostEqual(
+            miles_per_megajoule_from_arrays(speed, accel, gain=1),
+            sum(mpj) / len(mpj) / 1609.0 * 10**6)
+        self.assertAlmostEqual(
+            miles_per_gallon_from_arrays(speed, fuel, gain=1),
+            sum(mpg) / len(mpg) / 1609.0)
+
+        # vehicles with no valid value
+        self.assertEqual(
+            miles_per_gallon_from_arrays(speed, np.zeros(100)), 0)
+        self.assertEqual(
+            miles_per_megajoule_from_arrays(np.array([]), np.array([])), 0)
+
+    def test_multi_reward(self):
+        vehicles = VehicleParams()
+        vehicles.add("test", num_vehicles=10)
+
+        env_params = EnvParams(additional_params={
+            "target_velocity": 10, "max_accel": 1, "max_decel": 1,
+            "sort_vehicles": False})
+
+        env, _, _ = ring_road_exp_setup(vehicles=vehicles,
+                                        env_params=env_params)
+        for _ in range(10):
+            env.step(rl_actions=None)
+        env.k.vehicle.test_set_speed("test_0", 0)
+
+        values = multi_reward(env, [
+            "desired_velocity", "average_velocity", "min_delay",
+            "min_delay_unscaled", "penalize_standstill",
+            "penalize_near_standstill", "energy_consumption",
+            "miles_per_megajoule", "miles_per_gallon"])
+        self.assertAlmostEqual(values["desired_velocity"],
+                               desired_velocity(env))
+        self.assertAlmostEqual(values["average_velocity"],
+                               average_velocity(env))
+        self.assertAlmostEqual(values["min_delay"], min_delay(env))
+        self.assertAlmostEqual(values["min_delay_unscaled"],
+                               min_delay_unscaled(env))
+        self.assertEqual(values["penalize_standstill"],
+                         penalize_standstill(env))
+        self.assertEqual(values["penalize_near_standstill"],
+                         penalize_near_standstill(env))
+        self.assertAlmostEqual(values["energy_consumption"],
+                               energy_consumption(env))
+        self.assertAlmostEqual(values["miles_per_megajoule"],
+                               miles_per_megajoule(env))
+        self.assertAlmostEqual(values["miles_per_gallon"],
+                               miles_per_gallon(env))
+
+        # keyword arguments of every reward
+        values = multi_reward(env, {
+            "desired_velocity": {"target_velocity": 5},
+            "penalize_standstill": {"gain": 0.2}})
+        self.assertAlmostEqual(values["penalize_standstill"],
+                               penalize_standstill(env, gain=0.2))
+        self.assertNotAlmostEqual(values["desired_velocity"],
+                                  desired_velocity(env))
+
+        # rewards over a subset of the vehicles
+        self.assertAlmostEqual(
+            multi_reward(env, ["miles_per_gallon"],
+                         veh_ids=["test_1"])["miles_per_gallon"],
+            miles_per_gallon(env, "test_1"))
+
+        self.assertRaises(ValueError, multi_reward, env, ["unknown"])
+
+        # only the requested arrays are collected
+        self.assertSetEqual(set(get_vehicle_arrays(env)), set(VEHICLE_ARRAYS))
+        arrays = get_vehicle_arrays(env, keys=("speed", "accel", "grade"))
+        self.assertSetEqual(
+            set(arrays),
+            {"speed", "previous_speed", "accel", "grade", "sim_step"})
+        env.terminate()
+
+
 if __name__ == '__main__':
     unittest.main()
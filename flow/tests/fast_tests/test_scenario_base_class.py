@@ -1,7 +1,12 @@
 import unittest
 import os
+import shutil
+import tempfile
+from unittest import mock
 import numpy as np
 
+import flow.core.kernel.network.traci
+
 from flow.config import PROJECT_PATH
 from flow.core.params import InitialConfig
 from flow.core.params import NetParams
@@ -64,6 +69,14 @@ class TestGetX(unittest.TestCase):
         pos = 4.72
         self.assertAlmostEqual(self.env.k.network.get_x(edge, pos), -1001)
 
+    def test_get_x_many(self):
+        edges = ["bottom", ":bottom", ":center_0", ":unknown_1", "", "top"]
+        positions = [4.72, 0.1, 1.5, 2, 4.72, 10]
+        self.assertListEqual(
+            self.env.k.network.get_x_many(edges, positions).tolist(),
+            [self.env.k.network.get_x(edge, pos)
+             for edge, pos in zip(edges, positions)])
+
 
 class TestGetEdge(unittest.TestCase):
     """
@@ -92,6 +105,25 @@ class TestGetEdge(unittest.TestCase):
         self.assertTupleEqual(
             self.env.k.network.get_edge(x2), (":bottom", 0.1))
 
+    def test_get_edge_many(self):
+        network = self.env.k.network
+        xs = np.linspace(-1, network.length() + 1, 1001)
+        edges, positions = network.get_edge_many(xs)
+
+        for x, edge, pos in zip(xs, edges, positions):
+            # matches a linear search over the edges
+            expected = next(
+                ((e, x - start) for e, start in
+                 reversed(network.total_edgestarts) if x >= start), None)
+            self.assertEqual(network.get_edge(x), expected)
+            if expected is None:
+                # positions before the first edge are not on any edge
+                self.assertIsNone(edge)
+                self.assertTrue(np.isnan(pos))
+            else:
+                self.assertTupleEqual((edge, pos), expected)
+        self.assertIsNone(edges[0])
+
 
 class TestEvenStartPos(unittest.TestCase):
     """
@@ -693,6 +725,57 @@ class TestEdgeLength(unittest.TestCase):
             env.k.network.edge_length(":center_1"), 9.40)  # FIXME: 6.2?
 
 
+class TestNetworkCache(unittest.TestCase):
+    """
+    Tests that generated networks are cached if requested.
+    """
+
+    def setUp(self):
+        self.cache_path = tempfile.mkdtemp()
+        self.patch = mock.patch.object(
+            flow.core.kernel.network.traci, "CACHE_PATH", self.cache_path)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        shutil.rmtree(self.cache_path)
+
+    def make_env(self, length, network_cache=True):
+        net_params = NetParams(additional_params={
+            "length": length,
+            "lanes": 1,
+            "speed_limit": 30,
+            "resolution": 40
+        })
+        env, _, _ = ring_road_exp_setup(
+            sim_params=SumoParams(network_cache=network_cache),
+            net_params=net_params)
+        env.terminate()
+        return env
+
+    def test_cache(self):
+        env = self.make_env(230)
+        self.assertEqual(len(os.listdir(self.cache_path)), 1)
+
+        # the cached network matches the generated one
+        expected = self.make_env(230, network_cache=False)
+        self.assertDictEqual(env.k.network._edges,
+                             expected.k.network._edges)
+        self.assertDictEqual(env.k.network._connections,
+                             expected.k.network._connections)
+
+        # netconvert is not called if the network is cached
+        with mock.patch("subprocess.call") as call:
+            env = self.make_env(230)
+            call.assert_not_called()
+        self.assertAlmostEqual(env.k.network.length(), 230.4)
+
+        # a new entry is created if the network changes
+        env = self.make_env(260)
+        self.assertEqual(len(os.listdir(self.cache_path)), 2)
+        self.assertNotAlmostEqual(env.k.network.length(), 230.4)
+
+
 class TestSpeedLimit(unittest.TestCase):
     """
     Tests the speed_limit() method in the base network class.
@@ -1,11 +1,13 @@
 import unittest
 import os
+from unittest import mock
 
 from tests.setup_scripts import ring_road_exp_setup, traffic_light_grid_mxn_exp_setup
 from flow.core.params import VehicleParams
 from flow.core.params import NetParams
 from flow.core.params import SumoCarFollowingParams
 from flow.core.params import TrafficLightParams
+from flow.core.params import SumoParams
 from flow.core.experiment import Experiment
 from flow.controllers.routing_controllers import GridRouter
 from flow.controllers.car_following_models import IDMController
@@ -138,6 +140,81 @@ class TestSetState(unittest.TestCase):
         self.assertEqual(state[1], "R")
 
 
+class TestBatchTrafficLights(unittest.TestCase):
+    """
+    Tests the traffic light kernel when batch_traffic_lights is set.
+    """
+
+    def setUp(self):
+        # add a traffic light to the top node
+        traffic_lights = TrafficLightParams()
+        traffic_lights.add("top")
+
+        # create a ring road with two lanes
+        additional_net_params = {
+            "length": 230,
+            "lanes": 2,
+            "speed_limit": 30,
+            "resolution": 40
+        }
+        net_params = NetParams(additional_params=additional_net_params)
+
+        # create the environment and network classes for a ring road
+        self.env, _, _ = ring_road_exp_setup(
+            sim_params=SumoParams(batch_traffic_lights=True),
+            net_params=net_params, traffic_lights=traffic_lights)
+        self.env.reset()
+
+    def tearDown(self):
+        # terminate the traci instance
+        self.env.terminate()
+
+        # free data used by the class
+        self.env = None
+
+    def test_get_states(self):
+        self.env.step([])
+        self.assertListEqual(
+            self.env.k.traffic_light.get_states().tolist(), ["GG"])
+
+        self.env.k.traffic_light.set_state(node_id="top", state="rY")
+        self.env.step([])
+        self.assertEqual(self.env.k.traffic_light.get_state("top"), "rY")
+        self.assertListEqual(
+            self.env.k.traffic_light.get_states().tolist(), ["rY"])
+
+    def test_change_only_writes(self):
+        # record the commands sent by the traffic light kernel
+        tl = self.env.k.traffic_light
+        tl.kernel_api = mock.Mock(wraps=tl.kernel_api)
+        set_all = tl.kernel_api.trafficlight.setRedYellowGreenState
+        set_link = tl.kernel_api.trafficlight.setLinkState
+
+        # the state is sent the first time, even if it matches the
+        # current state of the traffic light
+        tl.set_state(node_id="top", state="GG")
+        self.env.step([])
+        self.assertEqual(set_all.call_count, 1)
+
+        # states that were already sent are skipped
+        tl.set_state(node_id="top", state="GG")
+        tl.set_state(node_id="top", state="G", link_index=1)
+        self.assertEqual(set_all.call_count, 1)
+        self.assertEqual(set_link.call_count, 0)
+
+        # new states are sent
+        tl.set_state(node_id="top", state="r", link_index=1)
+        self.env.step([])
+        self.assertEqual(set_link.call_count, 1)
+        self.assertEqual(tl.get_state("top"), "Gr")
+
+        tl.set_state(node_id="top", state="Gr")
+        tl.set_state(node_id="top", state="rG")
+        self.env.step([])
+        self.assertEqual(set_all.call_count, 2)
+        self.assertEqual(tl.get_state("top"), "rG")
+
+
 class TestPOEnv(unittest.TestCase):
     """
     Tests the set_state function
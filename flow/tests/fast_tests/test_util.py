@@ -3,6 +3,8 @@ import csv
 import os
 import json
 import collections
+import shutil
+import tempfile
 
 from flow.envs import AccelEnv
 from flow.networks import FigureEightNetwork
@@ -59,6 +61,76 @@ class TestEmissionToCSV(unittest.TestCase):
         self.assertEqual(len(dict1), 104)
 
 
+class TestStreamingEmissionToCSV(unittest.TestCase):
+    """Tests the chunked and parallel modes of the emission_to_csv function.
+
+    Ensures that every mode generates the same rows, in the expected order.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.emission_path = os.path.join(self.dir, "test-emission.xml")
+
+        vehicle = '<vehicle id="{}" eclass="HBEFA3/PC_G_EU4" CO2="2624.72" ' \
+            'CO="164.78" HC="0.81" NOx="1.20" PMx="0.07" fuel="1.13" ' \
+            'electricity="0.00" noise="55.94" route="route0" type="human" ' \
+            'waiting="0.00" lane="edge0_{}" pos="{}" speed="{}" ' \
+            'angle="90.00" x="{}" y="0.00"/>'
+        with open(self.emission_path, "w") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<emission-export>\n')
+            for t in range(10):
+                f.write('<timestep time="{:.2f}">\n'.format(t / 10))
+                for i in reversed(range(5)):
+                    f.write(vehicle.format("veh_{}".format(i), i % 2, t, i, t))
+                # vehicles with missing data are skipped
+                f.write('<vehicle id="veh_5" type="human"/>\n')
+                f.write('</timestep>\n')
+            f.write('</emission-export>\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read_rows(self, **kwargs):
+        output_path = os.path.join(self.dir, "test-emission.csv")
+        emission_to_csv(self.emission_path, output_path, **kwargs)
+        with open(output_path) as f:
+            return list(csv.reader(f))
+
+    def test_sort_by_id(self):
+        rows = self.read_rows()
+        self.assertListEqual(
+            rows[0], ['time', 'CO', 'y', 'CO2', 'electricity', 'type', 'id',
+                      'eclass', 'waiting', 'NOx', 'fuel', 'HC', 'x', 'route',
+                      'relative_position', 'noise', 'angle', 'PMx', 'speed',
+                      'edge_id', 'lane_number'])
+        self.assertEqual(len(rows), 51)
+        # rows are sorted by id, then time
+        self.assertListEqual(
+            [(row[6], row[0]) for row in rows[1:]],
+            sorted((row[6], row[0]) for row in rows[1:]))
+        self.assertListEqual(rows[1][-2:], ["edge0", "0"])
+
+        # the same rows are generated from small chunks and in parallel
+        self.assertListEqual(self.read_rows(chunk_size=7), rows)
+        self.assertListEqual(self.read_rows(chunk_size=7, num_workers=3), rows)
+
+    def test_sort_by_time(self):
+        rows = self.read_rows(sort_by_id=False)
+        self.assertEqual(len(rows), 51)
+        self.assertListEqual([row[6] for row in rows[1:6]],
+                             ["veh_4", "veh_3", "veh_2", "veh_1", "veh_0"])
+        self.assertListEqual([float(row[0]) for row in rows[1:]],
+                             sorted(float(row[0]) for row in rows[1:]))
+
+        self.assertListEqual(
+            self.read_rows(sort_by_id=False, num_workers=3), rows)
+
+        # no temporary file is left behind
+        self.assertCountEqual(os.listdir(self.dir),
+                              ["test-emission.xml", "test-emission.csv"])
+
+
 class TestRegistry(unittest.TestCase):
     """Tests the methods located in flow/utils/registry.py"""
 
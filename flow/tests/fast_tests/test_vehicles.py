@@ -1,6 +1,7 @@
 import unittest
 import os
 import numpy as np
+from traci.exceptions import TraCIException
 
 from flow.core.params import VehicleParams
 from flow.core.params import SumoCarFollowingParams, NetParams, \
@@ -9,6 +10,8 @@ from flow.controllers.car_following_models import IDMController, \
     SimCarFollowingController
 from flow.controllers.lane_change_controllers import StaticLaneChanger
 from flow.controllers.rlcontroller import RLController
+from flow.core.kernel.vehicle.columnar import ColumnarVehicleState
+from flow.core.kernel.vehicle.command_buffer import TraCICommandBuffer
 
 from tests.setup_scripts import ring_road_exp_setup, highway_exp_setup
 
@@ -568,6 +571,91 @@ class TestIdsByEdge(unittest.TestCase):
         self.assertCountEqual(ids, expected_ids)
 
 
+class TestEdgeStats(unittest.TestCase):
+    """Tests the per-step traffic statistics of edges and lanes."""
+
+    def setUp(self):
+        vehicles = VehicleParams()
+        vehicles.add(veh_id="test",
+                     acceleration_controller=(IDMController, {}),
+                     num_vehicles=20)
+
+        self.env, _, _ = ring_road_exp_setup(vehicles=vehicles)
+        self.env.reset()
+
+    def tearDown(self):
+        self.env.terminate()
+        self.env = None
+
+    def expected_stats(self, edges):
+        k = self.env.k.vehicle
+        ids = [veh_id for veh_id in k.get_ids() if k.get_edge(veh_id) in edges]
+        speeds = k.get_speed(ids)
+        length = sum(self.env.k.network.edge_length(edge) for edge in edges)
+        return {
+            "count": len(ids),
+            "mean_speed": np.mean(speeds),
+            "queue_length": sum(speed < 0.1 for speed in speeds),
+            "occupancy": sum(k.get_length(ids)) / length,
+        }
+
+    def test_edge_stats(self):
+        for _ in range(50):
+            self.env.step(rl_actions=[])
+
+        k = self.env.k.vehicle
+        for edges in (["bottom"], ["right"], ["bottom", "right"]):
+            stats = k.get_edge_stats(edges)
+            expected = self.expected_stats(edges)
+            self.assertEqual(stats["count"], expected["count"])
+            self.assertEqual(stats["queue_length"], expected["queue_length"])
+            self.assertAlmostEqual(stats["mean_speed"],
+                                   expected["mean_speed"])
+            self.assertAlmostEqual(stats["occupancy"], expected["occupancy"])
+
+        # the front and rear vehicles of an edge are the vehicles with the
+        # largest and smallest positions
+        stats = k.get_edge_stats("bottom")
+        positions = k.get_position(k.get_ids_by_edge("bottom"))
+        self.assertEqual(stats["front_position"], max(positions))
+        self.assertEqual(stats["rear_position"], min(positions))
+        self.assertEqual(k.get_position(stats["front_id"]), max(positions))
+
+        # with several edges, the rear vehicle is on the first edge and the
+        # front vehicle on the last one
+        stats = k.get_edge_stats(["bottom", "right"])
+        self.assertEqual(k.get_edge(stats["rear_id"]), "bottom")
+        self.assertEqual(k.get_edge(stats["front_id"]), "right")
+
+        # the single lane contains all vehicles of the edge
+        self.assertEqual(k.get_edge_stats("bottom", lane=0)["count"],
+                         k.get_edge_stats("bottom")["count"])
+        self.assertEqual(k.get_edge_stats("bottom", lane=1)["count"], 0)
+
+        # edges without vehicles
+        stats = k.get_edge_stats("unknown")
+        self.assertEqual(stats["count"], 0)
+        self.assertIsNone(stats["mean_speed"])
+        self.assertIsNone(stats["front_id"])
+
+    def test_cache(self):
+        k = self.env.k.vehicle
+        stats = k.get_edge_stats("bottom")
+
+        # the statistics are shared within a time step
+        self.assertIs(k.get_edge_stats("bottom"), stats)
+
+        # and recomputed after every update
+        self.env.step(rl_actions=[])
+        self.assertIsNot(k.get_edge_stats("bottom"), stats)
+
+        veh_id = k.get_ids_by_edge("bottom")[0]
+        stats = k.get_edge_stats("bottom")
+        k.test_set_speed(veh_id, 10)
+        self.assertEqual(k.get_edge_stats("bottom")["queue_length"],
+                         stats["queue_length"] - 1)
+
+
 class TestObservedIDs(unittest.TestCase):
     """Tests the observed_ids methods, which are used for visualization."""
 
@@ -600,5 +688,218 @@ class TestObservedIDs(unittest.TestCase):
         self.assertCountEqual(env.k.vehicle.get_observed_ids(), ["test_1"])
 
 
+class TestColumnarVehicleState(unittest.TestCase):
+    """Tests the array-backed vehicle state store."""
+
+    def test_slot_reuse(self):
+        state = ColumnarVehicleState(capacity=2)
+        self.assertEqual(state.add("a"), 0)
+        self.assertEqual(state.add("b"), 1)
+        # adding a vehicle twice returns the same row
+        self.assertEqual(state.add("a"), 0)
+
+        # the store grows once its capacity is exceeded
+        self.assertEqual(state.add("c"), 2)
+        self.assertEqual(state.capacity, 4)
+
+        # rows of removed vehicles are reused and reset to their defaults
+        state.set("b", "speed", 5)
+        state.remove("b")
+        self.assertNotIn("b", state)
+        self.assertEqual(state.add("d"), 1)
+        self.assertEqual(state.get("d", "speed"), -1001)
+        self.assertEqual(len(state), 3)
+
+    def test_gather(self):
+        state = ColumnarVehicleState()
+        for i, veh_id in enumerate(["a", "b", "c"]):
+            state.add(veh_id)
+            state.set(veh_id, "speed", float(i))
+
+        rows = state.rows(["c", "a", "missing"])
+        np.testing.assert_array_equal(
+            state.gather("speed", rows, error=-1), [2., 0., -1.])
+        self.assertListEqual(
+            list(state.gather("speed", rows, error=None)), [2., 0., None])
+        self.assertEqual(state.get("missing", "speed", error=None), None)
+
+    def test_kernel_getters(self):
+        """Check that the list getters match the per-vehicle getters."""
+        vehicles = VehicleParams()
+        vehicles.add("test", num_vehicles=10)
+        vehicles.add(
+            "test_rl",
+            num_vehicles=2,
+            acceleration_controller=(RLController, {}))
+
+        env, _, _ = ring_road_exp_setup(
+            sim_params=SumoParams(sim_step=0.1, columnar_state=True),
+            vehicles=vehicles)
+        env.reset()
+        for _ in range(5):
+            env.step(rl_actions=None)
+        env.k.vehicle.remove("test_0")
+
+        ids = env.k.vehicle.get_ids()
+        for getter in ["get_speed", "get_previous_speed", "get_position",
+                       "get_lane", "get_headway", "get_distance"]:
+            fn = getattr(env.k.vehicle, getter)
+            np.testing.assert_array_almost_equal(
+                fn(ids), [fn(veh_id) for veh_id in ids])
+        np.testing.assert_array_almost_equal(
+            env.k.vehicle.get_speed(["test_0", "test_1"]),
+            [-1001, env.k.vehicle.get_speed("test_1")])
+        # vehicles that are not in the network have a previous speed of 0
+        self.assertEqual(env.k.vehicle.get_previous_speed("test_0"), 0)
+        np.testing.assert_array_almost_equal(
+            env.k.vehicle.get_previous_speed(["test_0", "test_1"]),
+            [0, env.k.vehicle.get_previous_speed("test_1")])
+
+        env.terminate()
+
+
+class TestBatchSubscriptions(unittest.TestCase):
+    """Tests the batched subscription mode of the vehicle kernel."""
+
+    def test_matches_individual_subscriptions(self):
+        vehicles = VehicleParams()
+        vehicles.add(
+            "test",
+            acceleration_controller=(IDMController, {}),
+            num_vehicles=10)
+
+        states = []
+        for batch_subscriptions in [False, True]:
+            env, _, _ = ring_road_exp_setup(
+                sim_params=SumoParams(
+                    sim_step=0.1, batch_subscriptions=batch_subscriptions),
+                vehicles=vehicles)
+            env.reset()
+            for _ in range(10):
+                env.step(rl_actions=None)
+
+            ids = sorted(env.k.vehicle.get_ids())
+            states.append((
+                ids,
+                env.k.vehicle.get_speed(ids),
+                env.k.vehicle.get_position(ids),
+                env.k.vehicle.get_headway(ids),
+                env.k.vehicle.get_leader(ids),
+                env.k.vehicle.get_route(ids),
+            ))
+            env.terminate()
+
+        self.assertListEqual(states[0][0], states[1][0])
+        for individual, batched in zip(states[0][1:4], states[1][1:4]):
+            np.testing.assert_array_almost_equal(individual, batched)
+        self.assertListEqual(states[0][4], states[1][4])
+        self.assertListEqual(states[0][5], states[1][5])
+
+
+class TestBatchCommands(unittest.TestCase):
+    """Tests the buffered actuation commands of the vehicle kernel."""
+
+    def test_matches_individual_commands(self):
+        vehicles = VehicleParams()
+        vehicles.add(
+            "test",
+            acceleration_controller=(IDMController, {}),
+            num_vehicles=10)
+
+        speeds = []
+        for batch_commands in [False, True]:
+            env, _, _ = ring_road_exp_setup(
+                sim_params=SumoParams(
+                    sim_step=0.1, batch_commands=batch_commands),
+                vehicles=vehicles)
+            env.reset()
+            for _ in range(20):
+                env.step(rl_actions=None)
+            ids = sorted(env.k.vehicle.get_ids())
+            speeds.append(env.k.vehicle.get_speed(ids))
+            env.terminate()
+
+        np.testing.assert_array_almost_equal(speeds[0], speeds[1])
+
+    def test_errors(self):
+        vehicles = VehicleParams()
+        vehicles.add("test", num_vehicles=3)
+
+        env, _, _ = ring_road_exp_setup(
+            sim_params=SumoParams(sim_step=0.1, batch_commands=True),
+            vehicles=vehicles)
+        env.reset()
+
+        # commands are only sent when the buffer is flushed
+        env.k.vehicle.apply_acceleration(["test_0", "test_1"], [1, 1],
+                                         smooth=False)
+        edge = env.k.vehicle.get_edge("test_2")
+        env.k.vehicle.choose_routes("test_2", [edge])
+        env.k.vehicle._send_command(
+            "test_3", env.k.kernel_api.vehicle.setSpeed, "test_3", 1)
+        self.assertEqual(len(env.k.vehicle._command_buffer), 4)
+
+        # the failed command is reported, and all other commands are executed
+        with self.assertRaisesRegex(TraCIException, "test_3"):
+            env.k.simulation.simulation_step()
+        self.assertEqual(len(env.k.vehicle._command_buffer), 0)
+        self.assertEqual(
+            env.k.kernel_api.vehicle.getRoute("test_2"), (edge,))
+
+        env.terminate()
+
+    def test_fallback(self):
+        class Connection(object):
+            """Connection whose private attributes differ from TraCI's."""
+
+            def __init__(self, queue):
+                self._string = bytes()
+                self._queue = queue
+                self.executed = []
+
+            def _sendExact(self):
+                raise AssertionError("commands should not be packed")
+
+            def _recvExact(self):
+                raise AssertionError("commands should not be packed")
+
+            def set_speed(self, veh_id, speed):
+                if speed < 0:
+                    raise TraCIException("negative speed")
+                self.executed.append((veh_id, speed))
+
+        # connections without the expected attributes, or with attributes of
+        # an unexpected type, execute the commands one at a time
+        for conn in [Connection([]), Connection(())]:
+            if isinstance(conn._queue, list):
+                del conn._queue
+            buffer = TraCICommandBuffer()
+            buffer.append("test_0", conn.set_speed, "test_0", 1)
+            buffer.append("test_1", conn.set_speed, "test_1", -1)
+            buffer.append("test_2", conn.set_speed, "test_2", 2)
+            errors = buffer.flush(conn)
+            self.assertListEqual(conn.executed, [("test_0", 1), ("test_2", 2)])
+            self.assertEqual(len(errors), 1)
+            self.assertEqual(errors[0][0], "test_1")
+            self.assertEqual(len(buffer), 0)
+
+        # commands that are not packed as expected are executed once, one at
+        # a time
+        class UnpackedConnection(Connection):
+            """Connection whose commands are not packed."""
+
+            _socket = None
+
+            def _sendExact(self):
+                return None
+
+        conn = UnpackedConnection([])
+        buffer = TraCICommandBuffer()
+        buffer.append("test_0", conn.set_speed, "test_0", 1)
+        buffer.append("test_1", conn.set_speed, "test_1", 2)
+        self.assertListEqual(buffer.flush(conn), [])
+        self.assertListEqual(conn.executed, [("test_0", 1), ("test_1", 2)])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -3,8 +3,12 @@ from flow.visualize.visualizer_rllib import visualizer_rllib
 import flow.visualize.capacity_diagram_generator as cdg
 import flow.visualize.time_space_diagram as tsd
 import flow.visualize.plot_ray_results as prr
+from flow.core.trace import TraceWriter, trace_to_csv
+from flow.networks import RingNetwork
 
 import os
+import shutil
+import tempfile
 import unittest
 import ray
 import numpy as np
@@ -204,6 +208,41 @@ class TestPlotters(unittest.TestCase):
         for lane, expected_seg in expected_segs.items():
             np.testing.assert_array_almost_equal(segs[lane], expected_seg)
 
+    def test_time_space_diagram_trace(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        # two vehicles on a ring, during 10 steps
+        writer = TraceWriter(os.path.join(path, 'emission.trace'), [
+            ('time', 'float'), ('id', 'string'), ('speed', 'float'),
+            ('edge_id', 'string'), ('lane_number', 'int'),
+            ('distance', 'float')])
+        times = np.repeat(np.arange(10) * 0.1, 2)
+        writer.write({'time': times,
+                      'id': ['a', 'b'] * 10,
+                      'speed': [1.] * 20,
+                      'edge_id': ['top'] * 20,
+                      'lane_number': [0] * 20,
+                      'distance': times + np.tile([0., 50.], 10)})
+        writer.close()
+        trace_to_csv(os.path.join(path, 'emission.trace'),
+                     os.path.join(path, 'emission.csv'))
+        flow_params = {'network': RingNetwork}
+
+        # only the samples of every 3rd step between 0.2 s and 0.75 s are
+        # read, from the trace and from the csv file
+        for fp in ('emission.trace', 'emission.csv'):
+            emission_data = tsd.import_data_from_trajectory(
+                os.path.join(path, fp), flow_params, start=0.2, end=0.75,
+                steps=3)
+            np.testing.assert_array_almost_equal(
+                emission_data['next_time'], [0.5, 0.5])
+
+            segs, _ = tsd.get_time_space_data(emission_data, flow_params)
+            np.testing.assert_array_almost_equal(segs, [
+                [[0.2, 0.2], [0.5, 0.5]],
+                [[0.2, 50.2], [0.5, 50.5]]])
+
     def test_time_space_diagram_ring_road(self):
         dir_path = os.path.dirname(os.path.realpath(__file__))
         flow_params = tsd.get_flow_params(